@@ -0,0 +1,26 @@
+"""Tooling for the service resource bank stored under ``services/``.
+
+Every module works against a bank root (the directory holding ``services/``)
+and keeps any derived state under ``<root>/.bank/``, which is never committed.
+The root defaults to this checkout and can be overridden with ``BANK_ROOT``.
+"""
+
+import os
+from pathlib import Path
+
+REPO_ROOT = Path(os.environ.get("BANK_ROOT", Path(__file__).resolve().parent.parent))
+SERVICES_DIRNAME = "services"
+STATE_DIRNAME = ".bank"
+
+
+def services_dir(root=None):
+    """Return the ``services/`` directory of a bank root."""
+    return Path(root or REPO_ROOT) / SERVICES_DIRNAME
+
+
+def state_dir(root=None, create=True):
+    """Return the directory holding derived indexes and caches."""
+    path = Path(root or REPO_ROOT) / STATE_DIRNAME
+    if create:
+        path.mkdir(parents=True, exist_ok=True)
+    return path
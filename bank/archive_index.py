@@ -0,0 +1,279 @@
+"""Persistent index of every package's zip central directory.
+
+One parallel pass reads the central directory of each ``source.zip`` (or
+split part set) and records every member's name, sizes, CRC and header
+offset in ``.bank/archives.sqlite``.  Later passes only re-read archives
+whose size or mtime changed.  Queries such as "which services ship a
+``pom.xml``" or "how big is ``src/`` here" then run against indexed tables
+instead of opening hundreds of zips.
+
+Member paths are stored relative to the archive's single top-level
+directory (``PowerJob-5.1.1/pom.xml`` becomes ``pom.xml``), since GitHub
+archives wrap everything in one; :meth:`ArchiveIndex.member_name` maps them
+back to the name inside the zip.
+
+Usage::
+
+    python -m bank.archive_index build
+    python -m bank.archive_index find requirements.txt --max-depth 1
+    python -m bank.archive_index du <service_id> src/
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from . import state_dir
+from .metadata import iter_service_dirs
+from .parts import SOURCE_FILENAME, PartsError, find_parts, open_package_zip
+
+INDEX_FILENAME = "archives.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    service_id    TEXT PRIMARY KEY,
+    layout        TEXT NOT NULL,
+    size          INTEGER NOT NULL,
+    mtime_ns      INTEGER NOT NULL,
+    entries       INTEGER,
+    file_bytes    INTEGER,
+    top_dir       TEXT,
+    error         TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    service_id    TEXT NOT NULL,
+    relpath       TEXT NOT NULL,
+    basename      TEXT NOT NULL,
+    depth         INTEGER NOT NULL,
+    is_dir        INTEGER NOT NULL,
+    file_size     INTEGER NOT NULL,
+    compress_size INTEGER NOT NULL,
+    crc           INTEGER NOT NULL,
+    method        INTEGER NOT NULL,
+    header_offset INTEGER NOT NULL,
+    PRIMARY KEY (service_id, relpath)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entries_basename ON entries (basename, depth);
+"""
+
+
+def archive_stamp(service_dir):
+    """Return ``(layout, size, mtime_ns)`` for a service's package, or ``None``."""
+    source = service_dir / SOURCE_FILENAME
+    try:
+        st = source.stat()
+        return "zip", st.st_size, st.st_mtime_ns
+    except FileNotFoundError:
+        pass
+    parts = find_parts(service_dir)
+    if not parts:
+        return None
+    stats = [p.stat() for p in parts]
+    return "parts", sum(s.st_size for s in stats), max(s.st_mtime_ns for s in stats)
+
+
+def read_central_directory(service_dir):
+    """Return ``(top_dir, rows)`` for one package; raises on unreadable archives."""
+    with open_package_zip(service_dir) as zf:
+        infos = zf.infolist()
+    tops = {info.filename.split("/", 1)[0] for info in infos}
+    top = tops.pop() if len(tops) == 1 and all("/" in i.filename or i.is_dir() for i in infos) else None
+    strip = len(top) + 1 if top else 0
+    rows = []
+    for info in infos:
+        relpath = info.filename[strip:] if top else info.filename
+        trimmed = relpath.rstrip("/")
+        rows.append((
+            relpath,
+            trimmed.rsplit("/", 1)[-1],
+            trimmed.count("/") + 1 if trimmed else 0,
+            int(info.is_dir()),
+            info.file_size,
+            info.compress_size,
+            info.CRC,
+            info.compress_type,
+            info.header_offset,
+        ))
+    return top, rows
+
+
+def _scan(service_dir):
+    try:
+        top, rows = read_central_directory(service_dir)
+        return top, rows, None
+    except (zipfile.BadZipFile, PartsError, OSError, EOFError, ValueError) as exc:
+        return None, [], f"{type(exc).__name__}: {exc}"
+
+
+class ArchiveIndex:
+    """SQLite index over the central directories of all packages."""
+
+    def __init__(self, root=None, path=None):
+        self.root = root
+        self.path = path or state_dir(root) / INDEX_FILENAME
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, workers=None):
+        """Re-read the archives whose size or mtime changed.
+
+        Returns a dict with ``scanned``, ``unchanged``, ``removed`` and
+        ``errors`` counts.
+        """
+        known = {
+            row["service_id"]: (row["layout"], row["size"], row["mtime_ns"])
+            for row in self.conn.execute("SELECT service_id, layout, size, mtime_ns FROM archives")
+        }
+        todo = []
+        seen = set()
+        for service_id, service_dir in iter_service_dirs(self.root):
+            stamp = archive_stamp(service_dir)
+            if stamp is None:
+                continue
+            seen.add(service_id)
+            if known.get(service_id) != stamp:
+                todo.append((service_id, service_dir, stamp))
+        removed = [sid for sid in known if sid not in seen]
+        stats = {"scanned": len(todo), "unchanged": len(seen) - len(todo), "removed": len(removed), "errors": 0}
+        with self.conn:
+            for service_id in removed:
+                self._delete(service_id)
+        if not todo:
+            return stats
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_scan, [t[1] for t in todo], chunksize=4)
+            for (service_id, _, (layout, size, mtime_ns)), (top, rows, error) in zip(todo, results):
+                stats["errors"] += error is not None
+                with self.conn:
+                    self._delete(service_id)
+                    self.conn.execute(
+                        "INSERT INTO archives VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (service_id, layout, size, mtime_ns, len(rows),
+                         sum(r[4] for r in rows if not r[3]), top, error),
+                    )
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(service_id, *row) for row in rows],
+                    )
+        return stats
+
+    def _delete(self, service_id):
+        self.conn.execute("DELETE FROM entries WHERE service_id = ?", (service_id,))
+        self.conn.execute("DELETE FROM archives WHERE service_id = ?", (service_id,))
+
+    def archive(self, service_id):
+        row = self.conn.execute("SELECT * FROM archives WHERE service_id = ?", (service_id,)).fetchone()
+        return dict(row) if row else None
+
+    def member_name(self, service_id, relpath):
+        """Return the zip member name for an indexed ``relpath``."""
+        archive = self.archive(service_id)
+        top = archive and archive["top_dir"]
+        return f"{top}/{relpath}" if top else relpath
+
+    def errors(self):
+        """Return ``{service_id: error}`` for archives that could not be read."""
+        sql = "SELECT service_id, error FROM archives WHERE error IS NOT NULL ORDER BY service_id"
+        return dict(self.conn.execute(sql).fetchall())
+
+    def find(self, basename, max_depth=None):
+        """Return ``[(service_id, relpath, file_size)]`` for members named ``basename``."""
+        sql = "SELECT service_id, relpath, file_size FROM entries WHERE basename = ? AND is_dir = 0"
+        params = [basename]
+        if max_depth is not None:
+            sql += " AND depth <= ?"
+            params.append(max_depth)
+        return [tuple(row) for row in self.conn.execute(sql + " ORDER BY service_id, relpath", params)]
+
+    def services_with(self, basename, max_depth=None):
+        """Return the sorted ids of services shipping a member named ``basename``."""
+        return sorted({service_id for service_id, _, _ in self.find(basename, max_depth)})
+
+    def list(self, service_id, prefix=""):
+        """Return entry dicts under ``prefix`` (relative to the top directory)."""
+        sql = "SELECT * FROM entries WHERE service_id = ?"
+        params = [service_id]
+        if prefix:
+            sql += " AND relpath >= ? AND relpath < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        return [dict(row) for row in self.conn.execute(sql + " ORDER BY relpath", params)]
+
+    def du(self, service_id, prefix=""):
+        """Return ``(files, uncompressed_bytes, compressed_bytes)`` under ``prefix``."""
+        sql = "SELECT COUNT(*), COALESCE(SUM(file_size), 0), COALESCE(SUM(compress_size), 0) " \
+              "FROM entries WHERE service_id = ? AND is_dir = 0"
+        params = [service_id]
+        if prefix:
+            sql += " AND relpath >= ? AND relpath < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        return tuple(self.conn.execute(sql, params).fetchone())
+
+
+def open_index(root=None, refresh=True, workers=None):
+    index = ArchiveIndex(root)
+    if refresh:
+        index.refresh(workers=workers)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.archive_index", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    parser.add_argument("--workers", type=int, help="processes used to read archives")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="index new or changed archives")
+    sub.add_parser("errors", help="list archives that could not be read")
+    find = sub.add_parser("find", help="list services shipping a file with this name")
+    find.add_argument("basename")
+    find.add_argument("--max-depth", type=int, help="1 means the archive root only")
+    find.add_argument("--paths", action="store_true", help="print every matching path")
+    du = sub.add_parser("du", help="size of a service's files under a prefix")
+    du.add_argument("service_id")
+    du.add_argument("prefix", nargs="?", default="")
+    ls = sub.add_parser("ls", help="list a service's entries under a prefix")
+    ls.add_argument("service_id")
+    ls.add_argument("prefix", nargs="?", default="")
+
+    args = parser.parse_args(argv)
+    with ArchiveIndex(args.root) as index:
+        started = time.perf_counter()
+        stats = index.refresh(workers=args.workers)
+        if args.command == "build":
+            print(stats, f"({time.perf_counter() - started:.2f} s)")
+        elif args.command == "errors":
+            for service_id, error in index.errors().items():
+                print(f"{service_id}  {error}")
+        elif args.command == "find":
+            if args.paths:
+                for service_id, relpath, size in index.find(args.basename, args.max_depth):
+                    print(f"{service_id}  {size:>10}  {relpath}")
+            else:
+                for service_id in index.services_with(args.basename, args.max_depth):
+                    print(service_id)
+        elif args.command == "du":
+            files, size, compressed = index.du(args.service_id, args.prefix)
+            print(f"{files} files, {size} bytes ({compressed} compressed)")
+        elif args.command == "ls":
+            for entry in index.list(args.service_id, args.prefix):
+                print(f"{entry['file_size']:>12}  {entry['relpath']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
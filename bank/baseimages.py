@@ -0,0 +1,329 @@
+"""Shared base images synthesised from common Dockerfile prefixes.
+
+Most generated Dockerfiles open the same way: ``FROM python:3.11-slim``
+followed by an ``apt-get install curl ...`` step, sometimes with a
+``WORKDIR`` or ``ENV`` in between.  Each image still builds and stores those
+layers on its own.
+
+For every build stage this module extracts a *shareable prefix*: the
+``FROM`` image plus the system package steps (``apt-get``/``apk``/``yum``
+``RUN`` instructions) that come before the first instruction touching the
+build context.  ``ARG`` and ``ENV`` lines before a package step are in scope
+for it (``ARG DEBIAN_FRONTEND=noninteractive`` keeps tzdata from prompting),
+so they move into the prefix with it; ``ARG`` lines also stay in the stage,
+since an ``ARG`` does not outlive the build that declares it.  Other
+metadata instructions (``WORKDIR``, ``LABEL`` ...) are stepped over and stay
+in the service's Dockerfile.  Prefixes are arranged in a trie; every node
+shared by at least ``--min-services`` stages becomes a base image (bases
+nest, so a longer prefix builds ``FROM`` the shorter one).  A stage is
+rewritten to start ``FROM`` the deepest base matching its prefix.
+
+Usage::
+
+    python -m bank.baseimages analyze [--min-services 3] [--write]
+    python -m bank.baseimages build [--measure]
+    python -m bank.baseimages rewrite <service_id> <deploy-dir>
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .dockerfile import Dockerfile, from_image, split_shell_commands
+from .metadata import iter_service_dirs
+
+BASES_DIRNAME = "bases"
+PLAN_FILENAME = "plan.json"
+IMAGE_PREFIX = "bank-base"
+DEFAULT_MIN_SERVICES = 3
+
+_SYSTEM_PACKAGE_COMMANDS = frozenset({
+    "apt-get", "apt", "apk", "yum", "dnf", "microdnf", "rm", "update-ca-certificates", "ln",
+})
+_METADATA = frozenset({"ENV", "WORKDIR", "LABEL", "EXPOSE", "ARG", "STOPSIGNAL", "MAINTAINER"})
+
+
+def _normalise(instruction):
+    return f"{instruction.keyword} {' '.join(instruction.value.split())}"
+
+
+def _env_names(instruction):
+    value = instruction.value.strip()
+    if "=" not in value.split(" ", 1)[0]:
+        return {value.split(" ", 1)[0]}
+    return {m.group(1) for m in re.finditer(r"(?:^|\s)([A-Za-z_][A-Za-z0-9_]*)=", value)}
+
+
+def is_system_package_run(instruction):
+    """True for RUN steps that only drive the OS package manager."""
+    if instruction.keyword != "RUN" or "$" in instruction.value:
+        return False
+    flags, command = instruction.flags_and_command()
+    if flags:
+        return False
+    commands = split_shell_commands(command)
+    return bool(commands) and all(words[0] in _SYSTEM_PACKAGE_COMMANDS for words in commands) \
+        and any(words[0] != "rm" and words[0] != "ln" for words in commands)
+
+
+def stage_prefixes(dockerfile, service_id=""):
+    """Yield ``(from_index, keys, members)`` for each stage of ``dockerfile``.
+
+    ``keys`` is the shareable prefix (normalised instruction text, ``FROM``
+    first) and ``members`` the matching instruction indices, ``FROM`` first.
+    """
+    instructions = dockerfile.instructions
+    for index, instruction in enumerate(instructions):
+        if instruction.keyword != "FROM":
+            continue
+        image, _ = from_image(instruction)
+        if not image or "$" in image:
+            continue
+        flags, _ = instruction.flags_and_command()
+        keys = [f"FROM {image}" + (f" --platform={flags['platform'][0]}" if "platform" in flags else "")]
+        members = [index]
+        scoped = []
+        for later in range(index + 1, len(instructions)):
+            step = instructions[later]
+            if step.keyword == "FROM" or (service_id and service_id in step.value):
+                break
+            if step.keyword == "ENV" and "PATH" in _env_names(step):
+                break
+            if step.keyword in ("ARG", "ENV"):
+                scoped.append(later)        # visible to the package steps that follow
+                continue
+            if step.keyword in _METADATA:
+                continue
+            if not is_system_package_run(step):
+                break
+            for scoped_index in scoped:
+                keys.append(_normalise(instructions[scoped_index]))
+                members.append(scoped_index)
+            scoped = []
+            keys.append(_normalise(step))
+            members.append(later)
+        yield index, keys, members
+
+
+def base_name(keys):
+    digest = hashlib.sha256("\n".join(keys).encode()).hexdigest()[:10]
+    slug = re.sub(r"[^a-z0-9.]+", "-", keys[0].split()[1].lower()).strip("-")
+    return f"{IMAGE_PREFIX}/{slug}:{digest}"
+
+
+def analyze(root=None, min_services=DEFAULT_MIN_SERVICES):
+    """Group every stage by shareable prefix and choose the base images.
+
+    Returns a plan dict with ``bases`` (name -> keys, parent, stages) and
+    summary figures.
+    """
+    stages = []
+    for service_id, service_dir in iter_service_dirs(root):
+        path = service_dir / "Dockerfile"
+        if path.is_file():
+            for _, keys, _ in stage_prefixes(Dockerfile.read(path), service_id):
+                stages.append((service_id, keys))
+    counts = Counter()
+    for _, keys in stages:
+        for depth in range(2, len(keys) + 1):
+            counts[tuple(keys[:depth])] += 1
+    # A base only pays off if it ends in a filesystem layer worth sharing.
+    shared = {prefix for prefix, n in counts.items() if n >= min_services and prefix[-1].startswith("RUN ")}
+
+    bases = {}
+    layers_total = layers_built = 0
+    for service_id, keys in stages:
+        chosen = _deepest(keys, shared)
+        if chosen is None:
+            continue
+        name = base_name(list(chosen))
+        entry = bases.setdefault(name, {"keys": list(chosen), "services": []})
+        entry["services"].append(service_id)
+        layers_total += len(chosen) - 1
+    for name, entry in bases.items():
+        keys = entry["keys"]
+        parent = _deepest(keys[:-1], {tuple(b["keys"]) for b in bases.values()})
+        entry["parent"] = base_name(list(parent)) if parent else None
+        entry["own_layers"] = len(keys) - (len(parent) if parent else 1)
+        layers_built += entry["own_layers"]
+    return {
+        "min_services": min_services,
+        "stages": len(stages),
+        "stages_rebased": sum(len(b["services"]) for b in bases.values()),
+        "prefix_layers": layers_total,
+        "layers_built": layers_built,
+        "cache_hit_rate": 1 - layers_built / layers_total if layers_total else 0.0,
+        "bases": dict(sorted(bases.items())),
+    }
+
+
+def _deepest(keys, shared):
+    for depth in range(len(keys), 1, -1):
+        if tuple(keys[:depth]) in shared:
+            return tuple(keys[:depth])
+    return None
+
+
+def plan_path(root=None):
+    return state_dir(root) / BASES_DIRNAME / PLAN_FILENAME
+
+
+def load_plan(root=None):
+    try:
+        with open(plan_path(root), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_plan(plan, root=None):
+    path = plan_path(root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    return path
+
+
+def base_dockerfile(name, plan):
+    """Return the Dockerfile text of one base image in ``plan``."""
+    entry = plan["bases"][name]
+    keys = entry["keys"]
+    if entry["parent"]:
+        start = len(plan["bases"][entry["parent"]]["keys"])
+        header = f"FROM {entry['parent']}"
+    else:
+        start = 1
+        image, _, platform = keys[0][len("FROM "):].partition(" ")
+        header = f"FROM {platform + ' ' if platform else ''}{image}"
+    lines = [f"# Shared base for {len(entry['services'])} stages; generated by bank.baseimages.", header]
+    lines += keys[start:]
+    return "\n".join(lines) + "\n"
+
+
+def _build_order(plan):
+    order = []
+    done = set()
+
+    def visit(name):
+        if name in done:
+            return
+        parent = plan["bases"][name]["parent"]
+        if parent:
+            visit(parent)
+        done.add(name)
+        order.append(name)
+
+    for name in plan["bases"]:
+        visit(name)
+    return order
+
+
+def _image_size(image):
+    result = subprocess.run(["docker", "image", "inspect", "-f", "{{.Size}}", image],
+                            capture_output=True, text=True)
+    return int(result.stdout.strip()) if result.returncode == 0 else None
+
+
+def build(plan, root=None, measure=False, log=print):
+    """Build every base image, parents first; return bytes saved if measured."""
+    workdir = state_dir(root) / BASES_DIRNAME
+    saved = 0
+    for name in _build_order(plan):
+        context = workdir / name.replace("/", "_").replace(":", "_")
+        context.mkdir(parents=True, exist_ok=True)
+        (context / "Dockerfile").write_text(base_dockerfile(name, plan), encoding="utf-8")
+        result = subprocess.run(["docker", "build", "-t", name, "."], cwd=context, capture_output=True, text=True)
+        log(f"{name}: {'built' if result.returncode == 0 else 'FAILED'}")
+        if result.returncode != 0 or not measure:
+            continue
+        entry = plan["bases"][name]
+        parent = entry["parent"] or entry["keys"][0].split()[1]
+        size, parent_size = _image_size(name), _image_size(parent)
+        if size is not None and parent_size is not None:
+            # Built separately, these layers would exist once per stage.
+            saved += (len(entry["services"]) - 1) * (size - parent_size)
+    return saved if measure else None
+
+
+def rewrite(dockerfile, plan, service_id=""):
+    """Rebase the stages of ``dockerfile`` onto ``plan``'s bases; return count."""
+    by_keys = {tuple(entry["keys"]): name for name, entry in plan["bases"].items()}
+    rebased = 0
+    for from_index, keys, members in reversed(list(stage_prefixes(dockerfile, service_id))):
+        depth = next((d for d in range(len(keys), 1, -1) if tuple(keys[:d]) in by_keys), None)
+        if depth is None:
+            continue
+        name = by_keys[tuple(keys[:depth])]
+        instructions = dockerfile.instructions
+        _, alias = from_image(instructions[from_index])
+        # Drop consumed instructions bottom-up so earlier line numbers hold; ARGs stay in scope.
+        for index in sorted(members[1:depth], reverse=True):
+            if instructions[index].keyword == "ARG":
+                continue
+            dockerfile.replace(instructions[index], [])
+            instructions = dockerfile.instructions
+        dockerfile.replace(instructions[from_index], [f"FROM {name}" + (f" AS {alias}" if alias else "")])
+        rebased += 1
+    return rebased
+
+
+def apply_to_workdir(service_dir, workdir, root=None):
+    """Deploy transform: rebase ``workdir/Dockerfile`` onto the shared bases."""
+    plan = load_plan(root)
+    path = Path(workdir) / "Dockerfile"
+    if plan is None or not path.is_file():
+        return False
+    dockerfile = Dockerfile.read(path)
+    if not rewrite(dockerfile, plan, Path(service_dir).name):
+        return False
+    path.write_text(dockerfile.text(), encoding="utf-8", errors="surrogateescape")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.baseimages", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    an = sub.add_parser("analyze", help="group Dockerfiles by shared prefix and choose bases")
+    an.add_argument("--min-services", type=int, default=DEFAULT_MIN_SERVICES)
+    an.add_argument("--write", action="store_true", help=f"save the plan to .bank/{BASES_DIRNAME}/{PLAN_FILENAME}")
+    bd = sub.add_parser("build", help="build the base images of the saved plan")
+    bd.add_argument("--measure", action="store_true", help="report image bytes saved")
+    rw = sub.add_parser("rewrite", help="rebase a prepared deploy tree onto the bases")
+    rw.add_argument("service_id")
+    rw.add_argument("workdir", type=Path)
+
+    args = parser.parse_args(argv)
+    if args.command == "analyze":
+        plan = analyze(args.root, args.min_services)
+        print(f"stages analysed:      {plan['stages']}")
+        print(f"stages rebased:       {plan['stages_rebased']}")
+        print(f"base images:          {len(plan['bases'])}")
+        print(f"prefix layers:        {plan['prefix_layers']} ({plan['layers_built']} built once)")
+        print(f"expected cache hits:  {plan['cache_hit_rate']:.1%}")
+        for name, entry in sorted(plan["bases"].items(), key=lambda kv: -len(kv[1]["services"]))[:15]:
+            print(f"  {len(entry['services']):>4}  {name}  (+{entry['own_layers']} layers)")
+        if args.write:
+            print(f"plan written to {write_plan(plan, args.root)}")
+        return 0
+    if args.command == "build":
+        plan = load_plan(args.root)
+        if plan is None:
+            parser.error("no saved plan; run 'analyze --write' first")
+        saved = build(plan, args.root, measure=args.measure)
+        if saved is not None:
+            print(f"image bytes saved: {saved}")
+        return 0
+    changed = apply_to_workdir(services_dir(args.root) / args.service_id, args.workdir, args.root)
+    print("rewritten" if changed else "nothing to rewrite")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""Content-addressed, deduplicated storage for ``source.zip`` packages.
+
+Each package is split into segments and described by a *recipe*:
+
+* the compressed payload of every zip member becomes a blob keyed by its
+  SHA-256, so a member shared by several packages (the same repo uploaded
+  twice, vendored libraries, licence files ...) is stored once;
+* the bytes in between (local headers, data descriptors, the central
+  directory) are short and package-specific, so they are kept inline in the
+  recipe.
+
+Files that are not readable zips are cut into fixed-size chunks instead.
+Rebuilding concatenates the segments and checks the result against the
+SHA-256 recorded at ingest time, so restores are byte-identical.
+
+A re-upload of a repository (same ``repo_name``, later ``uploaded_at``) can
+be ingested against its previous version (``--delta``).  Payloads that are
+not already stored are then rsync-delta-encoded (:mod:`bank.delta`) against
+the same-named member of the previous version, and kept as a small patch
+blob when that saves at least half of the bytes.  Deflated payloads share
+almost no bytes after the first edit, so when zlib reproduces a payload
+exactly from its inflated content (see :func:`bank.seekable.reproduce_deflate`)
+the delta is taken between the inflated contents of both versions, the
+patch is deflated, and the zlib settings are kept in the segment.  Restores
+apply the patch to the base blob (inflating both and re-deflating the
+result when settings are present).  Deltas are always taken against full
+blobs, so no chain is longer than one step.
+
+The store lives under ``.bank/blobs/``::
+
+    python -m bank.blobstore ingest              # every services/*/source.zip
+    python -m bank.blobstore ingest --delta <id> # against the repo's previous upload
+    python -m bank.blobstore restore <id> out.zip
+    python -m bank.blobstore stats
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .catalog import open_catalog
+from .delta import apply as apply_delta
+from .delta import encode as encode_delta
+from .deploy import top_level_dir
+from .seekable import reproduce_deflate
+
+BLOBS_DIRNAME = "blobs"
+SOURCE_FILENAME = "source.zip"
+
+# Member payloads smaller than this are inlined rather than given a blob file.
+MIN_BLOB_SIZE = 1024
+# Chunk size used for files that cannot be parsed as zips.
+CHUNK_SIZE = 4 << 20
+COPY_BUFSIZE = 1 << 20
+# A delta is kept only if it is at most this fraction of the payload.
+MAX_DELTA_RATIO = 0.5
+
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_MAGIC = b"PK\x03\x04"
+
+
+class BlobStoreError(Exception):
+    pass
+
+
+class BlobStore:
+    """Blob and recipe storage rooted at ``.bank/blobs``."""
+
+    def __init__(self, root=None, path=None):
+        self.root = root
+        self.path = Path(path or state_dir(root) / BLOBS_DIRNAME)
+        self.objects = self.path / "objects"
+        self.recipes = self.path / "recipes"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.recipes.mkdir(parents=True, exist_ok=True)
+
+    # -- blobs -------------------------------------------------------------
+
+    def blob_path(self, digest):
+        return self.objects / digest[:2] / digest[2:]
+
+    def has(self, digest):
+        return self.blob_path(digest).exists()
+
+    def put(self, data):
+        """Store ``data`` and return its hex digest; existing blobs are reused."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            _atomic_write(path, data)
+        return digest
+
+    def get(self, digest):
+        with open(self.blob_path(digest), "rb") as f:
+            return f.read()
+
+    # -- recipes -----------------------------------------------------------
+
+    def recipe_path(self, service_id):
+        return self.recipes / f"{service_id}.json"
+
+    def load_recipe(self, service_id):
+        try:
+            with open(self.recipe_path(service_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise BlobStoreError(f"no recipe stored for {service_id}") from None
+
+    def iter_recipes(self):
+        for path in sorted(self.recipes.glob("*.json")):
+            with open(path, encoding="utf-8") as f:
+                yield path.stem, json.load(f)
+
+    def base_members(self, service_id):
+        """Return ``{member name: full blob digest}`` of a stored package."""
+        recipe = self.load_recipe(service_id)
+        bases = {seg[1]: seg[3] for seg in recipe["segments"] if seg[0] == "delta"}
+        return {name: bases.get(digest, digest) for name, digest in recipe.get("members", {}).items()}
+
+    def ingest(self, service_id, source=None, force=False, base=None):
+        """Store one package and return its recipe.
+
+        A package whose size and mtime match the existing recipe is skipped
+        unless ``force`` is set.  With ``base`` (the service id of a stored
+        previous version) new payloads are delta-encoded against it.
+        """
+        source = Path(source or services_dir(self.root) / service_id / SOURCE_FILENAME)
+        st = source.stat()
+        if not force:
+            try:
+                recipe = self.load_recipe(service_id)
+            except BlobStoreError:
+                recipe = None
+            if recipe and (recipe["size"], recipe["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                return recipe
+        base_members = self.base_members(base) if base else {}
+        with open(source, "rb") as f:
+            try:
+                spans = _member_spans(f, st.st_size)
+                layout = "zip"
+            except (zipfile.BadZipFile, BlobStoreError, OSError, EOFError):
+                spans = [(off, min(CHUNK_SIZE, st.st_size - off), f"#chunk{i}")
+                         for i, off in enumerate(range(0, st.st_size, CHUNK_SIZE))]
+                layout = "chunks"
+            members = {}
+            segments = self._segments(f, spans, st.st_size, members, base_members)
+            f.seek(0)
+            digest = _file_digest(f)
+        recipe = {
+            "service_id": service_id,
+            "layout": layout,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+            "base": base,
+            "members": members,
+            "segments": segments,
+        }
+        _atomic_write(self.recipe_path(service_id), json.dumps(recipe, separators=(",", ":")).encode())
+        return recipe
+
+    def _segments(self, f, spans, size, members, base_members):
+        segments = []
+        pos = 0
+        for offset, length, name in spans:
+            if offset > pos:
+                f.seek(pos)
+                _append_literal(segments, f.read(offset - pos))
+            f.seek(offset)
+            data = f.read(length)
+            if len(data) < MIN_BLOB_SIZE:
+                _append_literal(segments, data)
+            else:
+                digest = hashlib.sha256(data).hexdigest()
+                members[name] = digest
+                segments.append(self._delta_segment(data, digest, base_members.get(name))
+                                or ["blob", self.put(data), len(data)])
+            pos = offset + length
+        if pos < size:
+            f.seek(pos)
+            _append_literal(segments, f.read(size - pos))
+        return [
+            ["lit", base64.b64encode(seg[1]).decode("ascii")] if seg[0] == "lit" else seg
+            for seg in segments
+        ]
+
+    def _delta_segment(self, data, digest, base_digest):
+        """Return a ``delta`` segment for ``data``, or ``None`` to store it whole.
+
+        The segment is ``["delta", digest, size, base digest, patch digest]``,
+        plus ``[level, mem_level]`` when the patch is between inflated contents.
+        """
+        if base_digest is None or base_digest == digest or self.has(digest) or not self.has(base_digest):
+            return None
+        base = self.get(base_digest)
+        content, base_content = _inflate(data), _inflate(base)
+        settings = content is not None and base_content is not None and reproduce_deflate(data, content)
+        if settings:
+            patch = zlib.compress(encode_delta(base_content, content))
+        else:
+            patch = encode_delta(base, data)
+        if len(patch) > len(data) * MAX_DELTA_RATIO:
+            return None
+        segment = ["delta", digest, len(data), base_digest, self.put(patch)]
+        if settings:
+            segment.append(list(settings))
+        return segment
+
+    def _apply_delta_segment(self, segment):
+        base, patch = self.get(segment[3]), self.get(segment[4])
+        if len(segment) < 6:
+            return apply_delta(base, patch)
+        level, mem_level = segment[5]
+        content = apply_delta(zlib.decompress(base, -15), zlib.decompress(patch))
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, mem_level)
+        return compressor.compress(content) + compressor.flush()
+
+    def iter_restore(self, service_id):
+        """Yield the bytes of a stored package, segment by segment."""
+        for segment in self.load_recipe(service_id)["segments"]:
+            if segment[0] == "lit":
+                yield base64.b64decode(segment[1])
+            elif segment[0] == "delta":
+                yield self._apply_delta_segment(segment)
+            else:
+                yield self.get(segment[1])
+
+    def restore(self, service_id, dest):
+        """Rebuild a package at ``dest`` and verify it against its digest."""
+        recipe = self.load_recipe(service_id)
+        dest = Path(dest)
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(prefix=".restore.", dir=dest.parent)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in self.iter_restore(service_id):
+                    digest.update(chunk)
+                    out.write(chunk)
+            if digest.hexdigest() != recipe["sha256"]:
+                raise BlobStoreError(f"{service_id}: restored package does not match its recorded digest")
+            os.replace(tmp, dest)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        return dest
+
+    # -- reporting ---------------------------------------------------------
+
+    def stats(self):
+        """Return store-wide and per-service deduplication figures.
+
+        ``logical_bytes`` is the size of every package as uploaded and
+        ``stored_bytes`` what the store holds for them (unique blobs, patches
+        and inline bytes).  ``shared_bytes`` per service counts payload bytes
+        that are also referenced by another package; ``delta_bytes`` the
+        payload bytes rebuilt from a previous version.
+        """
+        refs = {}
+        recipes = dict(self.iter_recipes())
+        for service_id, recipe in recipes.items():
+            for segment in recipe["segments"]:
+                for digest in _segment_blobs(segment):
+                    refs.setdefault(digest, set()).add(service_id)
+        logical = inline = delta_total = 0
+        services = {}
+        for service_id, recipe in recipes.items():
+            shared = delta = 0
+            for segment in recipe["segments"]:
+                if segment[0] == "lit":
+                    inline += len(segment[1]) * 3 // 4
+                elif segment[0] == "delta":
+                    delta += segment[2]
+                elif len(refs[segment[1]]) > 1:
+                    shared += segment[2]
+            logical += recipe["size"]
+            delta_total += delta
+            services[service_id] = {"size": recipe["size"], "shared_bytes": shared, "delta_bytes": delta}
+        unique = sum(self.blob_path(d).stat().st_size for d in refs)
+        stored = unique + inline
+        return {
+            "packages": len(recipes),
+            "blobs": len(refs),
+            "logical_bytes": logical,
+            "stored_bytes": stored,
+            "delta_bytes": delta_total,
+            "dedup_ratio": logical / stored if stored else 1.0,
+            "services": services,
+        }
+
+    def gc(self):
+        """Delete blobs that no recipe references; return how many were removed."""
+        live = {
+            digest
+            for _, recipe in self.iter_recipes()
+            for segment in recipe["segments"]
+            for digest in _segment_blobs(segment)
+        }
+        removed = 0
+        for path in self.objects.glob("*/*"):
+            if path.parent.name + path.name not in live:
+                path.unlink()
+                removed += 1
+        return removed
+
+
+def previous_version(service_id, root=None, store=None):
+    """Return the newest stored earlier upload of the same repo, or ``None``."""
+    with open_catalog(root) as catalog:
+        row = catalog.get(service_id)
+        if row is None or not row["repo_name"] or not row["uploaded_at"]:
+            return None
+        earlier = catalog.query(repo_name=row["repo_name"], uploaded_before=row["uploaded_at"],
+                                order_by="-uploaded_at")
+    for candidate in earlier:
+        if store is None or store.recipe_path(candidate["service_id"]).exists():
+            return candidate["service_id"]
+    return None
+
+
+def _segment_blobs(segment):
+    if segment[0] == "blob":
+        return (segment[1],)
+    if segment[0] == "delta":
+        return (segment[3], segment[4])
+    return ()
+
+
+def _member_spans(f, size):
+    """Return sorted ``(offset, length, name)`` spans of every member's payload."""
+    spans = []
+    with zipfile.ZipFile(f) as zf:
+        infos = zf.infolist()
+        # Versions of a repo differ in their top directory (repo-main/, repo-1.2/ ...).
+        top = top_level_dir([info.filename for info in infos])
+        strip = len(top) + 1 if top else 0
+        for info in infos:
+            f.seek(info.header_offset)
+            header = f.read(_LOCAL_HEADER.size)
+            if len(header) != _LOCAL_HEADER.size or header[:4] != _LOCAL_HEADER_MAGIC:
+                raise BlobStoreError(f"bad local header for {info.filename!r}")
+            fields = _LOCAL_HEADER.unpack(header)
+            start = info.header_offset + _LOCAL_HEADER.size + fields[-2] + fields[-1]
+            if info.compress_size and start + info.compress_size <= size:
+                spans.append((start, info.compress_size, info.filename[strip:]))
+    spans.sort()
+    for (a_off, a_len, _), (b_off, _, _) in zip(spans, spans[1:]):
+        if a_off + a_len > b_off:
+            raise BlobStoreError("overlapping zip members")
+    return spans
+
+
+def _inflate(payload):
+    """Return the raw-inflated ``payload``, or ``None`` if it is not deflate data."""
+    try:
+        return zlib.decompress(payload, -15)
+    except zlib.error:
+        return None
+
+
+def _append_literal(segments, data):
+    if not data:
+        return
+    if segments and segments[-1][0] == "lit":
+        segments[-1][1] += data
+    else:
+        segments.append(["lit", bytearray(data)])
+
+
+def _file_digest(f):
+    digest = hashlib.sha256()
+    while chunk := f.read(COPY_BUFSIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(prefix=".tmp.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _source_ids(root):
+    base = services_dir(root)
+    return sorted(p.parent.name for p in base.glob(f"*/{SOURCE_FILENAME}"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.blobstore", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="store packages (all by default)")
+    ingest.add_argument("service_ids", nargs="*")
+    ingest.add_argument("--force", action="store_true", help="re-ingest unchanged packages")
+    ingest.add_argument("--delta", action="store_true",
+                        help="delta-encode against the previous upload of the same repo, if stored")
+
+    restore = sub.add_parser("restore", help="rebuild a package from the store")
+    restore.add_argument("service_id")
+    restore.add_argument("dest")
+
+    stats = sub.add_parser("stats", help="report deduplication ratios")
+    stats.add_argument("--top", type=int, default=10, help="list the N services sharing most bytes")
+
+    sub.add_parser("gc", help="delete unreferenced blobs")
+
+    args = parser.parse_args(argv)
+    store = BlobStore(args.root)
+    if args.command == "ingest":
+        for service_id in args.service_ids or _source_ids(args.root):
+            base = previous_version(service_id, args.root, store) if args.delta else None
+            recipe = store.ingest(service_id, force=args.force, base=base)
+            deltas = [seg for seg in recipe["segments"] if seg[0] == "delta"]
+            note = f"  {len(deltas)} deltas against {base}" if deltas else ""
+            print(f"{service_id}  {recipe['layout']:<6}  {recipe['size']:>12}  {len(recipe['segments'])} segments{note}")
+    elif args.command == "restore":
+        try:
+            store.restore(args.service_id, args.dest)
+        except BlobStoreError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+    elif args.command == "stats":
+        report = store.stats()
+        print(f"packages:      {report['packages']}")
+        print(f"unique blobs:  {report['blobs']}")
+        print(f"logical bytes: {report['logical_bytes']}")
+        print(f"stored bytes:  {report['stored_bytes']}")
+        print(f"delta bytes:   {report['delta_bytes']}")
+        print(f"dedup ratio:   {report['dedup_ratio']:.3f}")
+        ranked = sorted(report["services"].items(), key=lambda kv: kv[1]["shared_bytes"], reverse=True)
+        for service_id, entry in ranked[: args.top]:
+            if entry["shared_bytes"]:
+                pct = 100.0 * entry["shared_bytes"] / entry["size"]
+                print(f"  {service_id}  {entry['shared_bytes']:>12} shared  ({pct:.1f}%)")
+    elif args.command == "gc":
+        print(f"removed {store.gc()} blobs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+"""Build-result cache that lets redeploys skip ``docker compose build``.
+
+A build is keyed by everything that can change the images it produces:
+
+* the SHA-256 of the package (``source.zip`` or its part set),
+* the content of every generated file next to ``metadata.json``,
+* the Dockerfiles, compose file and overlays of the deploy tree after the
+  deploy transforms ran,
+* every file docker would send as each build's context, so files a
+  transform adds or rewrites (lazy-import wrappers, wheelhouse
+  requirements ...) change the key.  The build's ``.dockerignore`` rules
+  (``<Dockerfile>.dockerignore`` first, as BuildKit reads them) apply, and
+  the stack's bind-mount sources (``./data``, database directories) are
+  left out: containers write there, so hashing them would change the key
+  on every run,
+* the names of the deploy transforms that ran, and
+* the digest of every base image the Dockerfiles start ``FROM``.
+  Locally pulled images are resolved via ``docker image inspect``, others
+  via ``docker buildx imagetools inspect``.  An image that cannot be
+  resolved is keyed by its reference.
+
+After a successful build the image ids of the stack's built services are
+stored under the key in ``.bank/buildcache/index.json``.  On the next deploy
+with the same key, if those images still exist, they are re-tagged with the
+names compose expects and the build is skipped.  Package hashes are
+memoised by file size and mtime, so an unchanged package is not re-read.
+
+Every lookup is appended to ``.bank/buildcache/events.jsonl``.  ``stats``
+summarises hits, misses and the build seconds the hits saved, and can print
+them in the Prometheus text format for a node-exporter textfile collector.
+
+Usage::
+
+    python -m bank.buildcache key <service_id> [--workdir DIR] [--transform NAME ...]
+    python -m bank.buildcache stats [--prometheus]
+    python -m bank.buildcache prune
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .catalog import package_files, package_stamp
+from .buildcontext import IGNORE_SUFFIX, ignored, parse_rules
+from .compose import bind_sources, build_spec, services
+from .deploy import DEFAULT_WORKDIR, compose, compose_file, is_bank_file
+from .dockerfile import Dockerfile
+
+CACHE_DIRNAME = "buildcache"
+INDEX_FILENAME = "index.json"
+PACKAGES_FILENAME = "packages.json"
+EVENTS_FILENAME = "events.jsonl"
+KEY_VERSION = 3
+KEEP_PER_SERVICE = 3
+READ_SIZE = 1 << 20
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _atomic_write_json(path, data):
+    fd, tmp = tempfile.mkstemp(prefix=".tmp.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _docker(*args):
+    try:
+        result = subprocess.run(["docker", *args], capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def context_rules(path, dockerfile="Dockerfile"):
+    """Return the ignore rules of a build context, as :func:`bank.buildcontext.parse_rules` does."""
+    for name in (dockerfile + IGNORE_SUFFIX, ".dockerignore"):
+        try:
+            return parse_rules((Path(path) / name).read_text(encoding="utf-8", errors="replace").splitlines())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return []
+
+
+def context_digest(path, dockerfile="Dockerfile", skip=()):
+    """Return the SHA-256 over the relative paths and contents of a build context's files.
+
+    Files the context's ignore rules exclude are left out, and so is
+    everything under the paths in ``skip`` (bind-mount sources).
+    """
+    path = Path(path)
+    rules = context_rules(path, dockerfile)
+    prunable = not any(negated for negated, _ in rules)
+    base = path.resolve()
+    skipped = {s.relative_to(base).as_posix() for s in map(Path, skip) if s.is_relative_to(base) and s != base}
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        rel = Path(dirpath).relative_to(path).as_posix()
+        rel = "" if rel == "." else rel
+        # A negated rule can re-include files below an ignored directory, so only prune without one.
+        dirnames[:] = [d for d in dirnames if posixpath.join(rel, d) not in skipped
+                       and not (prunable and ignored(posixpath.join(rel, d), rules))]
+        files += [relpath for name in filenames
+                  if (relpath := posixpath.join(rel, name)) not in skipped and not ignored(relpath, rules)]
+    digest = hashlib.sha256()
+    for relpath in sorted(files):
+        digest.update(f"{relpath}\0{_sha256_file(path / relpath)}\n".encode())
+    return digest.hexdigest()
+
+
+def transform_name(transform):
+    """Return the short name of a deploy transform, e.g. ``lazyimport``."""
+    return transform.__module__.rpartition(".")[2]
+
+
+def image_id(reference):
+    """Return the local image id of ``reference``, or ``None``."""
+    return _docker("image", "inspect", "--format", "{{.Id}}", reference)
+
+
+def resolve_image(reference):
+    """Return a content digest for a base image reference, or the reference itself."""
+    digests = _docker("image", "inspect", "--format", "{{json .RepoDigests}}", reference)
+    if digests:
+        found = json.loads(digests)
+        if found:
+            return found[0].partition("@")[2]
+    remote = _docker("buildx", "imagetools", "inspect", "--format", "{{json .Manifest.Digest}}", reference)
+    if remote:
+        return json.loads(remote)
+    return reference
+
+
+def stack_builds(doc):
+    """Return ``{service: (image name, context, dockerfile)}`` for the built services of a compose config."""
+    project = doc.get("name") or "default"
+    builds = {}
+    for name, service in services(doc).items():
+        spec = build_spec(service or {})
+        if spec:
+            builds[name] = (service.get("image") or f"{project}-{name}", *spec)
+    return builds
+
+
+def base_images(workdir, builds):
+    """Return the sorted external ``FROM`` images of the stack's Dockerfiles."""
+    images = set()
+    for _, context, dockerfile in builds.values():
+        path = Path(workdir) / context / dockerfile
+        if not path.is_file():
+            continue
+        aliases = set()
+        for image, alias in Dockerfile.read(path).stages():
+            if image and image.lower() != "scratch" and image not in aliases:
+                images.add(image)
+            if alias:
+                aliases.add(alias)
+    return sorted(images)
+
+
+class BuildCache:
+    """Index of build keys to image ids, plus hit/miss events."""
+
+    def __init__(self, root=None):
+        self.root = root
+        self.dir = state_dir(root) / CACHE_DIRNAME
+        self.dir.mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._resolved = {}
+
+    def _load(self, filename):
+        try:
+            with open(self.dir / filename, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def package_digest(self, service_dir):
+        """Return the SHA-256 over a service's package files, memoised by stamp."""
+        service_dir = Path(service_dir)
+        files = package_files(service_dir)
+        stamp = package_stamp(files)
+        with self._lock:
+            memo = self._load(PACKAGES_FILENAME)
+            known = memo.get(service_dir.name)
+        if known and known["stamp"] == stamp:
+            return known["sha256"]
+        digest = hashlib.sha256()
+        for name in sorted(files):
+            digest.update(f"{name}\0{_sha256_file(service_dir / name)}\n".encode())
+        result = digest.hexdigest()
+        with self._lock:
+            memo = self._load(PACKAGES_FILENAME)
+            memo[service_dir.name] = {"stamp": stamp, "sha256": result}
+            _atomic_write_json(self.dir / PACKAGES_FILENAME, memo)
+        return result
+
+    def _resolve(self, reference):
+        with self._lock:
+            if reference in self._resolved:
+                return self._resolved[reference]
+        digest = resolve_image(reference)
+        with self._lock:
+            self._resolved[reference] = digest
+        return digest
+
+    def key(self, service_dir, workdir, config, transforms=()):
+        """Return ``(key, parts)`` for building the stack in ``workdir``.
+
+        ``transforms`` are the names of the deploy transforms that produced it.
+        """
+        service_dir, workdir = Path(service_dir), Path(workdir)
+        builds = stack_builds(config)
+        generated = hashlib.sha256()
+        for path in sorted(p for p in service_dir.rglob("*") if p.is_file()):
+            relpath = path.relative_to(service_dir).as_posix()
+            if not is_bank_file(relpath.partition("/")[0]):
+                generated.update(f"{relpath}\0{_sha256_file(path)}\n".encode())
+        tree = hashlib.sha256(json.dumps(config, sort_keys=True).encode())
+        mounts = bind_sources(config, workdir)
+        for _, context, dockerfile in sorted(builds.values()):
+            path = workdir / context / dockerfile
+            if path.is_file():
+                tree.update(f"{context}/{dockerfile}\0{_sha256_file(path)}\n".encode())
+        parts = {
+            "version": KEY_VERSION,
+            "package": self.package_digest(service_dir),
+            "generated": generated.hexdigest(),
+            "tree": tree.hexdigest(),
+            "contexts": {f"{context}/{dockerfile}": context_digest(workdir / context, dockerfile, mounts)
+                         for _, context, dockerfile in sorted(set(builds.values()))
+                         if (workdir / context).is_dir()},
+            "transforms": sorted(transforms),
+            "bases": {image: self._resolve(image) for image in base_images(workdir, builds)},
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest(), parts
+
+    def lookup(self, key, builds):
+        """Re-tag the cached images of ``key``; return the entry on a hit, else ``None``."""
+        with self._lock:
+            entry = self._load(INDEX_FILENAME).get(key)
+        if entry is None or set(entry["images"]) != set(builds):
+            return None
+        if any(image_id(image) is None for image in entry["images"].values()):
+            return None
+        for service, (name, _, _) in builds.items():
+            if _docker("tag", entry["images"][service], name) is None:
+                return None
+        return entry
+
+    def store(self, key, service_id, builds, build_s):
+        """Record the images just built for ``key``."""
+        images = {service: image_id(name) for service, (name, _, _) in builds.items()}
+        if not images or None in images.values():
+            return False
+        with self._lock:
+            index = self._load(INDEX_FILENAME)
+            index[key] = {"service_id": service_id, "images": images, "build_s": round(build_s, 2),
+                          "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+            mine = sorted((k for k, e in index.items() if e["service_id"] == service_id),
+                          key=lambda k: index[k]["built_at"])
+            for old in mine[:-KEEP_PER_SERVICE]:
+                del index[old]
+            _atomic_write_json(self.dir / INDEX_FILENAME, index)
+        return True
+
+    def record(self, service_id, key, hit, seconds, saved_s=0.0):
+        event = {"at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "service_id": service_id,
+                 "key": key[:16], "result": "hit" if hit else "miss", "seconds": round(seconds, 2),
+                 "saved_s": round(saved_s, 2)}
+        with self._lock, open(self.dir / EVENTS_FILENAME, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+
+    def build(self, service_dir, workdir, transforms=()):
+        """Build the stack in ``workdir`` unless the cache has it; return ``"hit"`` or ``"miss"``.
+
+        ``transforms`` are the deploy transform callables that ran on ``workdir``.
+        """
+        service_dir = Path(service_dir)
+        started = time.monotonic()
+        config = json.loads(compose(workdir, "config", "--format", "json").stdout)
+        builds = stack_builds(config)
+        key, _ = self.key(service_dir, workdir, config, [transform_name(t) for t in transforms])
+        entry = self.lookup(key, builds) if builds else None
+        if entry is not None:
+            elapsed = time.monotonic() - started
+            self.record(service_dir.name, key, True, elapsed, entry["build_s"] - elapsed)
+            return "hit"
+        build_started = time.monotonic()
+        compose(workdir, "build")
+        if builds:
+            self.store(key, service_dir.name, builds, time.monotonic() - build_started)
+        self.record(service_dir.name, key, False, time.monotonic() - started)
+        return "miss"
+
+    def events(self):
+        try:
+            with open(self.dir / EVENTS_FILENAME, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def stats(self):
+        events = self.events()
+        hits = [e for e in events if e["result"] == "hit"]
+        return {
+            "entries": len(self._load(INDEX_FILENAME)),
+            "lookups": len(events),
+            "hits": len(hits),
+            "misses": len(events) - len(hits),
+            "hit_rate": round(len(hits) / len(events), 3) if events else 0.0,
+            "saved_s": round(sum(e["saved_s"] for e in hits), 1),
+            "miss_build_s": round(sum(e["seconds"] for e in events if e["result"] == "miss"), 1),
+        }
+
+    def prune(self):
+        """Drop index entries whose images no longer exist; return how many."""
+        with self._lock:
+            index = self._load(INDEX_FILENAME)
+            gone = [k for k, e in index.items() if any(image_id(i) is None for i in e["images"].values())]
+            for key in gone:
+                del index[key]
+            _atomic_write_json(self.dir / INDEX_FILENAME, index)
+        return len(gone)
+
+
+def prometheus(stats):
+    """Render :meth:`BuildCache.stats` in the Prometheus text exposition format."""
+    metrics = [
+        ("bank_buildcache_hits_total", "counter", "Builds skipped because the cache had the images.", "hits"),
+        ("bank_buildcache_misses_total", "counter", "Builds that ran.", "misses"),
+        ("bank_buildcache_saved_seconds_total", "counter", "Build seconds avoided by cache hits.", "saved_s"),
+        ("bank_buildcache_entries", "gauge", "Cached build results.", "entries"),
+    ]
+    lines = []
+    for name, kind, help_text, field in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {stats[field]}"]
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.buildcache", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    key = sub.add_parser("key", help="show the cache key of a deployed service and its parts")
+    key.add_argument("service_id")
+    key.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="parent of the deploy trees")
+    key.add_argument("--transform", action="append", default=[], metavar="NAME",
+                     help="deploy transform the tree was prepared with (repeatable)")
+    stats = sub.add_parser("stats", help="summarise hits, misses and build time saved")
+    stats.add_argument("--prometheus", action="store_true", help="print Prometheus text format")
+    sub.add_parser("prune", help="forget entries whose images were removed")
+
+    args = parser.parse_args(argv)
+    cache = BuildCache(args.root)
+    if args.command == "key":
+        service_dir = services_dir(args.root) / args.service_id
+        workdir = args.workdir / args.service_id
+        if compose_file(workdir) is None:
+            print(f"error: no deploy tree at {workdir}", file=sys.stderr)
+            return 1
+        config = json.loads(compose(workdir, "config", "--format", "json").stdout)
+        digest, parts = cache.key(service_dir, workdir, config, args.transform)
+        print(json.dumps({"key": digest, **parts}, indent=2))
+    elif args.command == "stats":
+        summary = cache.stats()
+        if args.prometheus:
+            sys.stdout.write(prometheus(summary))
+        else:
+            for name, value in summary.items():
+                print(f"{name:<14} {value}")
+    elif args.command == "prune":
+        print(f"pruned {cache.prune()} entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,498 @@
+"""Minimal Docker build contexts computed from the package listing.
+
+A ``COPY . .`` sends the whole extracted repository to the daemon:
+notebooks, screenshots, slide decks, the ``.git`` directory.  This module
+works out which files a build can actually use and excludes the rest with a
+``<Dockerfile>.dockerignore`` (BuildKit's per-Dockerfile ignore file, so a
+package's own ``.dockerignore`` is never overwritten; its rules are carried
+over instead).
+
+* When every ``COPY``/``ADD`` of the build names explicit sources, the
+  context is exactly those sources plus the Dockerfile: ``*`` followed by a
+  ``!`` exception per source.
+* When something copies the whole context, only files that cannot matter
+  at runtime are excluded.  These are VCS and editor metadata, and bulky
+  document and media files (``.ipynb``, images, video, PDFs, archives).
+  Such a file is kept when its name or one of its directories appears in a
+  string literal of the code, the Dockerfile or the compose file, or when it
+  lives under a directory web apps serve from (``static``, ``templates``
+  ...).
+* Sources built from ``ARG``/``ENV`` variables cannot be resolved, so such
+  builds are left alone.
+
+The file listing comes from :mod:`bank.archive_index` when the archive is
+indexed (from the zip otherwise), overlaid with the generated files.
+``report`` compares the context each build would send before and after.
+``tar`` streams the minimised context straight from the archive as a tar,
+ready for ``docker build -f Dockerfile - < ctx.tar``, without extracting.
+``measure`` times streaming the full and the minimised context and appends
+the result to ``.bank/bench/buildcontext.jsonl``.
+
+Usage::
+
+    python -m bank.buildcontext show <service_id>
+    python -m bank.buildcontext report [--top 20]
+    python -m bank.buildcontext tar <service_id> > context.tar
+    python -m bank.buildcontext measure <service_id> ...
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import tarfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+
+from . import services_dir, state_dir
+from .archive_index import open_index
+from .compose import ComposeError, build_spec, load_compose, services
+from .deploy import BuildContext, compose_file, is_bank_file, record_generated, top_level_dir
+from .dockerfile import Dockerfile, copy_sources
+from .metadata import iter_service_dirs
+from .parts import open_package_zip
+
+IGNORE_SUFFIX = ".dockerignore"
+BENCH_FILENAME = "buildcontext.jsonl"
+HEADER = "# Generated by bank.buildcontext; files no build step reads."
+METADATA_DIRS = frozenset({".git", ".github", ".gitlab", ".svn", ".hg", ".idea", ".vscode", "__pycache__",
+                           ".ipynb_checkpoints", ".pytest_cache", ".mypy_cache", ".tox"})
+BULKY_SUFFIXES = frozenset({
+    ".ipynb", ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".psd", ".xcf",
+    ".mp4", ".mov", ".avi", ".mkv", ".webm", ".mp3", ".wav", ".flac", ".ogg",
+    ".pdf", ".ppt", ".pptx", ".doc", ".docx", ".xls", ".xlsx", ".key", ".odp",
+    ".zip", ".tar", ".tgz", ".gz", ".bz2", ".xz", ".7z", ".rar",
+})
+# Directories web frameworks serve files from by convention.
+SERVED_DIRS = frozenset({"static", "templates", "public", "assets", "www", "resources", "media"})
+CODE_SUFFIXES = frozenset({
+    ".py", ".js", ".mjs", ".cjs", ".ts", ".tsx", ".jsx", ".vue", ".svelte", ".html", ".htm", ".css", ".scss",
+    ".java", ".kt", ".scala", ".go", ".rs", ".rb", ".php", ".cs", ".sh", ".json", ".yaml", ".yml", ".toml",
+    ".cfg", ".ini", ".conf", ".xml", ".properties", ".gradle", ".txt", ".env",
+})
+MAX_SCAN_BYTES = 1 << 20
+_LITERAL = re.compile(r"""["'`]([^"'`\n]{1,300})["'`]""")
+_WORD = re.compile(r"[^\s\"'=:,;()\[\]{}]+")
+
+
+class ContextError(Exception):
+    pass
+
+
+def _pattern_regex(pattern):
+    """Translate a ``.dockerignore`` pattern into a regex over relative paths."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            if pattern.startswith("/", i):
+                out.append("/?")
+                i += 1
+            continue
+        out.append("[^/]*" if ch == "*" else "[^/]" if ch == "?" else re.escape(ch))
+        i += 1
+    return re.compile("".join(out) + r"(?:/.*)?\Z")
+
+
+def parse_rules(lines):
+    """Return ``[(negated, regex)]`` from ``.dockerignore`` lines."""
+    rules = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        pattern = os.path.normpath(line[1:] if negated else line).lstrip("/")
+        if pattern in (".", ""):
+            continue
+        rules.append((negated, _pattern_regex(pattern)))
+    return rules
+
+
+def ignored(relpath, rules):
+    """True if ``relpath`` is excluded by ``rules`` (the last matching rule wins)."""
+    result = False
+    for negated, regex in rules:
+        if regex.match(relpath):
+            result = not negated
+    return result
+
+
+class Tree:
+    """File listing and contents of a deploy tree, without extracting it."""
+
+    def __init__(self, service_dir, index=None):
+        self.service_dir = Path(service_dir)
+        self.context = BuildContext(self.service_dir)
+        self.files = self._package_files(index)
+        for path in self.service_dir.rglob("*"):
+            relpath = path.relative_to(self.service_dir).as_posix()
+            if path.is_file() and not is_bank_file(relpath.partition("/")[0]):
+                self.files[relpath] = path.stat().st_size
+
+    def _package_files(self, index):
+        if index is not None:
+            archive = index.archive(self.service_dir.name)
+            if archive and not archive["error"]:
+                return {e["relpath"]: e["file_size"]
+                        for e in index.list(self.service_dir.name) if not e["is_dir"]}
+        return self.context.package_files()
+
+    def read(self, relpath):
+        return self.context.read(relpath)
+
+    def open_zip(self):
+        return open_package_zip(self.service_dir) if self.context.has_package else None
+
+    def close(self):
+        self.context.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class WorkdirTree(Tree):
+    """A prepared deploy tree on disk, including what earlier transforms added."""
+
+    def __init__(self, workdir):
+        self.service_dir = Path(workdir)
+        self.files = {}
+        for dirpath, _, filenames in os.walk(self.service_dir):
+            for name in filenames:
+                path = Path(dirpath, name)
+                if path.is_file():
+                    self.files[path.relative_to(self.service_dir).as_posix()] = path.stat().st_size
+
+    def read(self, relpath):
+        path = self.service_dir / relpath.lstrip("/")
+        return path.read_bytes() if path.is_file() else None
+
+    def open_zip(self):
+        return None
+
+    def close(self):
+        pass
+
+
+@dataclass
+class Build:
+    """One image build of a stack and the context it needs."""
+
+    service: str
+    context: str                 # relative to the tree root, "" for the root
+    dockerfile: str              # relative to the context
+    mode: str = "unchanged"      # "sources", "whole" or "unchanged"
+    rules: list = field(default_factory=list)
+    existing: list = field(default_factory=list)
+    reason: str = ""
+
+    @property
+    def ignore_path(self):
+        return f"{self.context}/{self.dockerfile}{IGNORE_SUFFIX}" if self.context else self.dockerfile + IGNORE_SUFFIX
+
+
+def _norm_source(source):
+    source = source.strip()
+    while source.startswith("./"):
+        source = source[2:]
+    return source.rstrip("/") or "."
+
+
+def _components(text):
+    found = set()
+    for token in text.replace("\\", "/").split("/"):
+        token = token.strip()
+        if token and token not in (".", ".."):
+            found.add(token)
+    return found
+
+
+def referenced_names(tree, relpaths):
+    """Return file and directory names mentioned in the tree's code and build files."""
+    names = set()
+    for relpath in relpaths:
+        name = PurePosixPath(relpath).name
+        suffix = PurePosixPath(relpath).suffix.lower()
+        build_file = name.startswith(("Dockerfile", "docker-compose", "compose.")) or suffix in (".sh",)
+        if not build_file and (suffix not in CODE_SUFFIXES or tree.files.get(relpath, 0) > MAX_SCAN_BYTES):
+            continue
+        data = tree.read(relpath)
+        if data is None:
+            continue
+        text = data[:MAX_SCAN_BYTES].decode("utf-8", errors="replace")
+        for literal in _LITERAL.findall(text):
+            names |= _components(literal)
+        if build_file:
+            for word in _WORD.findall(text):
+                names |= _components(word)
+    return names
+
+
+def _whole_context_rules(tree, prefix, dockerfile_path):
+    """Exclusions for a build that copies its whole context."""
+    files = {p[len(prefix):]: size for p, size in tree.files.items() if p.startswith(prefix)}
+    names = referenced_names(tree, [prefix + p for p in files] + [dockerfile_path])
+    excluded_dirs = set()
+    excluded = set()
+    for relpath in files:
+        parts = PurePosixPath(relpath).parts
+        meta = next((i for i, part in enumerate(parts[:-1]) if part in METADATA_DIRS), None)
+        if meta is not None:
+            excluded_dirs.add("/".join(parts[:meta + 1]))
+            continue
+        if PurePosixPath(relpath).suffix.lower() not in BULKY_SUFFIXES:
+            continue
+        if set(parts[:-1]) & SERVED_DIRS or set(parts) & names:
+            continue
+        excluded.add(relpath)
+    # Collapse directories whose every file is excluded into one pattern.
+    collapsed = set()
+    by_dir = {}
+    for relpath in files:
+        for depth in range(1, len(PurePosixPath(relpath).parts)):
+            by_dir.setdefault("/".join(PurePosixPath(relpath).parts[:depth]), []).append(relpath)
+    for directory in sorted(by_dir, key=lambda d: d.count("/")):
+        if any(directory.startswith(c + "/") for c in collapsed):
+            continue
+        if all(f in excluded for f in by_dir[directory]):
+            collapsed.add(directory)
+    rules = sorted(excluded_dirs) + sorted(collapsed)
+    rules += sorted(f for f in excluded if not any(f.startswith(d + "/") for d in collapsed))
+    return rules
+
+
+def plan_build(tree, service, context, dockerfile):
+    """Return the :class:`Build` for one compose service."""
+    context = _norm_source(context)
+    context = "" if context == "." else context
+    prefix = context + "/" if context else ""
+    build = Build(service, context, dockerfile)
+    dockerfile_path = prefix + dockerfile
+    data = tree.read(dockerfile_path)
+    if data is None:
+        build.reason = f"no {dockerfile_path}"
+        return build
+    existing = tree.read(dockerfile_path + IGNORE_SUFFIX) or tree.read(prefix + ".dockerignore")
+    build.existing = existing.decode("utf-8", errors="replace").splitlines() if existing else []
+    if HEADER in build.existing:
+        build.existing = build.existing[:build.existing.index(HEADER)]
+    while build.existing and not build.existing[-1].strip():
+        build.existing.pop()
+    sources = []
+    for instruction in Dockerfile(data.decode("utf-8", errors="surrogateescape")).instructions:
+        if instruction.keyword not in ("COPY", "ADD"):
+            continue
+        srcs, _, flags = copy_sources(instruction)
+        if "from" in flags or instruction.value.lstrip().startswith("<<"):
+            continue
+        for source in srcs:
+            if "://" in source:
+                continue
+            if "$" in source:
+                build.reason = f"source {source!r} uses a variable"
+                return build
+            sources.append(_norm_source(source))
+    if "." in sources:
+        build.mode = "whole"
+        build.rules = _whole_context_rules(tree, prefix, dockerfile_path)
+    else:
+        build.mode = "sources"
+        build.rules = ["*", f"!{dockerfile}"] + [f"!{source}" for source in dict.fromkeys(sources)]
+    if not build.rules:
+        build.mode = "unchanged"
+        build.reason = "nothing to exclude"
+    return build
+
+
+def stack_builds(tree, doc):
+    """Plan every built service of a compose document."""
+    builds = []
+    for name, service in services(doc).items():
+        spec = build_spec(service or {})
+        if spec:
+            builds.append(plan_build(tree, name, *spec))
+    return builds
+
+
+def plan_service(service_dir, tree):
+    path = compose_file(service_dir)
+    if path is not None:
+        try:
+            return stack_builds(tree, load_compose(path))
+        except ComposeError:
+            pass
+    if tree.read("Dockerfile") is not None:
+        return [plan_build(tree, Path(service_dir).name, ".", "Dockerfile")]
+    return []
+
+
+def ignore_text(build):
+    lines = list(build.existing)
+    if lines:
+        lines.append("")
+    return "\n".join(lines + [HEADER] + build.rules) + "\n"
+
+
+def context_bytes(tree, build, rules=None):
+    """Return ``(files, bytes)`` the build would send with ``rules`` (default: its existing ignore file)."""
+    prefix = build.context + "/" if build.context else ""
+    parsed = parse_rules(build.existing if rules is None else rules)
+    files = total = 0
+    for relpath, size in tree.files.items():
+        if relpath.startswith(prefix) and not ignored(relpath[len(prefix):], parsed):
+            files += 1
+            total += size
+    return files, total
+
+
+def write_tar(tree, build, out, minimal=True):
+    """Stream the build context of ``build`` to ``out`` as an uncompressed tar."""
+    prefix = build.context + "/" if build.context else ""
+    rules = parse_rules(build.existing + (build.rules if minimal else []))
+    generated = {p for p in tree.files if (tree.service_dir / p).is_file()}
+    zf = tree.open_zip()
+    top = top_level_dir(zf.namelist()) if zf is not None else None
+    try:
+        with tarfile.open(fileobj=out, mode="w|") as tar:
+            for relpath in sorted(tree.files):
+                if not relpath.startswith(prefix) or ignored(relpath[len(prefix):], rules):
+                    continue
+                info = tarfile.TarInfo(relpath[len(prefix):])
+                if relpath in generated:
+                    path = tree.service_dir / relpath
+                    info.size = path.stat().st_size
+                    info.mode = path.stat().st_mode & 0o777
+                    with open(path, "rb") as f:
+                        tar.addfile(info, f)
+                    continue
+                member = zf.getinfo(f"{top}/{relpath}" if top else relpath)
+                info.size = member.file_size
+                info.mode = (member.external_attr >> 16) & 0o777 or 0o644
+                with zf.open(member) as f:
+                    tar.addfile(info, f)
+    finally:
+        if zf is not None:
+            zf.close()
+
+
+def apply_to_workdir(service_dir, workdir):
+    """Deploy transform: write ``<Dockerfile>.dockerignore`` files into ``workdir``."""
+    workdir = Path(workdir)
+    builds = plan_service(workdir, WorkdirTree(workdir))
+    written = False
+    for build in builds:
+        if build.mode == "unchanged":
+            continue
+        (workdir / build.ignore_path).write_text(ignore_text(build), encoding="utf-8")
+        record_generated(workdir, workdir / build.ignore_path)
+        written = True
+    return written
+
+
+class _Sink(io.RawIOBase):
+    def __init__(self):
+        self.count = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.count += len(data)
+        return len(data)
+
+
+def measure(service_id, root=None):
+    """Time streaming a service's full and minimised build contexts."""
+    service_dir = services_dir(root) / service_id
+    record = {"service_id": service_id, "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "builds": []}
+    with Tree(service_dir) as tree:
+        for build in plan_service(service_dir, tree):
+            if build.mode == "unchanged":
+                continue
+            result = {"service": build.service, "mode": build.mode}
+            for label, minimal in (("full", False), ("minimal", True)):
+                sink = _Sink()
+                started = time.monotonic()
+                write_tar(tree, build, sink, minimal=minimal)
+                result[f"{label}_bytes"] = sink.count
+                result[f"{label}_s"] = round(time.monotonic() - started, 3)
+            record["builds"].append(result)
+    path = state_dir(root) / "bench"
+    path.mkdir(exist_ok=True)
+    with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.buildcontext", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print the ignore files a service would get")
+    show.add_argument("service_id")
+    report = sub.add_parser("report", help="context bytes before and after, for every indexed service")
+    report.add_argument("--top", type=int, default=20, help="list the N largest savings")
+    tar = sub.add_parser("tar", help="stream a minimised build context to stdout")
+    tar.add_argument("service_id")
+    tar.add_argument("--service", help="compose service to build (default: the first built one)")
+    tar.add_argument("--full", action="store_true", help="do not minimise")
+    ms = sub.add_parser("measure", help="time streaming full vs. minimised contexts")
+    ms.add_argument("service_ids", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "show":
+        service_dir = services_dir(args.root) / args.service_id
+        with Tree(service_dir) as tree:
+            for build in plan_service(service_dir, tree):
+                before, after = context_bytes(tree, build), context_bytes(tree, build, build.existing + build.rules)
+                print(f"# {build.service}: {build.ignore_path} ({build.mode}{', ' + build.reason if build.reason else ''})")
+                print(f"# {before[0]} files / {before[1]} bytes -> {after[0]} files / {after[1]} bytes")
+                if build.mode != "unchanged":
+                    print(ignore_text(build))
+    elif args.command == "report":
+        rows = []
+        totals = [0, 0]
+        with open_index(args.root) as index:
+            for service_id, service_dir in iter_service_dirs(args.root):
+                if not index.archive(service_id):
+                    continue
+                with Tree(service_dir, index) as tree:
+                    for build in plan_service(service_dir, tree):
+                        before = context_bytes(tree, build)[1]
+                        after = context_bytes(tree, build, build.existing + build.rules)[1]
+                        totals[0] += before
+                        totals[1] += after
+                        rows.append((before - after, service_id, build, before, after))
+        print(f"{len(rows)} builds: {totals[0] / 1e6:.1f} MB of context -> {totals[1] / 1e6:.1f} MB")
+        for saved, service_id, build, before, after in sorted(rows, key=lambda r: -r[0])[:args.top]:
+            print(f"  {service_id}  {build.service:<20} {build.mode:<9} {before / 1e6:9.1f} -> {after / 1e6:9.1f} MB")
+    elif args.command == "tar":
+        service_dir = services_dir(args.root) / args.service_id
+        with Tree(service_dir) as tree:
+            builds = [b for b in plan_service(service_dir, tree) if args.service in (None, b.service)]
+            if not builds:
+                print(f"error: {args.service_id}: no matching build", file=sys.stderr)
+                return 1
+            write_tar(tree, builds[0], sys.stdout.buffer, minimal=not args.full)
+    elif args.command == "measure":
+        for service_id in args.service_ids:
+            for result in measure(service_id, args.root)["builds"]:
+                print(f"{service_id}  {result['service']:<20} full {result['full_bytes'] / 1e6:9.1f} MB "
+                      f"{result['full_s']:7.2f} s  minimal {result['minimal_bytes'] / 1e6:9.1f} MB "
+                      f"{result['minimal_s']:7.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
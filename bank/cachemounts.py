@@ -0,0 +1,322 @@
+"""BuildKit cache mounts for pip, Maven, Gradle and Node package managers.
+
+Every ``RUN`` that invokes a package manager gains a
+``--mount=type=cache`` for that tool's download cache.  Cache ids are shared
+across services (``bank-pip``, ``bank-m2`` ...), so a dependency fetched by
+one build is a cache hit for every other build on the same builder, and a
+rebuild of the same service re-resolves its graph without the network.
+
+Gradle's caches live under ``GRADLE_USER_HOME``: the value an ``ENV`` in
+the stage (or an ``export`` in the ``RUN`` itself) sets, else
+``/home/gradle/.gradle`` in stages built from the ``gradle`` image, else
+``/root/.gradle``.
+
+``pip install --no-cache-dir`` and ``ENV PIP_NO_CACHE_DIR=1`` are removed,
+since they would make pip ignore the mounted cache.  ``RUN`` instructions
+executing as a non-root ``USER`` are left alone because the cache location
+depends on that user's home and uid.
+
+``bench`` measures what the mounts buy: it builds a service once from the
+original Dockerfile and twice from the rewritten one, all with
+``--no-cache`` so every ``RUN`` executes.  The rewritten Dockerfile uses
+cache ids unique to the bench run, so the first rewritten build starts from
+empty mounts (cold) whatever other builds left in the shared caches, and
+the second runs against them (warm).  Afterwards the images the bench
+built are removed and its cache mounts pruned (found by their id in
+``docker buildx du --verbose``), so repeated benches do not pile up
+gigabytes of Maven and Gradle caches.  Results are appended to
+``.bank/bench/cachemounts.jsonl``.
+
+``rewrite`` prints the diff for the generated Dockerfile; with ``--apply``
+it rewrites the Dockerfile of the deploy tree ``<workdir>/<service_id>``
+instead, never the committed one under ``services/``.
+
+Usage::
+
+    python -m bank.cachemounts stats
+    python -m bank.cachemounts rewrite <service_id> [--apply [--workdir DIR]]
+    python -m bank.cachemounts bench <service_id> ...
+"""
+
+import argparse
+import difflib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .deploy import DEFAULT_WORKDIR, prepare_workdir
+from .dockerfile import Dockerfile, add_run_flags, from_image, split_shell_commands
+from .metadata import iter_service_dirs
+
+# tool -> [(cache id, target)]; "{gradle}" is the stage's GRADLE_USER_HOME
+CACHES = {
+    "pip": [("bank-pip", "/root/.cache/pip")],
+    "uv": [("bank-uv", "/root/.cache/uv")],
+    "maven": [("bank-m2", "/root/.m2/repository")],
+    "gradle": [("bank-gradle-caches", "{gradle}/caches"), ("bank-gradle-wrapper", "{gradle}/wrapper")],
+    "npm": [("bank-npm", "/root/.npm")],
+    "yarn": [("bank-yarn", "/usr/local/share/.cache/yarn")],
+    "pnpm": [("bank-pnpm", "/root/.local/share/pnpm/store")],
+}
+_COMMANDS = {
+    "pip": "pip", "pip3": "pip", "uv": "uv",
+    "mvn": "maven", "mvnw": "maven",
+    "gradle": "gradle", "gradlew": "gradle",
+    "npm": "npm", "yarn": "yarn", "pnpm": "pnpm",
+}
+_NPM_INSTALLS = frozenset({"install", "i", "ci", "add", "update"})
+_NO_CACHE_DIR = re.compile(r"\s--no-cache-dir\b")
+_PIP_NO_CACHE_ENV = re.compile(r"^\s*ENV\s+PIP_NO_CACHE_DIR[= ]\S+\s*$", re.IGNORECASE)
+_ROOT_USERS = frozenset({"", "root", "0", "0:0", "root:root"})
+_GRADLE_USER_HOME = re.compile(r"\bGRADLE_USER_HOME[= ]\s*([^\s;&|$]+)")
+DEFAULT_GRADLE_HOME = "/root/.gradle"
+GRADLE_IMAGE_HOME = "/home/gradle/.gradle"
+BENCH_FILENAME = "cachemounts.jsonl"
+
+
+def tools_used(command):
+    """Return the set of cacheable tools a shell command line invokes."""
+    tools = set()
+    for words in split_shell_commands(command):
+        while words and ("=" in words[0] and not words[0].startswith("-") or words[0] in ("sudo", "exec")):
+            words = words[1:]
+        if not words:
+            continue
+        name = os.path.basename(words[0])
+        name = re.sub(r"^(pip3)\.\d+$", r"\1", name)
+        if re.fullmatch(r"python3?(\.\d+)?", name) and words[1:3] == ["-m", "pip"]:
+            name = "pip"
+        tool = _COMMANDS.get(name)
+        if tool in ("npm", "yarn", "pnpm"):
+            # Only installs touch the package cache; `npm run build` does not.
+            args = [w for w in words[1:] if not w.startswith("-")]
+            if tool == "yarn" and not args:
+                args = ["install"]
+            if not args or args[0] not in _NPM_INSTALLS:
+                continue
+        if tool == "pip" and "install" not in words and "wheel" not in words and "download" not in words:
+            continue
+        if tool:
+            tools.add(tool)
+    return tools
+
+
+def cache_mounts(tool, gradle_home=DEFAULT_GRADLE_HOME):
+    """Return the ``(cache id, target)`` pairs of ``tool``."""
+    return [(cache_id, target.format(gradle=gradle_home)) for cache_id, target in CACHES[tool]]
+
+
+def mount_flags(tools, gradle_home=DEFAULT_GRADLE_HOME, id_suffix=""):
+    return [
+        f"--mount=type=cache,id={cache_id}{id_suffix},target={target}"
+        for tool in sorted(tools)
+        for cache_id, target in cache_mounts(tool, gradle_home)
+    ]
+
+
+def _image_gradle_home(image):
+    name = image.rpartition("/")[2].partition("@")[0].partition(":")[0]
+    return GRADLE_IMAGE_HOME if name == "gradle" else DEFAULT_GRADLE_HOME
+
+
+def rewrite(dockerfile, id_suffix=""):
+    """Add cache mounts to ``dockerfile`` in place; return ``Counter`` of tools.
+
+    ``id_suffix`` is appended to every cache id, to keep the mounts apart
+    from the shared ones.
+    """
+    added = Counter()
+    user = ""
+    stage, gradle_home = None, DEFAULT_GRADLE_HOME
+    homes = {}                                      # stage alias -> GRADLE_USER_HOME
+    index = 0
+    while index < len(dockerfile.instructions):
+        instruction = dockerfile.instructions[index]
+        index += 1
+        if instruction.keyword == "FROM":
+            image, stage = from_image(instruction)
+            user = ""
+            gradle_home = homes[image] if image in homes else _image_gradle_home(image)
+            homes[stage] = gradle_home
+        elif instruction.keyword == "USER":
+            user = instruction.value.strip()
+        elif instruction.keyword == "ENV" and _GRADLE_USER_HOME.search(instruction.value):
+            gradle_home = _GRADLE_USER_HOME.search(instruction.value).group(1).strip("\"'")
+            homes[stage] = gradle_home
+        elif instruction.keyword == "ENV" and _PIP_NO_CACHE_ENV.match("\n".join(dockerfile.source(instruction))):
+            dockerfile.replace(instruction, [])
+            index -= 1
+        elif instruction.keyword == "RUN" and user in _ROOT_USERS:
+            flags, command = instruction.flags_and_command()
+            tools = tools_used(command)
+            exported = _GRADLE_USER_HOME.search(command)
+            home = exported.group(1).strip("\"'") if exported else gradle_home
+            have = " ".join(flags.get("mount", []))
+            tools = {t for t in tools if not all(f"target={target}" in have for _, target in cache_mounts(t, home))}
+            if not tools:
+                continue
+            lines = dockerfile.source(instruction)
+            if "pip" in tools:
+                lines = [_NO_CACHE_DIR.sub("", line) for line in lines]
+            dockerfile.replace(instruction, add_run_flags(lines, mount_flags(tools, home, id_suffix)))
+            added.update(tools)
+    if added:
+        dockerfile.ensure_syntax_directive()
+    return added
+
+
+def apply_to_workdir(service_dir, workdir):
+    """Deploy transform: add cache mounts to ``workdir/Dockerfile``."""
+    path = Path(workdir) / "Dockerfile"
+    if not path.is_file():
+        return False
+    dockerfile = Dockerfile.read(path)
+    if not rewrite(dockerfile):
+        return False
+    path.write_text(dockerfile.text(), encoding="utf-8", errors="surrogateescape")
+    return True
+
+
+def stats(root=None):
+    """Return ``(per_tool_runs, services_changed, services_total)`` for the bank."""
+    per_tool = Counter()
+    changed = total = 0
+    for _, service_dir in iter_service_dirs(root):
+        path = service_dir / "Dockerfile"
+        if not path.is_file():
+            continue
+        total += 1
+        added = rewrite(Dockerfile.read(path))
+        per_tool.update(added)
+        changed += bool(added)
+    return per_tool, changed, total
+
+
+def _build(workdir, tag, dockerfile):
+    env = dict(os.environ, DOCKER_BUILDKIT="1")
+    cmd = ["docker", "build", "--no-cache", "--progress=plain", "-t", tag, "-f", dockerfile, "."]
+    started = time.monotonic()
+    result = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+    return time.monotonic() - started, result.returncode == 0
+
+
+def _image_id(tag):
+    result = subprocess.run(["docker", "image", "inspect", "--format", "{{.Id}}", tag], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _cache_records(id_suffix):
+    """Return the BuildKit record ids of the cache mounts whose id ends in ``id_suffix``."""
+    result = subprocess.run(["docker", "buildx", "du", "--verbose"], capture_output=True, text=True)
+    if result.returncode != 0:
+        return []
+    records, record = [], None
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition(":")
+        if key == "ID":
+            record = value.strip()
+        elif key == "Description" and f'{id_suffix}"' in value and record:
+            records.append(record)      # 'cached mount <target> from exec ... with id "<id>"'
+    return records
+
+
+def _cleanup(images, id_suffix, log=print):
+    """Remove the bench's images and prune the cache mounts it created."""
+    if images:
+        subprocess.run(["docker", "image", "rm", "--force", *sorted(images)], capture_output=True)
+    records = _cache_records(id_suffix)
+    for record in records:
+        subprocess.run(["docker", "builder", "prune", "--force", "--filter", f"id={record}"], capture_output=True)
+    if records:
+        log(f"pruned {len(records)} bench cache mounts (*{id_suffix})")
+
+
+def bench(service_id, root=None, log=print):
+    """Build one service cold (original) and cold/warm (rewritten)."""
+    service_dir = services_dir(root) / service_id
+    with tempfile.TemporaryDirectory(prefix=f"bank-bench-{service_id}-") as tmp:
+        prepare_workdir(service_dir, tmp)
+        original = Dockerfile.read(Path(tmp) / "Dockerfile")
+        rewritten = Dockerfile(original.text())
+        id_suffix = f"-bench-{os.urandom(4).hex()}"
+        tools = rewrite(rewritten, id_suffix=id_suffix)
+        (Path(tmp) / "Dockerfile.cachemounts").write_text(rewritten.text(), encoding="utf-8",
+                                                           errors="surrogateescape")
+        tag = f"bank-bench/{service_id}"
+        record = {"service_id": service_id, "tools": sorted(tools),
+                  "at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        images = set()
+        try:
+            for label, dockerfile in (("baseline", "Dockerfile"), ("cold", "Dockerfile.cachemounts"),
+                                      ("warm", "Dockerfile.cachemounts")):
+                seconds, ok = _build(tmp, tag, dockerfile)
+                images.add(_image_id(tag) if ok else None)
+                record[f"{label}_s"] = round(seconds, 2)
+                record[f"{label}_ok"] = ok
+                log(f"{service_id}  {label:<8} {seconds:8.1f} s  {'ok' if ok else 'FAILED'}")
+                if not ok:
+                    break
+        finally:
+            _cleanup(images - {None}, id_suffix, log)
+    path = state_dir(root) / "bench"
+    path.mkdir(exist_ok=True)
+    with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.cachemounts", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="count the RUN instructions that would gain cache mounts")
+    rw = sub.add_parser("rewrite", help="show (or apply) the rewrite of generated Dockerfiles")
+    rw.add_argument("service_ids", nargs="+")
+    rw.add_argument("--apply", action="store_true", help="rewrite the Dockerfile of the deploy tree")
+    rw.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="parent of the deploy trees")
+    bn = sub.add_parser("bench", help="measure baseline, cold and warm build times")
+    bn.add_argument("service_ids", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "stats":
+        per_tool, changed, total = stats(args.root)
+        print(f"{changed} of {total} Dockerfiles gain cache mounts")
+        for tool, n in per_tool.most_common():
+            print(f"  {n:>5}  {tool}")
+    elif args.command == "rewrite":
+        for service_id in args.service_ids:
+            if args.apply:
+                workdir = args.workdir / service_id
+                if not (workdir / "Dockerfile").is_file():
+                    print(f"error: no deploy tree with a Dockerfile at {workdir}", file=sys.stderr)
+                    return 1
+                apply_to_workdir(services_dir(args.root) / service_id, workdir)
+                continue
+            dockerfile = Dockerfile.read(services_dir(args.root) / service_id / "Dockerfile")
+            before = dockerfile.text()
+            if rewrite(dockerfile):
+                sys.stdout.writelines(difflib.unified_diff(
+                    before.splitlines(True), dockerfile.text().splitlines(True),
+                    f"a/{service_id}/Dockerfile", f"b/{service_id}/Dockerfile"))
+    elif args.command == "bench":
+        failed = 0
+        for service_id in args.service_ids:
+            record = bench(service_id, args.root)
+            failed += not record.get("warm_ok", False)
+            if record.get("warm_ok"):
+                saved = record["baseline_s"] - record["warm_s"]
+                print(f"{service_id}  warm build {saved:+.1f} s vs baseline")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
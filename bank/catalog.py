@@ -0,0 +1,599 @@
+"""Persistent, incrementally refreshed index over ``services/*/metadata.json``.
+
+The catalog is a SQLite database kept at ``.bank/catalog.sqlite``.  A refresh
+only stats each ``metadata.json`` and re-parses the files whose mtime or size
+changed since the last run, so keeping it current is cheap.  Queries go
+through indexed columns and answer in milliseconds.
+
+Each row also carries the package's exact size in bytes, measured rather
+than parsed from the free-text ``package_size``.  It is the size of
+``source.zip`` (or the size recorded in a git-LFS pointer), the manifest
+total of a split package, or the sum of a complete part set.  Only when
+none of those is available is it parsed from ``package_size``;
+``size_source`` records which one was used.  Package files are restamped on
+every refresh, so a re-uploaded package is re-measured even when its
+``metadata.json`` did not change.
+
+The ``integrity`` table holds the last result of :mod:`bank.integrity`
+for every package.  It is not derived from ``metadata.json`` and survives
+schema rebuilds.  ``query --integrity corrupt`` filters on it.  The
+``footprints`` table likewise keeps the CPU, memory and I/O measured by
+:mod:`bank.footprint`, one row per service and phase.
+
+Per ``language``, ``repo_flag`` and ``status`` (and bank-wide, as
+``all``/``*``) the ``aggregates`` table keeps the service count, total
+bytes, p50/p95 package size and the largest packages.  A refresh recomputes
+only the groups whose members changed.
+
+A ``metadata.json`` that cannot be read or parsed does not stop a refresh:
+the service keeps its previous row (or gets none), is counted as
+``invalid`` and logged, and is read again on the next refresh.
+
+Usage::
+
+    python -m bank.catalog refresh
+    python -m bank.catalog query --status deploying --language python
+    python -m bank.catalog query --repo-flag PYTHON-vllm --order-by=-star
+    python -m bank.catalog query --min-bytes 100000000 --order-by=-package_bytes
+    python -m bank.catalog sizes --by language
+    python -m bank.catalog query --integrity corrupt
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from . import state_dir
+from .metadata import METADATA_FILENAME, iter_service_dirs, load_metadata
+from .parts import MANIFEST_FILENAME, PART_PREFIX, SOURCE_FILENAME, contiguity_problems, load_manifest
+
+log = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "catalog.sqlite"
+
+# Metadata keys stored as plain columns, in table order.
+COLUMNS = (
+    "service_id",
+    "repo_name",
+    "platform",
+    "ref",
+    "version",
+    "status",
+    "package_size",
+    "language",
+    "star",
+    "repo_flag",
+    "uploaded_at",
+)
+INDEXED_COLUMNS = ("status", "language", "repo_flag", "platform", "star", "uploaded_at", "package_bytes")
+ORDERABLE_COLUMNS = frozenset(COLUMNS + ("package_bytes",))
+AGGREGATE_DIMENSIONS = ("language", "repo_flag", "status")
+LARGEST_N = 10
+SCHEMA_VERSION = 2
+# source.zip files this small may be git-LFS pointers.
+LFS_POINTER_MAX = 1024
+
+_LFS_SIZE = re.compile(rb"^size (\d+)\s*$", re.MULTILINE)
+_PACKAGE_SIZE = re.compile(r"^\s*([\d.]+)\s*([KMGT]?)B?\s*$", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS services (
+    service_id      TEXT PRIMARY KEY,
+    repo_name       TEXT,
+    platform        TEXT,
+    ref             TEXT,
+    version         TEXT,
+    status          TEXT,
+    package_size    TEXT,
+    language        TEXT,
+    star            INTEGER,
+    repo_flag       TEXT,
+    uploaded_at     TEXT,
+    generated_files TEXT,
+    meta_mtime_ns   INTEGER NOT NULL,
+    meta_size       INTEGER NOT NULL,
+    package_bytes   INTEGER,
+    size_source     TEXT,
+    package_stamp   TEXT
+);
+CREATE TABLE IF NOT EXISTS aggregates (
+    dimension       TEXT NOT NULL,
+    value           TEXT,
+    services        INTEGER NOT NULL,
+    sized           INTEGER NOT NULL,
+    total_bytes     INTEGER NOT NULL,
+    p50_bytes       INTEGER,
+    p95_bytes       INTEGER,
+    largest         TEXT NOT NULL,
+    PRIMARY KEY (dimension, value)
+);
+CREATE TABLE IF NOT EXISTS integrity (
+    service_id      TEXT PRIMARY KEY,
+    layout          TEXT NOT NULL,
+    size            INTEGER NOT NULL,
+    mtime_ns        INTEGER NOT NULL,
+    status          TEXT NOT NULL,
+    members         INTEGER,
+    checked_bytes   INTEGER,
+    bad_members     TEXT,
+    error           TEXT,
+    seconds         REAL,
+    checked_at      REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS integrity_runs (
+    run_id          INTEGER PRIMARY KEY,
+    started_at      REAL NOT NULL,
+    finished_at     REAL
+);
+CREATE TABLE IF NOT EXISTS footprints (
+    service_id      TEXT NOT NULL,
+    phase           TEXT NOT NULL,
+    source          TEXT NOT NULL,
+    seconds         REAL,
+    samples         INTEGER,
+    cpu_p50         REAL,
+    cpu_p95         REAL,
+    peak_rss_mb     REAL,
+    read_bps        REAL,
+    write_bps       REAL,
+    requests        INTEGER,
+    errors          INTEGER,
+    measured_at     TEXT NOT NULL,
+    PRIMARY KEY (service_id, phase)
+);
+"""
+INTEGRITY_COLUMNS = ("service_id", "layout", "size", "mtime_ns", "status", "members", "checked_bytes",
+                     "bad_members", "error", "seconds", "checked_at")
+FOOTPRINT_COLUMNS = ("service_id", "phase", "source", "seconds", "samples", "cpu_p50", "cpu_p95", "peak_rss_mb",
+                     "read_bps", "write_bps", "requests", "errors", "measured_at")
+
+
+class Catalog:
+    """SQLite-backed view of every service's metadata."""
+
+    def __init__(self, root=None, path=None):
+        self.root = root
+        self.path = path or state_dir(root) / CATALOG_FILENAME
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.conn:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # Everything here is derived from the tree; rebuild older layouts.
+                self.conn.executescript("DROP TABLE IF EXISTS services; DROP TABLE IF EXISTS aggregates;")
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.executescript(SCHEMA)
+            for column in INDEXED_COLUMNS:
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_services_{column} ON services ({column})"
+                )
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self):
+        """Bring the catalog in line with the tree.
+
+        Returns a dict with the number of ``added``, ``updated``, ``removed``,
+        ``unchanged`` and ``invalid`` services.
+        """
+        known = {
+            row["service_id"]: row
+            for row in self.conn.execute(
+                "SELECT service_id, meta_mtime_ns, meta_size, package_stamp, "
+                + ", ".join(AGGREGATE_DIMENSIONS) + " FROM services")
+        }
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "invalid": 0}
+        seen = set()
+        rows = []
+        dirty = set()
+        for service_id, path in iter_service_dirs(self.root):
+            try:
+                st = os.stat(path / METADATA_FILENAME)
+            except FileNotFoundError:
+                continue
+            seen.add(service_id)
+            stamp = (st.st_mtime_ns, st.st_size)
+            files = package_files(path)
+            files_stamp = package_stamp(files)
+            previous = known.get(service_id)
+            if previous is not None and (previous["meta_mtime_ns"], previous["meta_size"],
+                                         previous["package_stamp"]) == (*stamp, files_stamp):
+                stats["unchanged"] += 1
+                continue
+            try:
+                meta = load_metadata(path)
+                if not isinstance(meta, dict):
+                    raise ValueError(f"expected an object, got {type(meta).__name__}")
+            except (OSError, ValueError) as exc:
+                log.warning("skipping %s: %s", path / METADATA_FILENAME, exc)
+                stats["invalid"] += 1
+                continue
+            stats["updated" if previous else "added"] += 1
+            row = _row(meta, service_id, stamp)
+            row.extend(measure_package(path, files, meta.get("package_size")))
+            row.append(files_stamp)
+            rows.append(row)
+            dirty.update(_groups(dict(zip(COLUMNS, row))))
+            if previous is not None:
+                dirty.update(_groups(previous))
+        removed = [(sid,) for sid in known if sid not in seen]
+        for (sid,) in removed:
+            dirty.update(_groups(known[sid]))
+        stats["removed"] = len(removed)
+        with self.conn:
+            placeholders = ", ".join("?" * (len(COLUMNS) + 6))
+            self.conn.executemany(f"INSERT OR REPLACE INTO services VALUES ({placeholders})", rows)
+            self.conn.executemany("DELETE FROM services WHERE service_id = ?", removed)
+            if not self.conn.execute("SELECT 1 FROM aggregates LIMIT 1").fetchone():
+                dirty = {("all", "*")} | {
+                    (dimension, value)
+                    for dimension in AGGREGATE_DIMENSIONS
+                    for (value,) in self.conn.execute(f"SELECT DISTINCT {dimension} FROM services")
+                }
+            for dimension, value in dirty:
+                self._update_aggregate(dimension, value)
+        return stats
+
+    def _update_aggregate(self, dimension, value):
+        where, params = ("1", ()) if dimension == "all" else (f"{dimension} IS ?", (value,))
+        count = self.conn.execute(f"SELECT COUNT(*) FROM services WHERE {where}", params).fetchone()[0]
+        if not count:
+            self.conn.execute("DELETE FROM aggregates WHERE dimension = ? AND value IS ?", (dimension, value))
+            return
+        sizes = [size for (size,) in self.conn.execute(
+            f"SELECT package_bytes FROM services WHERE {where} AND package_bytes IS NOT NULL "
+            "ORDER BY package_bytes", params)]
+        largest = self.conn.execute(
+            f"SELECT service_id, package_bytes FROM services WHERE {where} AND package_bytes IS NOT NULL "
+            "ORDER BY package_bytes DESC, service_id LIMIT ?", (*params, LARGEST_N)).fetchall()
+        self.conn.execute("DELETE FROM aggregates WHERE dimension = ? AND value IS ?", (dimension, value))
+        self.conn.execute(
+            "INSERT INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (dimension, value, count, len(sizes), sum(sizes), percentile(sizes, 50), percentile(sizes, 95),
+             json.dumps([list(row) for row in largest])),
+        )
+
+    def aggregates(self, dimension="all"):
+        """Return ``{value: {...}}`` size aggregates for one dimension.
+
+        ``dimension`` is ``"all"`` (a single ``"*"`` group) or one of
+        :data:`AGGREGATE_DIMENSIONS`.
+        """
+        if dimension != "all" and dimension not in AGGREGATE_DIMENSIONS:
+            raise ValueError(f"no aggregates by {dimension!r}")
+        result = {}
+        for row in self.conn.execute(
+                "SELECT * FROM aggregates WHERE dimension = ? ORDER BY total_bytes DESC", (dimension,)):
+            entry = {key: row[key] for key in ("services", "sized", "total_bytes", "p50_bytes", "p95_bytes")}
+            entry["largest"] = [tuple(item) for item in json.loads(row["largest"])]
+            result[row["value"]] = entry
+        return result
+
+    def get(self, service_id):
+        """Return one service's metadata, or ``None`` if it is unknown."""
+        row = self.conn.execute("SELECT * FROM services WHERE service_id = ?", (service_id,)).fetchone()
+        return _record(row) if row else None
+
+    def status_stamps(self):
+        """Return ``{service_id: (status, meta_mtime_ns)}`` for every service."""
+        return {row[0]: (row[1], row[2]) for row in
+                self.conn.execute("SELECT service_id, status, meta_mtime_ns FROM services")}
+
+    def query(
+        self,
+        status=None,
+        language=None,
+        repo_flag=None,
+        platform=None,
+        repo_name=None,
+        min_star=None,
+        max_star=None,
+        uploaded_after=None,
+        uploaded_before=None,
+        min_bytes=None,
+        max_bytes=None,
+        integrity=None,
+        order_by="service_id",
+        limit=None,
+    ):
+        """Return metadata dicts matching every given filter.
+
+        ``order_by`` is a column name, prefixed with ``-`` for descending order.
+        """
+        clauses, params = [], []
+        for column, value in (
+            ("status", status),
+            ("language", language),
+            ("repo_flag", repo_flag),
+            ("platform", platform),
+            ("repo_name", repo_name),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        for clause, value in (
+            ("star >= ?", min_star),
+            ("star <= ?", max_star),
+            ("uploaded_at >= ?", uploaded_after),
+            ("uploaded_at < ?", uploaded_before),
+            ("package_bytes >= ?", min_bytes),
+            ("package_bytes <= ?", max_bytes),
+            ("service_id IN (SELECT service_id FROM integrity WHERE status = ?)", integrity),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = "SELECT * FROM services"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY " + _order_clause(order_by)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [_record(row) for row in self.conn.execute(sql, params)]
+
+    def integrity(self, service_id=None):
+        """Return ``{service_id: result}`` of the last integrity checks (of one service)."""
+        sql, params = "SELECT * FROM integrity", ()
+        if service_id is not None:
+            sql, params = sql + " WHERE service_id = ?", (service_id,)
+        results = {}
+        for row in self.conn.execute(sql + " ORDER BY service_id", params):
+            result = dict(row)
+            result["bad_members"] = json.loads(result["bad_members"] or "[]")
+            results[row["service_id"]] = result
+        return results
+
+    def record_integrity(self, result):
+        """Store one integrity result (a dict with :data:`INTEGRITY_COLUMNS`) and commit."""
+        values = dict(result, bad_members=json.dumps(result.get("bad_members") or []))
+        placeholders = ", ".join("?" * len(INTEGRITY_COLUMNS))
+        with self.conn:
+            self.conn.execute(f"INSERT OR REPLACE INTO integrity VALUES ({placeholders})",
+                              [values.get(column) for column in INTEGRITY_COLUMNS])
+
+    def forget_integrity(self, service_ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM integrity WHERE service_id = ?", [(sid,) for sid in service_ids])
+
+    def integrity_run(self):
+        """Return ``(run_id, started_at, resumed)`` for a full integrity audit.
+
+        An unfinished audit is resumed rather than restarted.
+        """
+        row = self.conn.execute(
+            "SELECT run_id, started_at FROM integrity_runs WHERE finished_at IS NULL "
+            "ORDER BY run_id DESC LIMIT 1").fetchone()
+        if row:
+            return row["run_id"], row["started_at"], True
+        started = time.time()
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO integrity_runs (started_at) VALUES (?)", (started,))
+        return cursor.lastrowid, started, False
+
+    def finish_integrity_run(self, run_id):
+        with self.conn:
+            self.conn.execute("UPDATE integrity_runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def footprints(self, service_id=None):
+        """Return ``{service_id: {phase: row}}`` of the measured footprints (of one service)."""
+        sql, params = "SELECT * FROM footprints", ()
+        if service_id is not None:
+            sql, params = sql + " WHERE service_id = ?", (service_id,)
+        footprints = {}
+        for row in self.conn.execute(sql + " ORDER BY service_id, phase DESC", params):
+            footprints.setdefault(row["service_id"], {})[row["phase"]] = dict(row)
+        return footprints
+
+    def record_footprint(self, result):
+        """Replace a service's footprint with the phases of one :mod:`bank.footprint` result and commit."""
+        placeholders = ", ".join("?" * len(FOOTPRINT_COLUMNS))
+        with self.conn:
+            self.conn.execute("DELETE FROM footprints WHERE service_id = ?", (result["service_id"],))
+            for phase, stats in result["phases"].items():
+                if stats is None:
+                    continue
+                values = dict(stats, service_id=result["service_id"], phase=phase, source=result["source"],
+                              measured_at=result["at"])
+                self.conn.execute(f"INSERT INTO footprints VALUES ({placeholders})",
+                                  [values.get(column) for column in FOOTPRINT_COLUMNS])
+
+    def count_by(self, column):
+        """Return ``{value: count}`` for one of the catalog columns."""
+        if column not in ORDERABLE_COLUMNS:
+            raise ValueError(f"unknown column: {column}")
+        sql = f"SELECT {column}, COUNT(*) FROM services GROUP BY {column} ORDER BY 2 DESC"
+        return dict(self.conn.execute(sql).fetchall())
+
+
+def open_catalog(root=None, refresh=True):
+    """Open the catalog for ``root``, refreshing it from the tree by default."""
+    catalog = Catalog(root)
+    if refresh:
+        catalog.refresh()
+    return catalog
+
+
+def package_files(path):
+    """Return ``{name: (size, mtime_ns)}`` for the package files of a service."""
+    files = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name in (SOURCE_FILENAME, MANIFEST_FILENAME) or entry.name.startswith(PART_PREFIX):
+                st = entry.stat()
+                files[entry.name] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def package_stamp(files):
+    """Return a short digest of :func:`package_files`' result, to detect package changes."""
+    return hashlib.blake2b(repr(sorted(files.items())).encode(), digest_size=8).hexdigest()
+
+
+def parse_package_size(text):
+    """Return bytes for a ``package_size`` string such as ``"18.22MB"``, or ``None``."""
+    match = _PACKAGE_SIZE.match(str(text or ""))
+    if not match:
+        return None
+    return round(float(match.group(1)) * 1024 ** " KMGT".index(match.group(2).upper() or " "))
+
+
+def measure_package(path, files, package_size=None):
+    """Return ``(package_bytes, size_source)`` for one service directory."""
+    if SOURCE_FILENAME in files:
+        size = files[SOURCE_FILENAME][0]
+        if size <= LFS_POINTER_MAX:
+            with open(path / SOURCE_FILENAME, "rb") as f:
+                head = f.read(LFS_POINTER_MAX)
+            match = _LFS_SIZE.search(head) if head.startswith(b"version https://git-lfs") else None
+            if match:
+                return int(match.group(1)), "lfs-pointer"
+        return size, "source.zip"
+    if MANIFEST_FILENAME in files:
+        manifest = load_manifest(path)
+        if manifest and "total_size" in manifest:
+            return manifest["total_size"], "manifest"
+    parts = sorted(name for name in files if name.startswith(PART_PREFIX) and len(name) == len(PART_PREFIX) + 2)
+    if parts and not contiguity_problems(parts):
+        return sum(files[name][0] for name in parts), "parts"
+    parsed = parse_package_size(package_size)
+    return (parsed, "metadata") if parsed is not None else (None, None)
+
+
+def _groups(row):
+    return {("all", "*")} | {(dimension, row[dimension]) for dimension in AGGREGATE_DIMENSIONS}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list, or ``None`` if empty."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def _row(meta, service_id, stamp):
+    values = [meta.get(column) for column in COLUMNS]
+    values[0] = service_id
+    generated = meta.get("generated_files")
+    values.append(json.dumps(generated) if generated is not None else None)
+    values.extend(stamp)
+    return values
+
+
+def _record(row):
+    record = {column: row[column] for column in COLUMNS}
+    record["package_bytes"] = row["package_bytes"]
+    record["size_source"] = row["size_source"]
+    if row["generated_files"] is not None:
+        record["generated_files"] = json.loads(row["generated_files"])
+    return record
+
+
+def _order_clause(order_by):
+    descending = order_by.startswith("-")
+    column = order_by.lstrip("-")
+    if column not in ORDERABLE_COLUMNS:
+        raise ValueError(f"cannot order by {column!r}")
+    return f"{column} {'DESC' if descending else 'ASC'}, service_id"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.catalog", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("refresh", help="re-index changed metadata.json files")
+
+    query = sub.add_parser("query", help="list services matching filters")
+    query.add_argument("--status")
+    query.add_argument("--language")
+    query.add_argument("--repo-flag")
+    query.add_argument("--platform")
+    query.add_argument("--repo-name")
+    query.add_argument("--min-star", type=int)
+    query.add_argument("--max-star", type=int)
+    query.add_argument("--uploaded-after")
+    query.add_argument("--uploaded-before")
+    query.add_argument("--min-bytes", type=int)
+    query.add_argument("--max-bytes", type=int)
+    query.add_argument("--integrity", help="last integrity status (ok, corrupt, unreadable, lfs-pointer)")
+    query.add_argument("--order-by", default="service_id", help="column, \"-column\" for descending")
+    query.add_argument("--limit", type=int)
+    query.add_argument("--json", action="store_true", help="print full records as JSON lines")
+
+    count = sub.add_parser("count", help="count services grouped by a column")
+    count.add_argument("column", choices=sorted(ORDERABLE_COLUMNS))
+
+    sizes = sub.add_parser("sizes", help="show package size aggregates")
+    sizes.add_argument("--by", default="all", choices=("all",) + AGGREGATE_DIMENSIONS)
+    sizes.add_argument("--largest", type=int, default=0, help="also list the N largest packages per group")
+
+    args = parser.parse_args(argv)
+    with Catalog(args.root) as catalog:
+        started = time.perf_counter()
+        stats = catalog.refresh()
+        refreshed = time.perf_counter() - started
+        if args.command == "refresh":
+            print(json.dumps(stats), f"({refreshed * 1000:.1f} ms)")
+        elif args.command == "query":
+            try:
+                records = catalog.query(
+                    status=args.status,
+                    language=args.language,
+                    repo_flag=args.repo_flag,
+                    platform=args.platform,
+                    repo_name=args.repo_name,
+                    min_star=args.min_star,
+                    max_star=args.max_star,
+                    uploaded_after=args.uploaded_after,
+                    uploaded_before=args.uploaded_before,
+                    min_bytes=args.min_bytes,
+                    max_bytes=args.max_bytes,
+                    integrity=args.integrity,
+                    order_by=args.order_by,
+                    limit=args.limit,
+                )
+            except ValueError as exc:
+                parser.error(str(exc))
+            for record in records:
+                if args.json:
+                    print(json.dumps(record, ensure_ascii=False))
+                else:
+                    print(
+                        f"{record['service_id']}  {record['status']:<9}  {record['language']:<6}"
+                        f"  {record['star'] or 0:>7}  {record['repo_flag']:<16}  {record['repo_name']}"
+                    )
+        elif args.command == "count":
+            for value, n in catalog.count_by(args.column).items():
+                print(f"{n:>5}  {value}")
+        elif args.command == "sizes":
+            print(f"{'group':<20} {'services':>8} {'total MB':>10} {'p50 MB':>8} {'p95 MB':>8}")
+            for value, entry in catalog.aggregates(args.by).items():
+                mb = {k: (entry[k] or 0) / 1e6 for k in ("total_bytes", "p50_bytes", "p95_bytes")}
+                print(f"{str(value):<20} {entry['services']:>8} {mb['total_bytes']:>10.1f}"
+                      f" {mb['p50_bytes']:>8.2f} {mb['p95_bytes']:>8.2f}")
+                for service_id, size in entry["largest"][: args.largest]:
+                    print(f"    {service_id}  {size / 1e6:10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""Read-only HTTP service over the catalog with ETags, pagination and filters.
+
+Dashboards and deploy tooling list services from here instead of walking
+``services/``.  The server is a single asyncio loop speaking a small subset
+of HTTP/1.1 (``GET``/``HEAD``, keep-alive) with the standard library only.
+
+Endpoints (all JSON)::
+
+    GET /services?language=python&status=stopped&min_star=100&fields=service_id,star&limit=50
+    GET /services?cursor=<next from the previous page>
+    GET /services/<service_id>
+    GET /aggregates?by=language
+    GET /healthz
+
+Filters are ``language``, ``repo_flag``, ``status``, ``platform``,
+``integrity``, ``min_star`` and ``max_star``.  ``fields`` projects each
+record onto the listed keys.  Pages are ordered by service id.  ``next`` (also
+sent as a ``Link`` header) is an opaque cursor holding the last id served,
+so paging stays consistent while services are added or removed.
+
+Records are held in memory.  Statuses come from the status journal
+(:mod:`bank.journal`), so they are current even before compaction.  Every
+``--reload`` seconds the catalog is refreshed; if anything changed, a new
+dataset version is published.  A response is a pure function of the
+dataset version and the normalised query.  That pair is the strong ETag,
+and rendered bodies are cached per pair, so repeat polls cost a dict
+lookup.  ``If-None-Match`` with a current ETag gets ``304 Not Modified``.
+
+Usage::
+
+    python -m bank.catalog_server [--host 127.0.0.1] [--port 8750] [--reload 10]
+    python -m bank.catalog_server bench [--connections 16] [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import sys
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from .catalog import AGGREGATE_DIMENSIONS, open_catalog
+from .journal import Journal
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8750
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+RELOAD_SECONDS = 10
+CACHED_RESPONSES = 512
+MAX_HEADER_BYTES = 16 << 10
+KEEPALIVE_SECONDS = 30
+FILTERS = ("language", "repo_flag", "status", "platform", "integrity")
+RANGE_FILTERS = {"min_star": ("star", int.__ge__), "max_star": ("star", int.__le__)}
+QUERY_KEYS = frozenset(FILTERS) | frozenset(RANGE_FILTERS) | {"fields", "limit", "cursor"}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Dataset:
+    """One immutable version of the catalog as served."""
+
+    def __init__(self, records, aggregates):
+        self.records = sorted(records, key=lambda r: r["service_id"])
+        self.by_id = {r["service_id"]: r for r in self.records}
+        self.ids = [r["service_id"] for r in self.records]
+        self.aggregates = aggregates
+        digest = hashlib.blake2b(digest_size=12)
+        digest.update(json.dumps([self.records, aggregates], sort_keys=True, default=str).encode())
+        self.version = digest.hexdigest()
+
+
+def load_dataset(root=None):
+    """Refresh the catalog and return the current :class:`Dataset`."""
+    with open_catalog(root) as catalog:
+        records = catalog.query()
+        integrity = catalog.integrity()
+        aggregates = {dimension: catalog.aggregates(dimension) for dimension in ("all",) + AGGREGATE_DIMENSIONS}
+    statuses = Journal(root).statuses()
+    for record in records:
+        entry = statuses.get(record["service_id"])
+        if entry:
+            record["status"] = entry["status"]
+        result = integrity.get(record["service_id"])
+        record["integrity"] = result["status"] if result else None
+    return Dataset(records, aggregates)
+
+
+def _encode_cursor(service_id):
+    return base64.urlsafe_b64encode(service_id.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise BadRequest("invalid cursor") from None
+
+
+def _normalise(params):
+    """Validate query parameters; return them as a sorted tuple (the cache key)."""
+    unknown = set(params) - QUERY_KEYS
+    if unknown:
+        raise BadRequest(f"unknown parameter(s): {', '.join(sorted(unknown))}")
+    for key in RANGE_FILTERS:
+        if key in params:
+            try:
+                params[key] = str(int(params[key]))
+            except ValueError:
+                raise BadRequest(f"{key} must be an integer") from None
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit must be an integer") from None
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f"limit must be between 1 and {MAX_LIMIT}")
+    params["limit"] = str(limit)
+    if "fields" in params:
+        params["fields"] = ",".join(sorted({f for f in params["fields"].split(",") if f}))
+    return tuple(sorted(params.items()))
+
+
+def list_services(dataset, query):
+    """Return ``(body, next_cursor)`` for a normalised ``/services`` query."""
+    params = dict(query)
+    limit = int(params["limit"])
+    fields = params["fields"].split(",") if params.get("fields") else None
+    after = _decode_cursor(params["cursor"]) if "cursor" in params else None
+    start = 0
+    if after is not None:
+        start = bisect_right(dataset.ids, after)
+    items = []
+    last = None
+    for record in dataset.records[start:]:
+        if any(key in params and str(record.get(key)) != params[key] for key in FILTERS):
+            continue
+        if any(key in params and not op(record.get(column) or 0, int(params[key]))
+               for key, (column, op) in RANGE_FILTERS.items()):
+            continue
+        if len(items) == limit:
+            break
+        items.append({f: record.get(f) for f in fields} if fields else record)
+        last = record["service_id"]
+    else:
+        last = None
+    next_cursor = _encode_cursor(last) if last is not None else None
+    return {"items": items, "next": next_cursor, "version": dataset.version}, next_cursor
+
+
+class CatalogServer:
+    """Serves one bank root's catalog; see the module docstring."""
+
+    def __init__(self, root=None, reload_seconds=RELOAD_SECONDS):
+        self.root = root
+        self.reload_seconds = reload_seconds
+        self.dataset = load_dataset(root)
+        self._cache = OrderedDict()
+        self.requests = 0
+        self.not_modified = 0
+
+    async def reload_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                dataset = await loop.run_in_executor(None, load_dataset, self.root)
+            except Exception:  # keep serving the last good version
+                log.exception("catalog reload failed")
+                continue
+            if dataset.version != self.dataset.version:
+                log.info("dataset %s -> %s", self.dataset.version, dataset.version)
+                self.dataset = dataset
+                self._cache.clear()
+
+    def respond(self, target, headers):
+        """Return ``(status, headers, body)`` for a GET of ``target``."""
+        split = urlsplit(target)
+        path = split.path.rstrip("/") or "/"
+        try:
+            params = dict(parse_qsl(split.query, keep_blank_values=True))
+            if path == "/healthz":
+                return HTTPStatus.OK, {}, b'{"ok": true}'
+            dataset = self.dataset
+            if path == "/services":
+                key = (dataset.version, path, _normalise(params))
+            elif path.startswith("/services/"):
+                key = (dataset.version, path, ())
+            elif path == "/aggregates":
+                key = (dataset.version, path, tuple(sorted(params.items())))
+            else:
+                return _error(HTTPStatus.NOT_FOUND, f"no route for {path}")
+            etag = '"' + hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest() + '"'
+            match = headers.get("if-none-match")
+            if match and (match.strip() == "*" or etag in [m.strip() for m in match.split(",")]):
+                self.not_modified += 1
+                return HTTPStatus.NOT_MODIFIED, {"ETag": etag}, b""
+            cached = self._cache.get(key)
+            if cached is None:
+                cached = self._render(dataset, path, key[2], params)
+                self._cache[key] = cached
+                while len(self._cache) > CACHED_RESPONSES:
+                    self._cache.popitem(last=False)
+            status, extra, body = cached
+            return status, dict(extra, ETag=etag, **{"Cache-Control": "no-cache"}), body
+        except BadRequest as exc:
+            return _error(HTTPStatus.BAD_REQUEST, str(exc))
+
+    def _render(self, dataset, path, query, params):
+        if path == "/services":
+            payload, next_cursor = list_services(dataset, query)
+            extra = {}
+            if next_cursor:
+                link = urlencode(dict(query, cursor=next_cursor))
+                extra["Link"] = f'</services?{link}>; rel="next"'
+            return HTTPStatus.OK, extra, _json(payload)
+        if path == "/aggregates":
+            by = params.get("by", "all")
+            if by not in dataset.aggregates:
+                raise BadRequest(f"by must be one of {', '.join(dataset.aggregates)}")
+            return HTTPStatus.OK, {}, _json({str(k): v for k, v in dataset.aggregates[by].items()})
+        record = dataset.by_id.get(path[len("/services/"):])
+        if record is None:
+            return _error(HTTPStatus.NOT_FOUND, "no such service")
+        return HTTPStatus.OK, {}, _json(record)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(_response(*_error(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "headers too large"),
+                                           keep_alive=False))
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    writer.write(_response(*_error(HTTPStatus.BAD_REQUEST, "malformed request line"),
+                                           keep_alive=False))
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                self.requests += 1
+                if method not in ("GET", "HEAD"):
+                    status, extra, body = _error(HTTPStatus.METHOD_NOT_ALLOWED, "read-only service")
+                    extra["Allow"] = "GET, HEAD"
+                else:
+                    status, extra, body = self.respond(target, headers)
+                writer.write(_response(status, extra, body, keep_alive, head_only=method == "HEAD"))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES, backlog=1024)
+        reloader = asyncio.create_task(self.reload_forever())
+        log.info("serving %d services on http://%s:%d (dataset %s)",
+                 len(self.dataset.records), host, port, self.dataset.version)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reloader.cancel()
+
+
+def _json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _error(status, message):
+    return status, {}, _json({"error": message})
+
+
+def _response(status, headers, body, keep_alive=True, head_only=False):
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    if status != HTTPStatus.NOT_MODIFIED:
+        lines.append("Content-Type: application/json")
+        lines.append(f"Content-Length: {len(body)}")
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (b"" if head_only else body)
+
+
+async def _load(host, port, connections, seconds, paths):
+    """Keep-alive clients polling ``paths`` with ``If-None-Match``; return counts."""
+    counts = {"requests": 0, "304": 0, "200": 0, "errors": 0}
+    deadline = time.monotonic() + seconds
+
+    async def client(n):
+        reader, writer = await asyncio.open_connection(host, port)
+        etags = {}
+        i = n
+        try:
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                conditional = f"If-None-Match: {etags[path]}\r\n" if path in etags else ""
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n{conditional}\r\n".encode())
+                head = await reader.readuntil(b"\r\n\r\n")
+                status = head[9:12].decode()
+                length = 0
+                for line in head.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.lower() == b"content-length":
+                        length = int(value)
+                    elif name.lower() == b"etag":
+                        etags[path] = value.strip().decode()
+                if length:
+                    await reader.readexactly(length)
+                counts["requests"] += 1
+                counts[status if status in counts else "errors"] += 1
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client(n) for n in range(connections)))
+    return counts
+
+
+def bench(root=None, connections=16, seconds=5.0):
+    """Run the server and a load generator in one loop; return requests per second."""
+    async def run():
+        server = CatalogServer(root, reload_seconds=3600)
+        listener = await asyncio.start_server(server.handle, DEFAULT_HOST, 0, limit=MAX_HEADER_BYTES)
+        port = listener.sockets[0].getsockname()[1]
+        paths = ["/services", "/services?language=python&limit=50", "/services?status=stopped&fields=service_id,star",
+                 f"/services/{server.dataset.ids[0]}", "/aggregates?by=language"]
+        async with listener:
+            started = time.monotonic()
+            counts = await _load(DEFAULT_HOST, port, connections, seconds, paths)
+            elapsed = time.monotonic() - started
+        return dict(counts, per_s=round(counts["requests"] / elapsed), connections=connections,
+                    services=len(server.dataset.records))
+    return asyncio.run(run())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.catalog_server", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--reload", type=float, default=RELOAD_SECONDS, help="seconds between catalog refreshes")
+    sub = parser.add_subparsers(dest="command")
+    bn = sub.add_parser("bench", help="measure requests per second against an in-process server")
+    bn.add_argument("--connections", type=int, default=16)
+    bn.add_argument("--seconds", type=float, default=5.0)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.command == "bench":
+        print(json.dumps(bench(args.root, args.connections, args.seconds)))
+        return 0
+    try:
+        asyncio.run(CatalogServer(args.root, args.reload).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,606 @@
+"""Cold-start benchmark for the generated Python wrappers.
+
+A wrapper is a ``.py`` file the generator wrote next to ``metadata.json``
+(``api.py``, ``service.py``, ``web_server.py`` ...).  The entry point is
+taken from the Dockerfile's ``CMD``/``ENTRYPOINT`` when it runs a wrapper,
+either as ``python <wrapper>.py`` or as ``uvicorn <wrapper>:app``.
+Otherwise the entry point is the wrapper that has a ``__main__`` block.
+
+Each wrapper is launched in a throwaway sandbox directory holding the
+generated files, or the full deploy tree with ``--source``.  A small
+bootstrap prepares the process before handing over to the wrapper:
+
+* Imports that cannot be resolved are replaced with permissive stub
+  modules.  This covers torch, tensorflow, cv2 and the repo's own ``lib``
+  packages when the source is not extracted.  ``--stub`` stubs a module even
+  when it is installed.  Web frameworks are never stubbed: a wrapper whose
+  framework is missing fails instead of measuring nothing.  Neither are
+  stdlib modules this platform lacks (``winreg``), which libraries probe
+  for and must find missing.
+* The first TCP port the wrapper binds is redirected to a free local
+  port, so hard-coded ports (``40209``, ``5000`` ...) never collide.
+* The werkzeug reloader and uvicorn ``reload``/``workers`` are turned off,
+  so the measured process is the one that serves.
+
+The runner polls the wrapper's health route (``/health`` where the wrapper
+declares one) until it answers 2xx.  It records the time from exec to that
+first success and the process's peak RSS (``ru_maxrss``).  Each service is
+run ``--runs`` times; the median readiness time and the maximum RSS are
+appended to ``.bank/bench/coldstart.jsonl``.  ``report`` compares each
+service's latest result with its previous one and exits non-zero on
+regressions.
+
+Usage::
+
+    python -m bank.coldstart list
+    python -m bank.coldstart run [<service_id> ...] [--runs 3] [--python /venv/bin/python]
+    python -m bank.coldstart report [--threshold 0.2]
+"""
+
+import argparse
+import json
+import os
+import re
+import shlex
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .deploy import overlay_generated, prepare_workdir
+from .dockerfile import Dockerfile
+from .metadata import iter_service_dirs
+from .probes import wrapper_routes
+
+BENCH_FILENAME = "coldstart.jsonl"
+BOOTSTRAP_FILENAME = "_bank_coldstart.py"
+DEFAULT_RUNS = 3
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_THRESHOLD = 0.2
+POLL_INTERVAL = 0.02
+STOP_GRACE = 5.0
+FRAMEWORKS = ("flask", "werkzeug", "fastapi", "starlette", "uvicorn", "gunicorn", "aiohttp", "tornado", "gradio")
+_ASGI_SERVERS = ("uvicorn", "hypercorn", "gunicorn")
+_PYTHONS = re.compile(r"^(?:/\S*/)?python[\d.]*$")
+_MAIN_BLOCK = re.compile(r"^if\s+__name__\s*==\s*['\"]__main__['\"]\s*:", re.MULTILINE)
+_IMPORTTIME = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| (\S+)$")
+
+# Runs inside the sandboxed interpreter before the wrapper.  Kept free of
+# bank imports: the interpreter may be a service's own venv.
+_BOOTSTRAP = r'''
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import inspect
+import json
+import os
+import runpy
+import socket
+import sys
+import types
+
+PORT = int(os.environ["BANK_COLDSTART_PORT"])
+FORCED = set(filter(None, os.environ.get("BANK_COLDSTART_STUB", "").split(",")))
+STUB_MISSING = os.environ.get("BANK_COLDSTART_STUB_MISSING") == "1"
+NEVER_STUB = set(os.environ["BANK_COLDSTART_FRAMEWORKS"].split(","))
+STUB_LOG = os.environ["BANK_COLDSTART_STUB_LOG"]
+STDLIB = getattr(sys, "stdlib_module_names", frozenset())
+
+
+class _StubMeta(type):
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _stub_class(f"{cls.__qualname__}.{name}")
+
+    def __call__(cls, *args, **kwargs):
+        # Decorators such as @torch.jit.script must hand back what they wrap.
+        if len(args) == 1 and not kwargs and (inspect.isfunction(args[0]) or inspect.isclass(args[0])):
+            return args[0]
+        return super().__call__(*args, **kwargs)
+
+    def __iter__(cls):
+        return iter(())
+
+
+class _Stub(metaclass=_StubMeta):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and callable(args[0]):
+            return args[0]
+        return _Stub()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Stub()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __getitem__(self, key):
+        return _Stub()
+
+
+for _op in ("add", "sub", "mul", "truediv", "floordiv", "mod", "pow", "matmul"):
+    setattr(_Stub, f"__{_op}__", lambda self, other: self)
+    setattr(_Stub, f"__r{_op}__", lambda self, other: self)
+
+
+def _stub_class(name):
+    return _StubMeta(name.rpartition(".")[2] or name, (_Stub,), {"__qualname__": name})
+
+
+class _StubModule(types.ModuleType):
+    __all__ = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = _stub_class(f"{self.__name__}.{name}")
+        setattr(self, name, value)
+        return value
+
+
+class _StubLoader(importlib.abc.Loader):
+    def create_module(self, spec):
+        return _StubModule(spec.name)
+
+    def exec_module(self, module):
+        module.__path__ = []
+        with open(STUB_LOG, "a") as f:
+            f.write(module.__name__ + "\n")
+
+
+class _Stubber(importlib.abc.MetaPathFinder):
+    def __init__(self, names, missing):
+        self.names = names
+        self.missing = missing
+
+    def find_spec(self, name, path=None, target=None):
+        top = name.partition(".")[0]
+        if top in NEVER_STUB:
+            return None
+        # Optional stdlib modules (winreg, _winapi ...) are probed inside try/except; they stay missing.
+        if top in self.names or (self.missing and top not in STDLIB):
+            return importlib.machinery.ModuleSpec(name, _StubLoader(), is_package=True)
+        return None
+
+
+def _patch_werkzeug(module):
+    run_simple = module.run_simple
+
+    def patched(*args, **kwargs):
+        kwargs["use_reloader"] = False
+        return run_simple(*args, **kwargs)
+
+    module.run_simple = patched
+
+
+def _patch_uvicorn(module):
+    run = module.run
+
+    def patched(app, *args, **kwargs):
+        kwargs.pop("reload", None)
+        kwargs.pop("workers", None)
+        return run(app, *args, **kwargs)
+
+    module.run = patched
+
+
+PATCHES = {"werkzeug.serving": _patch_werkzeug, "uvicorn": _patch_uvicorn}
+
+
+class _Patcher(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name not in PATCHES:
+            return None
+        sys.meta_path.remove(self)
+        try:
+            spec = importlib.util.find_spec(name)
+        finally:
+            sys.meta_path.insert(0, self)
+        if spec is None or spec.loader is None:
+            return None
+        exec_module = spec.loader.exec_module
+
+        def exec_and_patch(module):
+            exec_module(module)
+            PATCHES[name](module)
+
+        spec.loader.exec_module = exec_and_patch
+        return spec
+
+
+_bind = socket.socket.bind
+_redirected = []
+
+
+def _redirecting_bind(self, address):
+    if (not _redirected and self.family in (socket.AF_INET, socket.AF_INET6) and isinstance(address, tuple)
+            and address[1]):
+        _redirected.append(address[1])
+        address = ("127.0.0.1" if self.family == socket.AF_INET else "::1", PORT) + tuple(address[2:])
+    return _bind(self, address)
+
+
+socket.socket.bind = _redirecting_bind
+sys.meta_path.insert(0, _Patcher())
+sys.meta_path.insert(1, _Stubber(FORCED, False))
+sys.meta_path.append(_Stubber(set(), STUB_MISSING))
+
+sys.argv = json.loads(os.environ["BANK_COLDSTART_ARGV"])
+sys.path.insert(0, os.getcwd())
+module = os.environ.get("BANK_COLDSTART_MODULE")
+if module:
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+else:
+    sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+    runpy.run_path(sys.argv[0], run_name="__main__")
+'''
+
+
+@dataclass
+class Entry:
+    """How to start one service's wrapper."""
+
+    service_id: str
+    wrapper: str                  # the generated file that serves
+    argv: list                    # sys.argv for the wrapper
+    module: str = None            # run with ``-m``-style semantics (uvicorn ...)
+    route: str = "/"
+    from_cmd: bool = False        # entry point taken from the Dockerfile
+    routes: list = field(default_factory=list)
+
+
+def _generated_scripts(service_dir):
+    return sorted(p.name for p in Path(service_dir).iterdir() if p.suffix == ".py" and p.is_file())
+
+
+def _command(service_dir):
+    """Return the container command (ENTRYPOINT + CMD) of a service as argv."""
+    path = Path(service_dir) / "Dockerfile"
+    if not path.is_file():
+        return []
+    entrypoint, cmd = [], []
+    for instruction in Dockerfile.read(path):
+        if instruction.keyword not in ("CMD", "ENTRYPOINT"):
+            continue
+        try:
+            words = json.loads(instruction.value)
+        except ValueError:
+            try:
+                words = shlex.split(instruction.value)
+            except ValueError:
+                words = []
+        if not isinstance(words, list):
+            words = []
+        if instruction.keyword == "ENTRYPOINT":
+            entrypoint, cmd = words, []
+        else:
+            cmd = words
+    return entrypoint + cmd
+
+
+def entry_point(service_id, service_dir):
+    """Return the :class:`Entry` for a service's wrapper, or ``None``."""
+    scripts = _generated_scripts(service_dir)
+    if not scripts:
+        return None
+    routes = wrapper_routes(service_dir)
+    route = next((r for r in routes if r.rstrip("/") == "/health"), routes[0] if routes else "/")
+    command = [str(word) for word in _command(service_dir)]
+    if command and _PYTHONS.match(command[0]):
+        command = command[1:]
+        if command[:1] == ["-m"]:
+            command = command[1:]
+    if command and command[0] in _ASGI_SERVERS:
+        for word in command[1:]:
+            module = word.partition(":")[0]
+            if ":" in word and f"{module}.py" in scripts:
+                return Entry(service_id, f"{module}.py", list(command), module=command[0], route=route,
+                             from_cmd=True, routes=routes)
+    elif command and Path(command[0]).name in scripts:
+        name = Path(command[0]).name
+        return Entry(service_id, name, [name] + command[1:], route=route, from_cmd=True, routes=routes)
+    for name in scripts:
+        text = (Path(service_dir) / name).read_text(encoding="utf-8", errors="replace")
+        if _MAIN_BLOCK.search(text):
+            return Entry(service_id, name, [name], route=route, routes=routes)
+    return None
+
+
+def wrappers(root=None, service_ids=None):
+    """Yield ``(service_dir, Entry)`` for every benchmarkable wrapper."""
+    if service_ids:
+        dirs = [(sid, services_dir(root) / sid) for sid in service_ids]
+    else:
+        dirs = iter_service_dirs(root)
+    for service_id, service_dir in dirs:
+        entry = entry_point(service_id, service_dir)
+        if entry is not None:
+            yield service_dir, entry
+
+
+def free_port():
+    """Return a TCP port on 127.0.0.1 that is free right now."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def healthy(url):
+    """True if a GET of ``url`` answers 2xx within a second."""
+    try:
+        with urllib.request.urlopen(url, timeout=1.0) as response:
+            return 200 <= response.status < 300
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+def stop_process(proc):
+    """Stop ``proc``'s process group and return its rusage."""
+    for sig, grace in ((signal.SIGTERM, STOP_GRACE), (signal.SIGKILL, None)):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + (grace or STOP_GRACE)
+        while time.monotonic() < deadline:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                return rusage
+            time.sleep(POLL_INTERVAL)
+    raise RuntimeError(f"pid {proc.pid} did not exit after SIGKILL")
+
+
+def parse_importtime(text):
+    """Return ``{package: cumulative_us}`` for the top-level imports in ``-X importtime`` output."""
+    totals = {}
+    for line in text.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            package = match.group(2).partition(".")[0]
+            totals[package] = totals.get(package, 0) + int(match.group(1))
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def spawn(entry, sandbox, bootstrap, port, python=sys.executable, stub=(), stub_missing=True, importtime=False,
+          stderr=subprocess.DEVNULL, cpu_only=True):
+    """Start a wrapper serving on ``port`` in its own session and return the :class:`subprocess.Popen`.
+
+    Modules the bootstrap stubs are listed in ``<bootstrap>.stubs``.  With
+    ``cpu_only`` (the benchmark's default) no GPU is visible to the wrapper.
+    """
+    sandbox = Path(sandbox)
+    stub_log = Path(bootstrap).with_suffix(".stubs")
+    env = dict(os.environ, HOME=str(sandbox), PORT=str(port), PYTHONUNBUFFERED="1", PYTHONDONTWRITEBYTECODE="1",
+               BANK_COLDSTART_PORT=str(port), BANK_COLDSTART_STUB=",".join(stub),
+               BANK_COLDSTART_STUB_MISSING="1" if stub_missing else "0",
+               BANK_COLDSTART_FRAMEWORKS=",".join(FRAMEWORKS), BANK_COLDSTART_STUB_LOG=str(stub_log),
+               BANK_COLDSTART_ARGV=json.dumps(entry.argv), BANK_COLDSTART_MODULE=entry.module or "")
+    if cpu_only:
+        env["CUDA_VISIBLE_DEVICES"] = ""
+    flags = ["-X", "importtime"] if importtime else []
+    return subprocess.Popen([python, *flags, str(bootstrap)], cwd=sandbox, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=stderr, start_new_session=True)
+
+
+def launch(entry, sandbox, bootstrap, python=sys.executable, stub=(), stub_missing=True, timeout=DEFAULT_TIMEOUT,
+           importtime=False, monitor=None):
+    """Start a wrapper once and return ``{ready_s, peak_rss_mb, error, stubbed}``.
+
+    With ``importtime`` the interpreter runs with ``-X importtime`` and the
+    result also holds ``imports``, as returned by :func:`parse_importtime`.
+    A ``monitor`` gets ``started(pid)`` right after the process is spawned
+    and, once the route answers, ``ready(url)`` before the process is stopped.
+    """
+    port = free_port()
+    stub_log = Path(bootstrap).with_suffix(".stubs")
+    stub_log.unlink(missing_ok=True)
+    stderr_path = Path(bootstrap).with_suffix(".stderr")
+    url = f"http://127.0.0.1:{port}{entry.route}"
+    result = {"ready_s": None, "peak_rss_mb": None, "error": None}
+    with open(stderr_path, "wb") as stderr:
+        started = time.monotonic()
+        proc = spawn(entry, sandbox, bootstrap, port, python, stub, stub_missing, importtime, stderr)
+        if monitor is not None:
+            monitor.started(proc.pid)
+        rusage = None
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                result["error"] = f"exited with {proc.returncode} before {entry.route} answered"
+                break
+            if healthy(url):
+                result["ready_s"] = round(time.monotonic() - started, 3)
+                if monitor is not None:
+                    monitor.ready(url)
+                rusage = None
+                break
+            if time.monotonic() - started > timeout:
+                result["error"] = f"{entry.route} not healthy after {timeout:.0f}s"
+                rusage = None
+                break
+            time.sleep(POLL_INTERVAL)
+        if rusage is None:
+            rusage = stop_process(proc)
+    result["peak_rss_mb"] = round(rusage.ru_maxrss / 1024, 1)      # ru_maxrss is KiB on Linux
+    stderr = stderr_path.read_text(errors="replace")
+    if importtime:
+        result["imports"] = parse_importtime(stderr)
+    if result["error"]:
+        lines = [line for line in stderr.strip().splitlines() if not _IMPORTTIME.match(line)]
+        if lines:
+            result["error"] += f": {lines[-1][:200]}"
+    result["stubbed"] = sorted(set(stub_log.read_text().split())) if stub_log.exists() else []
+    return result
+
+
+def make_sandbox(service_dir, parent, source=False, prepare=None):
+    """Fill ``<parent>/app`` with the service and write the bootstrap; return ``(sandbox, bootstrap)``.
+
+    ``prepare(service_dir, sandbox)``, if given, may rewrite the sandbox.
+    """
+    sandbox = Path(parent) / "app"
+    sandbox.mkdir()
+    if source:
+        prepare_workdir(service_dir, sandbox)
+    else:
+        overlay_generated(service_dir, sandbox)
+    if prepare is not None:
+        prepare(service_dir, sandbox)
+    bootstrap = Path(parent) / BOOTSTRAP_FILENAME
+    bootstrap.write_text(_BOOTSTRAP, encoding="utf-8")
+    return sandbox, bootstrap
+
+
+def bench(service_dir, entry, runs=DEFAULT_RUNS, source=False, prepare=None, log=print, **options):
+    """Launch one wrapper ``runs`` times in a fresh sandbox and summarise.
+
+    ``prepare(service_dir, sandbox)``, if given, may rewrite the sandbox
+    before the first launch.
+    """
+    record = {"service_id": entry.service_id, "wrapper": entry.wrapper, "route": entry.route,
+              "source": source, "at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    with tempfile.TemporaryDirectory(prefix=f"bank-coldstart-{entry.service_id}-") as tmp:
+        sandbox, bootstrap = make_sandbox(service_dir, tmp, source, prepare)
+        results = []
+        for _ in range(runs):
+            result = launch(entry, sandbox, bootstrap, **options)
+            results.append(result)
+            if result["error"]:
+                break
+    ready = [r["ready_s"] for r in results if r["ready_s"] is not None]
+    record["ok"] = not results[-1]["error"]
+    record["ready_s"] = statistics.median(ready) if record["ok"] else None
+    record["runs_s"] = ready
+    record["peak_rss_mb"] = max(r["peak_rss_mb"] for r in results)
+    record["stubbed"] = sorted({name.partition(".")[0] for r in results for name in r["stubbed"]})
+    if "imports" in results[0]:
+        record["imports"] = results[0]["imports"]
+    if not record["ok"]:
+        record["error"] = results[-1]["error"]
+    if record["ok"]:
+        log(f"{entry.service_id}  {entry.wrapper:<18} ready {record['ready_s']:7.3f} s  "
+            f"peak {record['peak_rss_mb']:7.1f} MiB  stubbed {len(record['stubbed'])}")
+    else:
+        log(f"{entry.service_id}  {entry.wrapper:<18} FAILED  {record['error']}")
+    return record
+
+
+def save(records, root=None):
+    path = state_dir(root) / "bench"
+    path.mkdir(exist_ok=True)
+    with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def history(root=None):
+    """Return ``{service_id: [record, ...]}`` oldest first."""
+    path = state_dir(root, create=False) / "bench" / BENCH_FILENAME
+    runs = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    runs.setdefault(record["service_id"], []).append(record)
+    return runs
+
+
+def regressions(root=None, threshold=DEFAULT_THRESHOLD):
+    """Yield ``(service_id, previous, latest, regressed)`` for each service's last two results.
+
+    A result regressed when it failed after a success, or when it became
+    ready more than ``threshold`` (relative) slower.
+    """
+    for service_id, records in sorted(history(root).items()):
+        if len(records) < 2:
+            continue
+        previous, latest = records[-2:]
+        if not previous["ok"]:
+            regressed = False
+        elif not latest["ok"]:
+            regressed = True
+        else:
+            regressed = latest["ready_s"] > previous["ready_s"] * (1 + threshold)
+        yield service_id, previous, latest, regressed
+
+
+def _fmt_ready(record):
+    return f"{record['ready_s']:7.3f} s" if record["ok"] else "  failed"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.coldstart", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show each wrapper's entry point and health route")
+    run = sub.add_parser("run", help="benchmark wrapper cold starts")
+    run.add_argument("service_ids", nargs="*", help="default: every wrapper")
+    run.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    run.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for health")
+    run.add_argument("--python", default=sys.executable, help="interpreter to run wrappers with")
+    run.add_argument("--source", action="store_true", help="extract the package into the sandbox too")
+    run.add_argument("--stub", action="append", default=[], metavar="MODULE",
+                     help="stub MODULE even when it is installed (repeatable)")
+    run.add_argument("--no-stub-missing", dest="stub_missing", action="store_false",
+                     help="let unresolvable imports fail instead of stubbing them")
+    report = sub.add_parser("report", help="compare each service's latest result with its previous one")
+    report.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown counted as a regression")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        for _, entry in wrappers(args.root):
+            how = " ".join(entry.argv)
+            print(f"{entry.service_id}  {entry.route:<10} {'cmd ' if entry.from_cmd else 'main'}  {how}")
+    elif args.command == "run":
+        records = []
+        for service_dir, entry in wrappers(args.root, args.service_ids):
+            records.append(bench(service_dir, entry, runs=args.runs, source=args.source, python=args.python,
+                                 stub=args.stub, stub_missing=args.stub_missing, timeout=args.timeout))
+        if not records:
+            print("error: no wrappers to benchmark", file=sys.stderr)
+            return 1
+        save(records, args.root)
+        ok = [r for r in records if r["ok"]]
+        print(f"{len(ok)} of {len(records)} wrappers became healthy", end="")
+        print(f"; median ready {statistics.median(r['ready_s'] for r in ok):.3f} s" if ok else "")
+    elif args.command == "report":
+        regressed = 0
+        for service_id, previous, latest, slower in regressions(args.root, args.threshold):
+            regressed += slower
+            print(f"{service_id}  {_fmt_ready(previous)} -> {_fmt_ready(latest)}  "
+                  f"{previous['peak_rss_mb']:7.1f} -> {latest['peak_rss_mb']:7.1f} MiB"
+                  f"{'  REGRESSION' if slower else ''}")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Loading compose files and writing compose overlays.
+
+Tools never rewrite a service's generated compose file.  They write an
+overlay next to it in the deploy tree (``docker-compose.bank-<name>.yaml``)
+that :func:`bank.deploy.compose` passes to ``docker compose`` after the base
+file, so every change stays separable and reversible.
+
+PyYAML is required for anything in this module.
+"""
+
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - optional dependency
+    yaml = None
+
+OVERLAY_PREFIX = "docker-compose.bank-"
+OVERLAY_SUFFIX = ".yaml"
+
+
+class ComposeError(Exception):
+    pass
+
+
+class Override:
+    """Overlay value that replaces the base value instead of merging with it.
+
+    Written as ``!override`` (or ``!reset`` when empty), which Compose
+    2.24.4 and later understand.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+if yaml is not None:
+    class _Dumper(yaml.SafeDumper):
+        pass
+
+    def _represent_override(dumper, data):
+        tag = "!override" if data.value else "!reset"
+        if isinstance(data.value, dict):
+            return dumper.represent_mapping(tag, data.value)
+        return dumper.represent_sequence(tag, data.value)
+
+    _Dumper.add_representer(Override, _represent_override)
+
+
+def _require_yaml():
+    if yaml is None:
+        raise ComposeError("PyYAML is required to read compose files (pip install pyyaml)")
+
+
+def load_compose(path):
+    """Return the parsed compose document at ``path`` (an empty dict if blank)."""
+    _require_yaml()
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = yaml.safe_load(f)
+        except yaml.YAMLError as exc:
+            raise ComposeError(f"{path}: {exc}") from None
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ComposeError(f"{path}: top level is not a mapping")
+    return data
+
+
+def services(doc):
+    """Return the ``services`` mapping of a compose document."""
+    result = doc.get("services") or {}
+    return result if isinstance(result, dict) else {}
+
+
+def build_spec(service):
+    """Return ``(context, dockerfile)`` for a compose service, or ``None``.
+
+    Short-form ``build: <context>`` is normalised to the long form.
+    """
+    build = service.get("build")
+    if build is None:
+        return None
+    if isinstance(build, str):
+        return build, "Dockerfile"
+    return build.get("context", "."), build.get("dockerfile", "Dockerfile")
+
+
+def bind_sources(doc, base="."):
+    """Return the host paths the services of ``doc`` bind-mount, resolved against ``base``.
+
+    Covers the short form (``./data:/app/data``) and the long form
+    (``type: bind``) that ``docker compose config`` prints; named volumes
+    are not bind mounts.
+    """
+    sources = set()
+    for service in services(doc).values():
+        for volume in (service or {}).get("volumes") or []:
+            if isinstance(volume, dict):
+                source = volume.get("source") if volume.get("type") == "bind" else None
+            else:
+                source = str(volume).split(":", 1)[0]
+                if not source.startswith((".", "/", "~")):
+                    source = None
+            if source:
+                sources.add((Path(base) / Path(source).expanduser()).resolve())
+    return sorted(sources)
+
+
+def services_building(doc, dockerfile="Dockerfile", context="."):
+    """Return the names of services built from ``dockerfile`` in ``context``."""
+    want = Path(context) / dockerfile
+    names = []
+    for name, service in services(doc).items():
+        spec = build_spec(service or {})
+        if spec and Path(spec[0]) / spec[1] == want:
+            names.append(name)
+    return names
+
+
+def overlay_path(workdir, name):
+    return Path(workdir) / f"{OVERLAY_PREFIX}{name}{OVERLAY_SUFFIX}"
+
+
+def overlay_files(workdir):
+    """Return the overlays present in ``workdir``, in the order they apply."""
+    return sorted(Path(workdir).glob(f"{OVERLAY_PREFIX}*{OVERLAY_SUFFIX}"))
+
+
+def write_overlay(workdir, name, doc):
+    """Write ``doc`` as overlay ``name`` in ``workdir`` and return its path."""
+    _require_yaml()
+    path = overlay_path(workdir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# Generated by bank tooling ({name}); applied after the base compose file.\n")
+        yaml.dump(doc, f, Dumper=_Dumper, sort_keys=False, default_flow_style=False)
+    return path
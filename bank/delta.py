@@ -0,0 +1,216 @@
+"""rsync-style delta encoding between two versions of a byte string.
+
+:func:`signature` cuts the old version into fixed-size blocks and records a
+weak rolling checksum and a strong hash for each.  :func:`encode` slides a
+window over the new version, looking the rolling checksum up at every byte
+offset, and emits ``COPY`` records for blocks found in the old version and
+``DATA`` records for everything else.  :func:`apply` rebuilds the new
+version from the old one and the delta.
+
+The weak checksum is rsync's: ``a`` is the sum of the window's bytes and
+``b`` the sum of its prefix sums, both mod 2**16.  Both roll in O(1) per
+byte, and a whole block's value is computed at C speed with ``sum`` and
+``itertools.accumulate``.  Only windows whose weak checksum matches are
+hashed with BLAKE2b.
+
+Scanning a region that matches nothing runs in Python one byte at a time.
+A new version that stops matching for more than ``max_miss`` bytes therefore
+has its remainder emitted as data, so a payload that changed completely
+costs a bounded amount of work.
+
+Delta format: ``b"BKD1"``, then records ``b"C" <u64 offset> <u32 length>``
+and ``b"D" <u32 length> <bytes>``.
+
+Usage::
+
+    python -m bank.delta encode <old> <new> <delta>
+    python -m bank.delta apply <old> <delta> <out>
+"""
+
+import argparse
+import hashlib
+import math
+import struct
+import sys
+from itertools import accumulate
+
+MAGIC = b"BKD1"
+MIN_BLOCK = 2048
+MAX_BLOCK = 128 << 10
+DEFAULT_MAX_MISS = 4 << 20
+
+_COPY = struct.Struct("<QI")
+_DATA = struct.Struct("<I")
+_MOD = 1 << 16
+
+
+class DeltaError(Exception):
+    pass
+
+
+def block_size(length):
+    """Return rsync's block size for a base of ``length`` bytes (about its square root)."""
+    return max(MIN_BLOCK, min(MAX_BLOCK, (math.isqrt(length) + 7) & ~7))
+
+
+def _weak(block):
+    return (sum(block) % _MOD) | ((sum(accumulate(block)) % _MOD) << 16)
+
+
+def _strong(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def signature(old, block=None):
+    """Return ``(block, {weak: {strong: offset}})`` for ``old``."""
+    block = block or block_size(len(old))
+    table = {}
+    view = memoryview(old)
+    for offset in range(0, len(old) - block + 1, block):
+        chunk = view[offset:offset + block]
+        table.setdefault(_weak(chunk), {}).setdefault(_strong(chunk), offset)
+    return block, table
+
+
+class _Writer:
+    def __init__(self):
+        self.out = bytearray(MAGIC)
+        self.copy = None              # pending (offset, length)
+
+    def emit_copy(self, offset, length):
+        if self.copy and self.copy[0] + self.copy[1] == offset:
+            self.copy = (self.copy[0], self.copy[1] + length)
+        else:
+            self.flush_copy()
+            self.copy = (offset, length)
+
+    def flush_copy(self):
+        if self.copy:
+            self.out += b"C" + _COPY.pack(*self.copy)
+            self.copy = None
+
+    def emit_data(self, data):
+        if data:
+            self.flush_copy()
+            self.out += b"D" + _DATA.pack(len(data)) + data
+
+
+def encode(old, new, sig=None, max_miss=DEFAULT_MAX_MISS):
+    """Return the delta turning ``old`` into ``new`` as bytes."""
+    block, table = sig or signature(old)
+    new = memoryview(new)
+    n = len(new)
+    writer = _Writer()
+    literal_start = 0
+    i = 0
+    while i + block <= n:
+        window = new[i:i + block]
+        a = sum(window) % _MOD
+        b = sum(accumulate(window)) % _MOD
+        missed = 0
+        while True:
+            candidates = table.get(a | (b << 16))
+            if candidates is not None:
+                offset = candidates.get(_strong(new[i:i + block]))
+                if offset is not None:
+                    break
+            if i + block >= n or missed >= max_miss:
+                offset = None
+                break
+            # Roll the window one byte forward.
+            out_byte, in_byte = new[i], new[i + block]
+            a = (a - out_byte + in_byte) % _MOD
+            b = (b - block * out_byte + a) % _MOD
+            i += 1
+            missed += 1
+        if offset is None:
+            if missed >= max_miss:
+                i = n
+            break
+        writer.emit_data(bytes(new[literal_start:i]))
+        writer.emit_copy(offset, block)
+        i += block
+        literal_start = i
+    writer.emit_data(bytes(new[literal_start:n]))
+    writer.flush_copy()
+    return bytes(writer.out)
+
+
+def apply(old, delta):
+    """Rebuild the new version from ``old`` and ``delta``."""
+    if delta[:4] != MAGIC:
+        raise DeltaError("not a delta (bad magic)")
+    out = bytearray()
+    view = memoryview(delta)
+    pos = 4
+    while pos < len(delta):
+        kind = delta[pos:pos + 1]
+        pos += 1
+        if kind == b"C":
+            offset, length = _COPY.unpack_from(delta, pos)
+            pos += _COPY.size
+            if offset + length > len(old):
+                raise DeltaError("copy beyond the end of the base")
+            out += old[offset:offset + length]
+        elif kind == b"D":
+            (length,) = _DATA.unpack_from(delta, pos)
+            pos += _DATA.size
+            out += view[pos:pos + length]
+            pos += length
+        else:
+            raise DeltaError(f"bad record type {kind!r} at offset {pos - 1}")
+    return bytes(out)
+
+
+def copied_bytes(delta):
+    """Return how many bytes of the result ``delta`` copies from the base."""
+    total = 0
+    pos = 4
+    while pos < len(delta):
+        kind = delta[pos:pos + 1]
+        pos += 1
+        if kind == b"C":
+            total += _COPY.unpack_from(delta, pos)[1]
+            pos += _COPY.size
+        else:
+            pos += _DATA.size + _DATA.unpack_from(delta, pos)[0]
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.delta", description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    enc = sub.add_parser("encode", help="write the delta from OLD to NEW")
+    enc.add_argument("old")
+    enc.add_argument("new")
+    enc.add_argument("delta")
+    app = sub.add_parser("apply", help="rebuild NEW from OLD and a delta")
+    app.add_argument("old")
+    app.add_argument("delta")
+    app.add_argument("out")
+
+    args = parser.parse_args(argv)
+    with open(args.old, "rb") as f:
+        old = f.read()
+    if args.command == "encode":
+        with open(args.new, "rb") as f:
+            new = f.read()
+        delta = encode(old, new)
+        with open(args.delta, "wb") as f:
+            f.write(delta)
+        print(f"{len(new)} bytes -> {len(delta)} byte delta ({copied_bytes(delta)} copied from base)")
+    else:
+        with open(args.delta, "rb") as f:
+            delta = f.read()
+        try:
+            data = apply(old, delta)
+        except DeltaError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        with open(args.out, "wb") as f:
+            f.write(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""Preparing a service's working tree and driving its compose stack.
+
+A deployable tree is the package contents (with the archive's single
+top-level directory stripped) overlaid with the files the generator wrote
+next to ``metadata.json``: the Dockerfile, compose file, wrappers and
+configs.
+"""
+
+import shutil
+import subprocess
+import zipfile
+from pathlib import Path
+
+from .compose import overlay_files
+from .metadata import METADATA_FILENAME
+from .parts import MANIFEST_FILENAME, PART_PREFIX, SOURCE_FILENAME, PartsError, open_package_zip
+from .seekable import SEEKABLE_FILENAME, SeekableError, is_current, open_archive
+from .seekable import available as seekable_available
+
+COMPOSE_FILENAMES = ("docker-compose.yaml", "docker-compose.yml", "compose.yaml", "compose.yml")
+GENERATED_FILENAME = ".bank-generated"
+DEFAULT_WORKDIR = Path("/home/ubuntu/deploy-projects")
+
+
+class DeployError(Exception):
+    pass
+
+
+def compose_file(service_dir):
+    """Return the compose file of a service directory, or ``None``."""
+    for name in COMPOSE_FILENAMES:
+        path = Path(service_dir) / name
+        if path.is_file():
+            return path
+    return None
+
+
+def is_bank_file(name):
+    """True for files that belong to the bank rather than the deployed tree."""
+    return name in (METADATA_FILENAME, SOURCE_FILENAME, MANIFEST_FILENAME, SEEKABLE_FILENAME, GENERATED_FILENAME) or \
+        name.startswith(PART_PREFIX)
+
+
+def top_level_dir(names):
+    """Return the single directory every member lives under, or ``None``."""
+    tops = {name.split("/", 1)[0] for name in names}
+    if len(tops) == 1 and all("/" in name for name in names):
+        return tops.pop()
+    return None
+
+
+def extract_package(service_dir, dest):
+    """Extract a service's package into ``dest``, dropping the top-level dir.
+
+    Returns the number of members written, or 0 when the service has no
+    package (wrapper-only services).  An up-to-date ``source.szst`` is
+    extracted in parallel instead of the zip when zstandard is installed.
+    """
+    service_dir = Path(service_dir)
+    if seekable_available() and (service_dir / SEEKABLE_FILENAME).exists():
+        try:
+            with open_archive(service_dir) as archive:
+                if is_current(archive, service_dir):
+                    return archive.extract(dest, strip=top_level_dir(archive.names()))
+        except SeekableError as exc:
+            raise DeployError(str(exc)) from None
+    if not (service_dir / SOURCE_FILENAME).exists() and not any(service_dir.glob(PART_PREFIX + "*")):
+        return 0
+    dest = Path(dest).resolve()
+    count = 0
+    with open_package_zip(service_dir) as zf:
+        infos = zf.infolist()
+        top = top_level_dir([i.filename for i in infos])
+        strip = len(top) + 1 if top else 0
+        for info in infos:
+            relpath = info.filename[strip:]
+            if not relpath:
+                continue
+            target = (dest / relpath).resolve()
+            if dest not in target.parents:
+                raise DeployError(f"refusing to extract {info.filename!r} outside {dest}")
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with zf.open(info) as src, open(target, "wb") as out:
+                shutil.copyfileobj(src, out, 1 << 20)
+            mode = (info.external_attr >> 16) & 0o777
+            if mode:
+                target.chmod(mode)
+            count += 1
+    return count
+
+
+def overlay_generated(service_dir, dest):
+    """Copy the generated files of a service directory over ``dest``."""
+    service_dir = Path(service_dir)
+    dest = Path(dest)
+    for path in service_dir.iterdir():
+        if is_bank_file(path.name):
+            continue
+        target = dest / path.name
+        if path.is_dir():
+            shutil.copytree(path, target, dirs_exist_ok=True, symlinks=True)
+        else:
+            shutil.copy2(path, target)
+
+
+def record_generated(dest, path):
+    """Note that a transform wrote ``path`` into the deploy tree ``dest``.
+
+    Only files the package and the service directory do not provide need
+    recording; :func:`prepare_workdir` removes them before the next deploy.
+    """
+    dest = Path(dest)
+    with open(dest / GENERATED_FILENAME, "a", encoding="utf-8") as f:
+        f.write(Path(path).relative_to(dest).as_posix() + "\n")
+
+
+def clear_generated(dest):
+    """Remove the overlays and recorded transform files of a previous deploy."""
+    dest = Path(dest)
+    for path in overlay_files(dest):
+        path.unlink()
+    record = dest / GENERATED_FILENAME
+    try:
+        relpaths = set(record.read_text(encoding="utf-8").splitlines())
+    except FileNotFoundError:
+        return
+    for relpath in relpaths:
+        (dest / relpath).unlink(missing_ok=True)
+    record.unlink()
+
+
+def prepare_workdir(service_dir, dest, transforms=()):
+    """Build the deployable tree for a service at ``dest``.
+
+    A previous deploy's tree is reused: only its compose overlays and the
+    files its transforms recorded are removed, so those of transforms that
+    are not enabled this time do not carry over, while state the stack keeps
+    in bind mounts under ``dest`` (``./data``, database directories)
+    survives.  The package and generated files are then written over the
+    tree.  Each of ``transforms`` is called as ``transform(service_dir,
+    dest)`` and may rewrite files in the tree or add compose overlays.
+    """
+    dest = Path(dest)
+    if dest.is_symlink() or dest.is_file():
+        dest.unlink()
+    dest.mkdir(parents=True, exist_ok=True)
+    clear_generated(dest)
+    count = extract_package(service_dir, dest)
+    overlay_generated(service_dir, dest)
+    for transform in transforms:
+        transform(service_dir, dest)
+    return count
+
+
+class BuildContext:
+    """Read-only view of a service's deploy tree that extracts nothing.
+
+    Paths are relative to the tree root; generated files shadow package
+    members exactly as :func:`prepare_workdir` would lay them out.
+    """
+
+    def __init__(self, service_dir):
+        self.service_dir = Path(service_dir)
+        self._zip = None
+        self._top = None
+        self._opened = False
+
+    def _package(self):
+        if not self._opened:
+            self._opened = True
+            has_package = (self.service_dir / SOURCE_FILENAME).exists() or any(
+                self.service_dir.glob(PART_PREFIX + "*"))
+            if has_package:
+                try:
+                    self._zip = open_package_zip(self.service_dir)
+                except (zipfile.BadZipFile, PartsError, OSError):
+                    self._zip = None
+            if self._zip is not None:
+                self._top = top_level_dir(self._zip.namelist())
+        return self._zip
+
+    @property
+    def has_package(self):
+        return self._package() is not None
+
+    def _member(self, relpath):
+        return f"{self._top}/{relpath}" if self._top else relpath
+
+    def read(self, relpath):
+        """Return the bytes of ``relpath`` in the tree, or ``None``."""
+        relpath = relpath.lstrip("/")
+        while relpath.startswith("./"):
+            relpath = relpath[2:]
+        generated = self.service_dir / relpath
+        if relpath and not is_bank_file(relpath) and generated.is_file():
+            return generated.read_bytes()
+        zf = self._package()
+        if zf is None:
+            return None
+        try:
+            return zf.read(self._member(relpath))
+        except KeyError:
+            return None
+
+    def package_files(self):
+        """Return ``{relpath: size}`` for every file in the package."""
+        zf = self._package()
+        if zf is None:
+            return {}
+        strip = len(self._top) + 1 if self._top else 0
+        return {i.filename[strip:]: i.file_size for i in zf.infolist() if not i.is_dir()}
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def compose_command(workdir, *args):
+    """Return the ``docker compose`` argv for ``workdir``, overlays included."""
+    workdir = Path(workdir)
+    path = compose_file(workdir)
+    if path is None:
+        raise DeployError(f"no compose file in {workdir}")
+    cmd = ["docker", "compose", "-f", path.name]
+    for overlay in overlay_files(workdir):
+        cmd += ["-f", overlay.name]
+    return cmd + list(args)
+
+
+def compose(workdir, *args, timeout=None, check=True):
+    """Run ``docker compose <args>`` in ``workdir`` and return the result.
+
+    Overlays written by other bank tools (see :mod:`bank.compose`) are
+    applied after the service's own compose file.
+    """
+    workdir = Path(workdir)
+    cmd = compose_command(workdir, *args)
+    result = subprocess.run(cmd, cwd=workdir, capture_output=True, text=True, timeout=timeout)
+    if check and result.returncode != 0:
+        tail = (result.stderr or result.stdout).strip().splitlines()[-20:]
+        raise DeployError(f"{' '.join(cmd)} failed ({result.returncode}):\n" + "\n".join(tail))
+    return result
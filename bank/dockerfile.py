@@ -0,0 +1,199 @@
+"""Line-preserving Dockerfile parsing and editing.
+
+:class:`Dockerfile` splits a file into :class:`Instruction` objects that
+remember which source lines they came from, so tools can rewrite one
+instruction and leave comments, blank lines and continuation layout of the
+rest untouched.
+"""
+
+import json
+import re
+import shlex
+from dataclasses import dataclass
+
+SYNTAX_DIRECTIVE = "# syntax=docker/dockerfile:1"
+
+_DIRECTIVE = re.compile(r"^#\s*(\w+)\s*=\s*(\S+)\s*$")
+_HEREDOC = re.compile(r"<<-?\s*[\"']?(\w+)[\"']?")
+
+
+@dataclass
+class Instruction:
+    """One Dockerfile instruction.
+
+    ``value`` is the logical text after the keyword with line continuations
+    joined; ``start``/``end`` index the source lines it spans (end exclusive).
+    """
+
+    keyword: str
+    value: str
+    start: int
+    end: int
+
+    def flags_and_command(self):
+        """Split leading ``--flag=value`` options from the rest of the value."""
+        flags = {}
+        rest = self.value
+        while rest.startswith("--"):
+            name, _, tail = rest[2:].partition("=")
+            arg, _, rest = tail.partition(" ")
+            flags.setdefault(name, []).append(arg)
+            rest = rest.lstrip()
+        return flags, rest
+
+
+class Dockerfile:
+    """A parsed Dockerfile that can be edited instruction by instruction."""
+
+    def __init__(self, text):
+        self.lines = text.splitlines()
+        self.trailing_newline = text.endswith("\n")
+        self.escape = "\\"
+        for line in self.lines:
+            match = _DIRECTIVE.match(line)
+            if not match:
+                break
+            if match.group(1).lower() == "escape":
+                self.escape = match.group(2)
+        self.instructions = list(_parse(self.lines, self.escape))
+
+    @classmethod
+    def read(cls, path):
+        with open(path, encoding="utf-8", errors="surrogateescape") as f:
+            return cls(f.read())
+
+    def text(self):
+        return "\n".join(self.lines) + ("\n" if self.trailing_newline else "")
+
+    def source(self, instruction):
+        """Return the original source lines of ``instruction``."""
+        return self.lines[instruction.start:instruction.end]
+
+    def replace(self, instruction, new_lines):
+        """Replace the lines of ``instruction`` and re-parse the file."""
+        self.lines[instruction.start:instruction.end] = list(new_lines)
+        self.instructions = list(_parse(self.lines, self.escape))
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+    def stages(self):
+        """Return a list of ``(image, alias)`` pairs, one per ``FROM``."""
+        return [from_image(i) for i in self.instructions if i.keyword == "FROM"]
+
+    def has_syntax_directive(self):
+        for line in self.lines:
+            match = _DIRECTIVE.match(line)
+            if not match:
+                return False
+            if match.group(1).lower() == "syntax":
+                return True
+        return False
+
+    def ensure_syntax_directive(self):
+        """Prepend ``# syntax=docker/dockerfile:1`` unless a syntax is set."""
+        if not self.has_syntax_directive():
+            self.lines.insert(0, SYNTAX_DIRECTIVE)
+            self.instructions = list(_parse(self.lines, self.escape))
+
+
+def _parse(lines, escape):
+    i = 0
+    n = len(lines)
+    while i < n:
+        stripped = lines[i].strip()
+        if not stripped or stripped.startswith("#"):
+            i += 1
+            continue
+        start = i
+        keyword, _, rest = stripped.partition(" ")
+        parts = []
+        line = rest if rest else ""
+        while True:
+            body = line.rstrip()
+            if body.endswith(escape) and i + 1 < n:
+                parts.append(body[:-len(escape)].strip())
+                i += 1
+                while i < n and lines[i].strip().startswith("#"):
+                    i += 1
+                if i >= n:
+                    break
+                line = lines[i]
+                continue
+            parts.append(body.strip())
+            break
+        i += 1
+        value = " ".join(p for p in parts if p)
+        heredoc = _HEREDOC.search(value)
+        if heredoc and keyword.upper() in ("RUN", "COPY"):
+            marker = heredoc.group(1)
+            body = []
+            while i < n and lines[i].strip() != marker:
+                body.append(lines[i])
+                i += 1
+            i += 1
+            value = value + "\n" + "\n".join(body)
+        yield Instruction(keyword.upper(), value, start, min(i, n))
+
+
+def from_image(instruction):
+    """Return ``(image, alias)`` for a ``FROM`` instruction."""
+    _, rest = instruction.flags_and_command()
+    words = rest.split()
+    image = words[0] if words else ""
+    alias = words[2] if len(words) >= 3 and words[1].upper() == "AS" else None
+    return image, alias
+
+
+def add_run_flags(source_lines, flags):
+    """Insert ``flags`` (e.g. ``--mount=...``) right after ``RUN`` in a RUN's source.
+
+    Flags already present verbatim are not added twice.
+    """
+    lines = list(source_lines)
+    first = lines[0]
+    indent = first[: len(first) - len(first.lstrip())]
+    body = first.lstrip()
+    keyword, _, rest = body.partition(" ")
+    new = [f for f in flags if f not in "\n".join(lines)]
+    if new:
+        lines[0] = f"{indent}{keyword} {' '.join(new)} {rest.lstrip()}".rstrip()
+    return lines
+
+
+def copy_sources(instruction):
+    """Return ``(sources, dest, flags)`` for a ``COPY``/``ADD`` instruction."""
+    flags, rest = instruction.flags_and_command()
+    rest = rest.strip()
+    if rest.startswith("["):
+        try:
+            words = json.loads(rest)
+        except ValueError:
+            words = shlex.split(rest, posix=True)
+    else:
+        try:
+            words = shlex.split(rest, posix=True)
+        except ValueError:
+            words = rest.split()
+    if len(words) < 2:
+        return [], words[0] if words else "", flags
+    return words[:-1], words[-1], flags
+
+
+def split_shell_commands(command):
+    """Split a shell command line on ``&&``, ``||``, ``;`` and ``|``.
+
+    Quoted text is respected; each returned item is a list of words.
+    """
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=";&|")
+    lexer.whitespace_split = True
+    commands = [[]]
+    try:
+        for token in lexer:
+            if token and set(token) <= set(";&|"):
+                commands.append([])
+            else:
+                commands[-1].append(token)
+    except ValueError:
+        return [command.split()]
+    return [c for c in commands if c]
@@ -0,0 +1,424 @@
+"""Measured CPU, memory and disk I/O footprint of each service.
+
+A service is profiled while it starts and then under a synthetic load, and
+sampled every ``--interval`` seconds throughout:
+
+* ``wrapper`` launches the generated wrapper the way :mod:`bank.coldstart`
+  does (same sandbox, bootstrap and stubbing) and samples its whole process
+  tree from ``/proc``: ``stat`` for CPU time and RSS, ``io`` for bytes read
+  from and written to storage.  The tree is the wrapper's session, so worker
+  processes it forks are counted too.
+* ``container`` profiles a deployed compose stack in
+  ``<workdir>/<service_id>``.  The stack is stopped and started again, and
+  its containers' cgroups (v2) are sampled: ``cpu.stat``,
+  ``memory.current`` and ``io.stat``.  Readiness and load use the stack's
+  first HTTP probe target (see :mod:`bank.probes`).
+
+The startup phase runs from launch until the health route answers 2xx.
+The load phase then keeps ``--concurrency`` keep-alive connections issuing
+GETs against that route for ``--load-seconds``.  For each phase the
+profiler records the p50/p95 of CPU usage (in cores, between consecutive
+samples), the peak RSS, and the average read/write rate.
+
+Results replace the service's rows in the catalog's ``footprints`` table,
+which placement reads.  The full run, samples included, is appended to
+``.bank/bench/footprint.jsonl``.
+
+Usage::
+
+    python -m bank.footprint wrapper [<service_id> ...] [--load-seconds 10] [--python /venv/bin/python]
+    python -m bank.footprint container <service_id> ... [--workdir /home/ubuntu/deploy-projects]
+    python -m bank.footprint show [<service_id> ...]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .catalog import open_catalog, percentile
+from .coldstart import DEFAULT_TIMEOUT, bench as coldstart_bench, healthy, wrappers
+from .deploy import DEFAULT_WORKDIR, DeployError, compose, compose_file
+from .probes import stack_targets
+
+BENCH_FILENAME = "footprint.jsonl"
+PHASES = ("startup", "load")
+DEFAULT_INTERVAL = 0.1
+DEFAULT_LOAD_SECONDS = 10.0
+DEFAULT_CONCURRENCY = 4
+REQUEST_TIMEOUT = 5.0
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class FootprintError(Exception):
+    pass
+
+
+class ProcessTree:
+    """Usage counters summed over every process in the session led by ``pid``."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def read(self):
+        """Return ``(cpu_seconds, rss_bytes, read_bytes, write_bytes)``."""
+        cpu = rss = read = write = 0
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat", "rb") as f:
+                    fields = f.read().rpartition(b")")[2].split()
+                # fields[n] is field n + 3 of proc(5): session, utime, stime, cutime, cstime, rss
+                if int(fields[3]) != self.pid:
+                    continue
+                cpu += sum(int(value) for value in fields[11:15]) / _CLK_TCK
+                rss += int(fields[21]) * _PAGE_SIZE
+                with open(f"/proc/{name}/io", "rb") as f:
+                    counters = dict(line.split(b": ") for line in f.read().splitlines())
+                read += int(counters[b"read_bytes"])
+                write += int(counters[b"write_bytes"])
+            except (FileNotFoundError, ProcessLookupError, PermissionError, IndexError, KeyError, ValueError):
+                continue                                # exited, or not ours to read
+        return cpu, rss, read, write
+
+
+class Cgroups:
+    """Usage counters summed over the cgroups of some containers."""
+
+    def __init__(self, container_ids):
+        self.container_ids = list(container_ids)
+
+    def read(self):
+        cpu = rss = read = write = 0
+        for container_id in self.container_ids:
+            path = container_cgroup(container_id)
+            if path is None:
+                continue                                # not started yet
+            try:
+                stat = dict(line.split() for line in (path / "cpu.stat").read_text().splitlines())
+                cpu += int(stat["usage_usec"]) / 1e6
+                rss += int((path / "memory.current").read_text())
+                for line in (path / "io.stat").read_text().splitlines():
+                    for pair in line.split()[1:]:
+                        key, _, value = pair.partition("=")
+                        if key == "rbytes":
+                            read += int(value)
+                        elif key == "wbytes":
+                            write += int(value)
+            except (FileNotFoundError, KeyError, ValueError):
+                continue                                # stopped while we read it
+        return cpu, rss, read, write
+
+
+def container_cgroup(container_id):
+    """Return the cgroup v2 directory of a running container, or ``None``."""
+    for path in (CGROUP_ROOT / "system.slice" / f"docker-{container_id}.scope",   # systemd driver
+                 CGROUP_ROOT / "docker" / container_id):                         # cgroupfs driver
+        if path.is_dir():
+            return path
+    return None
+
+
+class Sampler(threading.Thread):
+    """Reads a counter source every ``interval`` seconds, tagging samples with the current phase."""
+
+    def __init__(self, source, interval=DEFAULT_INTERVAL):
+        super().__init__(daemon=True)
+        self.source = source
+        self.interval = interval
+        self.phase = PHASES[0]
+        self.samples = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def sample(self):
+        with self._lock:
+            self.samples.append((time.monotonic(), self.phase, *self.source.read()))
+
+    def mark(self, phase):
+        """Close the current phase with one sample and start ``phase``."""
+        self.sample()
+        self.phase = phase
+
+    def run(self):
+        while True:
+            self.sample()
+            if self._stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.sample()
+
+
+def summarise(samples, phase):
+    """Return the statistics of one phase, or ``None`` when it has fewer than two samples.
+
+    Each interval counts towards the phase of the sample that ends it.
+    """
+    samples = sorted(samples, key=lambda s: s[0])
+    intervals = [(a, b) for a, b in zip(samples, samples[1:]) if b[1] == phase and b[0] > a[0]]
+    if not intervals:
+        return None
+    first, last = intervals[0][0], intervals[-1][1]
+    seconds = last[0] - first[0]
+    cpu = sorted(max(0.0, b[2] - a[2]) / (b[0] - a[0]) for a, b in intervals)
+    return {
+        "seconds": round(seconds, 3),
+        "samples": len(intervals) + 1,
+        "cpu_p50": round(percentile(cpu, 50), 3),
+        "cpu_p95": round(percentile(cpu, 95), 3),
+        "peak_rss_mb": round(max(s[3] for s in [first] + [b for _, b in intervals]) / (1 << 20), 1),
+        "read_bps": round(max(0, last[4] - first[4]) / seconds),
+        "write_bps": round(max(0, last[5] - first[5]) / seconds),
+    }
+
+
+def drive_load(url, seconds=DEFAULT_LOAD_SECONDS, concurrency=DEFAULT_CONCURRENCY):
+    """GET ``url`` from ``concurrency`` keep-alive connections for ``seconds``; return counts and latency."""
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path or "/"
+    deadline = time.monotonic() + seconds
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker():
+        conn = None
+        mine, failed = [], 0
+        while time.monotonic() < deadline:
+            if conn is None:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=REQUEST_TIMEOUT)
+            started = time.monotonic()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+                else:
+                    mine.append(time.monotonic() - started)
+                if response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = None
+                time.sleep(0.05)
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    result = {"requests": len(latencies), "errors": errors[0], "rps": round(len(latencies) / seconds, 1)}
+    for pct in (50, 95):
+        value = percentile(latencies, pct)
+        result[f"latency_p{pct}_ms"] = None if value is None else round(value * 1000, 2)
+    return result
+
+
+class _Monitor:
+    """:func:`bank.coldstart.launch` monitor: samples the wrapper, then loads it once ready."""
+
+    def __init__(self, interval, load_seconds, concurrency):
+        self.interval = interval
+        self.load_seconds = load_seconds
+        self.concurrency = concurrency
+        self.sampler = None
+        self.load = None
+
+    def started(self, pid):
+        self.sampler = Sampler(ProcessTree(pid), self.interval)
+        self.sampler.start()
+
+    def ready(self, url):
+        self.sampler.mark("load")
+        if self.load_seconds > 0:
+            self.load = drive_load(url, self.load_seconds, self.concurrency)
+        self.close()
+
+    def close(self):
+        if self.sampler is not None and self.sampler.is_alive():
+            self.sampler.stop()
+
+
+def _result(service_id, source, sampler, load, **extra):
+    result = {"service_id": service_id, "source": source,
+              "at": datetime.now(timezone.utc).isoformat(timespec="seconds"), **extra}
+    result["phases"] = {phase: summarise(sampler.samples, phase) for phase in PHASES} if sampler else {}
+    if result["phases"].get("load") and load:
+        result["phases"]["load"].update(requests=load["requests"], errors=load["errors"])
+    result["load"] = load
+    result["samples"] = [[round(t - sampler.samples[0][0], 3), phase, round(cpu, 3), rss, read, write]
+                         for t, phase, cpu, rss, read, write in sampler.samples] if sampler else []
+    return result
+
+
+def profile_wrapper(service_dir, entry, interval=DEFAULT_INTERVAL, load_seconds=DEFAULT_LOAD_SECONDS,
+                    concurrency=DEFAULT_CONCURRENCY, **options):
+    """Profile one wrapper's startup and load; ``options`` go to :func:`bank.coldstart.launch`."""
+    monitor = _Monitor(interval, load_seconds, concurrency)
+    try:
+        record = coldstart_bench(service_dir, entry, runs=1, log=lambda line: None, monitor=monitor, **options)
+    finally:
+        monitor.close()
+    return _result(entry.service_id, "wrapper", monitor.sampler, monitor.load, ok=record["ok"],
+                   error=record.get("error"), ready_s=record["ready_s"], stubbed=record["stubbed"])
+
+
+def _container_ids(workdir):
+    ids = compose(workdir, "ps", "--all", "--quiet").stdout.split()
+    if not ids:
+        return []
+    result = subprocess.run(["docker", "inspect", "--format", "{{.Id}}", *ids], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise FootprintError(result.stderr.strip() or "docker inspect failed")
+    return result.stdout.split()
+
+
+def profile_container(service_id, root=None, workdir=DEFAULT_WORKDIR, interval=DEFAULT_INTERVAL,
+                      load_seconds=DEFAULT_LOAD_SECONDS, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+    """Restart a deployed stack and profile its containers' startup and load."""
+    target_dir = Path(workdir) / service_id
+    if compose_file(target_dir) is None:
+        raise FootprintError(f"{service_id}: not deployed in {workdir}")
+    target = next((t for t in stack_targets(service_id, services_dir(root) / service_id) if t.kind == "http"), None)
+    if target is None:
+        raise FootprintError(f"{service_id}: no published HTTP endpoint to wait for and load")
+    url = f"http://{target.host}:{target.port}{target.path}"
+    try:
+        container_ids = _container_ids(target_dir)
+        if not container_ids:
+            raise FootprintError(f"{service_id}: no containers; deploy the stack first")
+        compose(target_dir, "stop")
+        sampler = Sampler(Cgroups(container_ids), interval)
+        sampler.start()
+        try:
+            started = time.monotonic()
+            compose(target_dir, "start")
+            ready_s = error = load = None
+            while ready_s is None:
+                if healthy(url):
+                    ready_s = round(time.monotonic() - started, 3)
+                elif time.monotonic() - started > timeout:
+                    error = f"{target.path} not healthy after {timeout:.0f}s"
+                    break
+                else:
+                    time.sleep(interval)
+            if ready_s is not None:
+                sampler.mark("load")
+                if load_seconds > 0:
+                    load = drive_load(url, load_seconds, concurrency)
+        finally:
+            sampler.stop()
+    except DeployError as exc:
+        raise FootprintError(str(exc)) from exc
+    return _result(service_id, "container", sampler, load, ok=error is None, error=error, ready_s=ready_s,
+                   containers=len(container_ids))
+
+
+def save(results, root=None):
+    """Store results in the catalog and append them to the bench log."""
+    path = state_dir(root) / "bench"
+    path.mkdir(exist_ok=True)
+    with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    with open_catalog(root, refresh=False) as catalog:
+        for result in results:
+            if result["ok"]:
+                catalog.record_footprint(result)
+
+
+def _log(result):
+    if not result["ok"]:
+        print(f"{result['service_id']}  {result['source']:<9}  FAILED  {result['error']}", flush=True)
+        return
+    parts = []
+    for phase in PHASES:
+        stats = result["phases"].get(phase)
+        if stats:
+            parts.append(f"{phase} cpu {stats['cpu_p50']:.2f}/{stats['cpu_p95']:.2f} "
+                         f"rss {stats['peak_rss_mb']:.0f} MiB")
+    load = result["load"]
+    if load:
+        parts.append(f"{load['rps']:.0f} req/s")
+    print(f"{result['service_id']}  {result['source']:<9}  ready {result['ready_s']:6.2f}s  " + "  ".join(parts),
+          flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.footprint", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between samples")
+    common.add_argument("--load-seconds", type=float, default=DEFAULT_LOAD_SECONDS)
+    common.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="load connections")
+    common.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for health")
+    wrapper = sub.add_parser("wrapper", parents=[common], help="profile generated wrappers in a sandbox")
+    wrapper.add_argument("service_ids", nargs="*", help="default: every wrapper")
+    wrapper.add_argument("--python", default=sys.executable, help="interpreter to run wrappers with")
+    wrapper.add_argument("--source", action="store_true", help="extract the package into the sandbox too")
+    container = sub.add_parser("container", parents=[common], help="restart and profile deployed stacks")
+    container.add_argument("service_ids", nargs="+")
+    container.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR)
+    show = sub.add_parser("show", help="print stored footprints")
+    show.add_argument("service_ids", nargs="*")
+
+    args = parser.parse_args(argv)
+    if args.command == "show":
+        with open_catalog(args.root, refresh=False) as catalog:
+            footprints = catalog.footprints()
+        for service_id, phases in footprints.items():
+            if args.service_ids and service_id not in args.service_ids:
+                continue
+            for phase, row in phases.items():
+                print(f"{service_id}  {row['source']:<9} {phase:<7}  cpu p50 {row['cpu_p50']:5.2f} "
+                      f"p95 {row['cpu_p95']:5.2f}  rss {row['peak_rss_mb']:7.1f} MiB  "
+                      f"read {row['read_bps'] / 1e6:6.2f} MB/s  write {row['write_bps'] / 1e6:6.2f} MB/s")
+        return 0
+    options = dict(interval=args.interval, load_seconds=args.load_seconds, concurrency=args.concurrency,
+                   timeout=args.timeout)
+    results = []
+    if args.command == "wrapper":
+        for service_dir, entry in wrappers(args.root, args.service_ids):
+            results.append(profile_wrapper(service_dir, entry, python=args.python, source=args.source, **options))
+            _log(results[-1])
+    else:
+        for service_id in args.service_ids:
+            try:
+                results.append(profile_container(service_id, args.root, args.workdir, **options))
+            except FootprintError as exc:
+                print(f"error: {exc}", file=sys.stderr)
+                continue
+            _log(results[-1])
+    if not results:
+        print("error: nothing profiled", file=sys.stderr)
+        return 1
+    save(results, args.root)
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
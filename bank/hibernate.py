@@ -0,0 +1,518 @@
+"""Scale-to-zero proxy: hibernated services wake on their first request.
+
+The proxy holds a public port for every hibernated (``stopped``) service and
+keeps no backend running.  When a client connects and sends its first bytes,
+the proxy starts the service, polls its health route until it answers 2xx,
+and then replays the buffered bytes to it and pipes the connection both ways.
+Connections that arrive while the service wakes wait for the same wake.  A
+connection that never sends anything (a port scan, a TCP health check) does
+not wake the service.
+
+Backends:
+
+* ``wrapper`` (default) runs the generated wrapper with the
+  :mod:`bank.coldstart` bootstrap on a private port, from the full deploy
+  tree and with the GPU visible.  Unlike the benchmark it stubs nothing: a
+  wrapper whose imports fail fails its wake, and clients get 503 rather
+  than answers from stub modules.  Wrappers hard-code ports (``5000``,
+  ``8080`` ...), so each service gets its own public port from
+  ``--base-port`` on, kept stable in ``.bank/hibernate/ports.json``.
+* ``container`` runs the compose stack deployed in
+  ``<workdir>/<service_id>`` (the deploy tree is prepared on first wake).
+  The proxy holds the host port the stack publishes for its first HTTP probe
+  target (see :mod:`bank.probes`).  While the stack is awake a
+  ``hibernate`` overlay moves that mapping to a private loopback port; the
+  overlay is removed when the stack is stopped, so a later deploy of the
+  tree publishes the stack's own ports again.
+
+The most recently used ``--warm`` services stay up.  Waking one more stops
+the least recently used idle one, and services idle for ``--idle-timeout``
+seconds are stopped as well.  Every wake and stop is journaled
+(:mod:`bank.journal`): ``running`` with the wake time, then ``stopped``.
+
+Each wake and stop is also appended to ``.bank/bench/hibernate.jsonl``.
+``report`` prints the wake-latency distribution per service and how many
+connections each wake served, to tune ``--warm`` and ``--idle-timeout``.
+
+Usage::
+
+    python -m bank.hibernate serve [<service_id> ...] [--backend wrapper] [--warm 8] [--idle-timeout 900]
+    python -m bank.hibernate serve --backend container [--workdir /home/ubuntu/deploy-projects]
+    python -m bank.hibernate ports [<service_id> ...]
+    python -m bank.hibernate report
+"""
+
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .catalog import percentile
+from .coldstart import DEFAULT_TIMEOUT, free_port, healthy, make_sandbox, spawn, stop_process, wrappers
+from .compose import ComposeError, Override, load_compose, overlay_path, services, write_overlay
+from .deploy import DEFAULT_WORKDIR, DeployError, compose, compose_file, prepare_workdir
+from .journal import Journal
+from .probes import published_ports, stack_targets
+from .scheduler import SUCCESS_STATUS
+
+HIBERNATE_DIRNAME = "hibernate"
+PORTS_FILENAME = "ports.json"
+BENCH_FILENAME = "hibernate.jsonl"
+OVERLAY_NAME = "hibernate"
+HIBERNATED_STATUS = "stopped"
+DEFAULT_WARM = 8
+DEFAULT_IDLE_TIMEOUT = 900.0
+DEFAULT_BASE_PORT = 21000
+# Bytes read from a client before waking; the rest waits in the socket.
+BUFFER_LIMIT = 1 << 16
+FIRST_BYTES_TIMEOUT = 30.0
+HEALTH_INTERVAL = 0.05
+# A failed wake is not retried for this long; clients get 503 meanwhile.
+RETRY_AFTER = 10.0
+_UNAVAILABLE = (b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain\r\nContent-Length: 25\r\n"
+                b"Connection: close\r\n\r\nservice failed to start\r\n")
+
+
+class HibernateError(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+class WrapperBackend:
+    """A generated wrapper served from a deploy tree under ``parent``."""
+
+    kind = "wrapper"
+
+    def __init__(self, service_dir, entry, parent, python=sys.executable):
+        self.service_dir = service_dir
+        self.entry = entry
+        self.parent = Path(parent) / entry.service_id
+        self.python = python
+        self.route = entry.route
+        self.sandbox = self.bootstrap = self.proc = None
+
+    def start(self):
+        """Start the wrapper and return the ``(host, port)`` it will serve on."""
+        if self.sandbox is None:
+            self.parent.mkdir(parents=True)
+            self.sandbox, self.bootstrap = make_sandbox(self.service_dir, self.parent, source=True)
+        port = free_port()
+        with open(self.bootstrap.with_suffix(".stderr"), "wb") as stderr:
+            self.proc = spawn(self.entry, self.sandbox, self.bootstrap, port, self.python, stub_missing=False,
+                              stderr=stderr, cpu_only=False)
+        return "127.0.0.1", port
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def failure(self):
+        """Return the last line the wrapper wrote to stderr, if any."""
+        try:
+            lines = self.bootstrap.with_suffix(".stderr").read_text(errors="replace").strip().splitlines()
+        except (AttributeError, FileNotFoundError):
+            return ""
+        return lines[-1][:200] if lines else ""
+
+    def stop(self):
+        if self.alive():
+            stop_process(self.proc)
+        self.proc = None
+
+
+class ContainerBackend:
+    """A compose stack whose published HTTP port the proxy holds."""
+
+    kind = "container"
+
+    def __init__(self, service_id, service_dir, workdir, target):
+        self.service_dir = service_dir
+        self.workdir = Path(workdir) / service_id
+        self.target = target
+        self.route = target.path
+        self.compose_service = target.key.partition("/")[2]
+
+    def start(self):
+        if compose_file(self.workdir) is None:
+            prepare_workdir(self.service_dir, self.workdir)
+        doc = load_compose(compose_file(self.workdir))
+        service = services(doc).get(self.compose_service) or {}
+        kept, container_port = [], None
+        for entry in service.get("ports") or []:
+            mapping = published_ports({"ports": [entry]})
+            if container_port is None and self.target.port in mapping.values():
+                container_port = next(c for c, h in mapping.items() if h == self.target.port)
+            else:
+                kept.append(entry)
+        if container_port is None:
+            raise HibernateError(f"{self.compose_service} no longer publishes port {self.target.port}")
+        port = free_port()
+        kept.append(f"127.0.0.1:{port}:{container_port}")
+        write_overlay(self.workdir, OVERLAY_NAME, {"services": {self.compose_service: {"ports": Override(kept)}}})
+        compose(self.workdir, "up", "-d")
+        return "127.0.0.1", port
+
+    def alive(self):
+        return True                                     # the health route tells
+
+    def failure(self):
+        return ""
+
+    def stop(self):
+        if compose_file(self.workdir) is not None:
+            compose(self.workdir, "stop", check=False)
+        overlay_path(self.workdir, OVERLAY_NAME).unlink(missing_ok=True)
+
+
+@dataclass
+class Hibernated:
+    """One service behind the proxy."""
+
+    service_id: str
+    public_port: int
+    backend: object
+    state: str = "asleep"                               # or "awake"
+    address: tuple = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    active: int = 0
+    last_used: float = 0.0
+    woke_at: float = None
+    connections: int = 0
+    failed_at: float = None
+
+
+class Proxy:
+    """Listens for every hibernated service and wakes, warms and stops backends."""
+
+    def __init__(self, hibernated, root=None, host="127.0.0.1", warm=DEFAULT_WARM,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, wake_timeout=DEFAULT_TIMEOUT, journal=None, log=print):
+        self.hibernated = {h.service_id: h for h in hibernated}
+        self.root = root
+        self.host = host
+        self.warm = warm
+        self.idle_timeout = idle_timeout
+        self.wake_timeout = wake_timeout
+        self.journal = journal
+        self.log = log
+        self.awake = OrderedDict()                      # least recently used first
+        self.servers = []
+
+    async def run(self, stop):
+        """Serve until ``stop`` (an :class:`asyncio.Event`) is set, then stop every backend."""
+        for h in self.hibernated.values():
+            try:
+                server = await asyncio.start_server(lambda r, w, h=h: self._handle(h, r, w), self.host, h.public_port)
+            except OSError as exc:
+                self.log(f"{h.service_id}  port {h.public_port}: {exc.strerror}; skipped")
+                continue
+            self.servers.append(server)
+        self.log(f"holding {len(self.servers)} ports; warm set {self.warm}, idle timeout {self.idle_timeout:g}s")
+        reaper = asyncio.create_task(self._reap())
+        try:
+            await stop.wait()
+        finally:
+            reaper.cancel()
+            for server in self.servers:
+                server.close()
+            for h in list(self.awake.values()):
+                async with h.lock:
+                    await self._sleep(h, "shutdown")
+
+    async def _handle(self, h, reader, writer):
+        try:
+            first = await asyncio.wait_for(reader.read(BUFFER_LIMIT), FIRST_BYTES_TIMEOUT)
+        except (asyncio.TimeoutError, OSError):
+            first = b""
+        if not first:
+            writer.close()
+            return
+        h.active += 1
+        h.connections += 1
+        try:
+            if not await self._ensure_awake(h):
+                writer.write(_UNAVAILABLE)
+                await writer.drain()
+                return
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection(*h.address)
+            except OSError:
+                writer.write(_UNAVAILABLE)
+                await writer.drain()
+                return
+            upstream_writer.write(first)
+            await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+        except OSError:
+            pass
+        finally:
+            h.active -= 1
+            h.last_used = time.monotonic()
+            if h.service_id in self.awake:
+                self.awake.move_to_end(h.service_id)
+            writer.close()
+
+    async def _ensure_awake(self, h):
+        async with h.lock:
+            if h.state == "awake" and h.backend.alive():
+                self.awake.move_to_end(h.service_id)
+                return True
+            if h.state == "awake":
+                await self._sleep(h, "exited")
+            if h.failed_at is not None and time.monotonic() - h.failed_at < RETRY_AFTER:
+                return False
+            if not await self._wake(h):
+                return False
+        await self._evict()
+        return True
+
+    async def _wake(self, h):
+        started = time.monotonic()
+        error = None
+        try:
+            h.address = await asyncio.to_thread(h.backend.start)
+            url = f"http://{h.address[0]}:{h.address[1]}{h.backend.route}"
+            while not await asyncio.to_thread(healthy, url):
+                if not h.backend.alive():
+                    error = f"exited before {h.backend.route} answered"
+                elif time.monotonic() - started > self.wake_timeout:
+                    error = f"{h.backend.route} not healthy after {self.wake_timeout:.0f}s"
+                if error:
+                    break
+                await asyncio.sleep(HEALTH_INTERVAL)
+        except (HibernateError, DeployError, ComposeError, OSError) as exc:
+            error = str(exc)
+        wake_s = round(time.monotonic() - started, 3)
+        if error:
+            detail = h.backend.failure()
+            error += f": {detail}" if detail else ""
+            await asyncio.to_thread(h.backend.stop)
+            h.failed_at = time.monotonic()
+            self.log(f"{h.service_id}  wake FAILED after {wake_s:.2f}s  {error}")
+            self._event("wake", h, ok=False, wake_s=wake_s, error=error)
+            return False
+        h.state, h.woke_at, h.failed_at = "awake", time.monotonic(), None
+        h.last_used = h.woke_at
+        self.awake[h.service_id] = h
+        self.log(f"{h.service_id}  woke in {wake_s:.2f}s  ({len(self.awake)} awake)")
+        self._event("wake", h, ok=True, wake_s=wake_s, awake=len(self.awake))
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.record, h.service_id, SUCCESS_STATUS, source="hibernate",
+                                    wake_s=wake_s)
+        return True
+
+    async def _sleep(self, h, reason):
+        """Stop ``h``'s backend; the caller holds ``h.lock``."""
+        self.awake.pop(h.service_id, None)
+        await asyncio.to_thread(h.backend.stop)
+        awake_s = round(time.monotonic() - h.woke_at, 1) if h.woke_at else None
+        h.state, h.address = "asleep", None
+        self.log(f"{h.service_id}  stopped ({reason}) after {awake_s}s, {h.connections} connections")
+        self._event("sleep", h, reason=reason, awake_s=awake_s, connections=h.connections)
+        h.connections = 0
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.record, h.service_id, HIBERNATED_STATUS, source="hibernate",
+                                    reason=reason)
+
+    async def _evict(self):
+        """Stop least recently used idle services until the warm set fits."""
+        for h in list(self.awake.values()):
+            if len(self.awake) <= self.warm:
+                return
+            if h.active == 0 and not h.lock.locked():
+                async with h.lock:
+                    if h.state == "awake" and h.active == 0:
+                        await self._sleep(h, "evicted")
+
+    async def _reap(self):
+        interval = max(1.0, min(30.0, self.idle_timeout / 4))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for h in list(self.awake.values()):
+                if h.lock.locked() or h.active:
+                    continue
+                if not h.backend.alive() or (self.idle_timeout and now - h.last_used > self.idle_timeout):
+                    async with h.lock:
+                        if h.state == "awake" and not h.active:
+                            await self._sleep(h, "idle" if h.backend.alive() else "exited")
+
+    def _event(self, event, h, **fields):
+        record = {"event": event, "service_id": h.service_id, "backend": h.backend.kind, "at": _now(), **fields}
+        path = state_dir(self.root) / "bench"
+        path.mkdir(exist_ok=True)
+        with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(BUFFER_LIMIT)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except OSError:
+        pass
+    finally:
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+        except OSError:
+            pass
+
+
+def assigned_ports(service_ids, root=None, base_port=DEFAULT_BASE_PORT):
+    """Return ``{service_id: public_port}``, assigning new services the next free ports after ``base_port``."""
+    path = state_dir(root) / HIBERNATE_DIRNAME / PORTS_FILENAME
+    path.parent.mkdir(exist_ok=True)
+    try:
+        ports = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        ports = {}
+    used = set(ports.values())
+    next_port = base_port
+    changed = False
+    for service_id in service_ids:
+        if service_id in ports:
+            continue
+        while next_port in used:
+            next_port += 1
+        ports[service_id] = next_port
+        used.add(next_port)
+        changed = True
+    if changed:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(ports, indent=1, sort_keys=True), encoding="utf-8")
+        tmp.replace(path)
+    return {service_id: ports[service_id] for service_id in service_ids}
+
+
+def hibernated_wrappers(root, service_ids, parent, python=sys.executable, base_port=DEFAULT_BASE_PORT):
+    found = list(wrappers(root, service_ids))
+    ports = assigned_ports([entry.service_id for _, entry in found], root, base_port)
+    return [Hibernated(entry.service_id, ports[entry.service_id], WrapperBackend(service_dir, entry, parent, python))
+            for service_dir, entry in found]
+
+
+def hibernated_stacks(root, service_ids, workdir=DEFAULT_WORKDIR, log=print):
+    result, holders = [], {}
+    for service_id in service_ids:
+        service_dir = services_dir(root) / service_id
+        target = next((t for t in stack_targets(service_id, service_dir) if t.kind == "http"), None)
+        if target is None:
+            continue
+        if target.port in holders:
+            log(f"{service_id}  port {target.port} already held for {holders[target.port]}; skipped")
+            continue
+        holders[target.port] = service_id
+        result.append(Hibernated(service_id, target.port, ContainerBackend(service_id, service_dir, workdir, target)))
+    return result
+
+
+def report(root=None):
+    """Return per-service wake statistics from the event log, slowest p95 first."""
+    path = state_dir(root, create=False) / "bench" / BENCH_FILENAME
+    stats = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                entry = stats.setdefault(event["service_id"], {"wakes": [], "failed": 0, "connections": 0,
+                                                               "sleeps": 0})
+                if event["event"] == "wake":
+                    if event["ok"]:
+                        entry["wakes"].append(event["wake_s"])
+                    else:
+                        entry["failed"] += 1
+                elif event["event"] == "sleep":
+                    entry["sleeps"] += 1
+                    entry["connections"] += event["connections"]
+    rows = []
+    for service_id, entry in stats.items():
+        wakes = sorted(entry["wakes"])
+        rows.append({"service_id": service_id, "wakes": len(wakes), "failed": entry["failed"],
+                     "p50_s": percentile(wakes, 50), "p95_s": percentile(wakes, 95),
+                     "max_s": wakes[-1] if wakes else None,
+                     "connections_per_wake": round(entry["connections"] / entry["sleeps"], 1)
+                     if entry["sleeps"] else None})
+    rows.sort(key=lambda row: (-(row["p95_s"] or 0), row["service_id"]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.hibernate", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="hold the ports of hibernated services and wake them on demand")
+    serve.add_argument("service_ids", nargs="*", help="default: every stopped service")
+    serve.add_argument("--backend", choices=("wrapper", "container"), default="wrapper")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--warm", type=int, default=DEFAULT_WARM, help="services kept up after waking")
+    serve.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                       help="stop services idle this many seconds (0: only evict)")
+    serve.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for health")
+    serve.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT, help="first public port for wrappers")
+    serve.add_argument("--python", default=sys.executable, help="interpreter to run wrappers with")
+    serve.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR)
+    ports = sub.add_parser("ports", help="print the public port of each wrapper")
+    ports.add_argument("service_ids", nargs="*")
+    ports.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT)
+    sub.add_parser("report", help="wake-latency distribution per service")
+
+    args = parser.parse_args(argv)
+    if args.command == "report":
+        rows = report(args.root)
+        if not rows:
+            print("no wakes recorded")
+        for row in rows:
+            timing = (f"p50 {row['p50_s']:6.2f}s  p95 {row['p95_s']:6.2f}s  max {row['max_s']:6.2f}s"
+                      if row["wakes"] else f"{'':>36}")
+            per_wake = row["connections_per_wake"]
+            print(f"{row['service_id']}  {row['wakes']:>4} wakes  {row['failed']:>3} failed  {timing}  "
+                  f"{per_wake if per_wake is not None else '-'} connections/wake")
+        return 0
+    if args.command == "ports":
+        found = [entry.service_id for _, entry in wrappers(args.root, args.service_ids)]
+        for service_id, port in assigned_ports(found, args.root, args.base_port).items():
+            print(f"{service_id}  {port}")
+        return 0
+
+    journal = Journal(args.root)
+    service_ids = args.service_ids or sorted(sid for sid, entry in journal.statuses().items()
+                                             if entry["status"] == HIBERNATED_STATUS)
+    with tempfile.TemporaryDirectory(prefix="bank-hibernate-") as tmp:
+        if args.backend == "wrapper":
+            hibernated = hibernated_wrappers(args.root, service_ids, tmp, args.python, args.base_port)
+        else:
+            hibernated = hibernated_stacks(args.root, service_ids, args.workdir)
+        if not hibernated:
+            print("error: no services to hibernate", file=sys.stderr)
+            return 1
+        proxy = Proxy(hibernated, args.root, args.host, args.warm, args.idle_timeout, args.timeout, journal)
+
+        async def serve_until_signalled():
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+            await proxy.run(stop)
+
+        asyncio.run(serve_until_signalled())
+    journal.compact()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Parallel, resumable integrity scan of every package in the bank.
+
+Each package is opened as a zip and every member is read to the end, so
+:mod:`zipfile` checks its CRC-32.  Split packages first have their parts
+checked against the manifest (sizes and SHA-256).  Archives are verified on
+a process pool, largest first so the long ones do not trail at the end.
+
+Results go into the catalog's ``integrity`` table as each archive finishes.
+Every result carries the size and mtime of the package it checked, so an
+interrupted scan resumes where it stopped and later scans re-verify only
+packages that changed.  ``--full`` audits everything regardless; an
+unfinished full audit is resumed by the next ``--full`` run.  The
+scheduler skips packages whose last check failed: ``corrupt``,
+``unreadable`` and ``lfs-pointer`` (there is no archive to deploy).
+
+Statuses:
+
+* ``ok``: every member decompressed with a matching CRC;
+* ``corrupt``: the zip opens but members fail (listed in ``bad_members``);
+* ``unreadable``: not a zip, or missing/damaged parts;
+* ``lfs-pointer``: ``source.zip`` is a git-LFS pointer, not the archive.
+
+Usage::
+
+    python -m bank.integrity scan [<service_id> ...] [--workers N] [--full]
+    python -m bank.integrity report [--all]
+    python -m bank.integrity show <service_id>
+"""
+
+import argparse
+import os
+import sys
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from . import services_dir
+from .archive_index import archive_stamp
+from .catalog import LFS_POINTER_MAX, open_catalog
+from .metadata import iter_service_dirs
+from .parts import SOURCE_FILENAME, PartsError, check_parts, find_parts, open_package_zip
+
+READ_SIZE = 1 << 20
+# Bad members recorded per archive; the count covers all of them.
+MAX_BAD_MEMBERS = 20
+FAILED = ("corrupt", "unreadable", "lfs-pointer")
+
+
+def verify(service_dir, hashes=True):
+    """Check one package; return a result dict for :meth:`Catalog.record_integrity`."""
+    service_dir = Path(service_dir)
+    started = time.monotonic()
+    result = {"status": "ok", "members": 0, "checked_bytes": 0, "bad_members": [], "error": None}
+    source = service_dir / SOURCE_FILENAME
+    if source.exists() and source.stat().st_size <= LFS_POINTER_MAX:
+        with open(source, "rb") as f:
+            if f.read(LFS_POINTER_MAX).startswith(b"version https://git-lfs"):
+                result["status"] = "lfs-pointer"
+                return _finish(result, started)
+    if not source.exists() and find_parts(service_dir):
+        report = check_parts(service_dir, hashes=hashes)
+        if not report.ok:
+            result.update(status="unreadable", error="; ".join(report.problems()))
+            return _finish(result, started)
+    try:
+        zf = open_package_zip(service_dir)
+    except (zipfile.BadZipFile, PartsError, OSError, EOFError, ValueError) as exc:
+        result.update(status="unreadable", error=f"{type(exc).__name__}: {exc}")
+        return _finish(result, started)
+    bad = 0
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            result["members"] += 1
+            try:
+                with zf.open(info) as member:
+                    while member.read(READ_SIZE):
+                        pass
+            except (zipfile.BadZipFile, zlib.error, EOFError, OSError, NotImplementedError, RuntimeError) as exc:
+                bad += 1
+                if len(result["bad_members"]) < MAX_BAD_MEMBERS:
+                    result["bad_members"].append([info.filename, f"{type(exc).__name__}: {exc}"])
+                continue
+            result["checked_bytes"] += info.file_size
+    if bad:
+        result.update(status="corrupt", error=f"{bad} of {result['members']} members failed")
+    return _finish(result, started)
+
+
+def _finish(result, started):
+    result["seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def scan(root=None, service_ids=None, workers=None, full=False, progress=None):
+    """Verify new and changed packages (all of them with ``full``); return counts.
+
+    ``progress(service_id, result)`` is called as each archive finishes.
+    """
+    stats = {"checked": 0, "unchanged": 0, "removed": 0, "resumed": False}
+    with open_catalog(root, refresh=False) as catalog:
+        run_id = started_at = None
+        if full:
+            run_id, started_at, stats["resumed"] = catalog.integrity_run()
+        known = catalog.integrity()
+        todo = []
+        seen = set()
+        for service_id, service_dir in iter_service_dirs(root):
+            if service_ids and service_id not in service_ids:
+                continue
+            stamp = archive_stamp(service_dir)
+            if stamp is None:
+                continue
+            seen.add(service_id)
+            previous = known.get(service_id)
+            if previous and (previous["layout"], previous["size"], previous["mtime_ns"]) == stamp and \
+                    (started_at is None or previous["checked_at"] >= started_at):
+                stats["unchanged"] += 1
+                continue
+            todo.append((service_id, service_dir, stamp))
+        if not service_ids:
+            removed = [service_id for service_id in known if service_id not in seen]
+            catalog.forget_integrity(removed)
+            stats["removed"] = len(removed)
+        todo.sort(key=lambda item: item[2][1], reverse=True)
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {pool.submit(verify, service_dir): (service_id, stamp)
+                       for service_id, service_dir, stamp in todo}
+            for future in as_completed(futures):
+                service_id, (layout, size, mtime_ns) = futures[future]
+                result = dict(future.result(), service_id=service_id, layout=layout, size=size,
+                              mtime_ns=mtime_ns, checked_at=time.time())
+                catalog.record_integrity(result)
+                stats["checked"] += 1
+                stats[result["status"]] = stats.get(result["status"], 0) + 1
+                if progress:
+                    progress(service_id, result)
+        finally:
+            pool.shutdown(cancel_futures=True)
+        if run_id is not None and not service_ids:
+            catalog.finish_integrity_run(run_id)
+    return stats
+
+
+def failed_packages(catalog, root=None):
+    """Return ``{service_id: result}`` for unchanged packages whose last check failed."""
+    failed = {}
+    for service_id, result in catalog.integrity().items():
+        stamp = (result["layout"], result["size"], result["mtime_ns"])
+        if result["status"] in FAILED and archive_stamp(services_dir(root) / service_id) == stamp:
+            failed[service_id] = result
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.integrity", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sc = sub.add_parser("scan", help="verify new and changed packages")
+    sc.add_argument("service_ids", nargs="*")
+    sc.add_argument("--workers", type=int, default=os.cpu_count(), help="processes (default: one per core)")
+    sc.add_argument("--full", action="store_true", help="re-verify unchanged packages too (resumable)")
+    sc.add_argument("--quiet", action="store_true", help="only print failures and the summary")
+    report = sub.add_parser("report", help="list packages whose last check failed")
+    report.add_argument("--all", action="store_true", help="list every package")
+    show = sub.add_parser("show", help="print the last result for one package")
+    show.add_argument("service_id")
+
+    args = parser.parse_args(argv)
+    if args.command == "scan":
+        def progress(service_id, result):
+            if result["status"] in FAILED or not args.quiet:
+                note = f"  {result['error']}" if result["error"] else ""
+                print(f"{service_id}  {result['status']:<11} {result['members']:>6} members "
+                      f"{result['seconds']:7.2f}s{note}", flush=True)
+
+        started = time.monotonic()
+        try:
+            stats = scan(args.root, set(args.service_ids), args.workers, args.full, progress)
+        except KeyboardInterrupt:
+            print("interrupted; results so far are saved, run again to resume", file=sys.stderr)
+            return 130
+        counts = "  ".join(f"{key} {value}" for key, value in stats.items() if key != "resumed")
+        print(f"{'resumed; ' if stats['resumed'] else ''}{counts}  ({time.monotonic() - started:.1f}s)")
+        return 1 if any(stats.get(status) for status in FAILED) else 0
+    with open_catalog(args.root, refresh=False) as catalog:
+        if args.command == "report":
+            results = catalog.integrity()
+            counts = {}
+            for result in results.values():
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+            print("  ".join(f"{status} {n}" for status, n in sorted(counts.items())) or "no results; run scan")
+            for service_id, result in results.items():
+                if args.all or result["status"] in FAILED:
+                    print(f"{service_id}  {result['status']:<11} {result['error'] or ''}")
+        elif args.command == "show":
+            result = catalog.integrity(args.service_id).get(args.service_id)
+            if result is None:
+                print(f"error: {args.service_id}: not scanned", file=sys.stderr)
+                return 1
+            for key in ("status", "layout", "size", "members", "checked_bytes", "seconds", "error"):
+                print(f"{key + ':':<15}{result[key]}")
+            print(f"{'checked:':<15}{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(result['checked_at']))}")
+            for name, error in result["bad_members"]:
+                print(f"  {name}: {error}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""Append-only status journal with periodic compaction into ``metadata.json``.
+
+Deploy workers no longer rewrite ``metadata.json`` for every status change.
+Each change is appended as one JSON line to ``.bank/journal/status.jsonl``:
+service id, old and new status, timestamp, and whatever else the caller
+attaches (the scheduler adds phase durations and errors).
+
+Appends are group-committed.  While one thread writes and fsyncs a batch,
+the others queue their records, and the next writer flushes all of them
+with a single fsync.  An exclusive ``flock`` on the journal directory
+orders appends and compaction across processes.
+
+The current status of every service is the snapshot in
+``.bank/journal/status.json`` with the journal replayed over it.  Reading
+it does not scan the tree: the first view is seeded from the catalog, and
+later ones only read the catalog's stored ``metadata.json`` stamps.
+``metadata.json`` stays editable by hand: when the catalog shows a
+service's ``metadata.json`` modified after both the snapshot and that
+service's last journal record, and with a different status, that status
+wins.  Such edits are picked up whenever the catalog is refreshed (the
+scheduler does so before it reads the view), by ``refresh()`` and
+``status --refresh``, and at the latest by the next compaction.
+
+Compaction (``compact``, automatic once the journal passes
+:data:`COMPACT_BYTES`, and at the end of every scheduler run) does three
+things, in order, under the lock:
+
+1. writes the new status of each journaled service into its
+   ``metadata.json``;
+2. replaces the snapshot;
+3. moves the journal's records to ``history.jsonl`` and truncates it.
+
+Records only ever set an absolute status, so replaying a journal that a
+crash left untruncated is harmless.
+
+Usage::
+
+    python -m bank.journal status [--status stopped] [--refresh] [<service_id> ...]
+    python -m bank.journal log [<service_id>] [--tail 20] [--history]
+    python -m bank.journal set <service_id> <status>
+    python -m bank.journal compact
+    python -m bank.journal bench [--threads 8] [--updates 2000]
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from . import state_dir
+from .catalog import open_catalog
+from .metadata import load_metadata, metadata_path, write_metadata
+
+JOURNAL_DIRNAME = "journal"
+JOURNAL_FILENAME = "status.jsonl"
+SNAPSHOT_FILENAME = "status.json"
+HISTORY_FILENAME = "history.jsonl"
+LOCK_FILENAME = "lock"
+# Compact automatically once the journal grows past this many bytes.
+COMPACT_BYTES = 1 << 20
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _iso(ns):
+    return datetime.fromtimestamp(ns / 1e9, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _ns(at):
+    return int(datetime.fromisoformat(at).timestamp() * 1e9) if at else 0
+
+
+class Journal:
+    """Thread-safe, group-committed status journal of one bank root."""
+
+    def __init__(self, root=None, compact_bytes=COMPACT_BYTES):
+        self.root = root
+        self.compact_bytes = compact_bytes
+        self.dir = state_dir(root) / JOURNAL_DIRNAME
+        self.dir.mkdir(exist_ok=True)
+        self.path = self.dir / JOURNAL_FILENAME
+        self.snapshot_path = self.dir / SNAPSHOT_FILENAME
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0
+        self._durable = 0
+        self._flushing = False
+        self._state = None
+        self.fsyncs = 0
+
+    # -- reading ------------------------------------------------------------
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"compacted_at": None, "services": {}}
+
+    def events(self, history=False):
+        """Yield the journal records since the last compaction (or ever, with ``history``), oldest first."""
+        if history:
+            yield from _read_events(self.dir / HISTORY_FILENAME)
+        yield from _read_events(self.path)
+
+    def _replay(self, refresh=False):
+        snapshot = self._load_snapshot()
+        state = snapshot["services"]
+        for event in self.events():
+            state[event["service_id"]] = {"status": event["new"], "at": event["at"]}
+        with open_catalog(self.root, refresh=False) as catalog:
+            stamps = catalog.status_stamps()
+            if refresh or not stamps:
+                catalog.refresh()
+                stamps = catalog.status_stamps()
+        compacted_ns = _ns(snapshot["compacted_at"])
+        for service_id, (status, mtime_ns) in stamps.items():
+            entry = state.get(service_id)
+            if entry is None:
+                state[service_id] = {"status": status, "at": None}
+            elif entry["status"] != status and mtime_ns > max(compacted_ns, _ns(entry["at"])):
+                # metadata.json was edited after everything the journal knows
+                state[service_id] = {"status": status, "at": _iso(mtime_ns)}
+        return state
+
+    def statuses(self):
+        """Return ``{service_id: {"status", "at"}}`` for every known service."""
+        with self._cond:
+            if self._state is None:
+                self._state = self._replay()
+            return {sid: dict(entry) for sid, entry in self._state.items()}
+
+    def status(self, service_id):
+        entry = self.statuses().get(service_id)
+        return entry and entry["status"]
+
+    def refresh(self):
+        """Refresh the catalog, so ``metadata.json`` edits are seen, and return :meth:`statuses`."""
+        with self._cond:
+            while self._flushing or self._pending:
+                self._cond.wait()
+            self._state = self._replay(refresh=True)
+        return self.statuses()
+
+    # -- writing ------------------------------------------------------------
+
+    def record(self, service_id, status, **fields):
+        """Append a status change and return once it is on disk.
+
+        Extra ``fields`` (phase durations, errors ...) are stored with it.
+        """
+        with self._cond:
+            if self._state is None:
+                self._state = self._replay()
+            previous = self._state.get(service_id, {}).get("status")
+            event = dict(fields, service_id=service_id, old=previous, new=status, at=_now())
+            self._state[service_id] = {"status": status, "at": event["at"]}
+            self._pending.append(json.dumps(event, ensure_ascii=False) + "\n")
+            self._appended += 1
+            target = self._appended
+            while self._durable < target:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flushing = True
+                batch, self._pending = self._pending, []
+                upto = self._appended
+                self._cond.release()
+                written = False
+                try:
+                    size = self._write(batch)
+                    written = True
+                    if size >= self.compact_bytes:
+                        self.compact()
+                finally:
+                    self._cond.acquire()
+                    self._flushing = False
+                    if written:
+                        self._durable = max(self._durable, upto)
+                    else:
+                        # Nothing of the batch is durable: requeue it for the next writer,
+                        # so the waiters whose records it held do not return early.
+                        self._pending[:0] = batch
+                    self._cond.notify_all()
+            return event
+
+    def _write(self, lines):
+        with self._locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, "".join(lines).encode("utf-8"))
+                os.fsync(fd)
+                self.fsyncs += 1
+                return os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+
+    def _locked(self):
+        return _Flock(self.dir / LOCK_FILENAME)
+
+    def compact(self):
+        """Fold the journal into ``metadata.json`` and the snapshot; return the services written."""
+        with self._locked():
+            state = self._replay(refresh=True)
+            changed = {event["service_id"] for event in self.events()}
+            written = 0
+            for service_id in sorted(changed):
+                path = metadata_path(service_id, self.root)
+                try:
+                    meta = load_metadata(path)
+                except FileNotFoundError:
+                    continue
+                if meta.get("status") != state[service_id]["status"]:
+                    meta["status"] = state[service_id]["status"]
+                    write_metadata(path, meta)
+                    written += 1
+            _atomic_write(self.snapshot_path, {"compacted_at": _now(), "services": state})
+            with open(self.path, "rb") as src, open(self.dir / HISTORY_FILENAME, "ab") as dest:
+                dest.write(src.read())
+            with open(self.path, "w"):
+                pass
+        return written
+
+
+def _read_events(path):
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            if line.endswith("\n"):  # a torn last line is still being written
+                yield json.loads(line)
+
+
+class _Flock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(prefix=".tmp.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def bench(threads=8, updates=2000, services=50):
+    """Time ``updates`` status flips from ``threads`` workers: journal vs. metadata rewrites."""
+    result = {"threads": threads, "updates": updates}
+    with tempfile.TemporaryDirectory(prefix="bank-journal-") as tmp:
+        ids = [f"{n:024x}" for n in range(services)]
+        for service_id in ids:
+            path = metadata_path(service_id, tmp)
+            path.parent.mkdir(parents=True)
+            write_metadata(path, {"service_id": service_id, "status": "stopped"})
+        journal = Journal(tmp, compact_bytes=1 << 40)
+        lock = threading.Lock()
+
+        def rewrite(n):
+            with lock:  # what the scheduler's read-modify-write did
+                path = metadata_path(ids[n % services], tmp)
+                meta = load_metadata(path)
+                meta["status"] = "deploying" if n % 2 else "stopped"
+                write_metadata(path, meta)
+
+        def append(n):
+            journal.record(ids[n % services], "deploying" if n % 2 else "stopped")
+
+        for label, fn in (("metadata", rewrite), ("journal", append)):
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                for _ in pool.map(fn, range(updates)):
+                    pass
+            elapsed = time.monotonic() - started
+            result[f"{label}_per_s"] = round(updates / elapsed)
+        result["journal_fsyncs"] = journal.fsyncs
+        started = time.monotonic()
+        result["compacted"] = journal.compact()
+        result["compact_s"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.journal", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    st = sub.add_parser("status", help="current status of services, from snapshot and journal")
+    st.add_argument("service_ids", nargs="*")
+    st.add_argument("--status", help="only services with this status")
+    st.add_argument("--refresh", action="store_true", help="refresh the catalog first to pick up metadata.json edits")
+    lg = sub.add_parser("log", help="status changes since the last compaction")
+    lg.add_argument("service_id", nargs="?")
+    lg.add_argument("--tail", type=int, default=20)
+    lg.add_argument("--history", action="store_true", help="include compacted records")
+    setter = sub.add_parser("set", help="record a status change")
+    setter.add_argument("service_id")
+    setter.add_argument("status")
+    sub.add_parser("compact", help="write journaled statuses into metadata.json and truncate the journal")
+    bn = sub.add_parser("bench", help="journal vs. metadata.json rewrites under concurrent updates")
+    bn.add_argument("--threads", type=int, default=8)
+    bn.add_argument("--updates", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        print(json.dumps(bench(args.threads, args.updates)))
+        return 0
+    journal = Journal(args.root)
+    if args.command == "status":
+        statuses = journal.refresh() if args.refresh else journal.statuses()
+        selected = {sid: statuses[sid] for sid in args.service_ids if sid in statuses} if args.service_ids \
+            else statuses
+        if args.status:
+            selected = {sid: e for sid, e in selected.items() if e["status"] == args.status}
+        if args.service_ids or args.status:
+            for service_id, entry in sorted(selected.items()):
+                print(f"{service_id}  {entry['status']:<10} {entry['at'] or ''}")
+        else:
+            for status, n in Counter(e["status"] for e in selected.values()).most_common():
+                print(f"{n:>5}  {status}")
+    elif args.command == "log":
+        events = [e for e in journal.events(args.history) if args.service_id in (None, e["service_id"])]
+        for event in events[-args.tail:]:
+            extra = {k: v for k, v in event.items() if k not in ("service_id", "old", "new", "at")}
+            print(f"{event['at']}  {event['service_id']}  {event['old']} -> {event['new']}"
+                  f"{'  ' + json.dumps(extra) if extra else ''}")
+    elif args.command == "set":
+        if args.service_id not in journal.statuses():
+            print(f"error: unknown service {args.service_id}", file=sys.stderr)
+            return 1
+        event = journal.record(args.service_id, args.status, source="cli")
+        print(f"{args.service_id}: {event['old']} -> {event['new']}")
+    elif args.command == "compact":
+        print(f"wrote {journal.compact()} metadata.json files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Background imports and model loading for generated wrappers.
+
+This module is the runtime half of :mod:`bank.lazyimport`.  The transform
+copies it next to a rewritten wrapper as ``bank_lazy.py``.  It therefore
+depends on nothing but the standard library and never imports ``bank``.
+
+A rewritten wrapper binds its heavy names to proxies instead of importing
+them::
+
+    import bank_lazy
+    torch = bank_lazy.module(globals(), "torch", "torch")
+    load_model = bank_lazy.attr(globals(), "load_model", "tensorflow.keras.models", "load_model")
+    omniparser = bank_lazy.deferred(globals(), "omniparser", lambda: Omniparser(config))
+
+Each call queues the load on a single background thread, in source order,
+and returns at once, so the wrapper reaches ``app.run()`` and binds its port
+immediately.  When a load finishes, the real object replaces the proxy in
+the wrapper's globals.  Code that touches a proxy earlier blocks until that
+load is done and then sees exactly what an eager import would have
+produced.  A failed load is printed to stderr and re-raised on every use of
+the proxy.  Routes that never touch a heavy name, such as ``/health``,
+answer while the models are still loading.
+
+``ready()`` tells a health route whether everything has loaded.
+"""
+
+import importlib
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent import futures
+
+_queue = deque()
+_pending = []
+_cv = threading.Condition()
+_worker = None
+
+
+def _run():
+    while True:
+        with _cv:
+            while not _queue:
+                _cv.wait()
+            future, label, load = _queue.popleft()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            value = load()
+        except BaseException as exc:
+            print(f"bank_lazy: loading {label} failed", file=sys.stderr)
+            traceback.print_exc()
+            future.set_exception(exc)
+        else:
+            future.set_result(value)
+
+
+def _submit(label, load):
+    global _worker
+    future = futures.Future()
+    with _cv:
+        _queue.append((future, label, load))
+        _pending.append(future)
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="bank-lazy", daemon=True)
+            _worker.start()
+        _cv.notify()
+    return future
+
+
+class _Proxy:
+    """Stands in for a value that is still loading."""
+
+    __slots__ = ("_bank_future", "_bank_label", "_bank_namespace", "_bank_name")
+
+    def __init__(self, future, label, namespace, name):
+        object.__setattr__(self, "_bank_future", future)
+        object.__setattr__(self, "_bank_label", label)
+        object.__setattr__(self, "_bank_namespace", namespace)
+        object.__setattr__(self, "_bank_name", name)
+        future.add_done_callback(lambda _: self._bank_rebind())
+
+    def _bank_rebind(self):
+        # The wrapper may have rebound the name itself meanwhile; keep that.
+        future = self._bank_future
+        if not future.exception() and self._bank_namespace.get(self._bank_name) is self:
+            self._bank_namespace[self._bank_name] = future.result()
+
+    def _bank_value(self):
+        value = self._bank_future.result()
+        self._bank_rebind()
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._bank_value(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._bank_value(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._bank_value()(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._bank_value()[key]
+
+    def __iter__(self):
+        return iter(self._bank_value())
+
+    def __len__(self):
+        return len(self._bank_value())
+
+    def __bool__(self):
+        return bool(self._bank_value())
+
+    def __contains__(self, item):
+        return item in self._bank_value()
+
+    def __enter__(self):
+        return self._bank_value().__enter__()
+
+    def __exit__(self, *exc):
+        return self._bank_value().__exit__(*exc)
+
+    def __repr__(self):
+        if self._bank_future.done() and not self._bank_future.exception():
+            return repr(self._bank_future.result())
+        return f"<loading {self._bank_label}>"
+
+
+def _bind(namespace, name, load, label):
+    return _Proxy(_submit(label, load), label, namespace, name)
+
+
+def module(namespace, name, qualified, package=False):
+    """Lazily ``import qualified`` and bind it as ``name``.
+
+    With ``package`` the top-level package is bound instead, as a plain
+    ``import a.b`` binds ``a``.
+    """
+    def load():
+        loaded = importlib.import_module(qualified)
+        return sys.modules[qualified.partition(".")[0]] if package else loaded
+    return _bind(namespace, name, load, qualified)
+
+
+def attr(namespace, name, module_name, attribute):
+    """Lazily ``from module_name import attribute``."""
+    def load():
+        loaded = importlib.import_module(module_name)
+        try:
+            return getattr(loaded, attribute)
+        except AttributeError:
+            return importlib.import_module(f"{module_name}.{attribute}")
+    return _bind(namespace, name, load, f"{module_name}.{attribute}")
+
+
+def deferred(namespace, name, fn):
+    """Lazily evaluate ``name = fn()`` after the imports queued before it."""
+    return _bind(namespace, name, fn, name)
+
+
+def background(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the loader thread; return its future."""
+    return _submit(getattr(fn, "__name__", repr(fn)), lambda: fn(*args, **kwargs))
+
+
+def ready():
+    """True once every queued load has finished (successfully or not)."""
+    with _cv:
+        return all(future.done() for future in _pending)
+
+
+def wait(timeout=None):
+    """Block until every queued load has finished; return :func:`ready`."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _cv:
+        pending = list(_pending)
+    for future in pending:
+        try:
+            future.exception(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except futures.TimeoutError:
+            break
+    return ready()
@@ -0,0 +1,476 @@
+"""Lazy imports for the generated Python wrappers, with an import-time report.
+
+Wrappers such as ``service.py`` (torch, cv2, ``lib.networks``) or
+``omniparserserver.py`` (builds Omniparser at import) take seconds to bind
+their port.  Until then ``/health`` is unreachable and orchestrators mark
+the service unhealthy.  This transform rewrites such a wrapper so that its
+heavy work runs on a background thread, using the small runtime in
+:mod:`bank.lazy` (shipped next to the wrapper as ``bank_lazy.py``):
+
+* A module-level import is made lazy unless it is stdlib, a web framework,
+  or a name the module itself needs while it executes (a base class, a
+  decorator, a default argument, anything in the ``__main__`` block), or a
+  class used by ``isinstance``, ``issubclass`` or an ``except`` clause
+  anywhere, since a lazy name is a proxy object until its load finishes.
+* ``name = Call(...)`` at module level becomes a deferred value when the
+  callee is a lazy name or a class defined in the wrapper, and ``name`` is
+  not used at module level afterwards.
+* In the ``__main__`` block, argument-less calls of the wrapper's own
+  functions that come before the server starts (``load_model_once()``) run
+  in the background instead.
+
+Statements that share a line with others are left alone.  Wrappers are only
+rewritten when the Dockerfile ships ``bank_lazy.py`` with them, either via a
+``COPY`` of their directory or by an inserted ``COPY bank_lazy.py``.
+
+``report`` measures what this buys.  It launches each wrapper with the
+:mod:`bank.coldstart` harness twice, eager and lazy, both under
+``-X importtime``.  It prints the readiness time saved and the cumulative
+import time of every deferred package, and appends the results to
+``.bank/bench/lazyimport.jsonl``.
+
+Usage::
+
+    python -m bank.lazyimport plan [<service_id> ...]
+    python -m bank.lazyimport rewrite <service_id>
+    python -m bank.lazyimport report [<service_id> ...] [--python /venv/bin/python]
+"""
+
+import argparse
+import ast
+import difflib
+import json
+import shutil
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .coldstart import DEFAULT_TIMEOUT, FRAMEWORKS, bench, wrappers
+from .deploy import is_bank_file, record_generated
+from .dockerfile import Dockerfile, copy_sources
+from .metadata import iter_service_dirs
+
+RUNTIME_FILENAME = "bank_lazy.py"
+BENCH_FILENAME = "lazyimport.jsonl"
+DEFAULT_RUNS = 3
+# Needed before the port is bound, or too small to be worth deferring.
+EAGER_PACKAGES = frozenset(FRAMEWORKS) | {
+    "pydantic", "typing_extensions", "jinja2", "markupsafe", "itsdangerous", "click", "dotenv", "bank_lazy",
+}
+_SERVER_CALLS = frozenset({"run", "serve_forever", "launch"})
+
+
+@dataclass
+class Rewrite:
+    """The lazy rewrite of one wrapper."""
+
+    path: str
+    text: str
+    lazy: list = field(default_factory=list)          # (name, "module.qualname")
+    deferred: list = field(default_factory=list)      # names
+    background: list = field(default_factory=list)    # function names
+
+    @property
+    def changed(self):
+        return bool(self.lazy or self.deferred or self.background)
+
+
+def _is_main_block(node):
+    if not isinstance(node, ast.If) or not isinstance(node.test, ast.Compare):
+        return False
+    parts = [node.test.left, *node.test.comparators]
+    return (any(isinstance(p, ast.Name) and p.id == "__name__" for p in parts)
+            and any(isinstance(p, ast.Constant) and p.value == "__main__" for p in parts))
+
+
+def _callee_root(call):
+    func = call.func
+    while isinstance(func, (ast.Attribute, ast.Call, ast.Subscript)):
+        func = func.func if isinstance(func, ast.Call) else func.value
+    return func.id if isinstance(func, ast.Name) else None
+
+
+def _import_bindings(node):
+    """Yield ``(bound_name, alias)`` for an import statement."""
+    for alias in node.names:
+        if isinstance(node, ast.Import):
+            yield alias.asname or alias.name.partition(".")[0], alias
+        else:
+            yield alias.asname or alias.name, alias
+
+
+def _lazy_candidate(node):
+    if isinstance(node, ast.Import):
+        return True
+    return (isinstance(node, ast.ImportFrom) and node.level == 0 and node.module != "__future__"
+            and not any(alias.name == "*" for alias in node.names))
+
+
+def _package(node, alias):
+    return (alias.name if isinstance(node, ast.Import) else node.module).partition(".")[0]
+
+
+class _Loads(ast.NodeVisitor):
+    """Collect names a module reads while it executes (not inside function bodies)."""
+
+    def __init__(self, skip, postponed_annotations):
+        self.names = set()
+        self.skip = skip
+        self.postponed = postponed_annotations
+
+    def visit(self, node):
+        if id(node) not in self.skip:
+            super().visit(node)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.names.add(node.id)
+
+    def _signature(self, node):
+        for expr in node.decorator_list:
+            self.visit(expr)
+        for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+            self.visit(default)
+        if not self.postponed:
+            args = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+            args += [a for a in (node.args.vararg, node.args.kwarg) if a is not None]
+            for arg in args:
+                if arg.annotation is not None:
+                    self.visit(arg.annotation)
+            if node.returns is not None:
+                self.visit(node.returns)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = _signature
+
+    def visit_Lambda(self, node):
+        for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+            self.visit(default)
+
+
+def _class_uses(tree):
+    """Return names used as ``isinstance``/``issubclass``/``except`` classes, function bodies included."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler):
+            expr = node.type
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+              and node.func.id in ("isinstance", "issubclass") and len(node.args) == 2):
+            expr = node.args[1]
+        else:
+            continue
+        for elt in expr.elts if isinstance(expr, ast.Tuple) else [expr]:
+            if isinstance(elt, ast.Name):
+                names.add(elt.id)
+    return names
+
+
+def _bound_counts(tree):
+    """Count how often each name is bound outside function bodies."""
+    counts = {}
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        names = []
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names = [name for name, _ in _import_bindings(node)]
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names = [node.name]
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names = [node.id]
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(node))
+    return counts
+
+
+def _owns_lines(body, index):
+    node = body[index]
+    if index + 1 < len(body) and body[index + 1].lineno <= node.end_lineno:
+        return False
+    return index == 0 or body[index - 1].end_lineno < node.lineno
+
+
+def plan(text, path="<wrapper>"):
+    """Return the :class:`Rewrite` of a wrapper's source ``text``."""
+    tree = ast.parse(text)
+    body = tree.body
+    postponed = any(isinstance(n, ast.ImportFrom) and n.module == "__future__"
+                    and any(a.name == "annotations" for a in n.names) for n in body)
+    bound = _bound_counts(tree)
+    class_uses = _class_uses(tree)
+    classes = {n.name for n in body if isinstance(n, ast.ClassDef)}
+    functions = {n.name for n in body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))}
+
+    candidates = {}
+    for i, node in enumerate(body):
+        if _lazy_candidate(node) and _owns_lines(body, i):
+            for name, alias in _import_bindings(node):
+                if _package(node, alias) not in EAGER_PACKAGES and _package(node, alias) not in sys.stdlib_module_names:
+                    candidates[name] = (node, alias)
+    assignments = {
+        i: node for i, node in enumerate(body)
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+        and isinstance(node.value, ast.Call) and _owns_lines(body, i)
+    }
+
+    deferred = dict(assignments)
+    while True:
+        visitor = _Loads({id(node.value) for node in deferred.values()}, postponed)
+        visitor.visit(tree)
+        loads = visitor.names | class_uses
+        lazy = {name for name in candidates if name not in loads and bound.get(name) == 1}
+        kept = {
+            i: node for i, node in deferred.items()
+            if node.targets[0].id not in loads and bound.get(node.targets[0].id) == 1
+            and _callee_root(node.value) in lazy | classes
+        }
+        if kept.keys() == deferred.keys():
+            break
+        deferred = kept
+
+    main = next((n for n in body if _is_main_block(n)), None)
+    background = []
+    if main is not None:
+        server = next((j for j, stmt in enumerate(main.body)
+                       if isinstance(stmt, ast.With) or (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)
+                                                         and isinstance(stmt.value.func, ast.Attribute)
+                                                         and stmt.value.func.attr in _SERVER_CALLS)), None)
+        for j, stmt in enumerate(main.body[:server or 0]):
+            call = stmt.value if isinstance(stmt, ast.Expr) else None
+            if (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id in functions
+                    and not call.args and not call.keywords and _owns_lines(main.body, j)):
+                background.append(stmt)
+
+    rewrite = Rewrite(path, text)
+    lines = text.splitlines(keepends=True)
+    replacements = {}     # first line index -> (last line index, new lines)
+    for i, node in enumerate(body):
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and any(name in lazy for name, _ in _import_bindings(node)):
+            replacements[node.lineno - 1] = (node.end_lineno, _rewrite_import(node, lazy, rewrite))
+        elif i in deferred:
+            name = node.targets[0].id
+            value = ast.get_source_segment(text, node.value)
+            replacements[node.lineno - 1] = (
+                node.end_lineno, [f'{name} = bank_lazy.deferred(globals(), "{name}", lambda: {value})\n'])
+            rewrite.deferred.append(name)
+    for stmt in background:
+        indent = " " * stmt.col_offset
+        replacements[stmt.lineno - 1] = (stmt.end_lineno, [f"{indent}bank_lazy.background({stmt.value.func.id})\n"])
+        rewrite.background.append(stmt.value.func.id)
+    if not replacements:
+        return rewrite
+
+    first = min(replacements)
+    insert_at = next(n.lineno - 1 for n in body if n.end_lineno > first)
+    out = []
+    i = 0
+    while i < len(lines):
+        if i == insert_at:
+            out.append("import bank_lazy\n")
+        if i in replacements:
+            end, new = replacements[i]
+            out += new
+            i = end
+        else:
+            out.append(lines[i])
+            i += 1
+    rewrite.text = "".join(out)
+    return rewrite
+
+
+def _rewrite_import(node, lazy, rewrite):
+    eager, out = [], []
+    for name, alias in _import_bindings(node):
+        if name not in lazy:
+            eager.append(alias)
+        elif isinstance(node, ast.Import):
+            package = alias.asname is None and "." in alias.name
+            out.append(f'{name} = bank_lazy.module(globals(), "{name}", "{alias.name}"'
+                       f'{", package=True" if package else ""})\n')
+            rewrite.lazy.append((name, alias.name))
+        else:
+            out.append(f'{name} = bank_lazy.attr(globals(), "{name}", "{node.module}", "{alias.name}")\n')
+            rewrite.lazy.append((name, f"{node.module}.{alias.name}"))
+    if eager:
+        names = ", ".join(a.name + (f" as {a.asname}" if a.asname else "") for a in eager)
+        out.insert(0, f"import {names}\n" if isinstance(node, ast.Import) else f"from {node.module} import {names}\n")
+    return out
+
+
+def wrapper_paths(service_dir):
+    """Return the generated ``.py`` files of a service that import a web framework."""
+    service_dir = Path(service_dir)
+    found = []
+    for path in sorted(service_dir.rglob("*.py")):
+        relpath = path.relative_to(service_dir)
+        if is_bank_file(relpath.parts[0]) or path.name == RUNTIME_FILENAME or {"test", "tests"} & set(relpath.parts):
+            continue
+        try:
+            tree = ast.parse(path.read_text(encoding="utf-8", errors="replace"))
+        except SyntaxError:
+            continue
+        packages = {_package(node, alias) for node in tree.body if _lazy_candidate(node)
+                    for _, alias in _import_bindings(node)}
+        if packages & set(FRAMEWORKS):
+            found.append(relpath.as_posix())
+    return found
+
+
+def _shipping(dockerfile, relpath):
+    """Return ``True`` if a ``COPY`` brings ``relpath``'s directory along, the
+    ``COPY`` instruction that copies just ``relpath``, or ``None``.
+    """
+    explicit = None
+    for instruction in dockerfile:
+        if instruction.keyword not in ("COPY", "ADD"):
+            continue
+        sources, _, flags = copy_sources(instruction)
+        if "from" in flags:
+            continue
+        for source in sources:
+            source = source.strip()
+            while source.startswith("./"):
+                source = source[2:]
+            source = source.rstrip("/")
+            if source in ("", ".") or relpath.startswith(source + "/"):
+                return True
+            if source == relpath:
+                explicit = instruction
+    return explicit
+
+
+def _copy_runtime_line(instruction, relpath):
+    sources, dest, _ = copy_sources(instruction)
+    if len(sources) == 1 and not dest.endswith("/") and dest not in (".", "./"):
+        dest = dest.rpartition("/")[0] + "/" if "/" in dest else "./"
+    parent = relpath.rpartition("/")[0]
+    return f"COPY {parent + '/' if parent else ''}{RUNTIME_FILENAME} {dest}"
+
+
+def apply_to_workdir(service_dir, workdir):
+    """Deploy transform: make the wrappers in ``workdir`` import lazily."""
+    service_dir, workdir = Path(service_dir), Path(workdir)
+    dockerfile_path = workdir / "Dockerfile"
+    if not dockerfile_path.is_file():
+        return False
+    dockerfile = Dockerfile.read(dockerfile_path)
+    changed = dockerfile_changed = False
+    for relpath in wrapper_paths(service_dir):
+        target = workdir / relpath
+        rewrite = plan(target.read_text(encoding="utf-8"), relpath)
+        if not rewrite.changed:
+            continue
+        shipping = _shipping(dockerfile, relpath)
+        if shipping is None:
+            continue
+        if shipping is not True:
+            dockerfile.replace(shipping, dockerfile.source(shipping) + [_copy_runtime_line(shipping, relpath)])
+            dockerfile_changed = True
+        target.write_text(rewrite.text, encoding="utf-8")
+        shutil.copyfile(Path(__file__).with_name("lazy.py"), target.with_name(RUNTIME_FILENAME))
+        record_generated(workdir, target.with_name(RUNTIME_FILENAME))
+        changed = True
+    if dockerfile_changed:
+        dockerfile_path.write_text(dockerfile.text(), encoding="utf-8", errors="surrogateescape")
+    return changed
+
+
+def _rewrite_sandbox(service_dir, sandbox):
+    """Rewrite the wrappers of a coldstart sandbox (no Dockerfile involved)."""
+    for relpath in wrapper_paths(service_dir):
+        target = Path(sandbox) / relpath
+        rewrite = plan(target.read_text(encoding="utf-8"), relpath)
+        if rewrite.changed:
+            target.write_text(rewrite.text, encoding="utf-8")
+            shutil.copyfile(Path(__file__).with_name("lazy.py"), target.with_name(RUNTIME_FILENAME))
+
+
+def report(service_ids=None, root=None, runs=DEFAULT_RUNS, log=print, **options):
+    """Launch each wrapper eagerly and lazily; return one record per service."""
+    records = []
+    for service_dir, entry in wrappers(root, service_ids):
+        deferred = {name: target for relpath in wrapper_paths(service_dir)
+                    for name, target in plan((service_dir / relpath).read_text(encoding="utf-8"), relpath).lazy}
+        if not deferred:
+            continue
+        quiet = dict(log=lambda _: None, runs=runs, importtime=True, **options)
+        eager = bench(service_dir, entry, **quiet)
+        lazy = bench(service_dir, entry, prepare=_rewrite_sandbox, **quiet)
+        packages = {target.partition(".")[0] for target in deferred.values()}
+        record = {
+            "service_id": entry.service_id, "wrapper": entry.wrapper, "at": eager["at"],
+            "ok": eager["ok"] and lazy["ok"], "eager_s": eager["ready_s"], "lazy_s": lazy["ready_s"],
+            "eager_rss_mb": eager["peak_rss_mb"], "lazy_rss_mb": lazy["peak_rss_mb"],
+            "deferred_us": {p: us for p, us in eager.get("imports", {}).items() if p in packages},
+        }
+        if record["ok"]:
+            record["saved_s"] = round(eager["ready_s"] - lazy["ready_s"], 3)
+            log(f"{entry.service_id}  {entry.wrapper:<18} eager {eager['ready_s']:7.3f} s  "
+                f"lazy {lazy['ready_s']:7.3f} s  saved {record['saved_s']:+7.3f} s")
+        else:
+            record["error"] = eager.get("error") or lazy.get("error")
+            log(f"{entry.service_id}  {entry.wrapper:<18} FAILED  {record['error']}")
+        log(f"    {'cumulative':>12} | deferred import")
+        for package, us in sorted(record["deferred_us"].items(), key=lambda item: -item[1]):
+            log(f"    {us:>9} us | {package}")
+        records.append(record)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.lazyimport", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pl = sub.add_parser("plan", help="list what each wrapper would defer")
+    pl.add_argument("service_ids", nargs="*", help="default: every service")
+    rw = sub.add_parser("rewrite", help="show the rewrite of a service's wrappers as a diff")
+    rw.add_argument("service_id")
+    rp = sub.add_parser("report", help="measure eager vs. lazy cold starts")
+    rp.add_argument("service_ids", nargs="*", help="default: every wrapper")
+    rp.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    rp.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for health")
+    rp.add_argument("--python", default=sys.executable, help="interpreter to run wrappers with")
+
+    args = parser.parse_args(argv)
+    if args.command == "plan":
+        if args.service_ids:
+            dirs = [(sid, services_dir(args.root) / sid) for sid in args.service_ids]
+        else:
+            dirs = iter_service_dirs(args.root)
+        for service_id, service_dir in dirs:
+            for relpath in wrapper_paths(service_dir):
+                rewrite = plan((service_dir / relpath).read_text(encoding="utf-8"), relpath)
+                if rewrite.changed:
+                    print(f"{service_id}  {relpath}")
+                    if rewrite.lazy:
+                        print(f"    lazy:       {', '.join(name for name, _ in rewrite.lazy)}")
+                    if rewrite.deferred:
+                        print(f"    deferred:   {', '.join(rewrite.deferred)}")
+                    if rewrite.background:
+                        print(f"    background: {', '.join(rewrite.background)}")
+    elif args.command == "rewrite":
+        service_dir = services_dir(args.root) / args.service_id
+        for relpath in wrapper_paths(service_dir):
+            before = (service_dir / relpath).read_text(encoding="utf-8")
+            rewrite = plan(before, relpath)
+            if rewrite.changed:
+                sys.stdout.writelines(difflib.unified_diff(
+                    before.splitlines(True), rewrite.text.splitlines(True),
+                    f"a/{args.service_id}/{relpath}", f"b/{args.service_id}/{relpath}"))
+    elif args.command == "report":
+        records = report(args.service_ids, args.root, runs=args.runs, python=args.python, timeout=args.timeout)
+        if not records:
+            print("error: no wrapper has imports to defer", file=sys.stderr)
+            return 1
+        path = state_dir(args.root) / "bench"
+        path.mkdir(exist_ok=True)
+        with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Reading and writing per-service ``metadata.json`` files."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from . import services_dir
+
+METADATA_FILENAME = "metadata.json"
+
+
+def iter_service_dirs(root=None):
+    """Yield ``(service_id, path)`` for every service directory, sorted by id."""
+    base = services_dir(root)
+    with os.scandir(base) as entries:
+        dirs = sorted(e.name for e in entries if e.is_dir() and not e.name.startswith("."))
+    for name in dirs:
+        yield name, base / name
+
+
+def metadata_path(service_id, root=None):
+    return services_dir(root) / service_id / METADATA_FILENAME
+
+
+def load_metadata(path):
+    """Load one ``metadata.json`` file (a path or a service directory)."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / METADATA_FILENAME
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_metadata(path, data):
+    """Atomically replace ``metadata.json`` with ``data``.
+
+    The new content is written to a temporary file in the same directory,
+    flushed to disk and renamed over the original, so readers never observe a
+    partially written file.
+    """
+    path = Path(path)
+    if path.is_dir():
+        path = path / METADATA_FILENAME
+    fd, tmp = tempfile.mkstemp(prefix=".metadata.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,621 @@
+"""Verification and streaming extraction of split ``source.zip.partXX`` packages.
+
+Large packages are stored as ``split``-style parts (``source.zip.partaa``,
+``source.zip.partab`` ...).  This module
+
+* checks the parts against a manifest (``source.zip.parts.json``) holding
+  each part's size and SHA-256, or, without a manifest, checks that the part
+  suffixes run contiguously from ``aa`` to the last one present;
+* exposes the parts as one read-only stream (:class:`PartStream`) that
+  hashes every part as it goes past;
+* extracts that stream in a single forward pass by walking the local file
+  headers (:func:`stream_extract`), so no concatenated archive is ever
+  written to disk;
+* maps the parts into one seekable file (:class:`SplitFile`) that
+  :mod:`zipfile` can open directly, so reading a single member only touches
+  the central directory and that member's bytes.
+
+Usage::
+
+    python -m bank.parts status
+    python -m bank.parts manifest <service_id>
+    python -m bank.parts check <service_id> [--hashes]
+    python -m bank.parts extract <service_id> <dest>
+    python -m bank.parts ls <service_id>
+    python -m bank.parts cat <service_id> <member>
+"""
+
+import argparse
+import bz2
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import zipfile
+import zlib
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+from string import ascii_lowercase
+
+from . import services_dir
+
+SOURCE_FILENAME = "source.zip"
+PART_PREFIX = "source.zip.part"
+MANIFEST_FILENAME = "source.zip.parts.json"
+READ_SIZE = 1 << 20
+
+
+class PartsError(Exception):
+    pass
+
+
+def part_suffixes():
+    """Yield ``split``'s default suffixes: ``aa``, ``ab`` ... ``zz``."""
+    for first in ascii_lowercase:
+        for second in ascii_lowercase:
+            yield first + second
+
+
+def find_parts(service_dir):
+    """Return the part files present in ``service_dir``, in suffix order."""
+    service_dir = Path(service_dir)
+    return sorted(p for p in service_dir.glob(PART_PREFIX + "*") if len(p.name) == len(PART_PREFIX) + 2)
+
+
+def build_manifest(service_dir):
+    """Describe the parts currently present in ``service_dir``."""
+    parts = []
+    for path in find_parts(service_dir):
+        with open(path, "rb") as f:
+            digest = _sha256(f)
+        parts.append({"name": path.name, "size": path.stat().st_size, "sha256": digest})
+    return {"total_size": sum(p["size"] for p in parts), "parts": parts}
+
+
+def write_manifest(service_dir):
+    service_dir = Path(service_dir)
+    manifest = build_manifest(service_dir)
+    problems = contiguity_problems([p["name"] for p in manifest["parts"]])
+    if problems:
+        raise PartsError(f"refusing to write a manifest over an incomplete part set: {problems[0]}")
+    with open(service_dir / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(service_dir):
+    try:
+        with open(Path(service_dir) / MANIFEST_FILENAME, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@dataclass
+class PartsReport:
+    """Outcome of :func:`check_parts`; ``ok`` is true when nothing is wrong."""
+
+    service_dir: Path
+    parts: list = field(default_factory=list)
+    missing: list = field(default_factory=list)
+    size_mismatch: list = field(default_factory=list)
+    hash_mismatch: list = field(default_factory=list)
+    unexpected: list = field(default_factory=list)
+    has_manifest: bool = False
+
+    @property
+    def ok(self):
+        return bool(self.parts) and not (
+            self.missing or self.size_mismatch or self.hash_mismatch or self.unexpected
+        )
+
+    def problems(self):
+        out = [f"missing part {name}" for name in self.missing]
+        out += [f"{name}: expected {want} bytes, found {got}" for name, want, got in self.size_mismatch]
+        out += [f"{name}: SHA-256 mismatch" for name in self.hash_mismatch]
+        out += [f"unexpected part {name}" for name in self.unexpected]
+        if not self.parts and not self.missing:
+            out.append("no parts found")
+        return out
+
+
+def check_parts(service_dir, hashes=False):
+    """Check the part set of one service before anything reads it.
+
+    Sizes are always compared with the manifest; ``hashes`` additionally
+    reads every part to compare digests.  Without a manifest only gaps in the
+    suffix sequence can be detected.
+    """
+    service_dir = Path(service_dir)
+    present = {p.name: p for p in find_parts(service_dir)}
+    manifest = load_manifest(service_dir)
+    report = PartsReport(service_dir, has_manifest=manifest is not None)
+    if manifest is None:
+        report.missing = contiguity_problems(sorted(present))
+        report.parts = [present[name] for name in sorted(present)]
+        return report
+    expected = {entry["name"]: entry for entry in manifest["parts"]}
+    report.unexpected = sorted(set(present) - set(expected))
+    for entry in manifest["parts"]:
+        path = present.get(entry["name"])
+        if path is None:
+            report.missing.append(entry["name"])
+            continue
+        report.parts.append(path)
+        size = path.stat().st_size
+        if size != entry["size"]:
+            report.size_mismatch.append((entry["name"], entry["size"], size))
+        elif hashes:
+            with open(path, "rb") as f:
+                if _sha256(f) != entry["sha256"]:
+                    report.hash_mismatch.append(entry["name"])
+    return report
+
+
+def contiguity_problems(names):
+    """Return the suffixes missing between ``aa`` and the last name given."""
+    if not names:
+        return []
+    last = max(name[-2:] for name in names)
+    have = {name[-2:] for name in names}
+    missing = []
+    for suffix in part_suffixes():
+        if suffix not in have:
+            missing.append(PART_PREFIX + suffix)
+        if suffix == last:
+            break
+    return missing
+
+
+class PartStream(io.RawIOBase):
+    """Read-only, forward-only stream over a sequence of part files.
+
+    When ``digests`` (a list of expected SHA-256 hex digests, one per part) is
+    given, each part is hashed as it is consumed and :class:`PartsError` is
+    raised as soon as a part finishes with the wrong digest.
+    """
+
+    def __init__(self, paths, digests=None):
+        super().__init__()
+        self._paths = [Path(p) for p in paths]
+        self._digests = list(digests) if digests is not None else None
+        self._index = -1
+        self._file = None
+        self._hash = None
+        self._next_part()
+
+    def _next_part(self):
+        if self._file is not None:
+            self._file.close()
+            if self._digests is not None and self._hash.hexdigest() != self._digests[self._index]:
+                raise PartsError(f"{self._paths[self._index].name}: SHA-256 mismatch")
+        self._index += 1
+        if self._index < len(self._paths):
+            self._file = open(self._paths[self._index], "rb")
+            self._hash = hashlib.sha256()
+        else:
+            self._file = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._file is not None:
+            n = self._file.readinto(buffer)
+            if n:
+                if self._digests is not None:
+                    self._hash.update(memoryview(buffer)[:n])
+                return n
+            self._next_part()
+        return 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def open_parts(service_dir, hashes=True):
+    """Check a service's parts and return a :class:`PartStream` over them.
+
+    Missing, unexpected or wrongly sized parts are reported before any byte
+    is read.  With a manifest and ``hashes`` set, digests are verified while
+    streaming.
+    """
+    report = check_parts(service_dir)
+    if not report.ok:
+        raise PartsError(f"{Path(service_dir).name}: " + "; ".join(report.problems()))
+    digests = None
+    if hashes and report.has_manifest:
+        digests = [entry["sha256"] for entry in load_manifest(service_dir)["parts"]]
+    return PartStream(report.parts, digests)
+
+
+class SplitFile(io.RawIOBase):
+    """Seekable, read-only file spanning a sequence of part files.
+
+    Offsets are mapped to parts through their cumulative start offsets.  Each
+    part is memory-mapped the first time it is touched; parts that cannot be
+    mapped (empty files, unsupported file systems) are read with ordinary
+    positioned reads instead.  ``bytes_read`` counts the bytes served.
+    """
+
+    def __init__(self, paths):
+        super().__init__()
+        self._paths = [Path(p) for p in paths]
+        self._starts = []
+        total = 0
+        for path in self._paths:
+            self._starts.append(total)
+            total += path.stat().st_size
+        self._size = total
+        self._maps = [None] * len(self._paths)
+        self._files = [None] * len(self._paths)
+        self._pos = 0
+        self.bytes_read = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if pos < 0:
+            raise OSError("negative seek position")
+        self._pos = pos
+        return pos
+
+    def _part(self, index):
+        if self._files[index] is None:
+            f = open(self._paths[index], "rb")
+            self._files[index] = f
+            try:
+                self._maps[index] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                self._maps[index] = None
+        return self._maps[index], self._files[index]
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view) and self._pos < self._size:
+            index = bisect_right(self._starts, self._pos) - 1
+            start = self._starts[index]
+            end = self._starts[index + 1] if index + 1 < len(self._starts) else self._size
+            offset = self._pos - start
+            n = min(len(view) - filled, end - self._pos)
+            if n <= 0:
+                break
+            mapped, f = self._part(index)
+            if mapped is not None:
+                view[filled:filled + n] = mapped[offset:offset + n]
+            else:
+                n = _pread_into(f, view[filled:filled + n], offset)
+                if not n:
+                    raise PartsError(f"{self._paths[index].name} is shorter than when it was opened")
+            filled += n
+            self._pos += n
+        self.bytes_read += filled
+        return filled
+
+    def close(self):
+        for index, mapped in enumerate(self._maps):
+            if mapped is not None:
+                mapped.close()
+            if self._files[index] is not None:
+                self._files[index].close()
+        self._maps = [None] * len(self._paths)
+        self._files = [None] * len(self._paths)
+        super().close()
+
+
+def _pread_into(f, view, offset):
+    f.seek(offset)
+    return f.readinto(view)
+
+
+def open_split(service_dir, check=True):
+    """Return a buffered, seekable file over a service's parts.
+
+    With ``check`` set, missing or wrongly sized parts raise
+    :class:`PartsError` before anything is read.
+    """
+    if check:
+        report = check_parts(service_dir)
+        if not report.ok:
+            raise PartsError(f"{Path(service_dir).name}: " + "; ".join(report.problems()))
+        paths = report.parts
+    else:
+        paths = find_parts(service_dir)
+    return io.BufferedReader(SplitFile(paths), buffer_size=64 << 10)
+
+
+def open_package_zip(service_dir):
+    """Open a service's package as a :class:`zipfile.ZipFile`.
+
+    ``source.zip`` is used when present; otherwise the split parts are
+    opened through :class:`SplitFile` without being concatenated.
+    """
+    service_dir = Path(service_dir)
+    source = service_dir / SOURCE_FILENAME
+    if source.exists():
+        return zipfile.ZipFile(source)
+    raw = open_split(service_dir)
+    try:
+        return zipfile.ZipFile(raw)
+    except BaseException:
+        raw.close()
+        raise
+
+
+# -- streaming zip extraction ------------------------------------------------
+
+_LOCAL = struct.Struct("<4sHHHHHLLLHH")
+_CENTRAL = struct.Struct("<4sHHHHHHLLLHHHHHLL")
+_LOCAL_MAGIC = b"PK\x03\x04"
+_CENTRAL_MAGIC = b"PK\x01\x02"
+_DESCRIPTOR_MAGIC = b"PK\x07\x08"
+_ZIP64_EXTRA = 0x0001
+_FLAG_DESCRIPTOR = 0x08
+_STORED, _DEFLATED, _BZIP2 = 0, 8, 12
+
+
+class _Reader:
+    """Buffered forward reader with push-back, over a non-seekable stream."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._buf = b""
+
+    def read(self, n=READ_SIZE):
+        if self._buf:
+            data, self._buf = self._buf[:n], self._buf[n:]
+            return data
+        return self._raw.read(n)
+
+    def read_exact(self, n):
+        chunks = []
+        while n:
+            data = self.read(n)
+            if not data:
+                raise PartsError("archive stream ended unexpectedly")
+            chunks.append(data)
+            n -= len(data)
+        return b"".join(chunks)
+
+    def unread(self, data):
+        self._buf = data + self._buf
+
+
+def stream_extract(stream, dest):
+    """Extract a zip archive from a forward-only ``stream`` into ``dest``.
+
+    Members are decompressed and CRC-checked as they arrive.  Unix permission
+    bits live only in the central directory at the end of the archive, so
+    they are applied once it has been read.  The stream is then read to its
+    end, so a :class:`PartStream` also checks the digest of the last part.
+    Returns the number of members extracted.
+    """
+    dest = Path(dest).resolve()
+    dest.mkdir(parents=True, exist_ok=True)
+    reader = _Reader(stream)
+    written = {}
+    while True:
+        magic = reader.read_exact(4)
+        if magic == _LOCAL_MAGIC:
+            reader.unread(magic)
+            name, path = _extract_member(reader, dest)
+            written[name] = path
+        elif magic == _CENTRAL_MAGIC:
+            reader.unread(magic)
+            break
+        else:
+            raise PartsError(f"unexpected record signature {magic!r}")
+    while reader.read_exact(4) == _CENTRAL_MAGIC:
+        fields = _CENTRAL.unpack(_CENTRAL_MAGIC + reader.read_exact(_CENTRAL.size - 4))
+        name_len, extra_len, comment_len, external_attr = fields[10], fields[11], fields[12], fields[16]
+        name = reader.read_exact(name_len).decode("utf-8" if fields[3] & 0x800 else "cp437")
+        reader.read_exact(extra_len + comment_len)
+        mode = (external_attr >> 16) & 0o777
+        path = written.get(name)
+        if mode and path is not None and path.is_file():
+            os.chmod(path, mode)
+    while reader.read():
+        pass
+    return len(written)
+
+
+def _extract_member(reader, dest):
+    fields = _LOCAL.unpack(reader.read_exact(_LOCAL.size))
+    flags, method, crc, csize, usize, name_len, extra_len = (
+        fields[2], fields[3], fields[6], fields[7], fields[8], fields[9], fields[10])
+    raw_name = reader.read_exact(name_len)
+    extra = reader.read_exact(extra_len)
+    name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+    zip64 = False
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, size = struct.unpack_from("<HH", extra, pos)
+        if tag == _ZIP64_EXTRA:
+            zip64 = True
+            values = list(struct.unpack_from(f"<{size // 8}Q", extra, pos + 4))
+            if usize == 0xFFFFFFFF and values:
+                usize = values.pop(0)
+            if csize == 0xFFFFFFFF and values:
+                csize = values.pop(0)
+        pos += 4 + size
+
+    path = _safe_path(dest, name)
+    if name.endswith("/"):
+        path.mkdir(parents=True, exist_ok=True)
+        out = None
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        out = open(path, "wb")
+    try:
+        actual_crc = _copy_member(reader, out, method, csize, bool(flags & _FLAG_DESCRIPTOR), name)
+    finally:
+        if out is not None:
+            out.close()
+    if flags & _FLAG_DESCRIPTOR:
+        crc = _read_descriptor(reader, zip64)
+    if out is not None and actual_crc != crc:
+        raise PartsError(f"{name}: CRC mismatch")
+    return name, path
+
+
+def _copy_member(reader, out, method, csize, has_descriptor, name):
+    if method == _STORED:
+        if has_descriptor:
+            raise PartsError(f"{name}: stored member without known size cannot be streamed")
+        crc = 0
+        remaining = csize
+        while remaining:
+            data = reader.read(min(remaining, READ_SIZE))
+            if not data:
+                raise PartsError("archive stream ended unexpectedly")
+            remaining -= len(data)
+            crc = zlib.crc32(data, crc)
+            if out is not None:
+                out.write(data)
+        return crc
+    if method == _DEFLATED:
+        decomp = zlib.decompressobj(-15)
+    elif method == _BZIP2:
+        decomp = bz2.BZ2Decompressor()
+    else:
+        raise PartsError(f"{name}: unsupported compression method {method}")
+    crc = 0
+    remaining = None if has_descriptor else csize
+    while not decomp.eof:
+        data = reader.read(READ_SIZE if remaining is None else min(remaining, READ_SIZE))
+        if not data:
+            if remaining == 0 and method == _DEFLATED and csize == 0:
+                break
+            raise PartsError("archive stream ended unexpectedly")
+        if remaining is not None:
+            remaining -= len(data)
+        chunk = decomp.decompress(data)
+        crc = zlib.crc32(chunk, crc)
+        if out is not None:
+            out.write(chunk)
+    if decomp.unused_data:
+        reader.unread(decomp.unused_data)
+    if remaining:
+        reader.read_exact(remaining)
+    return crc
+
+
+def _read_descriptor(reader, zip64):
+    size_len = 16 if zip64 else 8
+    head = reader.read_exact(4)
+    if head == _DESCRIPTOR_MAGIC:
+        head = reader.read_exact(4)
+    reader.read_exact(size_len)
+    return struct.unpack("<L", head)[0]
+
+
+def _safe_path(dest, name):
+    path = (dest / name).resolve()
+    if path != dest and dest not in path.parents:
+        raise PartsError(f"refusing to extract {name!r} outside {dest}")
+    return path
+
+
+def _sha256(f):
+    digest = hashlib.sha256()
+    while chunk := f.read(READ_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _split_service_dirs(root):
+    seen = set()
+    for path in sorted(services_dir(root).glob(f"*/{PART_PREFIX}*")):
+        if path.parent not in seen:
+            seen.add(path.parent)
+            yield path.parent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.parts", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="check every split package")
+    manifest = sub.add_parser("manifest", help="write source.zip.parts.json for a complete part set")
+    manifest.add_argument("service_id")
+    check = sub.add_parser("check", help="check one split package")
+    check.add_argument("service_id")
+    check.add_argument("--hashes", action="store_true", help="also verify part digests")
+    extract = sub.add_parser("extract", help="verify and extract one split package")
+    extract.add_argument("service_id")
+    extract.add_argument("dest")
+    ls = sub.add_parser("ls", help="list the members of a package")
+    ls.add_argument("service_id")
+    cat = sub.add_parser("cat", help="write one member of a package to stdout")
+    cat.add_argument("service_id")
+    cat.add_argument("member")
+
+    args = parser.parse_args(argv)
+    if args.command == "status":
+        for service_dir in _split_service_dirs(args.root):
+            report = check_parts(service_dir)
+            if report.ok:
+                state = "ok"
+            elif report.missing and len(report.problems()) == len(report.missing):
+                state = f"missing {len(report.missing)}: {', '.join(n[-2:] for n in report.missing)}"
+            else:
+                state = "; ".join(report.problems())
+            print(f"{service_dir.name}  {len(report.parts):>2} present  {state}")
+        return 0
+    service_dir = services_dir(args.root) / args.service_id
+    try:
+        if args.command == "manifest":
+            manifest = write_manifest(service_dir)
+            print(f"{len(manifest['parts'])} parts, {manifest['total_size']} bytes")
+        elif args.command == "check":
+            report = check_parts(service_dir, hashes=args.hashes)
+            for problem in report.problems():
+                print(problem)
+            return 0 if report.ok else 1
+        elif args.command == "extract":
+            with open_parts(service_dir) as stream:
+                count = stream_extract(stream, args.dest)
+            print(f"extracted {count} members into {args.dest}")
+        elif args.command == "ls":
+            with open_package_zip(service_dir) as zf:
+                for info in zf.infolist():
+                    print(f"{info.file_size:>12}  {info.filename}")
+        elif args.command == "cat":
+            with open_package_zip(service_dir) as zf, zf.open(args.member) as member:
+                while chunk := member.read(READ_SIZE):
+                    sys.stdout.buffer.write(chunk)
+    except (PartsError, zipfile.BadZipFile, KeyError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
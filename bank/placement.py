@@ -0,0 +1,400 @@
+"""Bin-packing of compose stacks onto nodes from measured or estimated footprints.
+
+Each stack (every service of one compose file, or the lone container of a
+service without one) is placed as a unit, so a stack's application, database
+and cache always share a node.  A stack's demand is a CPU (cores) and memory
+(MiB) pair:
+
+* a ``container`` footprint from :mod:`bank.footprint` covers the whole
+  stack: the peak RSS of any phase and the CPU p95 under load;
+  a ``wrapper`` footprint the same for the application alone (wrappers
+  run with unavailable imports stubbed, so treat it as a lower bound);
+* otherwise each compose service is counted separately.  A service built
+  from the bank's Dockerfile uses the wrapper footprint if there is one,
+  or an estimate from ``language``, the base image (CUDA and PyTorch
+  images add a model-sized allowance) and the package size.  A service run
+  from an image (``mysql``, ``redis``, ``elasticsearch`` ...) uses a
+  per-image default.  Estimates never exceed the service's own
+  ``mem_limit``/``cpus`` or ``deploy.resources.limits``.
+
+``--headroom`` scales every demand before packing.  Stacks are packed
+best-fit decreasing by their dominant share of a node.  A stack that fits
+on no empty node is reported as oversized and left out.
+
+``simulate`` compares the packing with the current round-robin placement:
+stacks are dealt to nodes in catalog order, and the node count is the
+smallest one where no node overflows.  The lower bound is the total demand
+divided by one node's capacity.  ``plan`` writes the packing to
+``.bank/placement.json``.
+
+Usage::
+
+    python -m bank.placement simulate [--cpu 8] [--memory 32G] [--status deploying]
+    python -m bank.placement plan [--cpu 8] [--memory 32G] [--headroom 1.2]
+    python -m bank.placement show <service_id>
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+
+from . import services_dir, state_dir
+from .catalog import open_catalog
+from .compose import ComposeError, build_spec, load_compose, services
+from .deploy import compose_file
+from .dockerfile import Dockerfile
+from .journal import Journal
+from .sharedinfra import IDLE_MIB, engine_of, parse_size
+
+PLAN_FILENAME = "placement.json"
+DEFAULT_NODE_CPU = 8.0
+DEFAULT_NODE_MEMORY = "32G"
+DEFAULT_HEADROOM = 1.2
+
+# CPU (cores) and resident memory (MiB) of an idle-to-light application, by
+# ``language``.  The package adds PACKAGE_MIB_PER_MB per MB of source (data
+# files, models and templates it loads), up to PACKAGE_MIB_MAX.
+LANGUAGE_DEFAULTS = {"java": (0.25, 384), "python": (0.1, 160), "nodejs": (0.1, 96)}
+OTHER_LANGUAGE = (0.1, 192)
+PACKAGE_MIB_PER_MB = 0.5
+PACKAGE_MIB_MAX = 1024
+# Base images whose services load accelerator stacks or models.
+HEAVY_BASE_KEYWORDS = ("cuda", "pytorch", "tensorflow", "nvidia")
+HEAVY_BASE_MIB = 1536
+# Image-run services, matched by substring of the image name.
+IMAGE_DEFAULTS = (
+    ("elasticsearch", 0.25, 1024), ("opensearch", 0.25, 1024), ("kafka", 0.25, 512), ("zookeeper", 0.05, 128),
+    ("mongo", 0.1, 256), ("rabbitmq", 0.05, 160), ("minio", 0.05, 160), ("ollama", 1.0, 2048),
+    ("milvus", 0.25, 1024), ("neo4j", 0.25, 512), ("nacos", 0.25, 512), ("rocketmq", 0.25, 512),
+    ("chroma", 0.05, 256), ("qdrant", 0.05, 128), ("memcached", 0.02, 64), ("etcd", 0.02, 64),
+    ("nginx", 0.02, 16),
+)
+OTHER_IMAGE = (0.05, 256)
+BACKING_CPU = 0.05
+
+
+@dataclass
+class Part:
+    """Demand of one compose service (or of the whole stack, for a container footprint)."""
+
+    name: str
+    cpu: float
+    memory_mb: float
+    source: str                   # "footprint", "estimate", "image" or "limit"
+
+
+@dataclass
+class Stack:
+    """A unit of placement: every service of one compose file."""
+
+    service_id: str
+    parts: list = field(default_factory=list)
+
+    @property
+    def cpu(self):
+        return sum(part.cpu for part in self.parts)
+
+    @property
+    def memory_mb(self):
+        return sum(part.memory_mb for part in self.parts)
+
+    @property
+    def measured(self):
+        return any(part.source == "footprint" for part in self.parts)
+
+
+@dataclass
+class Node:
+    name: str
+    cpu: float
+    memory_mb: float
+    stacks: list = field(default_factory=list)
+    used_cpu: float = 0.0
+    used_memory_mb: float = 0.0
+
+    def fits(self, cpu, memory_mb):
+        return self.used_cpu + cpu <= self.cpu + 1e-9 and self.used_memory_mb + memory_mb <= self.memory_mb + 1e-9
+
+    def add(self, service_id, cpu, memory_mb):
+        self.stacks.append(service_id)
+        self.used_cpu += cpu
+        self.used_memory_mb += memory_mb
+
+
+def base_image(dockerfile_path):
+    """Return the image the final stage of a Dockerfile starts from, following stage aliases."""
+    try:
+        stages = Dockerfile.read(dockerfile_path).stages()
+    except (FileNotFoundError, IsADirectoryError):
+        return ""
+    if not stages:
+        return ""
+    aliases = {alias: image for image, alias in stages if alias}
+    image = stages[-1][0]
+    for _ in range(len(stages)):
+        if image not in aliases:
+            break
+        image = aliases[image]
+    return image
+
+
+def estimate_app(language, image, package_bytes):
+    """Return ``(cpu, memory_mb)`` for an unmeasured application service."""
+    cpu, memory_mb = LANGUAGE_DEFAULTS.get(language, OTHER_LANGUAGE)
+    if any(keyword in image.lower() for keyword in HEAVY_BASE_KEYWORDS):
+        memory_mb += HEAVY_BASE_MIB
+    if package_bytes:
+        memory_mb += min(PACKAGE_MIB_MAX, package_bytes / 1e6 * PACKAGE_MIB_PER_MB)
+    return cpu, memory_mb
+
+
+def estimate_image(image):
+    """Return ``(cpu, memory_mb)`` for a service run straight from an image."""
+    backing = engine_of(image)
+    if backing:
+        return BACKING_CPU, IDLE_MIB[backing[0]]
+    name = str(image).lower()
+    for keyword, cpu, memory_mb in IMAGE_DEFAULTS:
+        if keyword in name:
+            return cpu, memory_mb
+    return OTHER_IMAGE
+
+
+def _limits(service):
+    """Return ``(cpu, memory_mb)`` limits a compose service declares (``None`` where unset)."""
+    limits = (((service.get("deploy") or {}).get("resources") or {}).get("limits") or {})
+    memory = parse_size(limits.get("memory")) or parse_size(service.get("mem_limit"))
+    cpus = limits.get("cpus", service.get("cpus"))
+    try:
+        cpus = float(cpus) if cpus is not None else None
+    except (TypeError, ValueError):
+        cpus = None
+    return cpus or None, memory / 2 ** 20 if memory else None
+
+
+def _capped(name, estimate, service, source):
+    cpu, memory_mb = estimate
+    cpu_limit, memory_limit = _limits(service)
+    capped = False
+    if cpu_limit is not None and cpu_limit < cpu:
+        cpu, capped = cpu_limit, True
+    if memory_limit is not None and memory_limit < memory_mb:
+        memory_mb, capped = memory_limit, True
+    return Part(name, round(cpu, 3), round(memory_mb, 1), "limit" if capped else source)
+
+
+def _measured(phases):
+    """Return ``(cpu, memory_mb)`` from a service's stored footprint phases."""
+    busiest = phases.get("load") or phases.get("startup")
+    return busiest["cpu_p95"], max(row["peak_rss_mb"] for row in phases.values())
+
+
+def stack_demand(record, service_dir, footprint=None):
+    """Return the :class:`Stack` of one service from its catalog record and footprint."""
+    stack = Stack(record["service_id"])
+    if footprint and next(iter(footprint.values()))["source"] == "container":
+        cpu, memory_mb = _measured(footprint)
+        stack.parts.append(Part("stack", cpu, memory_mb, "footprint"))
+        return stack
+
+    def app(name, dockerfile_path, service):
+        if footprint:
+            cpu, memory_mb = _measured(footprint)
+            return Part(name, cpu, memory_mb, "footprint")
+        estimate = estimate_app(record["language"], base_image(dockerfile_path), record["package_bytes"])
+        return _capped(name, estimate, service, "estimate")
+
+    path = compose_file(service_dir)
+    doc = None
+    if path is not None:
+        try:
+            doc = load_compose(path)
+        except ComposeError:
+            pass
+    if not doc or not services(doc):
+        stack.parts.append(app("app", service_dir / "Dockerfile", {}))
+        return stack
+    for name, service in services(doc).items():
+        service = service or {}
+        spec = build_spec(service)
+        if spec is not None:
+            context, dockerfile = spec
+            stack.parts.append(app(name, service_dir / str(context) / str(dockerfile), service))
+        else:
+            stack.parts.append(_capped(name, estimate_image(service.get("image", "")), service, "image"))
+    return stack
+
+
+def demands(root=None, status=None, service_ids=None):
+    """Return the :class:`Stack` of every service (with ``status``, or among ``service_ids``)."""
+    wanted = set(service_ids or ())
+    if status:
+        wanted |= {sid for sid, entry in Journal(root).statuses().items() if entry["status"] == status}
+    with open_catalog(root) as catalog:
+        records = catalog.query()
+        footprints = catalog.footprints()
+    stacks = []
+    for record in records:
+        service_id = record["service_id"]
+        if (status or service_ids) and service_id not in wanted:
+            continue
+        stacks.append(stack_demand(record, services_dir(root) / service_id, footprints.get(service_id)))
+    return stacks
+
+
+def _scaled(stack, headroom):
+    return stack.cpu * headroom, stack.memory_mb * headroom
+
+
+def pack(stacks, cpu=DEFAULT_NODE_CPU, memory_mb=None, headroom=DEFAULT_HEADROOM):
+    """Best-fit decreasing packing; return ``(nodes, oversized_stacks)``."""
+    memory_mb = memory_mb or parse_size(DEFAULT_NODE_MEMORY) / 2 ** 20
+    items = []
+    oversized = []
+    for stack in stacks:
+        need_cpu, need_memory = _scaled(stack, headroom)
+        if need_cpu > cpu or need_memory > memory_mb:
+            oversized.append(stack)
+            continue
+        items.append((max(need_cpu / cpu, need_memory / memory_mb), stack.service_id, need_cpu, need_memory))
+    items.sort(key=lambda item: (-item[0], item[1]))
+    nodes = []
+    for _, service_id, need_cpu, need_memory in items:
+        best = None
+        best_left = None
+        for node in nodes:
+            if node.fits(need_cpu, need_memory):
+                left = max((node.cpu - node.used_cpu - need_cpu) / cpu,
+                           (node.memory_mb - node.used_memory_mb - need_memory) / memory_mb)
+                if best is None or left < best_left:
+                    best, best_left = node, left
+        if best is None:
+            best = Node(f"node-{len(nodes) + 1:03d}", cpu, memory_mb)
+            nodes.append(best)
+        best.add(service_id, need_cpu, need_memory)
+    return nodes, oversized
+
+
+def round_robin_nodes(stacks, cpu=DEFAULT_NODE_CPU, memory_mb=None, headroom=DEFAULT_HEADROOM):
+    """Return the fewest nodes on which dealing ``stacks`` in order overflows none of them."""
+    memory_mb = memory_mb or parse_size(DEFAULT_NODE_MEMORY) / 2 ** 20
+    items = [_scaled(stack, headroom) for stack in stacks]
+    items = [(c, m) for c, m in items if c <= cpu and m <= memory_mb]
+    if not items:
+        return 0
+    count = lower_bound(items, cpu, memory_mb)
+    while True:
+        used = [[0.0, 0.0] for _ in range(count)]
+        for index, (c, m) in enumerate(items):
+            node = used[index % count]
+            node[0] += c
+            node[1] += m
+        if all(c <= cpu + 1e-9 and m <= memory_mb + 1e-9 for c, m in used):
+            return count
+        count += 1
+
+
+def lower_bound(items, cpu, memory_mb):
+    """Nodes needed if demand were perfectly divisible: the larger of total CPU and memory over capacity."""
+    return max(1, math.ceil(sum(c for c, _ in items) / cpu - 1e-9),
+               math.ceil(sum(m for _, m in items) / memory_mb - 1e-9))
+
+
+def simulate(stacks, cpu=DEFAULT_NODE_CPU, memory_mb=None, headroom=DEFAULT_HEADROOM):
+    """Compare bin-packing with round-robin for ``stacks``; return a summary dict."""
+    memory_mb = memory_mb or parse_size(DEFAULT_NODE_MEMORY) / 2 ** 20
+    nodes, oversized = pack(stacks, cpu, memory_mb, headroom)
+    placed = [(n.used_cpu, n.used_memory_mb) for n in nodes]
+    sources = Counter(part.source for stack in stacks for part in stack.parts)
+    return {
+        "stacks": len(stacks),
+        "measured": sum(stack.measured for stack in stacks),
+        "parts": dict(sources),
+        "node_cpu": cpu,
+        "node_memory_mb": round(memory_mb),
+        "headroom": headroom,
+        "cpu": round(sum(c for c, _ in placed), 2),
+        "memory_mb": round(sum(m for _, m in placed)),
+        "lower_bound": lower_bound(placed, cpu, memory_mb) if placed else 0,
+        "packed_nodes": len(nodes),
+        "round_robin_nodes": round_robin_nodes(stacks, cpu, memory_mb, headroom),
+        "oversized": [stack.service_id for stack in oversized],
+        "cpu_utilisation": round(sum(c for c, _ in placed) / (cpu * len(nodes)), 3) if nodes else None,
+        "memory_utilisation": round(sum(m for _, m in placed) / (memory_mb * len(nodes)), 3) if nodes else None,
+    }
+
+
+def write_plan(nodes, oversized, root=None):
+    """Atomically write the packing to ``.bank/placement.json`` and return its path."""
+    path = state_dir(root) / PLAN_FILENAME
+    plan = {"nodes": [dict(asdict(node), used_cpu=round(node.used_cpu, 3),
+                           used_memory_mb=round(node.used_memory_mb, 1)) for node in nodes],
+            "oversized": [stack.service_id for stack in oversized]}
+    fd, tmp = tempfile.mkstemp(prefix=".tmp.", dir=path.parent)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.placement", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--cpu", type=float, default=DEFAULT_NODE_CPU, help="cores per node")
+    common.add_argument("--memory", default=DEFAULT_NODE_MEMORY, help="memory per node (e.g. 32G)")
+    common.add_argument("--headroom", type=float, default=DEFAULT_HEADROOM, help="factor applied to every demand")
+    common.add_argument("--status", help="only services with this status (e.g. deploying)")
+    common.add_argument("service_ids", nargs="*", help="default: every service")
+    sub.add_parser("simulate", parents=[common], help="node count of bin-packing vs. round-robin")
+    sub.add_parser("plan", parents=[common], help="write the packing to .bank/placement.json")
+    show = sub.add_parser("show", help="print one service's stack demand")
+    show.add_argument("service_id")
+
+    args = parser.parse_args(argv)
+    if args.command == "show":
+        stacks = demands(args.root, service_ids=[args.service_id])
+        if not stacks:
+            print(f"error: unknown service {args.service_id}", file=sys.stderr)
+            return 1
+        stack = stacks[0]
+        for part in stack.parts:
+            print(f"{part.name:<24} {part.cpu:6.2f} cores {part.memory_mb:9.1f} MiB  {part.source}")
+        print(f"{'total':<24} {stack.cpu:6.2f} cores {stack.memory_mb:9.1f} MiB")
+        return 0
+    memory_mb = parse_size(args.memory)
+    if not memory_mb or args.cpu <= 0 or args.headroom <= 0:
+        print("error: --cpu, --memory and --headroom must be positive", file=sys.stderr)
+        return 1
+    memory_mb /= 2 ** 20
+    stacks = demands(args.root, args.status, args.service_ids)
+    if not stacks:
+        print("error: no services to place", file=sys.stderr)
+        return 1
+    if args.command == "simulate":
+        result = simulate(stacks, args.cpu, memory_mb, args.headroom)
+        print(f"{result['stacks']} stacks ({result['measured']} measured), "
+              f"{result['cpu']:.1f} cores and {result['memory_mb'] / 1024:.1f} GiB with headroom {args.headroom}")
+        print(f"nodes of {args.cpu:g} cores / {args.memory}: lower bound {result['lower_bound']}, "
+              f"bin-packed {result['packed_nodes']}, round-robin {result['round_robin_nodes']}")
+        if result["packed_nodes"]:
+            print(f"bin-packed utilisation: cpu {result['cpu_utilisation']:.0%}, "
+                  f"memory {result['memory_utilisation']:.0%}")
+        if result["oversized"]:
+            print(f"{len(result['oversized'])} stacks fit on no node: {' '.join(result['oversized'])}")
+    else:
+        nodes, oversized = pack(stacks, args.cpu, memory_mb, args.headroom)
+        path = write_plan(nodes, oversized, args.root)
+        print(f"{len(stacks) - len(oversized)} stacks on {len(nodes)} nodes; "
+              f"{len(oversized)} oversized; wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,438 @@
+"""Concurrent health probing of every deployed stack with adaptive intervals.
+
+Probe targets come from the bank itself: the HTTP URL in each compose
+service's ``healthcheck`` (``curl -f http://localhost:8080/health`` ...)
+mapped to its published host port, a TCP connect for database and cache
+healthchecks (``redis-cli ping``, ``mysqladmin ping`` ...) whose port is
+published, and the ``/health`` route of generated wrappers (``app.py``,
+``server.js`` ...) for services built from the stack's Dockerfile that have
+no healthcheck of their own.  Only stacks the journal (:mod:`bank.journal`)
+has as ``running`` are probed by default: a stopped stack has nothing to
+check, and under :mod:`bank.hibernate` every probe would wake it.
+
+One asyncio loop checks all targets, with ``--concurrency`` probes in flight
+at most.  HTTP probes keep their connection open between checks
+(HTTP/1.1 keep-alive) and reconnect only when the server closes it.  Every
+target starts at ``--min-interval``.  After a few identical results in a row
+its interval grows by half, up to ``--max-interval`` (a quarter of that
+while it is unhealthy).  Any change of state resets the interval to the
+minimum, and a target that changes state several times within the flap
+window stays at the minimum.
+
+The loop publishes one snapshot of every target to
+``.bank/probes/status.json`` (atomically replaced) every
+``--publish-every`` seconds.
+
+Usage::
+
+    python -m bank.probes targets [--status running | --all]
+    python -m bank.probes run [--status running | --all] [--once] [--concurrency 500]
+    python -m bank.probes show [--unhealthy]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import state_dir
+from .compose import ComposeError, load_compose, services, services_building
+from .deploy import compose_file
+from .journal import Journal
+from .metadata import iter_service_dirs
+from .scheduler import SUCCESS_STATUS
+
+PROBES_DIRNAME = "probes"
+SNAPSHOT_FILENAME = "status.json"
+DEFAULT_CONCURRENCY = 500
+DEFAULT_MIN_INTERVAL = 5.0
+DEFAULT_MAX_INTERVAL = 120.0
+DEFAULT_TIMEOUT = 5.0
+BACKOFF_FACTOR = 1.5
+STABLE_AFTER = 3
+FLAP_WINDOW = 300.0
+FLAP_THRESHOLD = 3
+USER_AGENT = "bank-probes/1"
+
+_LOCAL_URL = re.compile(r"https?://(?:localhost|127\.0\.0\.1|0\.0\.0\.0)(?::(\d+))?(/[^\s'\"|;&>]*)?")
+_WRAPPER_ROUTE = re.compile(
+    r"(?:route|get|api_route|add_url_rule)\(\s*['\"](/(?:health|healthz|ready|readyz|ping)[\w/-]*)['\"]")
+_WRAPPER_SUFFIXES = (".py", ".js", ".mjs", ".cjs")
+# healthcheck command -> the port the engine listens on inside the container
+_TCP_CHECKS = {
+    "redis-cli": 6379, "mysqladmin": 3306, "mariadb-admin": 3306, "healthcheck.sh": 3306,
+    "pg_isready": 5432, "mongosh": 27017, "mongo": 27017, "rabbitmq-diagnostics": 5672,
+}
+
+
+@dataclass
+class Target:
+    """One probed endpoint and its probing state."""
+
+    key: str
+    kind: str                     # "http" or "tcp"
+    port: int
+    path: str = "/"
+    source: str = "healthcheck"
+    host: str = "127.0.0.1"
+    interval: float = DEFAULT_MIN_INTERVAL
+    healthy: bool = None
+    detail: str = ""
+    latency_ms: float = None
+    checked_at: float = None
+    since: float = None
+    streak: int = 0
+    checks: int = 0
+    transitions: deque = field(default_factory=deque)
+    conn: tuple = None
+
+    @property
+    def url(self):
+        if self.kind == "http":
+            return f"http://{self.host}:{self.port}{self.path}"
+        return f"tcp://{self.host}:{self.port}"
+
+    @property
+    def flapping(self):
+        return len(self.transitions) >= FLAP_THRESHOLD
+
+
+def published_ports(service):
+    """Return ``{container_port: host_port}`` for a compose service."""
+    mapping = {}
+    for port in service.get("ports") or []:
+        if isinstance(port, dict):
+            host, container = port.get("published"), port.get("target")
+        else:
+            parts = str(port).split("/")[0].rsplit(":", 2)
+            if len(parts) < 2:
+                continue
+            host, container = parts[-2], parts[-1]
+        try:
+            mapping.setdefault(int(container), int(str(host).split("-")[0]))
+        except (TypeError, ValueError):
+            continue
+    return mapping
+
+
+def _healthcheck_words(service):
+    test = (service.get("healthcheck") or {}).get("test")
+    if not test or (service.get("healthcheck") or {}).get("disable"):
+        return []
+    if isinstance(test, str):
+        return test.split()
+    return " ".join(str(word) for word in test[1:]).split()
+
+
+def wrapper_routes(service_dir):
+    """Return the health routes declared by a service's generated wrappers."""
+    routes = []
+    for path in sorted(Path(service_dir).iterdir()):
+        if path.suffix in _WRAPPER_SUFFIXES and path.is_file():
+            text = path.read_text(encoding="utf-8", errors="replace")
+            routes += [m.group(1) for m in _WRAPPER_ROUTE.finditer(text) if m.group(1) not in routes]
+    return routes
+
+
+def stack_targets(service_id, service_dir):
+    """Yield the :class:`Target` objects of one stack."""
+    path = compose_file(service_dir)
+    if path is None:
+        return
+    try:
+        doc = load_compose(path)
+    except ComposeError:
+        return
+    routes = None
+    built = set(services_building(doc))
+    for name, service in services(doc).items():
+        service = service or {}
+        ports = published_ports(service)
+        if not ports:
+            continue
+        key = f"{service_id}/{name}"
+        words = _healthcheck_words(service)
+        match = _LOCAL_URL.search(" ".join(words))
+        if match:
+            port = ports.get(int(match.group(1) or 80))
+            if port:
+                yield Target(key, "http", port, match.group(2) or "/")
+            continue
+        command = os.path.basename(words[0]) if words else ""
+        if command in _TCP_CHECKS:
+            port = ports.get(_TCP_CHECKS[command])
+            if port:
+                yield Target(key, "tcp", port)
+            continue
+        if not words and name in built:
+            routes = wrapper_routes(service_dir) if routes is None else routes
+            if routes:
+                container_port = min(ports)
+                yield Target(key, "http", ports[container_port], routes[0], source="wrapper")
+
+
+def discover(root=None, status=SUCCESS_STATUS):
+    """Return the probe targets of the stacks whose journaled status is ``status``.
+
+    ``status=None`` returns the targets of every stack.
+    """
+    statuses = Journal(root).statuses() if status else None
+    targets = []
+    for service_id, service_dir in iter_service_dirs(root):
+        if statuses is None or statuses.get(service_id, {}).get("status") == status:
+            targets.extend(stack_targets(service_id, service_dir))
+    return targets
+
+
+class ProbeEngine:
+    """Probes a set of targets forever (or once) and publishes snapshots."""
+
+    def __init__(self, targets, root=None, concurrency=DEFAULT_CONCURRENCY, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, timeout=DEFAULT_TIMEOUT, publish_every=5.0):
+        self.targets = list(targets)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.publish_every = publish_every
+        self.concurrency = concurrency
+        self.snapshot_path = state_dir(root) / PROBES_DIRNAME / SNAPSHOT_FILENAME
+        for target in self.targets:
+            target.interval = min_interval
+
+    async def _request(self, target, method="GET"):
+        reader, writer = target.conn
+        writer.write((f"{method} {target.path} HTTP/1.1\r\nHost: {target.host}:{target.port}\r\n"
+                      f"User-Agent: {USER_AGENT}\r\nConnection: keep-alive\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        status = 100
+        while 100 <= status < 200 and status != 101:      # skip interim responses (100 Continue, 103 ...)
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("connection closed by server")
+            version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+            status = int(status)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        if version == "HTTP/1.0" and headers.get("connection", "").lower() != "keep-alive":
+            headers["connection"] = "close"
+        if method == "HEAD" or status < 200 or status in (204, 304):
+            pass                                            # never has a body (RFC 9112 section 6.3)
+        elif "content-length" in headers:
+            await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            while (size := int((await reader.readline()).split(b";")[0], 16)):
+                await reader.readexactly(size + 2)
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+        elif headers.get("connection", "").lower() == "close":
+            await reader.read()                             # the body ends when the server closes
+        else:
+            headers["connection"] = "close"                 # no way to find the body's end; drop it
+        if headers.get("connection", "").lower() == "close":
+            self._close(target)
+        return status
+
+    def _close(self, target):
+        if target.conn is not None:
+            target.conn[1].close()
+            target.conn = None
+
+    async def _http(self, target):
+        reused = target.conn is not None and not target.conn[1].is_closing()
+        if not reused:
+            self._close(target)
+            target.conn = await asyncio.open_connection(target.host, target.port)
+        try:
+            status = await self._request(target)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self._close(target)
+            if not reused:
+                raise
+            # The server dropped the idle keep-alive connection; retry fresh.
+            target.conn = await asyncio.open_connection(target.host, target.port)
+            status = await self._request(target)
+        return status < 400, f"HTTP {status}"
+
+    async def _tcp(self, target):
+        _, writer = await asyncio.open_connection(target.host, target.port)
+        writer.close()
+        return True, "connected"
+
+    async def check(self, target):
+        """Probe ``target`` once and update its state and interval."""
+        started = time.monotonic()
+        try:
+            probe = self._http if target.kind == "http" else self._tcp
+            ok, detail = await asyncio.wait_for(probe(target), self.timeout)
+        except asyncio.TimeoutError:
+            self._close(target)
+            ok, detail = False, f"timeout after {self.timeout:g}s"
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as exc:
+            self._close(target)
+            ok, detail = False, f"{type(exc).__name__}: {exc}"
+        now = time.time()
+        target.latency_ms = round((time.monotonic() - started) * 1000, 1)
+        target.detail = detail
+        target.checked_at = now
+        target.checks += 1
+        self._adapt(target, ok, now)
+
+    def _adapt(self, target, ok, now):
+        if target.healthy is None or ok != target.healthy:
+            if target.healthy is not None:
+                target.transitions.append(now)
+            target.healthy = ok
+            target.since = now
+            target.streak = 0
+            target.interval = self.min_interval
+        else:
+            target.streak += 1
+        while target.transitions and now - target.transitions[0] > FLAP_WINDOW:
+            target.transitions.popleft()
+        if target.flapping:
+            target.interval = self.min_interval
+        elif target.streak >= STABLE_AFTER:
+            ceiling = self.max_interval if ok else max(self.min_interval, self.max_interval / 4)
+            target.interval = min(ceiling, target.interval * BACKOFF_FACTOR)
+
+    async def _watch(self, target, semaphore):
+        await asyncio.sleep(random.uniform(0, self.min_interval))
+        while True:
+            async with semaphore:
+                await self.check(target)
+            await asyncio.sleep(target.interval)
+
+    def snapshot(self):
+        """Return the current state of every target as a JSON-able dict."""
+        summary = Counter("unknown" if t.healthy is None else "healthy" if t.healthy else "unhealthy"
+                          for t in self.targets)
+        summary["flapping"] = sum(t.flapping for t in self.targets)
+
+        def stamp(seconds):
+            return datetime.fromtimestamp(seconds, timezone.utc).isoformat(timespec="seconds") if seconds else None
+
+        return {
+            "generated_at": stamp(time.time()),
+            "summary": dict(summary, targets=len(self.targets)),
+            "targets": {
+                t.key: {"url": t.url, "source": t.source, "healthy": t.healthy, "detail": t.detail,
+                        "latency_ms": t.latency_ms, "interval_s": round(t.interval, 1), "flapping": t.flapping,
+                        "checked_at": stamp(t.checked_at), "since": stamp(t.since), "checks": t.checks}
+                for t in self.targets
+            },
+        }
+
+    def publish(self):
+        """Atomically replace the snapshot file; return its path."""
+        path = self.snapshot_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".status.", suffix=".tmp", dir=path.parent)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+        return path
+
+    async def run_once(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(target):
+            async with semaphore:
+                await self.check(target)
+                self._close(target)
+
+        await asyncio.gather(*(one(t) for t in self.targets))
+        return self.publish()
+
+    async def run(self, duration=None):
+        """Probe until cancelled (or for ``duration`` seconds), publishing as we go."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        watchers = [asyncio.create_task(self._watch(t, semaphore)) for t in self.targets]
+        deadline = time.monotonic() + duration if duration else None
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                await asyncio.sleep(self.publish_every)
+                self.publish()
+        finally:
+            for task in watchers:
+                task.cancel()
+            await asyncio.gather(*watchers, return_exceptions=True)
+            for target in self.targets:
+                self._close(target)
+            self.publish()
+
+
+def load_snapshot(root=None):
+    with open(state_dir(root) / PROBES_DIRNAME / SNAPSHOT_FILENAME, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.probes", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    tg = sub.add_parser("targets", help="list the probe targets found in the bank")
+    rn = sub.add_parser("run", help="probe the targets and publish status snapshots")
+    for p in (tg, rn):
+        p.add_argument("--status", default=SUCCESS_STATUS,
+                       help=f"only stacks with this journaled status (default: {SUCCESS_STATUS})")
+        p.add_argument("--all", dest="status", action="store_const", const=None,
+                       help="every stack, whatever its status (wakes hibernated ones)")
+        p.add_argument("--host", default="127.0.0.1", help="address the published ports listen on")
+    rn.add_argument("--once", action="store_true", help="probe every target once, publish and exit")
+    rn.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    rn.add_argument("--min-interval", type=float, default=DEFAULT_MIN_INTERVAL)
+    rn.add_argument("--max-interval", type=float, default=DEFAULT_MAX_INTERVAL)
+    rn.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    rn.add_argument("--publish-every", type=float, default=5.0)
+    rn.add_argument("--duration", type=float, help="stop after this many seconds")
+    sh = sub.add_parser("show", help="summarise the last published snapshot")
+    sh.add_argument("--unhealthy", action="store_true", help="list unhealthy and flapping targets")
+
+    args = parser.parse_args(argv)
+    if args.command in ("targets", "run"):
+        targets = discover(args.root, args.status)
+        for target in targets:
+            target.host = args.host
+    if args.command == "targets":
+        for target in targets:
+            print(f"{target.key:<48} {target.source:<11} {target.url}")
+        print(f"{len(targets)} targets", file=sys.stderr)
+    elif args.command == "run":
+        engine = ProbeEngine(targets, args.root, args.concurrency, args.min_interval, args.max_interval,
+                             args.timeout, args.publish_every)
+        try:
+            if args.once:
+                asyncio.run(engine.run_once())
+            else:
+                asyncio.run(engine.run(args.duration))
+        except KeyboardInterrupt:
+            pass
+        summary = engine.snapshot()["summary"]
+        print(" ".join(f"{k}={v}" for k, v in sorted(summary.items())))
+    elif args.command == "show":
+        try:
+            snapshot = load_snapshot(args.root)
+        except FileNotFoundError:
+            print("no snapshot yet; run `python -m bank.probes run`", file=sys.stderr)
+            return 1
+        print(snapshot["generated_at"], " ".join(f"{k}={v}" for k, v in sorted(snapshot["summary"].items())))
+        if args.unhealthy:
+            for key, entry in sorted(snapshot["targets"].items()):
+                if entry["healthy"] is False or entry["flapping"]:
+                    print(f"{key:<48} {entry['url']:<40} {entry['detail']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""Concurrent extract → build → start pipelines for services being deployed.
+
+Jobs wait in a priority queue (most starred first, or oldest upload first)
+and are handed to a thread pool as soon as a slot for their language frees
+up: Java builds are CPU heavy and get few slots, Python and Node builds are
+mostly network and disk bound and get more.  Every status change is
+appended to the :class:`~bank.journal.Journal` together with the job's
+phase durations, and the journal is compacted back into ``metadata.json``
+when the run ends.  Which services are ``deploying`` is also read from
+the journal, so changes not compacted yet are seen.
+
+A finished job leaves its service ``running`` (the stack was started with
+``compose up -d``) or ``failed`` (a phase raised; the error is journaled).
+Both are new to ``metadata.json``, which only knew ``deploying`` (queued
+for the scheduler) and ``stopped``.  Neither fits a finished job: leaving
+``deploying`` would queue the service again on every run, and ``stopped``
+would hide that its stack is up.  A ``failed`` service is retried once it
+is set back to ``deploying``.
+
+Builds go through :class:`bank.buildcache.BuildCache` unless
+``--no-build-cache`` is given, so a redeploy with unchanged inputs reuses
+its images.  Packages that the last :mod:`bank.integrity` scan found
+corrupt, unreadable or a git-LFS pointer are skipped unless
+``--ignore-integrity`` is given.
+
+Usage::
+
+    python -m bank.scheduler --dry-run
+    python -m bank.scheduler --order age --limit java=1 --limit python=6
+"""
+
+import argparse
+import heapq
+import importlib
+import logging
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import services_dir
+from .buildcache import BuildCache
+from .catalog import open_catalog
+from .deploy import DEFAULT_WORKDIR, compose, prepare_workdir
+from .integrity import failed_packages
+from .journal import Journal
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {"java": 2, "python": 4, "nodejs": 4}
+DEFAULT_LIMIT = 2
+PHASES = ("extract", "build", "start")
+SUCCESS_STATUS = "running"        # compose up -d succeeded
+FAILURE_STATUS = "failed"         # a phase failed; not queued again until set back to deploying
+
+# Deploy-tree transforms selectable with --transform, as "module:function".
+TRANSFORMS = {
+    "baseimages": "bank.baseimages:apply_to_workdir",
+    "buildcontext": "bank.buildcontext:apply_to_workdir",
+    "cachemounts": "bank.cachemounts:apply_to_workdir",
+    "lazyimport": "bank.lazyimport:apply_to_workdir",
+    "sharedinfra": "bank.sharedinfra:apply_to_workdir",
+    "startup": "bank.startup:apply_to_workdir",
+    "wheelhouse": "bank.wheelhouse:apply_to_workdir",
+}
+
+
+@dataclass(order=True)
+class Job:
+    sort_key: tuple
+    service_id: str = field(compare=False)
+    language: str = field(compare=False)
+
+
+@dataclass
+class JobResult:
+    service_id: str
+    ok: bool
+    phases: dict = field(default_factory=dict)
+    error: str = None
+    build_cache: str = None       # "hit" or "miss" when the cache was used
+
+
+def job_key(meta, order):
+    """Priority key for a service; smaller keys run first."""
+    if order == "star":
+        return (-(meta.get("star") or 0), meta["service_id"])
+    if order == "age":
+        return (meta.get("uploaded_at") or "", meta["service_id"])
+    raise ValueError(f"unknown order: {order}")
+
+
+def load_transform(name):
+    """Resolve a :data:`TRANSFORMS` entry to its callable."""
+    module, _, attr = TRANSFORMS[name].partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def run_pipeline(service_id, root=None, workdir=DEFAULT_WORKDIR, dry_run=False, transforms=(), build_cache=None):
+    """Extract, build and start one service; return a :class:`JobResult`.
+
+    With a :class:`~bank.buildcache.BuildCache` the build is skipped when
+    the cache holds images for the same inputs.
+    """
+    result = JobResult(service_id, ok=False)
+    service_dir = services_dir(root) / service_id
+    target = workdir / service_id
+
+    def build():
+        if build_cache is None:
+            compose(target, "build")
+        else:
+            result.build_cache = build_cache.build(service_dir, target, transforms)
+
+    steps = {
+        "extract": lambda: prepare_workdir(service_dir, target, transforms),
+        "build": build,
+        "start": lambda: compose(target, "up", "-d"),
+    }
+    for phase in PHASES:
+        started = time.monotonic()
+        try:
+            if dry_run:
+                log.info("%s: %s (dry run)", service_id, phase)
+            else:
+                steps[phase]()
+        except Exception as exc:  # a failed phase fails the job, not the scheduler
+            result.phases[phase] = time.monotonic() - started
+            result.error = f"{phase}: {exc}"
+            return result
+        result.phases[phase] = time.monotonic() - started
+    result.ok = True
+    return result
+
+
+class Scheduler:
+    """Priority-ordered, per-language bounded pool of deploy pipelines."""
+
+    def __init__(self, root=None, limits=None, workdir=DEFAULT_WORKDIR, dry_run=False, pipeline=run_pipeline,
+                 transforms=(), build_cache=None):
+        self.root = root
+        self.transforms = list(transforms)
+        self.build_cache = build_cache
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.workdir = workdir
+        self.dry_run = dry_run
+        self.pipeline = pipeline
+        self.journal = None if dry_run else Journal(root)
+        self._queue = []
+
+    def limit(self, language):
+        return self.limits.get(language, DEFAULT_LIMIT)
+
+    def submit(self, meta, order="star"):
+        heapq.heappush(self._queue, Job(job_key(meta, order), meta["service_id"], meta.get("language")))
+
+    def _next_runnable(self, running):
+        """Pop the highest-priority job whose language has a free slot."""
+        skipped = []
+        job = None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            if running.get(candidate.language, 0) < self.limit(candidate.language):
+                job = candidate
+                break
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self._queue, candidate)
+        return job
+
+    def run(self):
+        """Drain the queue and return the list of :class:`JobResult`."""
+        results = []
+        running = {}
+        futures = {}
+        workers = max(1, sum(self.limit(language) for language in {job.language for job in self._queue}))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deploy") as pool:
+            while self._queue or futures:
+                while (job := self._next_runnable(running)) is not None:
+                    running[job.language] = running.get(job.language, 0) + 1
+                    log.info("%s: starting (%s)", job.service_id, job.language)
+                    future = pool.submit(self.pipeline, job.service_id, self.root, self.workdir, self.dry_run,
+                                         self.transforms, self.build_cache)
+                    futures[future] = job
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures.pop(future)
+                    running[job.language] -= 1
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        result = JobResult(job.service_id, ok=False, error=str(exc))
+                    self._record(result)
+                    log.log(logging.INFO if result.ok else logging.ERROR, "%s: %s", job.service_id,
+                            "done" if result.ok else result.error)
+                    results.append(result)
+        if self.journal is not None:
+            self.journal.compact()
+        return results
+
+    def _record(self, result):
+        status = SUCCESS_STATUS if result.ok else FAILURE_STATUS
+        if self.journal is None:
+            log.info("%s: would set %s", result.service_id, {"status": status})
+            return
+        fields = {"phases": {phase: round(seconds, 3) for phase, seconds in result.phases.items()}}
+        if result.error:
+            fields["error"] = result.error.splitlines()[0]
+        if result.build_cache:
+            fields["build_cache"] = result.build_cache
+        self.journal.record(result.service_id, status, **fields)
+
+
+def _parse_limit(value):
+    language, _, n = value.partition("=")
+    if not language or not n.isdigit() or int(n) < 1:
+        raise argparse.ArgumentTypeError(f"expected LANGUAGE=N, got {value!r}")
+    return language, int(n)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.scheduler", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    parser.add_argument("service_ids", nargs="*", help="services to deploy (default: every 'deploying' one)")
+    parser.add_argument("--order", choices=("star", "age"), default="star")
+    parser.add_argument("--limit", type=_parse_limit, action="append", default=[],
+                        help="concurrent jobs per language, e.g. java=2 (repeatable)")
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR)
+    parser.add_argument("--transform", action="append", choices=sorted(TRANSFORMS), default=[],
+                        help="rewrite each deploy tree before building (repeatable)")
+    parser.add_argument("--no-build-cache", dest="build_cache", action="store_false",
+                        help="always rebuild, even when the inputs of the last build are unchanged")
+    parser.add_argument("--ignore-integrity", action="store_true",
+                        help="also deploy packages the last integrity scan found corrupt, unreadable or LFS pointers")
+    parser.add_argument("--dry-run", action="store_true", help="schedule without running or writing anything")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+
+    with open_catalog(args.root) as catalog:
+        if args.service_ids:
+            metas = [m for m in (catalog.get(sid) for sid in args.service_ids) if m]
+        else:
+            statuses = Journal(args.root).statuses()
+            metas = [m for m in catalog.query()
+                     if statuses.get(m["service_id"], {}).get("status", m["status"]) == "deploying"]
+        broken = {} if args.ignore_integrity else failed_packages(catalog, args.root)
+    for meta in [m for m in metas if m["service_id"] in broken]:
+        result = broken[meta["service_id"]]
+        log.warning("skipping %s: package is %s (%s)", meta["service_id"], result["status"], result["error"])
+    metas = [m for m in metas if m["service_id"] not in broken]
+    transforms = [load_transform(name) for name in args.transform]
+    build_cache = BuildCache(args.root) if args.build_cache and not args.dry_run else None
+    scheduler = Scheduler(args.root, limits=dict(args.limit), workdir=args.workdir, dry_run=args.dry_run,
+                          transforms=transforms, build_cache=build_cache)
+    for meta in metas:
+        scheduler.submit(meta, order=args.order)
+    started = time.monotonic()
+    results = scheduler.run()
+    failed = [r for r in results if not r.ok]
+    print(f"{len(results) - len(failed)} deployed, {len(failed)} failed in {time.monotonic() - started:.1f} s")
+    hits = sum(r.build_cache == "hit" for r in results)
+    if build_cache is not None and hits:
+        print(f"{hits} builds reused cached images")
+    for result in failed:
+        print(f"  {result.service_id}: {(result.error or 'failed').splitlines()[0]}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,648 @@
+"""Seekable zstd-framed packages as an alternative to ``source.zip``.
+
+Extracting a deflate zip is a single-threaded inflate of every member.  A
+``source.szst`` holds the same package as a sequence of independently
+decodable zstd frames with an index at the end, so
+
+* extraction decodes frames on as many threads as there are cores
+  (zstandard releases the GIL) and writes each file slice with ``pwrite``;
+* reading one file decodes only the frame or two it lives in;
+* the original ``source.zip`` can be rebuilt byte for byte.
+
+Layout::
+
+    frame 0 .. frame N-1   zstd frames (with checksums) of the data stream
+    skippable frame        magic 0x184D2A5E, length, then
+        index              zstd-compressed JSON
+        footer             <Q index length> <8s "BANKSZS1">
+
+The data stream is the content of every member in archive order, followed
+by the *skeleton*: all bytes of the zip that are not member payloads (local
+headers, data descriptors, central directory).  Frames are cut every
+:data:`FRAME_SIZE` bytes of the stream.  Because the index sits in a
+skippable frame, ``zstd -d`` turns the file into the concatenated stream.
+
+Members are stored as plain content when re-deflating them reproduces the
+archived payload exactly.  zlib at level 6 does this for every deflated
+member in the bank today, and a few other zlib settings are also tried.
+Other members keep their compressed payload verbatim ("raw") and are
+inflated on extraction.  Rebuilding the zip re-deflates content members
+with the recorded settings and checks the result against the SHA-256
+recorded when packing.
+
+``pack`` writes ``source.szst`` next to the package it was built from, so
+every reader finds it from the service directory alone.  It is derived
+from the zip and never committed (``.gitignore`` excludes it), and a
+``source.szst`` that no longer matches its zip's size and mtime is
+ignored (:func:`is_current`).
+
+``zstandard`` is optional: only this format needs it.  :func:`available`
+says whether it is installed, and :mod:`bank.deploy` extracts from a
+``source.szst`` only when it is.
+
+Usage::
+
+    python -m bank.seekable pack [<service_id> ...] [--largest 10] [--level 3]
+    python -m bank.seekable unpack <service_id> out.zip
+    python -m bank.seekable ls <service_id>
+    python -m bank.seekable cat <service_id> <member>
+    python -m bank.seekable extract <service_id> <dest> [--workers N]
+    python -m bank.seekable bench [<service_id> ...] [--largest 5] [--repeat 3]
+"""
+
+import argparse
+import bz2
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+from . import services_dir, state_dir
+from .parts import PART_PREFIX, SOURCE_FILENAME, PartsError, open_split
+
+SEEKABLE_FILENAME = "source.szst"
+FORMAT_VERSION = 1
+FRAME_SIZE = 2 << 20
+DEFAULT_LEVEL = 3
+CACHED_FRAMES = 8
+BENCH_FILENAME = "seekable.jsonl"
+# zlib settings tried, in order, to reproduce a deflated payload.
+DEFLATE_SETTINGS = ((6, 8), (9, 8), (1, 8), (5, 8), (4, 8), (3, 8), (2, 8), (7, 8), (8, 8), (6, 9), (9, 9))
+READ_SIZE = 1 << 20
+
+_SKIPPABLE_MAGIC = 0x184D2A5E
+_FOOTER = struct.Struct("<Q8s")
+_FOOTER_MAGIC = b"BANKSZS1"
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_MAGIC = b"PK\x03\x04"
+
+
+class SeekableError(Exception):
+    pass
+
+
+def available():
+    """True when the optional ``zstandard`` package is installed."""
+    return zstandard is not None
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise SeekableError("zstandard is required for .szst packages (pip install zstandard)")
+
+
+def _zip_files(service_dir):
+    service_dir = Path(service_dir)
+    source = service_dir / SOURCE_FILENAME
+    return [source] if source.exists() else sorted(service_dir.glob(PART_PREFIX + "*"))
+
+
+def has_package_zip(service_dir):
+    return bool(_zip_files(service_dir))
+
+
+def _zip_stamp(service_dir):
+    stats = [path.stat() for path in _zip_files(service_dir)]
+    return sum(st.st_size for st in stats), max((st.st_mtime_ns for st in stats), default=0)
+
+
+def _open_raw(service_dir):
+    source = Path(service_dir) / SOURCE_FILENAME
+    return open(source, "rb") if source.exists() else open_split(service_dir)
+
+
+def reproduce_deflate(payload, content):
+    """Return the ``(level, mem_level)`` whose raw deflate of ``content`` is ``payload``."""
+    for level, mem_level in DEFLATE_SETTINGS:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, mem_level)
+        pos = 0
+        for start in range(0, len(content), READ_SIZE):
+            piece = compressor.compress(content[start:start + READ_SIZE])
+            if payload[pos:pos + len(piece)] != piece:
+                break
+            pos += len(piece)
+        else:
+            if payload[pos:] == compressor.flush():
+                return level, mem_level
+    return None
+
+
+def _decompress(method, payload):
+    if method == zipfile.ZIP_STORED:
+        return payload
+    if method == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(payload, -15)
+    if method == zipfile.ZIP_BZIP2:
+        return bz2.decompress(payload)
+    raise SeekableError(f"unsupported compression method {method}")
+
+
+class _Writer:
+    """Cuts the data stream into zstd frames as it is written."""
+
+    def __init__(self, out, level):
+        self.out = out
+        self.compressor = zstandard.ZstdCompressor(level=level, write_checksum=True)
+        self.buffer = bytearray()
+        self.frames = []
+        self.position = 0
+        self.offset = 0
+
+    def write(self, data):
+        start = self.position
+        view = memoryview(data)
+        while view:
+            take = min(len(view), FRAME_SIZE - len(self.buffer))
+            self.buffer += view[:take]
+            view = view[take:]
+            if len(self.buffer) == FRAME_SIZE:
+                self._flush()
+        self.position += len(data)
+        return start
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        frame = self.compressor.compress(bytes(self.buffer))
+        self.out.write(frame)
+        self.frames.append([self.offset, len(frame), self._stream_offset(), len(self.buffer)])
+        self.offset += len(frame)
+        self.buffer = bytearray()
+
+    def _stream_offset(self):
+        return self.frames[-1][2] + self.frames[-1][3] if self.frames else 0
+
+    def close(self):
+        self._flush()
+
+
+def _member_spans(f, infos, size):
+    """Return ``[(offset, info)]`` of every member payload, in file order."""
+    spans = []
+    for info in infos:
+        f.seek(info.header_offset)
+        header = f.read(_LOCAL_HEADER.size)
+        if len(header) != _LOCAL_HEADER.size or header[:4] != _LOCAL_HEADER_MAGIC:
+            raise SeekableError(f"bad local header for {info.filename!r}")
+        fields = _LOCAL_HEADER.unpack(header)
+        start = info.header_offset + _LOCAL_HEADER.size + fields[-2] + fields[-1]
+        if start + info.compress_size > size:
+            raise SeekableError(f"{info.filename!r} runs past the end of the archive")
+        spans.append((start, info))
+    spans.sort(key=lambda span: span[0])
+    for (a_off, a_info), (b_off, _) in zip(spans, spans[1:]):
+        if a_off + a_info.compress_size > b_off:
+            raise SeekableError("overlapping zip members")
+    return spans
+
+
+def pack(service_dir, dest=None, level=DEFAULT_LEVEL):
+    """Convert a service's zip package into ``source.szst``; return its index."""
+    _require_zstandard()
+    service_dir = Path(service_dir)
+    dest = Path(dest or service_dir / SEEKABLE_FILENAME)
+    try:
+        raw = _open_raw(service_dir)
+    except (PartsError, OSError) as exc:
+        raise SeekableError(f"{service_dir.name}: {exc}") from None
+    with raw:
+        size = raw.seek(0, io.SEEK_END)
+        try:
+            infos = zipfile.ZipFile(raw).infolist()
+        except zipfile.BadZipFile as exc:
+            raise SeekableError(f"{service_dir.name}: {exc}") from None
+        spans = _member_spans(raw, infos, size)
+        mtime_ns = _zip_stamp(service_dir)[1]
+        fd, tmp = tempfile.mkstemp(prefix=".tmp.", dir=dest.parent)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                index = _pack(raw, spans, size, _Writer(out, level))
+                index["mtime_ns"] = mtime_ns
+                data = zstandard.ZstdCompressor(level=19).compress(json.dumps(index, separators=(",", ":")).encode())
+                footer = _FOOTER.pack(len(data), _FOOTER_MAGIC)
+                out.write(struct.pack("<II", _SKIPPABLE_MAGIC, len(data) + len(footer)) + data + footer)
+            os.replace(tmp, dest)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+    return index
+
+
+def _pack(raw, spans, size, writer):
+    digest = hashlib.sha256()
+    members = []
+    layout = []
+    gaps = []
+    pos = 0
+    for offset, info in spans:
+        if offset > pos:
+            raw.seek(pos)
+            gap = raw.read(offset - pos)
+            digest.update(gap)
+            gaps.append(gap)
+            layout.append(len(gap))
+        raw.seek(offset)
+        payload = raw.read(info.compress_size)
+        digest.update(payload)
+        member = {"name": info.filename, "method": info.compress_type, "size": info.file_size,
+                  "crc": info.CRC, "mode": (info.external_attr >> 16) & 0o7777, "payload": len(payload)}
+        settings = None
+        content = payload
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            try:
+                content = zlib.decompress(payload, -15)
+            except zlib.error:
+                content = None
+            settings = content is not None and reproduce_deflate(payload, content)
+        if info.compress_type == zipfile.ZIP_STORED or settings:
+            member["encoding"] = "content"
+            if settings:
+                member["deflate"] = list(settings)
+        else:
+            member["encoding"] = "raw"
+            content = payload
+        member["offset"] = writer.write(content)
+        member["length"] = len(content)
+        layout.append(-1 - len(members))
+        members.append(member)
+        pos = offset + info.compress_size
+    raw.seek(pos)
+    tail = raw.read(size - pos)
+    digest.update(tail)
+    gaps.append(tail)
+    layout.append(len(tail))
+    skeleton = writer.write(b"".join(gaps))
+    writer.close()
+    return {"version": FORMAT_VERSION, "size": size, "sha256": digest.hexdigest(), "frame_size": FRAME_SIZE,
+            "frames": writer.frames, "members": members, "skeleton": skeleton, "layout": layout}
+
+
+class SeekableArchive:
+    """Read access to a ``source.szst``: members, ranges, extraction, the zip."""
+
+    def __init__(self, path):
+        _require_zstandard()
+        self.path = Path(path)
+        self.fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self.index = self._read_index()
+        except BaseException:
+            os.close(self.fd)
+            raise
+        self.members = self.index["members"]
+        self.frames = self.index["frames"]
+        self._starts = [frame[2] for frame in self.frames]
+        self._by_name = {member["name"]: member for member in self.members}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _read_index(self):
+        size = os.fstat(self.fd).st_size
+        if size < _FOOTER.size + 8:
+            raise SeekableError(f"{self.path}: too short")
+        length, magic = _FOOTER.unpack(os.pread(self.fd, _FOOTER.size, size - _FOOTER.size))
+        if magic != _FOOTER_MAGIC:
+            raise SeekableError(f"{self.path}: not a seekable package")
+        data = os.pread(self.fd, length, size - _FOOTER.size - length)
+        index = json.loads(zstandard.ZstdDecompressor().decompress(data))
+        if index.get("version") != FORMAT_VERSION:
+            raise SeekableError(f"{self.path}: unsupported format version {index.get('version')}")
+        return index
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def names(self):
+        return [member["name"] for member in self.members]
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def frame(self, number):
+        """Return the decoded bytes of frame ``number``."""
+        offset, length, _, size = self.frames[number]
+        return self._decompressor().decompress(os.pread(self.fd, length, offset), max_output_size=size)
+
+    def _cached_frame(self, number):
+        with self._lock:
+            if number in self._cache:
+                self._cache.move_to_end(number)
+                return self._cache[number]
+        data = self.frame(number)
+        with self._lock:
+            self._cache[number] = data
+            while len(self._cache) > CACHED_FRAMES:
+                self._cache.popitem(last=False)
+        return data
+
+    def read_range(self, offset, length):
+        """Return ``length`` bytes of the data stream starting at ``offset``."""
+        out = bytearray()
+        number = bisect_right(self._starts, offset) - 1
+        while len(out) < length:
+            start = self.frames[number][2]
+            data = self._cached_frame(number)
+            out += data[offset + len(out) - start:offset + length - start]
+            number += 1
+        return bytes(out)
+
+    def read(self, name):
+        """Return the uncompressed bytes of member ``name``."""
+        try:
+            member = self._by_name[name]
+        except KeyError:
+            raise KeyError(f"no member {name!r}") from None
+        data = self.read_range(member["offset"], member["length"])
+        if member["encoding"] == "raw":
+            data = _decompress(member["method"], data)
+        if zlib.crc32(data) != member["crc"]:
+            raise SeekableError(f"{name}: CRC mismatch")
+        return data
+
+    def extract(self, dest, strip=None, workers=None):
+        """Extract every member below ``dest`` with ``workers`` threads; return the file count.
+
+        ``strip`` names a top-level directory to drop from member names.
+        """
+        dest = os.path.realpath(dest)
+        prefix = strip + "/" if strip else ""
+        targets = {}
+        made = set()
+        for member in self.members:
+            name = member["name"][len(prefix):] if member["name"].startswith(prefix) else member["name"]
+            if not name:
+                continue
+            target = os.path.normpath(os.path.join(dest, name))
+            if not target.startswith(dest + os.sep):
+                raise SeekableError(f"refusing to extract {member['name']!r} outside {dest}")
+            directory = target if member["name"].endswith("/") else os.path.dirname(target)
+            if directory not in made:
+                os.makedirs(directory, exist_ok=True)
+                made.add(directory)
+            if not member["name"].endswith("/"):
+                targets[member["name"]] = target
+        content = [m for m in self.members if m["name"] in targets and m["encoding"] == "content"]
+        starts = [m["offset"] for m in content]
+        raw = [m for m in self.members if m["name"] in targets and m["encoding"] == "raw"]
+        # Files split across frames are created up front and filled in by several workers.
+        for member in content:
+            if self._frame_of(member["offset"]) != self._frame_of(member["offset"] + member["length"] - 1) \
+                    or not member["length"]:
+                _write(targets[member["name"]], b"", member["mode"], truncate=member["size"])
+
+        def write_frame(number):
+            _, _, start, size = self.frames[number]
+            if start >= self.index["skeleton"]:
+                return
+            data = self.frame(number)
+            first = max(0, bisect_right(starts, start) - 1)
+            for member in content[first:bisect_right(starts, start + size - 1)]:
+                lo = max(member["offset"], start)
+                hi = min(member["offset"] + member["length"], start + size)
+                if lo >= hi:
+                    continue
+                whole = lo == member["offset"] and hi == member["offset"] + member["length"]
+                _write(targets[member["name"]], data[lo - start:hi - start], member["mode"] if whole else None,
+                       offset=None if whole else lo - member["offset"])
+
+        def write_raw(member):
+            _write(targets[member["name"]], self.read(member["name"]), member["mode"])
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            for _ in pool.map(write_frame, range(len(self.frames))):
+                pass
+            for _ in pool.map(write_raw, raw):
+                pass
+        return len(targets)
+
+    def _frame_of(self, offset):
+        return bisect_right(self._starts, offset) - 1
+
+    def write_zip(self, out):
+        """Write the original zip to ``out``, verifying its SHA-256; return its size."""
+        digest = hashlib.sha256()
+        skeleton = self.index["skeleton"]
+        written = 0
+        for item in self.index["layout"]:
+            if item >= 0:
+                data = self.read_range(skeleton, item)
+                skeleton += item
+            else:
+                member = self.members[-1 - item]
+                data = self.read_range(member["offset"], member["length"])
+                if "deflate" in member:
+                    level, mem_level = member["deflate"]
+                    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, mem_level)
+                    data = compressor.compress(data) + compressor.flush()
+            digest.update(data)
+            out.write(data)
+            written += len(data)
+        if written != self.index["size"] or digest.hexdigest() != self.index["sha256"]:
+            raise SeekableError(f"{self.path}: rebuilt zip does not match the original")
+        return written
+
+
+def _write(path, data, mode, offset=None, truncate=None):
+    """Write ``data`` to ``path``: a whole new file, or a slice at ``offset`` of an existing one."""
+    if offset is None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        offset = 0
+    else:
+        fd = os.open(path, os.O_WRONLY)
+    try:
+        if truncate is not None:
+            os.ftruncate(fd, truncate)
+        if mode is not None and mode & 0o777:
+            os.fchmod(fd, mode & 0o777)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+    finally:
+        os.close(fd)
+
+
+def open_archive(service_dir):
+    return SeekableArchive(Path(service_dir) / SEEKABLE_FILENAME)
+
+
+def is_current(archive, service_dir):
+    """True if ``archive`` still matches the service's zip package (or there is none)."""
+    if not has_package_zip(service_dir):
+        return True
+    return _zip_stamp(service_dir) == (archive.index["size"], archive.index.get("mtime_ns"))
+
+
+def _package_bytes(service_dir):
+    return _zip_stamp(service_dir)[0]
+
+
+def largest(root=None, count=10):
+    """Return the service directories of the ``count`` largest zip packages."""
+    dirs = [path for path in services_dir(root).iterdir() if path.is_dir() and has_package_zip(path)]
+    return sorted(dirs, key=_package_bytes, reverse=True)[:count]
+
+
+def _best(fn, repeat):
+    """Return the fastest of ``repeat`` timed calls of ``fn``, in seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.monotonic()
+        fn()
+        times.append(time.monotonic() - started)
+    return min(times)
+
+
+def bench(service_dir, root=None, workers=None, repeat=3, level=DEFAULT_LEVEL):
+    """Time zip vs. seekable extraction and single-member reads of one package.
+
+    Each figure is the best of ``repeat`` runs.  The probe member is the one
+    of median size.
+    """
+    service_dir = Path(service_dir)
+    record = {"service_id": service_dir.name, "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "workers": workers or os.cpu_count() or 1, "repeat": repeat}
+    started = time.monotonic()
+    pack(service_dir, level=level)
+    record["pack_s"] = round(time.monotonic() - started, 3)
+    record["zip_bytes"] = _package_bytes(service_dir)
+    record["szst_bytes"] = (service_dir / SEEKABLE_FILENAME).stat().st_size
+    with _open_raw(service_dir) as raw, zipfile.ZipFile(raw) as zf:
+        files = sorted((info for info in zf.infolist() if not info.is_dir()), key=lambda info: info.file_size)
+    probe = files[len(files) // 2].filename if files else None
+
+    with tempfile.TemporaryDirectory(prefix="bank-seekable-") as tmp:
+        def zip_extract():
+            with _open_raw(service_dir) as raw, zipfile.ZipFile(raw) as zf:
+                zf.extractall(Path(tmp, "x"))
+            shutil.rmtree(Path(tmp, "x"))
+
+        def szst_extract(count):
+            with open_archive(service_dir) as archive:
+                archive.extract(Path(tmp, "x"), workers=count)
+            shutil.rmtree(Path(tmp, "x"))
+
+        record["zip_extract_s"] = round(_best(zip_extract, repeat), 3)
+        record["szst_extract_1_s"] = round(_best(lambda: szst_extract(1), repeat), 3)
+        record["szst_extract_s"] = round(_best(lambda: szst_extract(record["workers"]), repeat), 3)
+    if probe is not None:
+        def zip_read():
+            with _open_raw(service_dir) as raw, zipfile.ZipFile(raw) as zf:
+                zf.read(probe)
+
+        def szst_read():
+            with open_archive(service_dir) as archive:
+                archive.read(probe)
+
+        record["probe"] = probe
+        record["zip_read_ms"] = round(_best(zip_read, repeat) * 1000, 2)
+        record["szst_read_ms"] = round(_best(szst_read, repeat) * 1000, 2)
+    path = state_dir(root) / "bench"
+    path.mkdir(exist_ok=True)
+    with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.seekable", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pk = sub.add_parser("pack", help="write source.szst next to the zip package")
+    pk.add_argument("service_ids", nargs="*")
+    pk.add_argument("--largest", type=int, default=10, help="without ids, pack the N largest packages")
+    pk.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="zstd compression level")
+    unpack = sub.add_parser("unpack", help="rebuild the original zip from source.szst")
+    unpack.add_argument("service_id")
+    unpack.add_argument("dest")
+    ls = sub.add_parser("ls", help="list the members of a seekable package")
+    ls.add_argument("service_id")
+    cat = sub.add_parser("cat", help="write one member to stdout")
+    cat.add_argument("service_id")
+    cat.add_argument("member")
+    extract = sub.add_parser("extract", help="extract a seekable package in parallel")
+    extract.add_argument("service_id")
+    extract.add_argument("dest")
+    extract.add_argument("--workers", type=int, help="decoding threads (default: one per core)")
+    bn = sub.add_parser("bench", help="time zip vs. seekable extraction and member reads")
+    bn.add_argument("service_ids", nargs="*")
+    bn.add_argument("--largest", type=int, default=5, help="without ids, benchmark the N largest packages")
+    bn.add_argument("--workers", type=int, help="decoding threads (default: one per core)")
+    bn.add_argument("--repeat", type=int, default=3, help="report the best of N runs")
+
+    args = parser.parse_args(argv)
+    base = services_dir(args.root)
+    try:
+        if args.command == "pack":
+            dirs = [base / sid for sid in args.service_ids] or largest(args.root, args.largest)
+            for service_dir in dirs:
+                started = time.monotonic()
+                index = pack(service_dir, level=args.level)
+                raw = sum(1 for member in index["members"] if member["encoding"] == "raw")
+                packed = (service_dir / SEEKABLE_FILENAME).stat().st_size
+                print(f"{service_dir.name}  {index['size']:>12} -> {packed:>12}  {len(index['frames'])} frames  "
+                      f"{raw} raw  {time.monotonic() - started:.1f}s")
+        elif args.command == "unpack":
+            with open_archive(base / args.service_id) as archive, open(args.dest, "wb") as out:
+                print(f"wrote {archive.write_zip(out)} bytes to {args.dest}")
+        elif args.command == "ls":
+            with open_archive(base / args.service_id) as archive:
+                for member in archive.members:
+                    print(f"{member['size']:>12}  {member['encoding']:<7}  {member['name']}")
+        elif args.command == "cat":
+            with open_archive(base / args.service_id) as archive:
+                sys.stdout.buffer.write(archive.read(args.member))
+        elif args.command == "extract":
+            with open_archive(base / args.service_id) as archive:
+                count = archive.extract(args.dest, workers=args.workers)
+            print(f"extracted {count} files into {args.dest}")
+        elif args.command == "bench":
+            dirs = [base / sid for sid in args.service_ids] or largest(args.root, args.largest)
+            for service_dir in dirs:
+                r = bench(service_dir, args.root, workers=args.workers, repeat=args.repeat)
+                print(f"{r['service_id']}  {r['zip_bytes'] / 1e6:7.1f} MB zip -> {r['szst_bytes'] / 1e6:7.1f} MB  "
+                      f"extract zip {r['zip_extract_s']:6.2f}s  szst {r['szst_extract_1_s']:6.2f}s "
+                      f"({r['workers']} threads {r['szst_extract_s']:6.2f}s)  "
+                      f"read zip {r.get('zip_read_ms', 0):6.1f}ms  szst {r.get('szst_read_ms', 0):6.1f}ms")
+    except (SeekableError, OSError, KeyError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
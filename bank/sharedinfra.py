@@ -0,0 +1,763 @@
+"""Shared MySQL, MariaDB, PostgreSQL and Redis instances for deployed stacks.
+
+Most compose files start their own database and cache next to the
+application, so fifty running stacks cost fifty MySQL daemons.  In shared
+mode each backing service is instead served by one pooled instance per
+engine and version (``mysql-8-0``, ``postgres-15``, ``redis-7`` ...), run as
+the ``bank-shared`` compose project on the ``bank-shared`` network.
+
+Every stack gets a *tenant* on its pool: a database and a user with a
+generated password for MySQL/MariaDB/PostgreSQL, a database index for
+Redis.  The ``sharedinfra`` overlay then
+
+* disables the stack's own backing service (it is moved to a profile),
+* drops it from ``depends_on`` of the services using it,
+* joins those services to ``bank-shared`` and links the pool container under
+  the old host name, so ``mysql:3306`` keeps resolving, and
+* rewrites their environment: user, password and database values, the
+  user/password/path parts of connection URLs, and the Redis database index.
+
+A backing service is only shared when the stack passes its credentials and
+database through the environment; one that is configured inside the image
+stays local.  On first deploy the tenant is provisioned and the backing
+service's ``docker-entrypoint-initdb.d`` SQL scripts are replayed into the
+tenant database.  Pool passwords and tenants live in
+``.bank/shared/state.json``.
+
+``report`` estimates the memory freed per node from the compose files;
+``measure`` samples ``docker stats`` for pooled and dedicated containers and
+appends the result to ``.bank/bench/sharedinfra.jsonl``.
+
+Usage::
+
+    python -m bank.sharedinfra report [--status deploying]
+    python -m bank.sharedinfra rewrite <service_id> <deploy-dir> [--no-provision]
+    python -m bank.sharedinfra pool up
+    python -m bank.sharedinfra release <service_id>
+    python -m bank.sharedinfra measure
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .catalog import open_catalog
+from .compose import ComposeError, Override, load_compose, services, write_overlay, yaml
+from .deploy import compose_file
+from .metadata import iter_service_dirs
+
+SHARED_DIRNAME = "shared"
+STATE_FILENAME = "state.json"
+POOL_COMPOSE_FILENAME = "docker-compose.yaml"
+BENCH_FILENAME = "sharedinfra.jsonl"
+PROJECT = "bank-shared"
+NETWORK = "bank-shared"
+OVERLAY_NAME = "sharedinfra"
+DISABLED_PROFILE = "bank-sharedinfra-disabled"
+REDIS_DATABASES = 1024
+
+# Idle resident memory of one instance, used when estimating density.
+IDLE_MIB = {"mysql": 400, "mariadb": 120, "postgres": 40, "redis": 8}
+
+_IMAGE = re.compile(r"^(?:docker\.io/)?(?:library/)?(mysql|mariadb|postgres|redis)(?::([^@\s]+))?(?:@\S+)?$")
+_URL = re.compile(
+    r"^(?P<scheme>[A-Za-z][\w+.:-]*://)(?:(?P<user>[^:@/]*)(?::(?P<password>[^@/]*))?@)?"
+    r"(?P<host>[^/:?#,@]+)(?P<port>:\d+)?(?P<path>/[^?#]*)?(?P<rest>.*)$", re.DOTALL)
+_SIZE = re.compile(r"^\s*([\d.]+)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_state_lock = threading.Lock()
+
+
+class SharedInfraError(Exception):
+    pass
+
+
+def engine_of(image):
+    """Return ``(engine, version)`` for an official backing image, or ``None``.
+
+    Versions keep the components that decide data compatibility: major.minor
+    for MySQL/MariaDB, the major for PostgreSQL (10+) and Redis.
+    """
+    match = _IMAGE.match(str(image or "").strip())
+    if not match:
+        return None
+    engine, tag = match.group(1), match.group(2) or "latest"
+    number = re.match(r"\d+(?:\.\d+)*", tag)
+    if not number:
+        return engine, "latest"
+    parts = number.group(0).split(".")
+    keep = 2 if engine in ("mysql", "mariadb") or (engine == "postgres" and int(parts[0]) < 10) else 1
+    return engine, ".".join(parts[:keep])
+
+
+def pool_key(engine, version, auth=False):
+    key = f"{engine}-{version.replace('.', '-')}"
+    return f"{key}-auth" if auth else key
+
+
+def pool_image(engine, version):
+    if engine in ("postgres", "redis"):
+        return f"{engine}:{version}-alpine" if version != "latest" else f"{engine}:alpine"
+    return f"{engine}:{version}"
+
+
+def container_name(key):
+    return f"{PROJECT}-{key}"
+
+
+def parse_size(text):
+    """Return bytes for ``512M``, ``2G``, ``12.5MiB`` ... or ``None``."""
+    if isinstance(text, (int, float)):
+        return int(text)
+    match = _SIZE.match(str(text or ""))
+    if not match:
+        return None
+    power = " kmgt".index(match.group(2).lower() or " ")
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def _scalar(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return None if value is None else str(value)
+
+
+def environment(service):
+    """Return a service's ``environment`` as an ordered ``{name: str}`` dict."""
+    env = service.get("environment") or {}
+    if isinstance(env, list):
+        result = {}
+        for item in env:
+            name, sep, value = str(item).partition("=")
+            result[name] = value if sep else None
+        return result
+    return {str(k): _scalar(v) for k, v in env.items()}
+
+
+def _key_role(key):
+    key = key.upper()
+    if re.search(r"PASS|PWD", key):
+        return "password"
+    if "USER" in key:
+        return "user"
+    if re.search(r"HOST|URL|URI|DSN|ADDR|SERVER|PORT", key):
+        return "location"
+    if re.search(r"DB|DATABASE|SCHEMA", key):
+        return "database"
+    return None
+
+
+def _command_words(service):
+    command = service.get("command") or []
+    if isinstance(command, str):
+        return command.split()
+    return [str(word) for word in command]
+
+
+@dataclass
+class Backing:
+    """A backing service of one stack and what its clients know about it."""
+
+    name: str
+    engine: str
+    version: str
+    hosts: list
+    users: dict = field(default_factory=dict)      # user -> password
+    database: str = None
+    password: str = None                            # Redis requirepass
+    init_paths: list = field(default_factory=list)
+    native_password: bool = False
+
+    @property
+    def auth(self):
+        return self.engine == "redis" and bool(self.password)
+
+    @property
+    def pool(self):
+        return pool_key(self.engine, self.version, self.auth)
+
+
+def backing_services(doc, base_dir="."):
+    """Return the :class:`Backing` services of a compose document."""
+    found = []
+    for name, service in services(doc).items():
+        service = service or {}
+        if service.get("build"):
+            continue
+        detected = engine_of(service.get("image"))
+        if not detected:
+            continue
+        env = environment(service)
+        hosts = [name] + [h for h in (service.get("container_name"), service.get("hostname")) if h]
+        for network in (service.get("networks") or {}).values() if isinstance(service.get("networks"), dict) else ():
+            hosts += (network or {}).get("aliases") or []
+        backing = Backing(name, detected[0], detected[1], list(dict.fromkeys(hosts)))
+        words = _command_words(service)
+        if backing.engine in ("mysql", "mariadb"):
+            prefix = "MARIADB_" if backing.engine == "mariadb" and "MARIADB_ROOT_PASSWORD" in env else "MYSQL_"
+            backing.users["root"] = env.get(prefix + "ROOT_PASSWORD") or ""
+            if env.get(prefix + "USER"):
+                backing.users[env[prefix + "USER"]] = env.get(prefix + "PASSWORD") or ""
+            backing.database = env.get(prefix + "DATABASE") or None
+            backing.native_password = any("mysql_native_password" in word for word in words)
+        elif backing.engine == "postgres":
+            user = env.get("POSTGRES_USER") or "postgres"
+            backing.users[user] = env.get("POSTGRES_PASSWORD") or ""
+            backing.database = env.get("POSTGRES_DB") or user
+        else:
+            if "--requirepass" in words[:-1]:
+                backing.password = words[words.index("--requirepass") + 1].strip("\"'")
+            backing.password = backing.password or env.get("REDIS_PASSWORD") or None
+        for volume in service.get("volumes") or []:
+            source, target = _volume_paths(volume)
+            if source and target and target.startswith("/docker-entrypoint-initdb.d"):
+                backing.init_paths.append(Path(base_dir) / source)
+        found.append(backing)
+    return found
+
+
+def _volume_paths(volume):
+    if isinstance(volume, dict):
+        return volume.get("source"), volume.get("target")
+    parts = str(volume).split(":")
+    if len(parts) < 2 or not parts[0].startswith((".", "/")):
+        return None, None
+    return parts[0], parts[1]
+
+
+def init_scripts(backing):
+    """Return the SQL files replayed into a new tenant, in entrypoint order."""
+    files = []
+    for path in backing.init_paths:
+        if path.is_dir():
+            files += sorted(p for p in path.iterdir() if p.name.endswith((".sql", ".sql.gz")))
+        elif path.name.endswith((".sql", ".sql.gz")) and path.is_file():
+            files.append(path)
+    return files
+
+
+def _uses(service, backing):
+    depends = service.get("depends_on") or []
+    if backing.name in depends or backing.name in (service.get("links") or []):
+        return True
+    for value in environment(service).values():
+        if value and (value in backing.hosts or any(f"//{h}" in value or f"@{h}" in value for h in backing.hosts)):
+            return True
+    return False
+
+
+@dataclass
+class Rewrite:
+    """Environment changes for the clients of one backing service."""
+
+    env: dict = field(default_factory=dict)        # client -> {name: value}
+    refs: Counter = field(default_factory=Counter)
+
+    def set(self, client, name, value):
+        self.env.setdefault(client, {})[name] = value
+
+
+def rewrite_clients(doc, backing, tenant):
+    """Return the :class:`Rewrite` pointing ``backing``'s clients at ``tenant``."""
+    result = Rewrite()
+    is_redis = backing.engine == "redis"
+    for client, service in services(doc).items():
+        service = service or {}
+        if client == backing.name or not _uses(service, backing):
+            continue
+        result.refs["clients"] += 1
+        env = environment(service)
+        host_key = None
+        indexed = result.refs["database"]
+        for name, value in env.items():
+            if value is None or ("REDIS" in name.upper()) != is_redis and "://" not in value:
+                continue
+            new = _rewrite_value(name, value, backing, tenant, result.refs)
+            if new != value:
+                result.set(client, name, new)
+            if is_redis and value in backing.hosts and _key_role(name) == "location":
+                host_key = name
+        if is_redis and result.refs["database"] == indexed and host_key:
+            # No index configured anywhere: add one next to the host setting.
+            name = re.sub("HOST$", "DATABASE" if host_key.upper().startswith("SPRING") else "DB", host_key,
+                          flags=re.IGNORECASE)
+            result.set(client, name, str(tenant["redis_db"]))
+            result.refs["database"] += 1
+    return result
+
+
+def _rewrite_value(name, value, backing, tenant, refs):
+    role = _key_role(name)
+    if backing.engine == "redis":
+        if role == "password" and backing.password and value == backing.password:
+            refs["password"] += 1
+            return tenant["password"]
+        if role == "database" and re.fullmatch(r"\d+", value):
+            refs["database"] += 1
+            return str(tenant["redis_db"])
+    else:
+        if role == "password" and value and value in backing.users.values():
+            refs["password"] += 1
+            return tenant["password"]
+        if role == "user" and value in backing.users:
+            refs["user"] += 1
+            return tenant["user"]
+        if role == "database" and value == backing.database:
+            refs["database"] += 1
+            return tenant["database"]
+    match = _URL.match(value)
+    if not match or match.group("host") not in backing.hosts:
+        return value
+    url = match.groupdict(default="")
+    if backing.engine == "redis":
+        if url["password"] and url["password"] == backing.password:
+            url["password"] = tenant["password"]
+            refs["password"] += 1
+        url["path"] = f"/{tenant['redis_db']}"
+        refs["database"] += 1
+    else:
+        if url["user"] in backing.users:
+            url["user"] = tenant["user"]
+            refs["user"] += 1
+        if url["password"] and url["password"] in backing.users.values():
+            url["password"] = tenant["password"]
+            refs["password"] += 1
+        if url["path"].strip("/") and url["path"].strip("/") == backing.database:
+            url["path"] = f"/{tenant['database']}"
+            refs["database"] += 1
+    auth = url["user"] + (f":{url['password']}" if url["password"] else "")
+    return (url["scheme"] + (f"{auth}@" if auth else "") + url["host"] + url["port"] + url["path"]
+            + url["rest"])
+
+
+def _infer_database(doc, backing):
+    for client, service in services(doc).items():
+        if client == backing.name:
+            continue
+        for value in environment(service or {}).values():
+            match = _URL.match(value or "")
+            if match and match.group("host") in backing.hosts and (match.group("path") or "").strip("/"):
+                return match.group("path").strip("/")
+    return None
+
+
+def shareable(backing, rewrite):
+    """Return ``None`` if ``backing`` can move to its pool, else the reason."""
+    refs = rewrite.refs
+    if not refs["clients"]:
+        return "no client service found"
+    if backing.engine == "redis":
+        if backing.password and not refs["password"]:
+            return "redis password is not passed through the environment"
+        if not refs["database"]:
+            return "redis database index is not configurable through the environment"
+        return None
+    if not (refs["user"] or refs["password"]):
+        return "credentials are not passed through the environment"
+    if backing.database and not refs["database"]:
+        return "database name is not passed through the environment"
+    return None
+
+
+def _identifier(text):
+    return re.sub(r"[^a-z0-9_]", "_", text.lower())
+
+
+class SharedState:
+    """Pool passwords and tenants in ``.bank/shared/state.json``."""
+
+    def __init__(self, root=None):
+        self.path = state_dir(root) / SHARED_DIRNAME / STATE_FILENAME
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"pools": {}, "tenants": {}}
+
+    def save(self, state):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".state.", suffix=".tmp", dir=self.path.parent)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+
+    def tenant(self, service_id, backing):
+        """Return the tenant of ``backing`` in ``service_id``, allocating it once."""
+        key = f"{service_id}/{backing.name}"
+        with _state_lock:
+            state = self.load()
+            pools, tenants = state["pools"], state["tenants"]
+            if backing.pool not in pools:
+                pools[backing.pool] = {
+                    "engine": backing.engine, "version": backing.version,
+                    "image": pool_image(backing.engine, backing.version),
+                    "password": secrets.token_hex(16) if backing.engine != "redis" or backing.auth else "",
+                }
+            pool = pools[backing.pool]
+            if key in tenants and tenants[key]["pool"] == backing.pool:
+                return tenants[key], pool
+            tenant = {"pool": backing.pool, "provisioned": False}
+            if backing.engine == "redis":
+                used = {t["redis_db"] for t in tenants.values() if t["pool"] == backing.pool}
+                free = [i for i in range(1, REDIS_DATABASES) if i not in used]
+                if not free:
+                    raise SharedInfraError(f"pool {backing.pool} has no free database index")
+                tenant.update(redis_db=free[0], password=pool["password"])
+            else:
+                name = f"s{service_id[:12]}_{_identifier(backing.name)}"
+                tenant.update(user=name[:32], password=secrets.token_hex(16),
+                              database=f"s{service_id[:12]}_{_identifier(backing.database or 'app')}"[:63],
+                              native_password=backing.native_password)
+            tenants[key] = tenant
+            self.save(state)
+            return tenant, pool
+
+    def mark_provisioned(self, key):
+        with _state_lock:
+            state = self.load()
+            state["tenants"][key]["provisioned"] = True
+            self.save(state)
+
+
+def plan_stack(doc, base_dir="."):
+    """Yield ``(backing, reason)`` for every backing service of a stack.
+
+    ``reason`` is ``None`` when the backing service can be shared.  Uses
+    placeholder credentials, so nothing is allocated.
+    """
+    for backing in backing_services(doc, base_dir):
+        backing.database = backing.database or _infer_database(doc, backing)
+        placeholder = {"user": "u", "password": "p", "database": "d", "redis_db": 1}
+        yield backing, shareable(backing, rewrite_clients(doc, backing, placeholder))
+
+
+def overlay(doc, shared):
+    """Return the overlay document for ``[(backing, tenant, rewrite)]``."""
+    result = {"services": {}, "networks": {NETWORK: {"name": NETWORK, "external": True}}}
+    out = result["services"]
+    removed = {backing.name for backing, _, _ in shared}
+    for backing, _, _ in shared:
+        out[backing.name] = {"profiles": [DISABLED_PROFILE]}
+    for client, service in services(doc).items():
+        service = service or {}
+        if client in removed:
+            continue
+        links = [f"{container_name(backing.pool)}:{host}" for backing, _, rewrite in shared if client in rewrite.env
+                 or _uses(service, backing) for host in backing.hosts]
+        if not links:
+            continue
+        entry = out.setdefault(client, {})
+        env = {}
+        for _, _, rewrite in shared:
+            env.update(rewrite.env.get(client, {}))
+        if env:
+            entry["environment"] = env
+        depends = service.get("depends_on")
+        if depends and removed & set(depends):
+            if isinstance(depends, dict):
+                kept = {name: spec for name, spec in depends.items() if name not in removed}
+            else:
+                kept = [name for name in depends if name not in removed]
+            entry["depends_on"] = Override(kept)
+        old_links = service.get("links")
+        if old_links:
+            entry["links"] = Override([link for link in old_links if link.split(":")[0] not in removed])
+        entry["external_links"] = links
+        if "network_mode" not in service:
+            entry["networks"] = [NETWORK] if service.get("networks") else ["default", NETWORK]
+    return result
+
+
+def pool_service(key, pool):
+    """Return the compose service definition of one pooled instance."""
+    engine, version, password = pool["engine"], pool["version"], pool["password"]
+    service = {"image": pool["image"], "container_name": container_name(key), "restart": "unless-stopped",
+               "networks": [NETWORK]}
+    if engine in ("mysql", "mariadb"):
+        client = "mariadb-admin" if engine == "mariadb" else "mysqladmin"
+        service["environment"] = {f"{engine.upper()}_ROOT_PASSWORD": password}
+        service["command"] = ["--character-set-server=utf8mb4", "--collation-server=utf8mb4_unicode_ci"]
+        if engine == "mysql" and version == "8.0":
+            service["command"].append("--default-authentication-plugin=mysql_native_password")
+        service["volumes"] = [f"{key}-data:/var/lib/mysql"]
+        service["healthcheck"] = {"test": ["CMD", client, "ping", "-h", "localhost", "-uroot", f"-p{password}"]}
+    elif engine == "postgres":
+        service["environment"] = {"POSTGRES_PASSWORD": password}
+        service["volumes"] = [f"{key}-data:/var/lib/postgresql/data"]
+        service["healthcheck"] = {"test": ["CMD", "pg_isready", "-U", "postgres"]}
+    else:
+        service["command"] = ["redis-server", "--databases", str(REDIS_DATABASES), "--appendonly", "yes"]
+        ping = ["CMD", "redis-cli", "ping"]
+        if password:
+            service["command"] += ["--requirepass", password]
+            ping[2:2] = ["-a", password]
+        service["volumes"] = [f"{key}-data:/data"]
+        service["healthcheck"] = {"test": ping}
+    service["healthcheck"].update(interval="10s", timeout="5s", retries=10)
+    return service
+
+
+def write_pool_compose(state, root=None):
+    """Write the ``bank-shared`` compose file for every pool in ``state``."""
+    pools = state["pools"]
+    doc = {
+        "name": PROJECT,
+        "services": {key: pool_service(key, pool) for key, pool in sorted(pools.items())},
+        "networks": {NETWORK: {"name": NETWORK}},
+        "volumes": {f"{key}-data": {} for key in sorted(pools)},
+    }
+    path = state_dir(root) / SHARED_DIRNAME / POOL_COMPOSE_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(doc, f, sort_keys=False, default_flow_style=False)
+    os.chmod(path, 0o600)
+    return path
+
+
+def pool_up(keys=(), root=None):
+    """Start (or update) the pooled instances and wait until they are healthy."""
+    path = write_pool_compose(SharedState(root).load(), root)
+    cmd = ["docker", "compose", "-f", str(path), "up", "-d", "--wait", *sorted(keys)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SharedInfraError(f"{' '.join(cmd[:6])} failed:\n{(result.stderr or result.stdout).strip()}")
+
+
+def _exec(key, argv, stdin=None, env=()):
+    cmd = ["docker", "exec", "-i"] + [f"-e{e}" for e in env] + [container_name(key)] + argv
+    result = subprocess.run(cmd, input=stdin, capture_output=True)
+    if result.returncode != 0:
+        raise SharedInfraError(f"{key}: {' '.join(argv[:2])} failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def _retarget_sql(text, old, new):
+    """Point database-level statements of an init script at the tenant database."""
+    if not old:
+        return text
+    name = re.escape(old)
+    text = re.sub(rf"(?i)\b(CREATE\s+(?:DATABASE|SCHEMA)(?:\s+IF\s+NOT\s+EXISTS)?|USE|"
+                  rf"DROP\s+(?:DATABASE|SCHEMA)(?:\s+IF\s+EXISTS)?)\s+([`\"]?){name}\2(?=[\s;]|$)",
+                  rf"\1 \2{new}\2", text)
+    text = re.sub(rf"([`\"]){name}\1\.", rf"\g<1>{new}\1.", text)
+    return re.sub(rf"(?m)^\\c(?:onnect)?\s+{name}\b", rf"\\c {new}", text)
+
+
+def provision(backing, tenant, pool, scripts=()):
+    """Create the tenant's database and user, then replay ``scripts``."""
+    key, engine = backing.pool, backing.engine
+    if engine == "redis":
+        _exec(key, ["redis-cli", "-n", str(tenant["redis_db"]), "FLUSHDB"],
+              env=[f"REDISCLI_AUTH={pool['password']}"] if pool["password"] else ())
+        return
+    user, password, database = tenant["user"], tenant["password"], tenant["database"]
+    if engine in ("mysql", "mariadb"):
+        client = ["mariadb" if engine == "mariadb" else "mysql", "-uroot", "--default-character-set=utf8mb4"]
+        plugin = "WITH mysql_native_password " if tenant.get("native_password") and engine == "mysql" else ""
+        sql = (f"CREATE DATABASE IF NOT EXISTS `{database}` CHARACTER SET utf8mb4;\n"
+               f"CREATE USER IF NOT EXISTS '{user}'@'%' IDENTIFIED {plugin}BY '{password}';\n"
+               f"GRANT ALL PRIVILEGES ON `{database}`.* TO '{user}'@'%';\nFLUSH PRIVILEGES;\n")
+        env = [f"MYSQL_PWD={pool['password']}"]
+        _exec(key, client, sql.encode(), env)
+        run = client + [database]
+    else:
+        sql = (f"DO $$ BEGIN IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = '{user}') THEN "
+               f"CREATE ROLE \"{user}\" LOGIN PASSWORD '{password}'; END IF; END $$;\n"
+               f"SELECT 'CREATE DATABASE \"{database}\" OWNER \"{user}\"' "
+               f"WHERE NOT EXISTS (SELECT FROM pg_database WHERE datname = '{database}')\\gexec\n")
+        env = ()
+        _exec(key, ["psql", "-v", "ON_ERROR_STOP=1", "-U", "postgres"], sql.encode())
+        run = ["psql", "-v", "ON_ERROR_STOP=1", "-U", user, "-d", database]
+    for script in scripts:
+        data = script.read_bytes()
+        if script.name.endswith(".gz"):
+            data = gzip.decompress(data)
+        text = _retarget_sql(data.decode("utf-8", errors="surrogateescape"), backing.database, database)
+        _exec(key, run, text.encode("utf-8", errors="surrogateescape"), env)
+
+
+def apply_to_workdir(service_dir, workdir, root=None, provision_tenants=True):
+    """Deploy transform: move shareable backing services onto the pools."""
+    service_dir, workdir = Path(service_dir), Path(workdir)
+    path = compose_file(workdir)
+    if path is None:
+        return False
+    doc = load_compose(path)
+    store = SharedState(root)
+    shared = []
+    for backing, reason in plan_stack(doc, workdir):
+        if reason:
+            continue
+        tenant, pool = store.tenant(service_dir.name, backing)
+        shared.append((backing, tenant, rewrite_clients(doc, backing, tenant)))
+    if not shared:
+        return False
+    if provision_tenants:
+        pool_up({backing.pool for backing, _, _ in shared}, root)
+        state = store.load()
+        for backing, tenant, _ in shared:
+            if not tenant["provisioned"]:
+                provision(backing, tenant, state["pools"][backing.pool], init_scripts(backing))
+                store.mark_provisioned(f"{service_dir.name}/{backing.name}")
+    write_overlay(workdir, OVERLAY_NAME, overlay(doc, shared))
+    return True
+
+
+def release(service_id, root=None):
+    """Drop every tenant of ``service_id`` and return how many there were."""
+    store = SharedState(root)
+    state = store.load()
+    keys = [key for key in state["tenants"] if key.split("/", 1)[0] == service_id]
+    for key in keys:
+        tenant = state["tenants"][key]
+        pool = state["pools"][tenant["pool"]]
+        if tenant["provisioned"]:
+            if pool["engine"] == "redis":
+                _exec(tenant["pool"], ["redis-cli", "-n", str(tenant["redis_db"]), "FLUSHDB"],
+                      env=[f"REDISCLI_AUTH={pool['password']}"] if pool["password"] else ())
+            elif pool["engine"] == "postgres":
+                sql = f"DROP DATABASE IF EXISTS \"{tenant['database']}\";\nDROP ROLE IF EXISTS \"{tenant['user']}\";\n"
+                _exec(tenant["pool"], ["psql", "-U", "postgres"], sql.encode())
+            else:
+                client = "mariadb" if pool["engine"] == "mariadb" else "mysql"
+                sql = f"DROP DATABASE IF EXISTS `{tenant['database']}`;\nDROP USER IF EXISTS '{tenant['user']}'@'%';\n"
+                _exec(tenant["pool"], [client, "-uroot"], sql.encode(), [f"MYSQL_PWD={pool['password']}"])
+    with _state_lock:
+        state = store.load()
+        for key in keys:
+            state["tenants"].pop(key, None)
+        store.save(state)
+    return len(keys)
+
+
+def _memory_limit(service):
+    resources = ((service.get("deploy") or {}).get("resources") or {})
+    return parse_size((resources.get("limits") or {}).get("memory")) or parse_size(service.get("mem_limit"))
+
+
+def report(root=None, status=None):
+    """Estimate the density win of shared mode over a set of stacks."""
+    if status:
+        with open_catalog(root) as catalog:
+            wanted = {row["service_id"] for row in catalog.query(status=status)}
+    else:
+        wanted = None
+    totals = Counter()
+    reasons = Counter()
+    pools = Counter()
+    for service_id, service_dir in iter_service_dirs(root):
+        if wanted is not None and service_id not in wanted:
+            continue
+        path = compose_file(service_dir)
+        if path is None:
+            continue
+        try:
+            doc = load_compose(path)
+        except ComposeError:
+            continue
+        totals["stacks"] += 1
+        for backing, reason in plan_stack(doc, service_dir):
+            totals["backing"] += 1
+            if reason:
+                reasons[reason] += 1
+                continue
+            totals["shared"] += 1
+            totals["idle_before_mib"] += IDLE_MIB[backing.engine]
+            totals["limit_before_bytes"] += _memory_limit(services(doc)[backing.name] or {}) or 0
+            pools[backing.pool] += 1
+    totals["pools"] = len(pools)
+    totals["idle_after_mib"] = sum(IDLE_MIB[key.split("-")[0]] for key in pools)
+    return totals, reasons, pools
+
+
+def _docker_json(argv):
+    result = subprocess.run(["docker", *argv, "--format", "{{json .}}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SharedInfraError(result.stderr.strip())
+    return [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+
+
+def measure(root=None):
+    """Sample memory of pooled vs. dedicated backing containers on this node."""
+    images = {c["Names"]: c["Image"] for c in _docker_json(["ps"])}
+    record = Counter()
+    for row in _docker_json(["stats", "--no-stream"]):
+        name = row["Name"]
+        if not engine_of(images.get(name, "")):
+            continue
+        kind = "pooled" if name.startswith(PROJECT + "-") else "dedicated"
+        record[f"{kind}_containers"] += 1
+        record[f"{kind}_mib"] += round((parse_size(row["MemUsage"].split("/")[0]) or 0) / 2 ** 20, 1)
+    state = SharedState(root).load()
+    record["tenants"] = len(state["tenants"])
+    result = dict(record, at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    path = state_dir(root) / "bench"
+    path.mkdir(exist_ok=True)
+    with open(path / BENCH_FILENAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.sharedinfra", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rp = sub.add_parser("report", help="estimate how many backing services shared mode removes")
+    rp.add_argument("--status", help="only stacks with this catalog status")
+    rw = sub.add_parser("rewrite", help="write the sharedinfra overlay into a prepared deploy tree")
+    rw.add_argument("service_id")
+    rw.add_argument("workdir", type=Path)
+    rw.add_argument("--no-provision", action="store_true", help="allocate tenants but do not touch the pools")
+    pl = sub.add_parser("pool", help="manage the pooled instances")
+    pl.add_argument("action", choices=("up", "config"))
+    rl = sub.add_parser("release", help="drop the tenants of a service")
+    rl.add_argument("service_id")
+    sub.add_parser("measure", help="sample memory of pooled and dedicated backing containers")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "report":
+            totals, reasons, pools = report(args.root, args.status)
+            print(f"{totals['stacks']} stacks, {totals['backing']} backing services, "
+                  f"{totals['shared']} shareable onto {totals['pools']} pools")
+            print(f"idle memory  {totals['idle_before_mib']:>7} MiB -> {totals['idle_after_mib']} MiB (estimate)")
+            print(f"memory limits released  {totals['limit_before_bytes'] / 2 ** 30:.1f} GiB")
+            for key, n in pools.most_common():
+                print(f"  {n:>5}  {key}")
+            for reason, n in reasons.most_common():
+                print(f"  {n:>5}  kept local: {reason}")
+        elif args.command == "rewrite":
+            changed = apply_to_workdir(services_dir(args.root) / args.service_id, args.workdir, args.root,
+                                       provision_tenants=not args.no_provision)
+            print(f"{args.service_id}: {'overlay written' if changed else 'nothing to share'}")
+        elif args.command == "pool":
+            if args.action == "up":
+                pool_up(root=args.root)
+            else:
+                print(write_pool_compose(SharedState(args.root).load(), args.root))
+        elif args.command == "release":
+            print(f"{args.service_id}: released {release(args.service_id, args.root)} tenants")
+        elif args.command == "measure":
+            print(json.dumps(measure(args.root), indent=2))
+    except (SharedInfraError, ComposeError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
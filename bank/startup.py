@@ -0,0 +1,449 @@
+"""Dependency-ordered parallel startup of compose stacks, with critical paths.
+
+``depends_on`` entries of one or more stacks form a DAG whose nodes are
+``<service_id>/<compose service>``.  The runner starts every node whose
+dependencies are satisfied at once (``docker compose up -d --no-deps``),
+up to ``--max-parallel`` starts in flight.  Each edge's condition is then
+gated on a readiness signal read from the container with ``docker inspect``:
+
+* ``service_started``: the container is running.
+* ``service_healthy``: its healthcheck reports healthy.
+* ``service_completed_successfully``: it exited with status 0.
+
+A dependency that fails (unhealthy, non-zero exit, readiness timeout) skips
+everything downstream of it and nothing else.
+
+Every run records per-node timings and its *critical path*, the chain of
+nodes whose readiness actually gated the last node to become ready.  Runs
+are appended to ``.bank/startup/runs.jsonl``, and ``plan`` uses the measured
+durations to estimate the critical path before anything starts.
+
+Docker runs the first health check only after ``interval`` (30 s in most
+generated files), so every ``service_healthy`` edge costs at least that
+long.  The ``startup`` deploy transform writes an overlay that adds
+``start_interval: 1s`` so healthchecks are probed every second during the
+start period.
+
+Usage::
+
+    python -m bank.startup plan <service_id> ...
+    python -m bank.startup run <service_id> ... [--max-parallel 8] [--workdir DIR]
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import services_dir, state_dir
+from .compose import ComposeError, load_compose, services, write_overlay
+from .deploy import DEFAULT_WORKDIR, DeployError, compose, compose_file
+
+STARTUP_DIRNAME = "startup"
+RUNS_FILENAME = "runs.jsonl"
+OVERLAY_NAME = "startup"
+START_INTERVAL = "1s"
+DEFAULT_MAX_PARALLEL = 8
+DEFAULT_POLL = 0.5
+DEFAULT_TIMEOUT = 600.0
+# Docker's healthcheck defaults.
+DEFAULT_INTERVAL = 30.0
+DEFAULT_RETRIES = 3
+# Assumed container start cost when no run has been recorded.
+DEFAULT_START_S = 1.0
+
+CONDITION_EVENTS = {
+    "service_started": "started",
+    "service_healthy": "healthy",
+    "service_completed_successfully": "completed",
+}
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(h|ms|m|s|us|ns)")
+_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "ns": 1e-9}
+
+
+class StartupError(Exception):
+    pass
+
+
+def parse_duration(value, default=0.0):
+    """Return seconds for a compose duration such as ``1m30s`` or ``500ms``."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    total = sum(float(n) * _UNITS[unit] for n, unit in _DURATION.findall(str(value)))
+    return total if _DURATION.search(str(value)) else default
+
+
+@dataclass
+class Node:
+    """One compose service in the startup graph."""
+
+    key: str
+    stack: str
+    service: str
+    deps: dict = field(default_factory=dict)     # dependency key -> event it must reach
+    healthcheck: bool = False
+    first_check: float = 0.0                     # when Docker runs the first health check
+    budget: float = 0.0                          # when Docker gives up and marks it unhealthy
+
+    @property
+    def final_event(self):
+        return "healthy" if self.healthcheck else "started"
+
+
+def _healthcheck(service):
+    check = service.get("healthcheck") or {}
+    test = check.get("test")
+    if not test or check.get("disable") or test in (["NONE"], "NONE"):
+        return None
+    return check
+
+
+def stack_graph(doc, stack):
+    """Return ``{key: Node}`` for the services of one compose document.
+
+    Services assigned to a profile are not started by a plain ``up`` and are
+    left out, together with edges pointing at them.
+    """
+    active = {name: service or {} for name, service in services(doc).items() if not (service or {}).get("profiles")}
+    nodes = {}
+    for name, service in active.items():
+        node = Node(f"{stack}/{name}", stack, name)
+        depends = service.get("depends_on") or {}
+        if isinstance(depends, list):
+            depends = {dep: {} for dep in depends}
+        for dep, spec in depends.items():
+            if dep in active:
+                condition = (spec or {}).get("condition", "service_started")
+                node.deps[f"{stack}/{dep}"] = CONDITION_EVENTS.get(condition, "started")
+        check = _healthcheck(service)
+        if check:
+            interval = parse_duration(check.get("interval"), DEFAULT_INTERVAL)
+            start_interval = parse_duration(check.get("start_interval"), 0.0)
+            start_period = parse_duration(check.get("start_period"))
+            node.healthcheck = True
+            node.first_check = start_interval if start_interval and start_period else interval
+            node.budget = start_period + interval * int(check.get("retries", DEFAULT_RETRIES))
+        nodes[node.key] = node
+    for node in nodes.values():
+        for dep, event in node.deps.items():
+            if event == "healthy" and not nodes[dep].healthcheck:
+                # Compose treats a dependency without healthcheck as healthy once started.
+                node.deps[dep] = "started"
+    return nodes
+
+
+def load_stack(stack, workdir=None, root=None):
+    """Return the graph of a stack, from its deploy tree if one is given.
+
+    With a deploy tree the effective model (overlays included) comes from
+    ``docker compose config``; otherwise the service's compose file is read.
+    """
+    if workdir is not None and Path(workdir).is_dir():
+        result = compose(workdir, "config", "--format", "json")
+        return stack_graph(json.loads(result.stdout), stack)
+    path = compose_file(services_dir(root) / stack)
+    if path is None:
+        raise StartupError(f"{stack}: no compose file")
+    return stack_graph(load_compose(path), stack)
+
+
+def waves(nodes):
+    """Return the nodes in topological waves; raise on cycles."""
+    remaining = {key: set(node.deps) for key, node in nodes.items()}
+    result = []
+    while remaining:
+        wave = sorted(key for key, deps in remaining.items() if not deps)
+        if not wave:
+            raise StartupError("dependency cycle among " + ", ".join(sorted(remaining)))
+        result.append(wave)
+        for key in wave:
+            del remaining[key]
+        for deps in remaining.values():
+            deps.difference_update(wave)
+    return result
+
+
+def critical_path(nodes, times):
+    """Return the chain of keys that gated the last node to become ready.
+
+    ``times`` maps ``key -> {"started": s, "healthy": s, ...}`` (seconds from
+    the start of the run); a node is gated by the dependency whose required
+    event came last.
+    """
+    def ready(key):
+        return times[key].get(nodes[key].final_event, times[key].get("started"))
+
+    done = [key for key in nodes if ready(key) is not None]
+    if not done:
+        return []
+    key = max(done, key=ready)
+    path = [key]
+    while True:
+        gates = [(times[dep].get(event), dep) for dep, event in nodes[key].deps.items()
+                 if dep in times and times[dep].get(event) is not None]
+        if not gates:
+            break
+        key = max(gates)[1]
+        path.append(key)
+    return path[::-1]
+
+
+def history(root=None):
+    """Return ``{key: (start_s, ready_s)}`` from the most recent recorded runs."""
+    path = state_dir(root) / STARTUP_DIRNAME / RUNS_FILENAME
+    measured = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                for key, entry in json.loads(line)["nodes"].items():
+                    if entry.get("ready_s") is not None:
+                        measured[key] = (entry["start_s"], entry["ready_s"])
+    except FileNotFoundError:
+        pass
+    return measured
+
+
+def estimate(nodes, measured=None):
+    """Estimate event times for ``nodes`` from history or healthcheck settings."""
+    measured = measured or {}
+    times = {}
+    for wave in waves(nodes):
+        for key in wave:
+            node = nodes[key]
+            gate = max((times[dep][event] for dep, event in node.deps.items()), default=0.0)
+            start_s, ready_s = measured.get(key, (DEFAULT_START_S, node.first_check))
+            started = gate + start_s
+            times[key] = {"started": started, "healthy": started + ready_s, "completed": started + ready_s,
+                          "source": "measured" if key in measured else "healthcheck"}
+    return times
+
+
+def apply_to_workdir(service_dir, workdir):
+    """Deploy transform: probe healthchecks every second while services start."""
+    path = compose_file(workdir)
+    if path is None:
+        return False
+    overlay = {}
+    for name, service in services(load_compose(path)).items():
+        check = _healthcheck(service or {})
+        if check is None or "start_interval" in check:
+            continue
+        entry = {"start_interval": START_INTERVAL}
+        if not check.get("start_period"):
+            # start_interval only applies during the start period.
+            interval = parse_duration(check.get("interval"), DEFAULT_INTERVAL)
+            entry["start_period"] = f"{int(interval * int(check.get('retries', DEFAULT_RETRIES)))}s"
+        overlay[name] = {"healthcheck": entry}
+    if not overlay:
+        return False
+    write_overlay(workdir, OVERLAY_NAME, {"services": overlay})
+    return True
+
+
+def _inspect(container):
+    result = subprocess.run(
+        ["docker", "inspect", "-f", "{{.State.Status}} {{.State.ExitCode}} "
+         "{{if .State.Health}}{{.State.Health.Status}}{{end}}", container],
+        capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, None, None
+    status, code, health = (result.stdout.split() + [""] * 3)[:3]
+    return status, int(code), health or None
+
+
+class StartupRunner:
+    """Starts the nodes of one or more stacks as soon as their gates open."""
+
+    def __init__(self, nodes, workdirs, max_parallel=DEFAULT_MAX_PARALLEL, poll=DEFAULT_POLL,
+                 timeout=DEFAULT_TIMEOUT, log=print):
+        waves(nodes)  # reject cycles up front
+        self.nodes = nodes
+        self.workdirs = workdirs
+        self.max_parallel = max_parallel
+        self.poll = poll
+        self.timeout = timeout
+        self.log = log
+        self.times = {key: {} for key in nodes}
+        self.failed = {}
+        self._cond = threading.Condition()
+        self._t0 = None
+
+    def _now(self):
+        return round(time.monotonic() - self._t0, 2)
+
+    def _event(self, key, event):
+        with self._cond:
+            self.times[key][event] = self._now()
+            self._cond.notify_all()
+
+    def _fail(self, key, reason):
+        with self._cond:
+            self.failed[key] = reason
+            self._cond.notify_all()
+        self.log(f"{key}: {reason}")
+
+    def _wait_for(self, node):
+        """Wait until ``node`` reaches every event anyone needs from it.
+
+        A scaled service has several containers: it is healthy once all of
+        them are, and completed once all of them exited with status 0.
+        """
+        needed = {node.final_event}
+        needed.update(event for other in self.nodes.values() for dep, event in other.deps.items() if dep == node.key)
+        workdir = self.workdirs[node.stack]
+        containers = compose(workdir, "ps", "-a", "-q", node.service).stdout.split()
+        if not containers:
+            self._fail(node.key, "no container was created")
+            return
+        deadline = time.monotonic() + max(self.timeout, node.budget)
+        while time.monotonic() < deadline:
+            states = [_inspect(container) for container in containers]
+            reached = self.times[node.key]
+            failed = [code for status, code, _ in states if status == "exited" and code != 0]
+            if failed:
+                self._fail(node.key, f"exited with status {failed[0]}")
+                return
+            if any(health == "unhealthy" for status, _, health in states if status == "running"):
+                self._fail(node.key, "unhealthy")
+                return
+            if all(status == "exited" for status, _, _ in states):
+                self._event(node.key, "completed")
+                missing = needed - set(reached)
+                if missing:
+                    self._fail(node.key, f"exited with status 0 before it was {', '.join(sorted(missing))}")
+                return
+            running = [health for status, _, health in states if status == "running"]
+            if running and all(health == "healthy" for health in running) and "healthy" not in reached:
+                self._event(node.key, "healthy")
+            if needed <= set(reached):
+                return
+            time.sleep(self.poll)
+        self._fail(node.key, f"not ready after {max(self.timeout, node.budget):.0f}s")
+
+    def _start(self, node):
+        try:
+            compose(self.workdirs[node.stack], "up", "-d", "--no-deps", node.service)
+            self._event(node.key, "started")
+            self._wait_for(node)
+        except (DeployError, subprocess.SubprocessError, OSError) as exc:
+            self._fail(node.key, str(exc).splitlines()[0])
+
+    def _state(self, key):
+        """Return ``"run"``, ``"wait"`` or ``"skip"`` for a pending node."""
+        for dep, event in self.nodes[key].deps.items():
+            if dep in self.failed and event not in self.times[dep]:
+                return "skip"
+            if event not in self.times[dep]:
+                return "wait"
+        return "run"
+
+    def run(self):
+        """Start everything; return the run record."""
+        self._t0 = time.monotonic()
+        started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        pending = set(self.nodes)
+        skipped = []
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="startup") as pool:
+            futures = []
+            with self._cond:
+                while pending:
+                    for key in sorted(pending):
+                        state = self._state(key)
+                        if state == "run":
+                            pending.discard(key)
+                            futures.append(pool.submit(self._start, self.nodes[key]))
+                        elif state == "skip":
+                            pending.discard(key)
+                            skipped.append(key)
+                            self.failed[key] = "dependency failed"
+                            self._cond.notify_all()
+                    if pending:
+                        self._cond.wait(self.poll)
+            for future in futures:
+                future.result()
+        return self.record(started_at, skipped)
+
+    def record(self, started_at, skipped=()):
+        path = critical_path(self.nodes, self.times)
+        nodes = {}
+        for key, node in self.nodes.items():
+            times = self.times[key]
+            gate = max((self.times[dep].get(event, 0.0) for dep, event in node.deps.items()), default=0.0)
+            ready = times.get(node.final_event, times.get("completed"))
+            nodes[key] = {
+                "gate_s": gate if "started" in times else None,
+                "start_s": round(times["started"] - gate, 2) if "started" in times else None,
+                "ready_s": round(ready - times["started"], 2) if ready is not None else None,
+                "ready_at": ready,
+                "error": self.failed.get(key),
+            }
+        total = max((entry["ready_at"] or 0.0 for entry in nodes.values()), default=0.0)
+        return {"at": started_at, "stacks": sorted(self.workdirs), "total_s": total, "critical_path": path,
+                "failed": sorted(self.failed), "skipped": sorted(skipped), "nodes": nodes}
+
+
+def save_run(record, root=None):
+    path = state_dir(root) / STARTUP_DIRNAME
+    path.mkdir(exist_ok=True)
+    with open(path / RUNS_FILENAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _print_path(nodes, times, path, label):
+    print(f"{label}:")
+    for key in path:
+        event = nodes[key].final_event
+        start = times[key].get("started")
+        ready = times[key].get(event)
+        print(f"  {key:<56} started {start:7.1f}s  {event} {ready if ready is not None else '-':>7}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.startup", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pl = sub.add_parser("plan", help="show startup waves and the estimated critical path")
+    pl.add_argument("service_ids", nargs="+")
+    rn = sub.add_parser("run", help="start prepared stacks in dependency order, in parallel")
+    rn.add_argument("service_ids", nargs="+")
+    rn.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="parent of the deploy trees")
+    rn.add_argument("--max-parallel", type=int, default=DEFAULT_MAX_PARALLEL)
+    rn.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="per-node readiness timeout")
+
+    args = parser.parse_args(argv)
+    nodes = {}
+    try:
+        for service_id in args.service_ids:
+            workdir = args.workdir / service_id if args.command == "run" else None
+            nodes.update(load_stack(service_id, workdir, args.root))
+        if args.command == "plan":
+            for i, wave in enumerate(waves(nodes)):
+                print(f"wave {i}: {' '.join(wave)}")
+            times = estimate(nodes, history(args.root))
+            _print_path(nodes, times, critical_path(nodes, times), "estimated critical path")
+            budget = sum(nodes[key].budget for key in critical_path(nodes, times))
+            print(f"healthcheck budget along that path: {budget:.0f}s")
+            return 0
+        runner = StartupRunner(nodes, {sid: args.workdir / sid for sid in args.service_ids}, args.max_parallel,
+                               timeout=args.timeout)
+        record = runner.run()
+    except (StartupError, ComposeError, DeployError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    save_run(record, args.root)
+    _print_path(nodes, runner.times, record["critical_path"], "critical path")
+    print(f"time to ready: {record['total_s']:.1f}s, {len(record['failed'])} failed")
+    return 1 if record["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
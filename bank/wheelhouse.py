@@ -0,0 +1,512 @@
+"""Shared offline wheelhouse for every Python service's dependencies.
+
+``scan`` collects what each service installs: the specs on every
+``pip install`` line of its Dockerfile, with ``-r`` files read from the build
+context (generated files first, then the package) and followed through
+``COPY`` instructions.  Requirements are grouped by *tag*, the Python ABI of
+the stage that installs them (``py3.11``, ``py3.11-musl``, or the image name
+for non-``python:`` images).
+
+``build`` turns each distinct requirement set into wheels inside a throwaway
+container of the stage's own image, all writing to one directory per tag
+under ``.bank/wheelhouse/``.  Because every run passes ``--find-links`` to
+the wheels already there, a package shared by fifty services is downloaded
+and built once.
+
+Index options (``--index-url``, ``--extra-index-url`` ...) are part of a
+requirement set and are passed to its wheel build, so a CUDA build of torch
+is fetched from the same index the Dockerfile names.
+
+``rewrite`` (also usable as a deploy transform) points a deploy tree at the
+wheelhouse: each ``pip install`` gains ``--no-index --find-links`` on a
+read-only bind mount of the tag's directory, supplied through a compose
+``additional_contexts`` overlay.  Only ``RUN`` instructions whose every
+install is served entirely by built wheels are rewritten.  Installs of local
+paths (``-e .``), VCS or URL specs, constraint files or unreadable
+requirement files need more than the wheelhouse and stay on the index, as
+do services without a compose file to carry the overlay.
+
+Usage::
+
+    python -m bank.wheelhouse scan
+    python -m bank.wheelhouse build --jobs 4
+    python -m bank.wheelhouse rewrite <service_id> <deploy-dir>
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import subprocess
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+
+from . import services_dir, state_dir
+from .compose import load_compose, services_building, write_overlay
+from .deploy import BuildContext, compose_file
+from .dockerfile import Dockerfile, add_run_flags, copy_sources, from_image, split_shell_commands
+from .metadata import iter_service_dirs
+
+WHEELHOUSE_DIRNAME = "wheelhouse"
+MOUNT_TARGET = "/wheelhouse"
+OVERLAY_NAME = "wheelhouse"
+
+# Options that select where packages come from; kept with a requirement set.
+_INDEX_OPTIONS = frozenset({"-i", "--index-url", "--extra-index-url", "--trusted-host", "--pre"})
+# pip options that consume the following word.
+_OPTIONS_WITH_ARG = frozenset({
+    "-r", "--requirement", "-c", "--constraint", "-i", "--index-url", "--extra-index-url",
+    "-f", "--find-links", "-t", "--target", "--prefix", "--root", "--trusted-host",
+    "--platform", "--python-version", "--implementation", "--abi", "--progress-bar",
+    "--src", "--cache-dir", "--log", "--timeout", "--retries", "--proxy", "--cert",
+    "--client-cert", "--upgrade-strategy", "--only-binary", "--no-binary",
+    "--global-option", "--config-settings", "-C", "-e", "--editable",
+})
+_PIP_INSTALL = re.compile(r"\b((?:pip3?(?:\.\d+)?|python3?(?:\.\d+)?\s+-m\s+pip)\s+install)\b")
+_PYTHON_IMAGE = re.compile(r"^(?:docker\.io/)?(?:library/)?python:(\d+\.\d+)[^\s]*$")
+_NAME = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+@dataclass
+class PipInstall:
+    """One ``pip install`` invocation found in a service's Dockerfile."""
+
+    service_id: str
+    tag: str
+    image: str
+    line: int
+    specs: list = field(default_factory=list)
+    requirement_files: list = field(default_factory=list)
+    unresolved: list = field(default_factory=list)
+    local: list = field(default_factory=list)           # specs the wheelhouse cannot serve
+    index_options: list = field(default_factory=list)
+
+    @property
+    def set_id(self):
+        payload = "\n".join(self.index_options + sorted(set(self.specs)))
+        return hashlib.sha256(f"{self.tag}\n{payload}".encode()).hexdigest()[:16]
+
+    @property
+    def offline(self):
+        """True when the wheelhouse alone can satisfy this install."""
+        return bool(self.specs) and not self.local and not self.unresolved
+
+    def requirements_text(self):
+        return "\n".join(self.index_options + sorted(set(self.specs))) + "\n"
+
+
+def wheelhouse_tag(image):
+    """Return the wheelhouse a stage's base image installs from."""
+    match = _PYTHON_IMAGE.match(image)
+    if match:
+        return f"py{match.group(1)}" + ("-musl" if "alpine" in image else "")
+    return re.sub(r"[^A-Za-z0-9.]+", "_", image).strip("_")
+
+
+def canonical_name(spec):
+    """Return the PEP 503 normalised project name of a requirement spec."""
+    match = _NAME.match(spec.strip())
+    return re.sub(r"[-_.]+", "-", match.group(1)).lower() if match else None
+
+
+def _is_pip_install(words, i):
+    word = words[i]
+    if re.fullmatch(r"pip3?(\.\d+)?", word) and words[i + 1:i + 2] == ["install"]:
+        return i + 2
+    if re.fullmatch(r"python3?(\.\d+)?", word) and words[i + 1:i + 4] == ["-m", "pip", "install"]:
+        return i + 4
+    return None
+
+
+def parse_pip_args(words):
+    """Split pip install arguments into ``(specs, requirement_files, local, index_options)``.
+
+    ``local`` holds what the wheelhouse cannot serve: editable installs,
+    paths, VCS and URL specs, and constraint or ``--find-links`` sources.
+    """
+    specs, files, local, index_options = [], [], [], []
+    words = iter(words)
+    for word in words:
+        if not word.startswith("-"):
+            (specs if _shareable_spec(word) else local).append(word)
+            continue
+        name, eq, value = word.partition("=")
+        if name in _OPTIONS_WITH_ARG and not eq:
+            value = next(words, "")
+        if name in ("-r", "--requirement"):
+            files.append(value)
+        elif name.startswith("-r") and not name.startswith("--"):
+            files.append(name[2:])
+        elif name in ("-e", "--editable", "-c", "--constraint", "-f", "--find-links"):
+            local.append(f"{name} {value}")
+        elif name in _INDEX_OPTIONS:
+            index_options.append(f"{name} {value}" if name in _OPTIONS_WITH_ARG else name)
+    return specs, [f for f in files if f], local, index_options
+
+
+def _shareable_spec(spec):
+    return bool(spec) and not (
+        spec.startswith((".", "/", "$", "~"))
+        or "://" in spec
+        or spec.startswith("git+")
+        or spec.endswith((".whl", ".tar.gz", ".zip"))
+    ) and canonical_name(spec) is not None
+
+
+def parse_requirements(text, read, base=PurePosixPath("."), seen=None):
+    """Return ``(specs, unresolved, local, index_options)`` from a requirements file's text.
+
+    Nested ``-r`` files are read through ``read(relpath)`` relative to
+    ``base``; files that cannot be read are reported as unresolved.
+    ``local`` and ``index_options`` are as for :func:`parse_pip_args`.
+    """
+    seen = seen if seen is not None else set()
+    specs, unresolved, local, index_options = [], [], [], []
+    logical = []
+    for line in text.splitlines():
+        if logical and logical[-1].endswith("\\"):
+            logical[-1] = logical[-1][:-1] + " " + line.strip()
+        else:
+            logical.append(line.strip())
+    for line in logical:
+        line = re.sub(r"(^|\s)#.*$", "", line).strip()
+        if not line:
+            continue
+        if line.startswith("-"):
+            option, _, value = line.partition(" ")
+            option, eq, inline = option.partition("=")
+            value = (inline if eq else value).strip()
+            if option in ("-r", "--requirement") and value:
+                nested = (base / value).as_posix()
+                if nested in seen:
+                    continue
+                seen.add(nested)
+                data = read(nested)
+                if data is None:
+                    unresolved.append(nested)
+                    continue
+                more, missing, more_local, more_options = parse_requirements(
+                    data.decode("utf-8", "replace"), read, PurePosixPath(nested).parent, seen)
+                specs += more
+                unresolved += missing
+                local += more_local
+                index_options += more_options
+            elif option in ("-e", "--editable", "-c", "--constraint", "-f", "--find-links"):
+                local.append(f"{option} {value}")
+            elif option in _INDEX_OPTIONS:
+                index_options.append(f"{option} {value}" if option in _OPTIONS_WITH_ARG else option)
+            continue
+        spec = re.sub(r"\s+--hash=\S+", "", line).strip()
+        (specs if _shareable_spec(spec) else local).append(spec)
+    return specs, unresolved, local, index_options
+
+
+def _abspath(path, workdir):
+    path = PurePosixPath(path)
+    return PurePosixPath(_normpath(path if path.is_absolute() else PurePosixPath(workdir) / path))
+
+
+def _normpath(path):
+    parts = []
+    for part in PurePosixPath(path).parts:
+        if part == "..":
+            if len(parts) > 1:
+                parts.pop()
+        elif part != ".":
+            parts.append(part)
+    return PurePosixPath(*parts) if parts else PurePosixPath("/")
+
+
+def context_path(dockerfile, before, path):
+    """Map a path used by a ``RUN`` back to a build-context path.
+
+    ``COPY``/``ADD`` instructions (from the context, not other stages) ahead
+    of instruction index ``before`` are replayed; the last one that put a
+    file at ``path`` wins.  Falls back to ``path`` relative to the context.
+    """
+    workdir = PurePosixPath("/")
+    found = None
+    for instruction in dockerfile.instructions[:before]:
+        if instruction.keyword == "FROM":
+            workdir = PurePosixPath("/")
+            found = None
+        elif instruction.keyword == "WORKDIR":
+            workdir = _abspath(instruction.value.strip(), workdir)
+        elif instruction.keyword in ("COPY", "ADD"):
+            sources, dest, flags = copy_sources(instruction)
+            if "from" in flags or not sources:
+                continue
+            target = _abspath(path, workdir)
+            dest_abs = _abspath(dest, workdir)
+            is_dir = dest.endswith("/") or dest in (".", "./") or len(sources) > 1
+            for src in sources:
+                src = _strip_dot(src.rstrip("/")) or "."
+                if src == ".":
+                    try:
+                        found = target.relative_to(dest_abs).as_posix()
+                    except ValueError:
+                        pass
+                elif (dest_abs / PurePosixPath(src).name if is_dir else dest_abs) == target:
+                    found = src
+    return found if found is not None else _strip_dot(path)
+
+
+def _strip_dot(path):
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+def scan_service(service_id, service_dir, dockerfile_path=None):
+    """Return the :class:`PipInstall` invocations of one service.
+
+    ``dockerfile_path`` scans another copy of the Dockerfile (e.g. one in a
+    deploy tree) while still reading requirement files from the service.
+    """
+    path = Path(dockerfile_path or Path(service_dir) / "Dockerfile")
+    if not path.is_file():
+        return []
+    dockerfile = Dockerfile.read(path)
+    installs = []
+    image = ""
+    stages = {}
+    with BuildContext(service_dir) as context:
+        for index, instruction in enumerate(dockerfile.instructions):
+            if instruction.keyword == "FROM":
+                image, alias = from_image(instruction)
+                image = stages.get(image, image)
+                if alias:
+                    stages[alias] = image
+                continue
+            if instruction.keyword != "RUN" or not _PIP_INSTALL.search(instruction.value):
+                continue
+            _, command = instruction.flags_and_command()
+            for words in split_shell_commands(command):
+                for i in range(len(words)):
+                    start = _is_pip_install(words, i)
+                    if start is None:
+                        continue
+                    install = PipInstall(service_id, wheelhouse_tag(image), image, instruction.start)
+                    specs, files, local, index_options = parse_pip_args(words[start:])
+                    install.specs += specs
+                    install.local += local
+                    install.index_options += index_options
+                    for name in files:
+                        relpath = context_path(dockerfile, index, name)
+                        data = context.read(relpath)
+                        install.requirement_files.append(relpath)
+                        if data is None:
+                            install.unresolved.append(relpath)
+                            continue
+                        more, missing, more_local, more_options = parse_requirements(
+                            data.decode("utf-8", "replace"), context.read, PurePosixPath(relpath).parent)
+                        install.specs += more
+                        install.unresolved += missing
+                        install.local += more_local
+                        install.index_options += more_options
+                    installs.append(install)
+                    break
+    return installs
+
+
+def scan(root=None):
+    """Return every service's :class:`PipInstall` invocations."""
+    installs = []
+    for service_id, service_dir in iter_service_dirs(root):
+        installs += scan_service(service_id, service_dir)
+    return installs
+
+
+class Wheelhouse:
+    """Per-tag wheel directories plus the record of which sets built."""
+
+    def __init__(self, root=None, path=None):
+        self.path = Path(path or state_dir(root) / WHEELHOUSE_DIRNAME)
+
+    def tag_dir(self, tag):
+        return self.path / tag
+
+    def _state_path(self, tag):
+        return self.tag_dir(tag) / "sets.json"
+
+    def state(self, tag):
+        try:
+            with open(self._state_path(tag), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, tag, state):
+        with open(self._state_path(tag), "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+
+    def build(self, installs, jobs=2, dry_run=False, log=print):
+        """Build the wheels for every distinct requirement set.
+
+        Sets already recorded as built are skipped.  Returns
+        ``{tag: {set_id: "ok" | "failed"}}``.
+        """
+        by_tag = defaultdict(dict)
+        for install in installs:
+            if install.specs:
+                by_tag[install.tag].setdefault(install.set_id, install)
+        results = {}
+        for tag, sets in sorted(by_tag.items()):
+            tag_dir = self.tag_dir(tag)
+            (tag_dir / "requirements").mkdir(parents=True, exist_ok=True)
+            state = self.state(tag)
+            todo = [s for set_id, s in sorted(sets.items()) if state.get(set_id) != "ok"]
+            log(f"{tag}: {len(sets)} requirement sets, {len(todo)} to build")
+            for install in todo:
+                req = tag_dir / "requirements" / f"{install.set_id}.txt"
+                req.write_text(install.requirements_text(), encoding="utf-8")
+            if dry_run:
+                continue
+
+            def run(install, tag_dir=tag_dir):
+                cmd = [
+                    "docker", "run", "--rm",
+                    "-v", f"{tag_dir.resolve()}:{MOUNT_TARGET}",
+                    install.image,
+                    "pip", "wheel", "--wheel-dir", MOUNT_TARGET, "--find-links", MOUNT_TARGET,
+                    "-r", f"{MOUNT_TARGET}/requirements/{install.set_id}.txt",
+                ]
+                done = subprocess.run(cmd, capture_output=True, text=True)
+                return install.set_id, "ok" if done.returncode == 0 else "failed"
+
+            # The wheel set of one tag grows as sets finish, so later runs reuse
+            # what earlier ones built; a small pool keeps that overlap useful.
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                for set_id, outcome in pool.map(run, todo):
+                    state[set_id] = outcome
+                    self._save_state(tag, state)
+                    log(f"  {tag}/{set_id}: {outcome}")
+            results[tag] = state
+        return results
+
+    def ready(self, installs):
+        """True when the wheelhouse alone can serve every install in ``installs``."""
+        return all(i.offline and self.state(i.tag).get(i.set_id) == "ok" for i in installs)
+
+
+def rewrite_dockerfile(dockerfile, installs_by_line, wheelhouse):
+    """Point each ``pip install`` at the wheelhouse; return the tags mounted.
+
+    A ``RUN`` is only rewritten when the wheelhouse can serve every install
+    in it; the others keep installing from the index.
+    """
+    tags = set()
+    for instruction in list(dockerfile.instructions):
+        installs = installs_by_line.get(instruction.start)
+        if instruction.keyword != "RUN" or not installs or f"target={MOUNT_TARGET}" in instruction.value:
+            continue
+        if not wheelhouse.ready(installs):
+            continue
+        tag = installs[0].tag
+        extra = f"--find-links={MOUNT_TARGET} --no-index"
+        lines = [_PIP_INSTALL.sub(lambda m: f"{m.group(1)} {extra}", line) for line in dockerfile.source(instruction)]
+        lines = add_run_flags(lines, [f"--mount=type=bind,from=wheelhouse-{tag},target={MOUNT_TARGET}"])
+        # Re-parse after each edit; line numbers do not shift because the
+        # rewrite keeps one output line per input line.
+        dockerfile.replace(instruction, lines)
+        tags.add(tag)
+    if tags:
+        dockerfile.ensure_syntax_directive()
+    return tags
+
+
+def apply_to_workdir(service_dir, workdir, root=None):
+    """Deploy transform: rewrite ``workdir/Dockerfile`` to use the wheelhouse.
+
+    The Dockerfile is left alone when there is no compose service building
+    it, since only the compose overlay supplies the wheelhouse context.
+    """
+    service_dir, workdir = Path(service_dir), Path(workdir)
+    path = workdir / "Dockerfile"
+    compose_path = compose_file(workdir)
+    names = services_building(load_compose(compose_path)) if compose_path is not None else []
+    if not names:
+        return False
+    wheelhouse = Wheelhouse(root)
+    installs = scan_service(service_dir.name, service_dir, path)
+    if not installs:
+        return False
+    by_line = defaultdict(list)
+    for install in installs:
+        by_line[install.line].append(install)
+    dockerfile = Dockerfile.read(path)
+    tags = rewrite_dockerfile(dockerfile, by_line, wheelhouse)
+    if not tags:
+        return False
+    path.write_text(dockerfile.text(), encoding="utf-8", errors="surrogateescape")
+    contexts = {f"wheelhouse-{tag}": str(wheelhouse.tag_dir(tag).resolve()) for tag in sorted(tags)}
+    write_overlay(workdir, OVERLAY_NAME, {
+        "services": {name: {"build": {"additional_contexts": contexts}} for name in names}
+    })
+    return True
+
+
+def report(installs):
+    """Summarise how much the wheelhouse deduplicates."""
+    services = {i.service_id for i in installs}
+    per_package = Counter()
+    for service_id in services:
+        names = {canonical_name(s) for i in installs if i.service_id == service_id for s in i.specs}
+        per_package.update(n for n in names if n)
+    total_installs = sum(per_package.values())
+    return {
+        "services": len(services),
+        "pip_invocations": len(installs),
+        "requirement_sets": len({(i.tag, i.set_id) for i in installs if i.specs}),
+        "index_only": sum(not i.offline for i in installs),
+        "tags": dict(Counter(i.tag for i in installs).most_common()),
+        "package_installs": total_installs,
+        "unique_packages": len(per_package),
+        "avoided_downloads": total_installs - len(per_package),
+        "top_packages": per_package.most_common(15),
+        "unresolved_files": sorted({f"{i.service_id}:{f}" for i in installs for f in i.unresolved}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bank.wheelhouse", description=__doc__.split("\n")[0])
+    parser.add_argument("--root", help="bank root (default: this checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("scan", help="report the requirements every service installs")
+    build = sub.add_parser("build", help="build the wheelhouse")
+    build.add_argument("--tag", action="append", help="only build these tags (repeatable)")
+    build.add_argument("--jobs", type=int, default=2)
+    build.add_argument("--dry-run", action="store_true", help="write requirement sets without building")
+    rewrite = sub.add_parser("rewrite", help="point a prepared deploy tree at the wheelhouse")
+    rewrite.add_argument("service_id")
+    rewrite.add_argument("workdir", type=Path)
+
+    args = parser.parse_args(argv)
+    if args.command == "rewrite":
+        changed = apply_to_workdir(services_dir(args.root) / args.service_id, args.workdir, args.root)
+        print("rewritten" if changed else "nothing to rewrite")
+        return 0
+    installs = scan(args.root)
+    if args.command == "scan":
+        summary = report(installs)
+        for key in ("services", "pip_invocations", "index_only", "requirement_sets", "package_installs",
+                    "unique_packages", "avoided_downloads"):
+            print(f"{key:<18} {summary[key]}")
+        print("tags:", ", ".join(f"{tag}={n}" for tag, n in summary["tags"].items()))
+        print("most shared packages:")
+        for name, n in summary["top_packages"]:
+            print(f"  {n:>4}  {name}")
+        if summary["unresolved_files"]:
+            print(f"unresolved requirement files: {len(summary['unresolved_files'])}")
+    elif args.command == "build":
+        if args.tag:
+            installs = [i for i in installs if i.tag in args.tag]
+        Wheelhouse(args.root).build(installs, jobs=args.jobs, dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
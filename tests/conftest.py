@@ -0,0 +1,38 @@
+import zipfile
+
+import pytest
+
+from bank import services_dir
+from bank.metadata import METADATA_FILENAME, write_metadata
+
+
+@pytest.fixture
+def bank_root(tmp_path):
+    """An empty bank root with a ``services/`` directory."""
+    root = tmp_path / "bank"
+    services_dir(root).mkdir(parents=True)
+    return root
+
+
+@pytest.fixture
+def make_service(bank_root):
+    """Create ``services/<service_id>`` with metadata, generated files and an optional package.
+
+    ``package`` maps member names to bytes; they are zipped under a
+    ``repo-main/`` top-level directory, as uploads are.
+    """
+
+    def make(service_id, files=None, package=None, **metadata):
+        service_dir = services_dir(bank_root) / service_id
+        service_dir.mkdir()
+        write_metadata(service_dir / METADATA_FILENAME,
+                       {"service_id": service_id, "status": "stopped", **metadata})
+        for name, text in (files or {}).items():
+            (service_dir / name).write_text(text, encoding="utf-8")
+        if package is not None:
+            with zipfile.ZipFile(service_dir / "source.zip", "w", zipfile.ZIP_DEFLATED) as zf:
+                for name, data in package.items():
+                    zf.writestr(f"repo-main/{name}", data)
+        return service_dir
+
+    return make
@@ -0,0 +1,34 @@
+from bank.archive_index import open_index
+
+PACKAGE = {
+    "pom.xml": b"<project/>",
+    "src/main/App.java": b"class App {}\n" * 10,
+    "src/main/pom.xml": b"<module/>",
+    "README.md": b"# app\n",
+}
+
+
+def test_index_finds_members_relative_to_the_top_directory(bank_root, make_service):
+    make_service("a" * 24, package=PACKAGE)
+    make_service("b" * 24, package={"requirements.txt": b"flask\n"})
+    with open_index(bank_root, workers=1) as index:
+        assert index.archive("a" * 24)["top_dir"] == "repo-main"
+        assert index.find("pom.xml") == [("a" * 24, "pom.xml", 10), ("a" * 24, "src/main/pom.xml", 9)]
+        assert index.services_with("pom.xml", max_depth=1) == ["a" * 24]
+        assert index.du("a" * 24, "src/")[:2] == (2, 139)
+        assert [e["relpath"] for e in index.list("a" * 24, "src/")] == ["src/main/App.java", "src/main/pom.xml"]
+        assert index.member_name("a" * 24, "pom.xml") == "repo-main/pom.xml"
+
+
+def test_refresh_rescans_only_changed_archives(bank_root, make_service):
+    make_service("a" * 24, package=PACKAGE)
+    broken = make_service("b" * 24)
+    with open_index(bank_root, refresh=False) as index:
+        assert index.refresh(workers=1) == {"scanned": 1, "unchanged": 0, "removed": 0, "errors": 0}
+        (broken / "source.zip").write_bytes(b"not a zip")
+        assert index.refresh(workers=1) == {"scanned": 1, "unchanged": 1, "removed": 0, "errors": 1}
+        assert index.errors()["b" * 24].startswith("BadZipFile")
+
+        (broken / "source.zip").unlink()
+        assert index.refresh(workers=1)["removed"] == 1
+        assert index.archive("b" * 24) is None and index.errors() == {}
@@ -0,0 +1,41 @@
+from bank.baseimages import analyze, base_dockerfile, rewrite
+from bank.dockerfile import Dockerfile
+
+DOCKERFILE = """\
+FROM ubuntu:22.04
+ARG DEBIAN_FRONTEND=noninteractive
+WORKDIR /app
+ENV APP_HOME=/app
+RUN apt-get update && apt-get install -y tzdata curl
+COPY . .
+CMD ["python3", "app.py"]
+"""
+
+
+def test_arg_and_env_move_into_the_base_before_its_package_steps(bank_root, make_service):
+    for n in range(3):
+        make_service(f"{n:024x}", files={"Dockerfile": DOCKERFILE})
+    plan = analyze(bank_root, min_services=3)
+    (name,) = plan["bases"]
+    assert base_dockerfile(name, plan).splitlines()[1:] == [
+        "FROM ubuntu:22.04",
+        "ARG DEBIAN_FRONTEND=noninteractive",
+        "ENV APP_HOME=/app",
+        "RUN apt-get update && apt-get install -y tzdata curl",
+    ]
+
+    dockerfile = Dockerfile(DOCKERFILE)
+    assert rewrite(dockerfile, plan, "0" * 24) == 1
+    assert dockerfile.text().splitlines() == [
+        f"FROM {name}", "ARG DEBIAN_FRONTEND=noninteractive", "WORKDIR /app", "COPY . .", 'CMD ["python3", "app.py"]']
+
+
+def test_bases_nest_and_need_min_services(bank_root, make_service):
+    longer = DOCKERFILE.replace("COPY . .", "RUN apt-get install -y git\nCOPY . .")
+    for n, text in enumerate([DOCKERFILE] * 2 + [longer] * 3 + ["FROM alpine:3.19\nRUN apk add curl\n"]):
+        make_service(f"{n:024x}", files={"Dockerfile": text})
+    plan = analyze(bank_root, min_services=3)
+    assert plan["stages"] == 6 and plan["stages_rebased"] == 5
+    parent, child = sorted(plan["bases"], key=lambda name: len(plan["bases"][name]["keys"]))
+    assert plan["bases"][child]["parent"] == parent and plan["bases"][child]["own_layers"] == 1
+    assert base_dockerfile(child, plan).splitlines()[1:] == [f"FROM {parent}", "RUN apt-get install -y git"]
@@ -0,0 +1,33 @@
+import random
+import zipfile
+
+from bank.blobstore import BlobStore
+
+
+def _source(rng, lines=6000):
+    words = ["alpha", "beta", "gamma", "delta", "service", "request", "handler", "config", "value", "return"]
+    return "".join(" ".join(rng.choice(words) for _ in range(8)) + f" {rng.random()}\n" for _ in range(lines))
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, text in members.items():
+            zf.writestr(f"repo-main/{name}", text)
+
+
+def test_deflated_member_is_delta_encoded_on_its_content(tmp_path):
+    rng = random.Random(13)
+    old = _source(rng)
+    new = old.replace(old.splitlines()[3000], "changed line")
+    _zip(tmp_path / "v1.zip", {"app.py": old})
+    _zip(tmp_path / "v2.zip", {"app.py": new})
+    store = BlobStore(path=tmp_path / "store")
+    store.ingest("v1", source=tmp_path / "v1.zip")
+
+    recipe = store.ingest("v2", source=tmp_path / "v2.zip", base="v1")
+    deltas = [segment for segment in recipe["segments"] if segment[0] == "delta"]
+    assert len(deltas) == 1 and len(deltas[0]) == 6
+    assert store.blob_path(deltas[0][4]).stat().st_size < deltas[0][2] // 20
+
+    store.restore("v2", tmp_path / "restored.zip")
+    assert (tmp_path / "restored.zip").read_bytes() == (tmp_path / "v2.zip").read_bytes()
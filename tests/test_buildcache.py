@@ -0,0 +1,72 @@
+import pytest
+
+from bank.buildcache import BuildCache, transform_name
+from bank.deploy import prepare_workdir
+from bank.lazyimport import apply_to_workdir as lazyimport
+
+COMPOSE = """\
+services:
+  web:
+    build: .
+"""
+
+
+@pytest.fixture
+def deployed(make_service, tmp_path):
+    service_dir = make_service("a" * 24, files={
+        "Dockerfile": "FROM scratch\nCOPY . /app\n",  # no base image to resolve
+        "docker-compose.yaml": COMPOSE,
+    }, package={"app.py": b"print('hi')\n"})
+    workdir = tmp_path / "deploy"
+    prepare_workdir(service_dir, workdir)
+    config = {"name": "a", "services": {"web": {"build": {"context": str(workdir), "dockerfile": "Dockerfile"}}}}
+    return service_dir, workdir, config
+
+
+def test_key_is_stable(bank_root, deployed):
+    cache = BuildCache(bank_root)
+    assert cache.key(*deployed)[0] == cache.key(*deployed)[0]
+
+
+def test_key_covers_files_written_into_the_context(bank_root, deployed):
+    service_dir, workdir, config = deployed
+    cache = BuildCache(bank_root)
+    before, _ = cache.key(service_dir, workdir, config)
+    (workdir / "_bank_lazy.py").write_text("# written by a transform\n")
+    assert cache.key(service_dir, workdir, config)[0] != before
+
+
+def test_key_covers_transform_names(bank_root, deployed):
+    cache = BuildCache(bank_root)
+    plain, _ = cache.key(*deployed)
+    key, parts = cache.key(*deployed, [transform_name(lazyimport)])
+    assert parts["transforms"] == ["lazyimport"]
+    assert key != plain
+
+
+def test_key_follows_the_dockerignore_rules(bank_root, deployed):
+    service_dir, workdir, config = deployed
+    (workdir / "Dockerfile.dockerignore").write_text("logs\n*.tmp\n!keep.tmp\n")
+    cache = BuildCache(bank_root)
+    before, _ = cache.key(service_dir, workdir, config)
+    (workdir / "logs").mkdir()
+    (workdir / "logs" / "app.log").write_text("ignored\n")
+    (workdir / "scratch.tmp").write_text("ignored\n")
+    assert cache.key(service_dir, workdir, config)[0] == before
+    (workdir / "keep.tmp").write_text("re-included\n")
+    assert cache.key(service_dir, workdir, config)[0] != before
+
+
+def test_key_skips_bind_mount_sources(bank_root, deployed):
+    service_dir, workdir, config = deployed
+    config["services"]["web"]["volumes"] = [
+        "./data:/app/data",
+        {"type": "bind", "source": str(workdir / "mysql"), "target": "/var/lib/mysql"},
+        {"type": "volume", "source": "cache", "target": "/cache"},
+    ]
+    cache = BuildCache(bank_root)
+    before, _ = cache.key(service_dir, workdir, config)
+    for directory in ("data", "mysql"):
+        (workdir / directory).mkdir()
+        (workdir / directory / "state").write_bytes(b"written by the container")
+    assert cache.key(service_dir, workdir, config)[0] == before
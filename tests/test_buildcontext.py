@@ -0,0 +1,68 @@
+import io
+import tarfile
+
+import pytest
+
+from bank.buildcontext import HEADER, Tree, context_bytes, ignored, parse_rules, plan_build, write_tar
+
+PACKAGE = {
+    "app.py": b"open('docs/diagram.png')\n",
+    "requirements.txt": b"flask\n",
+    ".git/HEAD": b"ref: refs/heads/main\n",
+    "docs/diagram.png": b"\x89PNG" * 100,
+    "deck.pptx": b"slides" * 1000,
+    "docs/notes.pdf": b"%PDF" * 100,
+    "notebooks/explore.ipynb": b"{}" * 1000,
+    "static/logo.png": b"\x89PNG" * 10,
+}
+
+
+@pytest.mark.parametrize("relpath, expected", [
+    ("build/out.o", True),
+    ("build/keep.txt", False),
+    ("src/a/b/test_x.py", True),
+    ("README.md", False),
+    ("docs/README.md", True),
+])
+def test_ignored_applies_the_last_matching_rule(relpath, expected):
+    rules = parse_rules(["# comment", "build", "!build/keep.txt", "**/test_*.py", "/docs/*.md", ""])
+    assert ignored(relpath, rules) is expected
+
+
+def test_explicit_sources_become_an_allow_list(make_service):
+    service_dir = make_service("a" * 24, package=PACKAGE, files={
+        "Dockerfile": "FROM python:3.11\nCOPY requirements.txt ./\nCOPY app.py /app/\n",
+        ".dockerignore": "*.md\n",
+    })
+    with Tree(service_dir) as tree:
+        build = plan_build(tree, "web", ".", "Dockerfile")
+        assert build.mode == "sources"
+        assert build.rules == ["*", "!Dockerfile", "!requirements.txt", "!app.py"]
+        assert build.existing == ["*.md"]
+        assert context_bytes(tree, build, build.existing + build.rules)[0] == 3
+
+
+def test_whole_context_drops_unreferenced_bulky_files(make_service):
+    service_dir = make_service("a" * 24, package=PACKAGE,
+                               files={"Dockerfile": "FROM python:3.11\nCOPY . /app\n"})
+    with Tree(service_dir) as tree:
+        build = plan_build(tree, "web", ".", "Dockerfile")
+        assert build.mode == "whole"
+        assert build.rules == [".git", "notebooks", "deck.pptx"]
+
+        out = io.BytesIO()
+        write_tar(tree, build, out)
+    with tarfile.open(fileobj=io.BytesIO(out.getvalue())) as tar:
+        names = sorted(tar.getnames())
+        assert names == ["Dockerfile", "app.py", "docs/diagram.png", "docs/notes.pdf", "requirements.txt",
+                         "static/logo.png"]
+        assert tar.extractfile("docs/diagram.png").read() == PACKAGE["docs/diagram.png"]
+
+
+def test_variable_sources_leave_the_build_alone(make_service):
+    service_dir = make_service("a" * 24, package=PACKAGE,
+                               files={"Dockerfile": "FROM python:3.11\nARG SRC=.\nCOPY $SRC /app\n"})
+    with Tree(service_dir) as tree:
+        build = plan_build(tree, "web", ".", "Dockerfile")
+    assert build.mode == "unchanged" and "variable" in build.reason
+    assert HEADER not in build.existing
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from bank.cachemounts import bench, rewrite
+from bank.dockerfile import Dockerfile
+
+
+def _mounts(text, **options):
+    dockerfile = Dockerfile(text)
+    rewrite(dockerfile, **options)
+    return [line for line in dockerfile.text().splitlines() if line.startswith("RUN")]
+
+
+def test_gradle_mounts_follow_gradle_user_home():
+    runs = _mounts(
+        "FROM gradle:8.5-jdk17 AS builder\n"
+        "RUN gradle build\n"
+        "FROM builder AS test\n"
+        "RUN gradle test\n"
+        "FROM eclipse-temurin:17-jdk\n"
+        "RUN ./gradlew build\n"
+        "ENV GRADLE_USER_HOME=/cache/gradle\n"
+        "RUN ./gradlew build\n")
+    assert "target=/home/gradle/.gradle/caches" in runs[0]
+    assert "target=/home/gradle/.gradle/caches" in runs[1]
+    assert "target=/root/.gradle/caches" in runs[2]
+    assert "target=/cache/gradle/caches" in runs[3]
+
+
+def test_id_suffix_keeps_bench_mounts_apart():
+    runs = _mounts("FROM python:3.11\nRUN pip install --no-cache-dir flask\n", id_suffix="-bench-1")
+    assert runs == ["RUN --mount=type=cache,id=bank-pip-bench-1,target=/root/.cache/pip pip install flask"]
+
+
+def test_bench_removes_its_images_and_cache_mounts(make_service, bank_root, monkeypatch):
+    make_service("a" * 24, files={"Dockerfile": "FROM python:3.11\nRUN pip install flask\n"})
+    du = ('ID:\tshared\nDescription:\tcached mount /root/.cache/pip from exec pip install with id "bank-pip"\n\n'
+          'ID:\tbench\nDescription:\tcached mount /root/.cache/pip from exec pip install '
+          'with id "bank-pip-bench-01020304"\n')
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        stdout = {"inspect": "sha256:built\n", "du": du}.get(cmd[2], "")
+        return SimpleNamespace(returncode=0, stdout=stdout)
+
+    monkeypatch.setattr("bank.cachemounts.os.urandom", lambda n: bytes(range(1, n + 1)))
+    monkeypatch.setattr("bank.cachemounts.subprocess.run", run)
+    record = bench("a" * 24, bank_root, log=lambda line: None)
+
+    assert record["warm_ok"] and [cmd[1] for cmd in calls].count("build") == 3
+    assert ["docker", "image", "rm", "--force", "sha256:built"] in calls
+    assert [cmd for cmd in calls if cmd[1] == "builder"] == [
+        ["docker", "builder", "prune", "--force", "--filter", "id=bench"]]
@@ -0,0 +1,79 @@
+import logging
+import shutil
+
+import pytest
+
+from bank.catalog import open_catalog
+from bank.metadata import metadata_path, write_metadata
+
+
+def test_malformed_metadata_is_skipped_and_reported(bank_root, make_service, caplog):
+    make_service("a" * 24, language="python")
+    make_service("b" * 24, language="java")
+    with open_catalog(bank_root):
+        pass
+    metadata_path("b" * 24, bank_root).write_text('{"service_id": "bbb", "status":')
+    make_service("c" * 24).joinpath("metadata.json").write_text("[]")
+
+    with caplog.at_level(logging.WARNING, logger="bank.catalog"), open_catalog(bank_root, refresh=False) as catalog:
+        stats = catalog.refresh()
+        assert stats["invalid"] == 2 and stats["unchanged"] == 1
+        assert catalog.get("b" * 24)["language"] == "java"      # the last good row is kept
+        assert catalog.get("c" * 24) is None
+    assert sorted(record.getMessage().split(":")[0] for record in caplog.records) == [
+        f"skipping {metadata_path(sid, bank_root)}" for sid in ("b" * 24, "c" * 24)]
+
+
+def test_refresh_adds_updates_and_removes(bank_root, make_service):
+    make_service("a" * 24, language="python", package_size="1KB")
+    make_service("b" * 24, language="java", package_size="2KB")
+    with open_catalog(bank_root, refresh=False) as catalog:
+        assert catalog.refresh() == {"added": 2, "updated": 0, "removed": 0, "unchanged": 0, "invalid": 0}
+        assert catalog.refresh()["unchanged"] == 2
+
+        write_metadata(metadata_path("a" * 24, bank_root),
+                       {"service_id": "a" * 24, "status": "running", "language": "python", "package_size": "1KB"})
+        shutil.rmtree(metadata_path("b" * 24, bank_root).parent)
+        make_service("c" * 24, package={"app.py": b"print('hi')\n"})
+        assert catalog.refresh() == {"added": 1, "updated": 1, "removed": 1, "unchanged": 0, "invalid": 0}
+
+        assert catalog.get("a" * 24)["status"] == "running"
+        assert catalog.get("b" * 24) is None
+        record = catalog.get("c" * 24)
+        assert record["size_source"] == "source.zip"
+        assert record["package_bytes"] == metadata_path("c" * 24, bank_root).with_name("source.zip").stat().st_size
+
+
+def _ids(records):
+    return [record["service_id"][-1] for record in records]
+
+
+def test_query_filters_and_orders(bank_root, make_service):
+    for n, (language, star, size) in enumerate([("python", 5, "3KB"), ("python", 50, "1KB"), ("go", 500, "2KB")]):
+        make_service(f"{n:024x}", language=language, star=star, package_size=size)
+    with open_catalog(bank_root) as catalog:
+        assert _ids(catalog.query(language="python")) == ["0", "1"]
+        assert _ids(catalog.query(min_star=10, order_by="-star")) == ["2", "1"]
+        assert _ids(catalog.query(max_bytes=2048, order_by="package_bytes")) == ["1", "2"]
+        assert _ids(catalog.query(order_by="-package_bytes", limit=1)) == ["0"]
+        assert catalog.count_by("language") == {"python": 2, "go": 1}
+        with pytest.raises(ValueError):
+            catalog.query(order_by="star; DROP TABLE services")
+
+
+def test_aggregates_follow_changed_groups(bank_root, make_service):
+    for n, (language, size) in enumerate([("python", "1KB"), ("python", "3KB"), ("go", "2KB"), ("go", None)]):
+        make_service(f"{n:024x}", language=language, package_size=size)
+    with open_catalog(bank_root) as catalog:
+        everything = catalog.aggregates()["*"]
+        assert (everything["services"], everything["sized"], everything["total_bytes"]) == (4, 3, 6144)
+        assert everything["p50_bytes"] == 2048 and everything["p95_bytes"] == 3072
+        assert everything["largest"][0] == ("1".zfill(24), 3072)
+        assert list(catalog.aggregates("language")) == ["python", "go"]
+
+        shutil.rmtree(metadata_path("1".zfill(24), bank_root).parent)
+        catalog.refresh()
+        by_language = catalog.aggregates("language")
+        assert by_language["python"]["total_bytes"] == 1024 and by_language["go"]["total_bytes"] == 2048
+        with pytest.raises(ValueError):
+            catalog.aggregates("platform")
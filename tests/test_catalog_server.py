@@ -0,0 +1,66 @@
+import json
+from http import HTTPStatus
+
+import pytest
+
+from bank.catalog_server import BadRequest, CatalogServer, Dataset, _normalise, list_services
+from bank.journal import Journal
+
+
+def _dataset(count=7):
+    return Dataset([{"service_id": f"{n:02d}", "language": "python" if n % 2 else "go", "star": n * 10}
+                    for n in range(count)], {})
+
+
+def _pages(dataset, **params):
+    ids, cursor = [], None
+    while True:
+        query = _normalise(dict(params, **({"cursor": cursor} if cursor else {})))
+        body, cursor = list_services(dataset, query)
+        ids.append([item["service_id"] for item in body["items"]])
+        if cursor is None:
+            return ids
+
+
+def test_cursor_pages_cover_every_match_once():
+    dataset = _dataset()
+    assert _pages(dataset, limit="3") == [["00", "01", "02"], ["03", "04", "05"], ["06"]]
+    assert _pages(dataset, limit="2", language="python", min_star="20") == [["03", "05"]]
+    assert _pages(dataset, limit="7") == [["00", "01", "02", "03", "04", "05", "06"]]
+
+
+def test_cursor_survives_a_new_dataset_version():
+    query = _normalise({"limit": "2"})
+    _, cursor = list_services(_dataset(), query)
+    changed = Dataset([r for r in _dataset(9).records if r["service_id"] != "02"], {})
+    body, _ = list_services(changed, _normalise({"limit": "2", "cursor": cursor}))
+    assert [item["service_id"] for item in body["items"]] == ["03", "04"]
+
+
+def test_fields_project_records():
+    body, _ = list_services(_dataset(), _normalise({"fields": "star,service_id,", "limit": "1"}))
+    assert body["items"] == [{"service_id": "00", "star": 0}]
+
+
+@pytest.mark.parametrize("params", [{"limit": "0"}, {"min_star": "lots"}, {"sort": "star"}, {"cursor": "!"}])
+def test_bad_queries_are_rejected(params):
+    with pytest.raises(BadRequest):
+        list_services(_dataset(), _normalise(params))
+
+
+def test_server_answers_with_etags_and_journal_statuses(bank_root, make_service):
+    for n in range(3):
+        make_service(f"{n:024x}", language="python")
+    Journal(bank_root).record(f"{1:024x}", "running")
+    server = CatalogServer(bank_root)
+
+    status, headers, body = server.respond("/services?limit=2&fields=service_id,status", {})
+    assert status == HTTPStatus.OK and "cursor=" in headers["Link"]
+    assert [item["status"] for item in json.loads(body)["items"]] == ["stopped", "running"]
+    status, _, body = server.respond("/services?fields=status,service_id&limit=2", {"if-none-match": headers["ETag"]})
+    assert status == HTTPStatus.NOT_MODIFIED and body == b""
+
+    assert server.respond(f"/services/{2:024x}", {})[0] == HTTPStatus.OK
+    assert server.respond("/services/missing", {})[0] == HTTPStatus.NOT_FOUND
+    assert json.loads(server.respond("/aggregates?by=language", {})[2])["python"]["services"] == 3
+    assert server.respond("/aggregates?by=colour", {})[0] == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,74 @@
+import json
+import sys
+
+from bank import state_dir
+from bank.coldstart import BENCH_FILENAME, bench, entry_point, parse_importtime, regressions, wrappers
+
+SERVER = """\
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import not_installed_model_lib
+from not_installed_model_lib.nets import Net
+
+net = Net(layers=3)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+if __name__ == "__main__":
+    HTTPServer(("0.0.0.0", 40209), Handler).serve_forever()
+"""
+ROUTES = '@app.get("/health")\ndef health():\n    return "ok"\n'
+
+
+def test_entry_point_follows_the_dockerfile(make_service):
+    uvicorn = make_service("a" * 24, files={"api.py": "app = None\n" + ROUTES, "helper.py": "",
+                                            "Dockerfile": 'FROM python:3.11\nCMD ["uvicorn", "api:app", "--port", "80"]\n'})
+    entry = entry_point("a" * 24, uvicorn)
+    assert (entry.wrapper, entry.module, entry.route, entry.from_cmd) == ("api.py", "uvicorn", "/health", True)
+
+    script = make_service("b" * 24, files={"serve.py": "", "Dockerfile": "FROM python:3.11\nCMD python3 serve.py -v\n"})
+    entry = entry_point("b" * 24, script)
+    assert (entry.wrapper, entry.argv, entry.route) == ("serve.py", ["serve.py", "-v"], "/")
+
+    main = make_service("c" * 24, files={"lib.py": "", "web.py": 'if __name__ == "__main__":\n    pass\n'})
+    assert entry_point("c" * 24, main).wrapper == "web.py"
+    assert entry_point("d" * 24, make_service("d" * 24, files={"util.py": ""})) is None
+
+
+def test_parse_importtime_sums_top_level_packages():
+    text = ("import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        500 | torch._C\n"
+            "import time:        80 |       4000 | torch\n"
+            "import time:        10 |         10 |   encodings.utf_8\n"
+            "import time:        20 |        300 | numpy\n")
+    assert parse_importtime(text) == {"torch": 4500, "numpy": 300}
+
+
+def test_bench_stubs_missing_imports_and_redirects_the_port(bank_root, make_service):
+    make_service("a" * 24, files={"server.py": SERVER})
+    (service_dir, entry), = wrappers(bank_root)
+    record = bench(service_dir, entry, runs=2, log=lambda line: None, timeout=10)
+    assert record["ok"], record.get("error")
+    assert len(record["runs_s"]) == 2 and record["peak_rss_mb"] > 0
+    assert "not_installed_model_lib" in record["stubbed"]
+    assert not set(record["stubbed"]) & sys.stdlib_module_names
+
+    record = bench(service_dir, entry, runs=1, log=lambda line: None, stub_missing=False, timeout=10)
+    assert not record["ok"] and "not_installed_model_lib" in record["error"]
+
+
+def test_regressions_compare_the_last_two_results(bank_root):
+    path = state_dir(bank_root) / "bench"
+    path.mkdir()
+    records = [("a", True, 1.0), ("a", True, 1.3), ("b", True, 1.0), ("b", True, 1.1),
+               ("c", True, 1.0), ("c", False, None), ("d", False, None), ("d", True, 9.0), ("e", True, 1.0)]
+    (path / BENCH_FILENAME).write_text("".join(
+        json.dumps({"service_id": sid, "ok": ok, "ready_s": ready}) + "\n" for sid, ok, ready in records))
+    assert {sid: regressed for sid, _, _, regressed in regressions(bank_root)} == {
+        "a": True, "b": False, "c": True, "d": False}
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from bank.delta import DeltaError, apply, copied_bytes, encode, signature
+
+
+def _payload(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def test_round_trip_copies_unchanged_blocks():
+    old = _payload(256 << 10)
+    new = old[:1000] + b"inserted" + old[1000:200_000] + _payload(5000, seed=1) + old[210_000:]
+    delta = encode(old, new)
+    assert apply(old, delta) == new
+    block, _ = signature(old)
+    assert copied_bytes(delta) >= len(old) - 20_000 - 3 * block
+    assert len(delta) < 20_000
+
+
+@pytest.mark.parametrize("old, new", [(b"", b"fresh"), (b"old" * 10, b""), (b"short", b"short")])
+def test_round_trip_edge_cases(old, new):
+    assert apply(old, encode(old, new)) == new
+
+
+def test_unmatched_remainder_is_emitted_as_data():
+    old = _payload(64 << 10)
+    new = old[:32 << 10] + _payload(64 << 10, seed=2) + old
+    delta = encode(old, new, max_miss=4096)
+    assert apply(old, delta) == new
+    assert copied_bytes(delta) == 32 << 10
+
+
+def test_apply_rejects_foreign_input():
+    with pytest.raises(DeltaError):
+        apply(b"base", b"not a delta")
+    with pytest.raises(DeltaError):
+        apply(b"base", b"BKD1C" + (0).to_bytes(8, "little") + (10).to_bytes(4, "little"))
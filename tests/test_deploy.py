@@ -0,0 +1,29 @@
+from bank.compose import overlay_files, write_overlay
+from bank.deploy import prepare_workdir, record_generated
+
+COMPOSE = """\
+services:
+  web:
+    build: .
+    volumes:
+      - ./data:/app/data
+"""
+
+
+def test_prepare_workdir_keeps_state_and_drops_what_the_bank_wrote(make_service, tmp_path):
+    service_dir = make_service("a" * 24, files={"Dockerfile": "FROM scratch\n", "docker-compose.yaml": COMPOSE},
+                               package={"app.py": b"print('hi')\n"})
+    workdir = tmp_path / "deploy"
+    prepare_workdir(service_dir, workdir)
+    write_overlay(workdir, "hibernate", {"services": {"web": {"ports": ["127.0.0.1:1234:80"]}}})
+    (workdir / "bank_lazy.py").write_text("# left by a transform\n")
+    record_generated(workdir, workdir / "bank_lazy.py")
+    (workdir / "data").mkdir()
+    (workdir / "data" / "app.db").write_bytes(b"user data")
+    (workdir / "app.py").write_text("# edited in place\n")
+
+    assert prepare_workdir(service_dir, workdir) == 1
+    assert overlay_files(workdir) == []
+    assert not (workdir / "bank_lazy.py").exists()
+    assert (workdir / "data" / "app.db").read_bytes() == b"user data"
+    assert (workdir / "app.py").read_text() == "print('hi')\n"
@@ -0,0 +1,70 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bank.catalog import open_catalog
+from bank.footprint import ProcessTree, drive_load, save, summarise
+
+MIB = 1 << 20
+
+
+def test_summarise_counts_each_interval_towards_the_phase_that_ends_it():
+    samples = [  # (t, phase, cpu_seconds, rss, read, write)
+        (0.0, "startup", 0.0, 10 * MIB, 0, 0),
+        (1.0, "startup", 1.0, 50 * MIB, 4000, 0),
+        (2.0, "startup", 1.5, 40 * MIB, 8000, 100),
+        (3.0, "load", 3.5, 80 * MIB, 8000, 100),
+        (4.0, "load", 4.5, 60 * MIB, 8000, 300),
+    ]
+    startup = summarise(samples, "startup")
+    assert (startup["seconds"], startup["samples"], startup["cpu_p50"], startup["cpu_p95"]) == (2.0, 3, 0.5, 1.0)
+    assert (startup["peak_rss_mb"], startup["read_bps"], startup["write_bps"]) == (50.0, 4000, 50)
+    load = summarise(samples, "load")
+    assert (load["seconds"], load["cpu_p95"], load["peak_rss_mb"], load["write_bps"]) == (2.0, 2.0, 80.0, 100)
+    assert summarise(samples[:1], "startup") is None
+
+
+def test_process_tree_reads_this_session():
+    cpu, rss, read, write = ProcessTree(os.getsid(0)).read()
+    assert cpu > 0 and rss > 0 and read >= 0 and write >= 0
+    assert ProcessTree(-1).read() == (0, 0, 0, 0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status = 500 if self.path == "/fail" else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_drive_load_counts_requests_and_errors():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        ok = drive_load(url + "/health", seconds=0.3, concurrency=2)
+        failing = drive_load(url + "/fail", seconds=0.2, concurrency=1)
+    finally:
+        server.shutdown()
+    assert ok["requests"] > 0 and ok["errors"] == 0 and ok["latency_p95_ms"] >= ok["latency_p50_ms"]
+    assert failing["requests"] == 0 and failing["errors"] > 0 and failing["latency_p50_ms"] is None
+
+
+def test_save_replaces_catalog_rows_of_successful_runs(bank_root, make_service):
+    make_service("a" * 24)
+    stats = {"seconds": 1.0, "samples": 3, "cpu_p50": 0.2, "cpu_p95": 0.4, "peak_rss_mb": 120.0,
+             "read_bps": 0, "write_bps": 0}
+    result = {"service_id": "a" * 24, "source": "wrapper", "at": "2026-01-01T00:00:00+00:00", "ok": True,
+              "phases": {"startup": stats, "load": None}}
+    save([result, dict(result, ok=False, phases={"startup": dict(stats, peak_rss_mb=999.0)})], bank_root)
+    with open_catalog(bank_root) as catalog:
+        (footprint,) = catalog.footprints().values()
+    assert list(footprint) == ["startup"] and footprint["startup"]["peak_rss_mb"] == 120.0
+    assert (bank_root / ".bank" / "bench" / "footprint.jsonl").read_text().count("\n") == 2
@@ -0,0 +1,83 @@
+import time
+import urllib.request
+from types import SimpleNamespace
+
+from bank.coldstart import healthy, wrappers
+from bank.compose import overlay_path, write_overlay
+from bank.hibernate import OVERLAY_NAME, ContainerBackend, WrapperBackend
+
+
+def test_stop_removes_the_port_overlay(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr("bank.hibernate.compose", lambda workdir, *args, **kw: calls.append(args))
+    workdir = tmp_path / "deploy" / ("a" * 24)
+    workdir.mkdir(parents=True)
+    (workdir / "docker-compose.yaml").write_text("services:\n  web:\n    ports: ['8000:8000']\n")
+    write_overlay(workdir, OVERLAY_NAME, {"services": {"web": {"ports": ["127.0.0.1:40000:8000"]}}})
+    target = SimpleNamespace(key="a" * 24 + "/web", path="/", port=8000)
+    backend = ContainerBackend("a" * 24, tmp_path / "svc", tmp_path / "deploy", target)
+
+    backend.stop()
+    assert calls == [("stop",)]
+    assert not overlay_path(workdir, OVERLAY_NAME).exists()
+
+
+def test_stop_without_a_deploy_tree(tmp_path, monkeypatch):
+    def compose(*args, **kwargs):
+        raise AssertionError("compose needs a deploy tree")
+
+    monkeypatch.setattr("bank.hibernate.compose", compose)
+    target = SimpleNamespace(key="a" * 24 + "/web", path="/", port=8000)
+    ContainerBackend("a" * 24, tmp_path / "svc", tmp_path / "deploy", target).stop()
+
+
+WRAPPER = """\
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+{imports}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = VALUE.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    HTTPServer(("127.0.0.1", 5000), Handler).serve_forever()
+"""
+
+
+def _wrapper_backend(bank_root, make_service, tmp_path, imports):
+    service_dir = make_service("a" * 24, files={"app.py": WRAPPER.format(imports=imports)},
+                               package={"lib/__init__.py": b"", "lib/values.py": b"VALUE = 'from the repo'\n"})
+    (entry,) = [entry for _, entry in wrappers(bank_root)]
+    return WrapperBackend(service_dir, entry, tmp_path / "wake")
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_wrapper_serves_from_the_full_deploy_tree(bank_root, make_service, tmp_path):
+    backend = _wrapper_backend(bank_root, make_service, tmp_path, "from lib.values import VALUE")
+    host, port = backend.start()
+    try:
+        _wait(lambda: healthy(f"http://{host}:{port}/"))
+        with urllib.request.urlopen(f"http://{host}:{port}/") as response:
+            assert response.read() == b"from the repo"
+    finally:
+        backend.stop()
+
+
+def test_wrapper_with_missing_imports_fails_its_wake(bank_root, make_service, tmp_path):
+    backend = _wrapper_backend(bank_root, make_service, tmp_path, "import torch_is_not_installed\nVALUE = ''")
+    backend.start()
+    _wait(lambda: not backend.alive())
+    assert "ModuleNotFoundError" in backend.failure()
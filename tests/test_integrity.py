@@ -0,0 +1,18 @@
+from bank.catalog import open_catalog
+from bank.integrity import failed_packages, scan
+
+LFS_POINTER = """\
+version https://git-lfs.github.com/spec/v1
+oid sha256:4d7a214614ab2935c943f9e0ff69d22eadbb8f32b1258daaa5e2ca24d17e2393
+size 18220000
+"""
+
+
+def test_lfs_pointers_are_skipped_like_corrupt_packages(bank_root, make_service):
+    make_service("a" * 24, package={"app.py": b"print('hi')\n"})
+    pointer = make_service("b" * 24)
+    (pointer / "source.zip").write_text(LFS_POINTER)
+    scan(bank_root, workers=1)
+    with open_catalog(bank_root) as catalog:
+        failed = failed_packages(catalog, bank_root)
+    assert {service_id: result["status"] for service_id, result in failed.items()} == {"b" * 24: "lfs-pointer"}
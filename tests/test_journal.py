@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+from bank.catalog import open_catalog
+from bank.journal import Journal
+from bank.metadata import load_metadata, metadata_path, write_metadata
+
+
+def _edit_status(root, service_id, status):
+    path = metadata_path(service_id, root)
+    meta = load_metadata(path)
+    meta["status"] = status
+    write_metadata(path, meta)
+    later = time.time_ns() + 1_000_000_000   # clearly after anything journaled
+    os.utime(path, ns=(later, later))
+
+
+def test_statuses_are_seeded_from_metadata(bank_root, make_service):
+    make_service("a" * 24, status="deploying")
+    make_service("b" * 24)
+    assert Journal(bank_root).statuses()["a" * 24]["status"] == "deploying"
+    assert Journal(bank_root).status("b" * 24) == "stopped"
+
+
+def test_recorded_status_wins_over_older_metadata(bank_root, make_service):
+    make_service("a" * 24)
+    Journal(bank_root).record("a" * 24, "running")
+    assert Journal(bank_root).status("a" * 24) == "running"
+
+
+def test_metadata_edit_after_compaction_wins(bank_root, make_service):
+    make_service("a" * 24)
+    journal = Journal(bank_root)
+    journal.record("a" * 24, "running")
+    journal.compact()
+    assert load_metadata(metadata_path("a" * 24, bank_root))["status"] == "running"
+
+    _edit_status(bank_root, "a" * 24, "deploying")
+    with open_catalog(bank_root) as catalog:
+        assert catalog.get("a" * 24)["status"] == "deploying"
+    assert Journal(bank_root).status("a" * 24) == "deploying"
+
+
+def test_metadata_edit_after_journal_record_wins_on_refresh(bank_root, make_service):
+    make_service("a" * 24)
+    Journal(bank_root).record("a" * 24, "failed")
+    _edit_status(bank_root, "a" * 24, "deploying")
+    assert Journal(bank_root).status("a" * 24) == "failed"         # reading the view scans nothing
+    assert Journal(bank_root).refresh()["a" * 24]["status"] == "deploying"
+
+
+def test_new_record_after_metadata_edit_wins(bank_root, make_service):
+    make_service("a" * 24)
+    journal = Journal(bank_root)
+    journal.record("a" * 24, "running")
+    journal.compact()
+    path = metadata_path("a" * 24, bank_root)
+    meta = load_metadata(path)
+    meta["status"] = "deploying"
+    write_metadata(path, meta)
+    Journal(bank_root).record("a" * 24, "stopped")
+    assert Journal(bank_root).status("a" * 24) == "stopped"
+
+
+def test_failed_batch_is_requeued_for_its_waiters(bank_root, make_service, monkeypatch):
+    for service_id in ("a" * 24, "b" * 24, "c" * 24):
+        make_service(service_id)
+    journal = Journal(bank_root)
+    journal.statuses()
+    write, batches = journal._write, []
+
+    def flaky_write(lines):
+        batches.append(len(lines))
+        if len(batches) == 1:                   # hold the first batch until two records queue behind it
+            while len(journal._pending) < 2:
+                time.sleep(0.01)
+        elif len(batches) == 2:
+            raise OSError(28, "No space left on device")
+        return write(lines)
+
+    monkeypatch.setattr(journal, "_write", flaky_write)
+    errors = []
+
+    def record(service_id):
+        try:
+            journal.record(service_id, "running")
+        except OSError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=record, args=(service_id,)) for service_id in ("a" * 24, "b" * 24)]
+    threads[0].start()
+    while not batches:
+        time.sleep(0.01)
+    threads[1].start()
+    record("c" * 24)
+    for thread in threads:
+        thread.join()
+    assert batches == [1, 2, 2] and len(errors) == 1
+    assert sorted(event["service_id"] for event in journal.events()) == ["a" * 24, "b" * 24, "c" * 24]
@@ -0,0 +1,129 @@
+import importlib
+import sys
+
+from bank import lazy
+from bank.lazyimport import plan
+
+WRAPPER = """\
+from flask import Flask
+import torch
+from PIL import Image, UnidentifiedImageError
+from lib.model import Model, ModelError
+
+app = Flask(__name__)
+model = Model()
+
+
+@app.route("/predict")
+def predict(data):
+    try:
+        image = Image.open(data)
+    except (UnidentifiedImageError, OSError):
+        return "bad image", 400
+    if isinstance(image, Image.Image):
+        return str(model(torch.tensor(image)))
+
+
+@app.route("/reload")
+def reload():
+    try:
+        model.reload()
+    except ModelError:
+        return "failed", 500
+    return "ok"
+
+
+if __name__ == "__main__":
+    app.run()
+"""
+
+
+def test_class_and_exception_names_stay_eager():
+    rewrite = plan(WRAPPER)
+    assert dict(rewrite.lazy) == {"torch": "torch", "Image": "PIL.Image", "Model": "lib.model.Model"}
+    assert rewrite.deferred == ["model"]
+    assert "from PIL import UnidentifiedImageError\n" in rewrite.text
+    assert "from lib.model import ModelError\n" in rewrite.text
+    compile(rewrite.text, "wrapper.py", "exec")
+
+
+SERVER = """\
+import json
+import heavy
+from heavy import Base, Model, route, DEFAULT
+
+model = Model()
+loaded = []
+
+
+class Handler(Base):
+    pass
+
+
+@route
+def handle(limit=DEFAULT):
+    return json.dumps(model.predict(limit))
+
+
+def warm():
+    loaded.append(heavy.NAME)
+
+
+if __name__ == "__main__":
+    warm()
+    print(heavy.NAME)
+    server.serve_forever()
+"""
+
+
+def test_names_needed_while_the_module_runs_stay_eager():
+    rewrite = plan(SERVER)
+    assert rewrite.lazy == [("Model", "heavy.Model")]
+    assert rewrite.deferred == ["model"] and rewrite.background == ["warm"]
+    assert "import heavy\nimport bank_lazy\nfrom heavy import Base, route, DEFAULT\n" in rewrite.text
+    assert "    bank_lazy.background(warm)\n" in rewrite.text
+
+
+HEAVY = """\
+import threading
+started = threading.Event()
+release = threading.Event()
+
+
+class Model:
+    def __init__(self):
+        started.set()
+        release.wait(5)
+
+    def predict(self, x):
+        return x * 2
+"""
+
+LOADING_WRAPPER = """\
+from lazyheavy import Model
+
+model = Model()
+
+
+def health():
+    return "ok"
+
+
+def predict(x):
+    return model.predict(x)
+"""
+
+
+def test_rewritten_wrapper_answers_before_its_model_loads(tmp_path, monkeypatch):
+    (tmp_path / "lazyheavy.py").write_text(HEAVY)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setitem(sys.modules, "bank_lazy", lazy)
+    namespace = {"__name__": "wrapper"}
+    exec(plan(LOADING_WRAPPER).text, namespace)
+
+    heavy = importlib.import_module("lazyheavy")
+    assert heavy.started.wait(5)
+    assert namespace["health"]() == "ok" and not lazy.ready()
+    heavy.release.set()
+    assert namespace["predict"](21) == 42
+    assert lazy.wait(5) and isinstance(namespace["model"], heavy.Model)
@@ -0,0 +1,39 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from bank.parts import PartsError, open_parts, stream_extract, write_manifest
+
+
+@pytest.fixture
+def split_package(tmp_path):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("repo/app.py", "print('hello')\n")
+        zf.writestr("repo/data.bin", os.urandom(20000))
+    data = buf.getvalue()
+    service_dir = tmp_path / "svc"
+    service_dir.mkdir()
+    third = len(data) // 3
+    for suffix, chunk in (("aa", data[:third]), ("ab", data[third:2 * third]), ("ac", data[2 * third:])):
+        (service_dir / f"source.zip.part{suffix}").write_bytes(chunk)
+    write_manifest(service_dir)
+    return service_dir
+
+
+def test_stream_extract_verifies_every_part(split_package, tmp_path):
+    with open_parts(split_package) as stream:
+        assert stream_extract(stream, tmp_path / "out") == 2
+    assert (tmp_path / "out" / "repo" / "app.py").read_text() == "print('hello')\n"
+
+
+def test_corrupt_last_part_is_detected(split_package, tmp_path):
+    last = split_package / "source.zip.partac"
+    data = bytearray(last.read_bytes())
+    data[-2] ^= 0xFF                    # inside the end-of-central-directory record
+    last.write_bytes(bytes(data))
+    with pytest.raises(PartsError, match="partac: SHA-256 mismatch"):
+        with open_parts(split_package) as stream:
+            stream_extract(stream, tmp_path / "out")
@@ -0,0 +1,51 @@
+from bank.placement import HEAVY_BASE_MIB, LANGUAGE_DEFAULTS, Part, Stack, pack, simulate, stack_demand
+
+COMPOSE = """\
+services:
+  app:
+    build: .
+  db:
+    image: mysql:8.0
+  search:
+    image: elasticsearch:8.11.0
+    mem_limit: 512m
+"""
+
+
+def _stack(service_id, cpu, memory_mb):
+    return Stack(service_id, [Part("app", cpu, memory_mb, "estimate")])
+
+
+def test_pack_fills_nodes_best_fit_and_beats_round_robin():
+    stacks = [_stack("a", 3, 200), _stack("b", 1, 700), _stack("e", 3, 100), _stack("c", 1, 300),
+              _stack("huge", 1, 2000)]
+    nodes, oversized = pack(stacks, cpu=4, memory_mb=1000, headroom=1.0)
+    assert [node.stacks for node in nodes] == [["a", "b"], ["e", "c"]]
+    assert oversized == [stacks[-1]]
+    for node in nodes:
+        assert node.used_cpu <= node.cpu and node.used_memory_mb <= node.memory_mb
+
+    summary = simulate(stacks, cpu=4, memory_mb=1000, headroom=1.0)
+    assert (summary["lower_bound"], summary["packed_nodes"], summary["round_robin_nodes"]) == (2, 2, 3)
+    assert summary["oversized"] == ["huge"]
+
+
+def test_headroom_scales_demand():
+    nodes, oversized = pack([_stack("a", 3, 100)], cpu=4, memory_mb=1000, headroom=1.5)
+    assert nodes == [] and [stack.service_id for stack in oversized] == ["a"]
+
+
+def test_stack_demand_estimates_each_compose_service(make_service):
+    service_dir = make_service("a" * 24, files={"docker-compose.yml": COMPOSE,
+                                                "Dockerfile": "FROM pytorch/pytorch:2.1.0-cuda12.1\n"})
+    record = {"service_id": "a" * 24, "language": "python", "package_bytes": 10_000_000}
+    parts = {part.name: part for part in stack_demand(record, service_dir).parts}
+    assert parts["app"].source == "estimate"
+    assert parts["app"].memory_mb == LANGUAGE_DEFAULTS["python"][1] + HEAVY_BASE_MIB + 5
+    assert parts["db"].source == "image"
+    assert (parts["search"].source, parts["search"].memory_mb) == ("limit", 512)
+
+    footprint = {"load": {"source": "container", "cpu_p95": 1.5, "peak_rss_mb": 900.0},
+                 "startup": {"source": "container", "cpu_p95": 0.5, "peak_rss_mb": 1200.0}}
+    stack = stack_demand(record, service_dir, footprint)
+    assert stack.measured and (stack.cpu, stack.memory_mb) == (1.5, 1200.0)
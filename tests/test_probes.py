@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from bank.journal import Journal
+from bank.probes import ProbeEngine, Target, discover
+
+COMPOSE = """\
+services:
+  web:
+    image: nginx
+    ports: ["8080:80"]
+    healthcheck:
+      test: ["CMD", "curl", "-f", "http://localhost:80/health"]
+  cache:
+    image: redis
+    ports: ["6379:6379"]
+    healthcheck:
+      test: ["CMD", "redis-cli", "ping"]
+"""
+
+
+def _probe(response, checks=2):
+    """Serve ``response`` to every request on one keep-alive server; return the target and connection count."""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(response)
+            await writer.drain()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        target = Target("s/web", "http", server.sockets[0].getsockname()[1], "/health")
+        engine = ProbeEngine([target], timeout=1.0)
+        for _ in range(checks):
+            await engine.check(target)
+            assert target.healthy, target.detail
+        engine._close(target)
+        server.close()
+        return target, len(connections)
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("status", [b"204 No Content", b"304 Not Modified"])
+def test_bodiless_responses_keep_the_connection(status):
+    target, connections = _probe(b"HTTP/1.1 " + status + b"\r\nServer: test\r\n\r\n")
+    assert target.detail == f"HTTP {int(status[:3])}" and target.latency_ms < 500
+    assert connections == 1
+
+
+def test_interim_responses_are_skipped():
+    target, _ = _probe(b"HTTP/1.1 103 Early Hints\r\nLink: </a.css>\r\n\r\n"
+                       b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+    assert target.detail == "HTTP 200"
+
+
+def test_unframed_keep_alive_body_is_dropped_not_awaited():
+    target, connections = _probe(b"HTTP/1.1 200 OK\r\n\r\nok")
+    assert target.latency_ms < 500
+    assert connections == 2
+
+
+def test_discover_defaults_to_running_stacks(bank_root, make_service):
+    for service_id in ("a" * 24, "b" * 24):
+        make_service(service_id, files={"docker-compose.yaml": COMPOSE})
+    Journal(bank_root).record("a" * 24, "running")
+
+    assert {t.key for t in discover(bank_root)} == {"a" * 24 + "/web", "a" * 24 + "/cache"}
+    assert {t.key.partition("/")[0] for t in discover(bank_root, status=None)} == {"a" * 24, "b" * 24}
+    assert [t.url for t in discover(bank_root) if t.kind == "http"] == ["http://127.0.0.1:8080/health"]
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from bank.deploy import DeployError
+from bank.metadata import load_metadata
+from bank.scheduler import JobResult, Scheduler, job_key, run_pipeline
+
+
+def test_job_key_orders_by_stars_or_age():
+    metas = [{"service_id": "a", "star": 5, "uploaded_at": "2024-03"},
+             {"service_id": "b", "star": 50, "uploaded_at": "2024-01"},
+             {"service_id": "c", "uploaded_at": "2024-02"}]
+    assert [m["service_id"] for m in sorted(metas, key=lambda m: job_key(m, "star"))] == ["b", "a", "c"]
+    assert [m["service_id"] for m in sorted(metas, key=lambda m: job_key(m, "age"))] == ["b", "c", "a"]
+
+
+def test_jobs_run_by_priority_within_language_limits(bank_root, make_service):
+    metas = [{"service_id": f"{n:024x}", "language": "java" if n < 3 else "python", "star": n} for n in range(6)]
+    for meta in metas:
+        make_service(meta["service_id"], language=meta["language"], star=meta["star"], status="deploying")
+    lock = threading.Lock()
+    running, peak, started = {}, {}, []
+
+    def pipeline(service_id, root, workdir, dry_run, transforms, build_cache):
+        language = "java" if int(service_id, 16) < 3 else "python"
+        with lock:
+            started.append(service_id)
+            running[language] = running.get(language, 0) + 1
+            peak[language] = max(peak.get(language, 0), running[language])
+        time.sleep(0.05)
+        with lock:
+            running[language] -= 1
+        if service_id == metas[4]["service_id"]:
+            raise DeployError("compose up failed\nwith details")
+        return JobResult(service_id, ok=True, phases={"extract": 0.01})
+
+    scheduler = Scheduler(bank_root, limits={"java": 1, "python": 2}, pipeline=pipeline)
+    for meta in metas:
+        scheduler.submit(meta)
+    results = scheduler.run()
+
+    assert peak == {"java": 1, "python": 2}
+    assert started[:2] == [metas[5]["service_id"], metas[4]["service_id"]]
+    assert [m["service_id"] for m in metas if m["language"] == "java"][::-1] == \
+        [sid for sid in started if int(sid, 16) < 3]
+    assert sorted(r.service_id for r in results if not r.ok) == [metas[4]["service_id"]]
+    statuses = {m["service_id"]: load_metadata(bank_root / "services" / m["service_id"])["status"] for m in metas}
+    assert statuses == {m["service_id"]: "failed" if m is metas[4] else "running" for m in metas}
+
+
+def test_pipeline_stops_at_the_failing_phase(make_service, bank_root, tmp_path, monkeypatch):
+    make_service("a" * 24, files={"Dockerfile": "FROM scratch\n"}, package={"app.py": b""})
+    calls = []
+
+    def compose(workdir, *args, **kwargs):
+        calls.append(args)
+        raise DeployError("no such image")
+
+    monkeypatch.setattr("bank.scheduler.compose", compose)
+    result = run_pipeline("a" * 24, bank_root, tmp_path)
+    assert not result.ok and result.error == "build: no such image"
+    assert list(result.phases) == ["extract", "build"] and calls == [("build",)]
+    assert (tmp_path / ("a" * 24) / "app.py").exists()
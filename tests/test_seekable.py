@@ -0,0 +1,53 @@
+import io
+import os
+import random
+import zipfile
+import zlib
+
+import pytest
+
+from bank import seekable
+from bank.seekable import SEEKABLE_FILENAME, is_current, open_archive, pack, reproduce_deflate
+
+PACKAGE = {
+    "app.py": b"print('hello')\n" * 200,
+    "model.bin": random.Random(0).randbytes(48 << 10),
+    "empty.txt": b"",
+    "lib/util.py": b"def f():\n    return 1\n" * 50,
+}
+
+
+def test_reproduce_deflate_finds_the_zlib_settings():
+    content = PACKAGE["lib/util.py"] + PACKAGE["model.bin"]
+    compressor = zlib.compressobj(1, zlib.DEFLATED, -15, 8)
+    assert reproduce_deflate(compressor.compress(content) + compressor.flush(), content) == (1, 8)
+    assert reproduce_deflate(b"not deflate", content) is None
+
+
+def test_pack_round_trips_members_and_the_zip(make_service, monkeypatch, tmp_path):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(seekable, "FRAME_SIZE", 16 << 10)
+    service_dir = make_service("a" * 24, package=PACKAGE)
+    with zipfile.ZipFile(service_dir / "source.zip", "a") as zf:
+        zf.writestr("repo-main/stored.txt", b"stored " * 100, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("repo-main/bzip.txt", b"bzip " * 100, compress_type=zipfile.ZIP_BZIP2)
+    pack(service_dir)
+
+    with open_archive(service_dir) as archive:
+        assert len(archive.frames) > 3 and is_current(archive, service_dir)
+        for name, data in PACKAGE.items():
+            assert archive.read(f"repo-main/{name}") == data
+        assert archive.read("repo-main/bzip.txt") == b"bzip " * 100
+
+        out = io.BytesIO()
+        archive.write_zip(out)
+        assert out.getvalue() == (service_dir / "source.zip").read_bytes()
+
+        assert archive.extract(tmp_path / "out", strip="repo-main", workers=4) == len(PACKAGE) + 2
+        for name, data in PACKAGE.items():
+            assert (tmp_path / "out" / name).read_bytes() == data
+
+    os.utime(service_dir / "source.zip", ns=(0, 0))
+    with open_archive(service_dir) as archive:
+        assert not is_current(archive, service_dir)
+    assert (service_dir / SEEKABLE_FILENAME).exists()
@@ -0,0 +1,76 @@
+import pytest
+
+from bank.sharedinfra import (DISABLED_PROFILE, NETWORK, SharedState, backing_services, engine_of, overlay,
+                              plan_stack, rewrite_clients)
+
+DOC = {"services": {
+    "app": {
+        "build": ".",
+        "depends_on": ["db", "cache"],
+        "environment": {
+            "SPRING_DATASOURCE_URL": "jdbc:mysql://db:3306/shop?useSSL=false",
+            "SPRING_DATASOURCE_USERNAME": "shop",
+            "SPRING_DATASOURCE_PASSWORD": "secret",
+            "SPRING_REDIS_HOST": "cache",
+        },
+    },
+    "db": {
+        "image": "mysql:8.0.33",
+        "command": "--default-authentication-plugin=mysql_native_password",
+        "environment": {"MYSQL_ROOT_PASSWORD": "root", "MYSQL_USER": "shop", "MYSQL_PASSWORD": "secret",
+                        "MYSQL_DATABASE": "shop"},
+        "volumes": ["./sql:/docker-entrypoint-initdb.d"],
+    },
+    "cache": {"image": "redis:7.2-alpine"},
+    "search": {"image": "redis", "command": ["redis-server", "--requirepass", "hidden"]},
+}}
+
+
+@pytest.mark.parametrize("image, expected", [
+    ("mysql:8.0.33", ("mysql", "8.0")),
+    ("docker.io/library/postgres:15.4-alpine", ("postgres", "15")),
+    ("postgres:9.6", ("postgres", "9.6")),
+    ("redis", ("redis", "latest")),
+    ("bitnami/redis:7", None),
+])
+def test_engine_of(image, expected):
+    assert engine_of(image) == expected
+
+
+def test_backing_services_read_credentials_from_the_environment(tmp_path):
+    db, cache, search = backing_services(DOC, tmp_path)
+    assert (db.pool, db.users, db.database, db.native_password) == (
+        "mysql-8-0", {"root": "root", "shop": "secret"}, "shop", True)
+    assert db.init_paths == [tmp_path / "sql"]
+    assert (cache.pool, search.pool, search.password) == ("redis-7", "redis-latest-auth", "hidden")
+
+
+def test_plan_stack_shares_what_clients_configure_through_the_environment():
+    reasons = {backing.name: reason for backing, reason in plan_stack(DOC)}
+    assert reasons == {"db": None, "cache": None, "search": "no client service found"}
+
+
+def test_rewrite_and_overlay_point_clients_at_their_tenants(bank_root):
+    state = SharedState(bank_root)
+    db, cache, _ = backing_services(DOC)
+    shared = []
+    for backing in (db, cache):
+        tenant, _ = state.tenant("a" * 24, backing)
+        assert state.tenant("a" * 24, backing)[0] == tenant
+        shared.append((backing, tenant, rewrite_clients(DOC, backing, tenant)))
+    db_tenant, cache_tenant = shared[0][1], shared[1][1]
+    assert cache_tenant["redis_db"] == 1
+    assert state.tenant("b" * 24, cache)[0]["redis_db"] == 2
+
+    app = overlay(DOC, shared)["services"]
+    assert app["db"] == app["cache"] == {"profiles": [DISABLED_PROFILE]}
+    env = app["app"]["environment"]
+    assert env == {
+        "SPRING_DATASOURCE_URL": f"jdbc:mysql://db:3306/{db_tenant['database']}?useSSL=false",
+        "SPRING_DATASOURCE_USERNAME": db_tenant["user"],
+        "SPRING_DATASOURCE_PASSWORD": db_tenant["password"],
+        "SPRING_REDIS_DATABASE": "1",
+    }
+    assert app["app"]["depends_on"].value == []
+    assert sorted(app["app"]["external_links"]) == ["bank-shared-mysql-8-0:db", "bank-shared-redis-7:cache"]
+    assert app["app"]["networks"] == ["default", NETWORK]
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bank.startup import StartupRunner, stack_graph
+
+
+@pytest.fixture
+def fake_docker(monkeypatch):
+    """Serve ``compose ps`` and ``docker inspect`` from ``containers``: {service: [(status, code, health)]}."""
+    containers = {}
+
+    def compose(workdir, *args, **kwargs):
+        ids = []
+        if args[:1] == ("ps",):
+            ids = [f"{args[-1]}-{n}" for n in range(len(containers.get(args[-1], [])))]
+        return SimpleNamespace(stdout="\n".join(ids) + "\n")
+
+    def inspect(container):
+        service, _, n = container.rpartition("-")
+        return containers[service][int(n)]
+
+    monkeypatch.setattr("bank.startup.compose", compose)
+    monkeypatch.setattr("bank.startup._inspect", inspect)
+    return containers
+
+
+def _run(doc, tmp_path):
+    runner = StartupRunner(stack_graph(doc, "s"), {"s": tmp_path}, poll=0.01, timeout=1, log=lambda line: None)
+    return runner.run()
+
+
+def test_one_shot_exiting_zero_is_not_a_failure(fake_docker, tmp_path):
+    fake_docker.update({"migrate": [("exited", 0, None)], "web": [("running", 0, None)]})
+    record = _run({"services": {"migrate": {}, "web": {}}}, tmp_path)
+    assert record["failed"] == []
+
+
+def test_exit_zero_satisfies_service_completed_successfully(fake_docker, tmp_path):
+    fake_docker.update({"migrate": [("exited", 0, None)], "web": [("running", 0, None)]})
+    doc = {"services": {"migrate": {},
+                        "web": {"depends_on": {"migrate": {"condition": "service_completed_successfully"}}}}}
+    record = _run(doc, tmp_path)
+    assert record["failed"] == [] and record["skipped"] == []
+
+
+def test_non_zero_exit_fails_and_skips_dependants(fake_docker, tmp_path):
+    fake_docker.update({"migrate": [("exited", 2, None)], "web": [("running", 0, None)]})
+    doc = {"services": {"migrate": {},
+                        "web": {"depends_on": {"migrate": {"condition": "service_completed_successfully"}}}}}
+    record = _run(doc, tmp_path)
+    assert record["nodes"]["s/migrate"]["error"] == "exited with status 2"
+    assert record["skipped"] == ["s/web"]
+
+
+def test_scaled_service_inspects_every_replica(fake_docker, tmp_path):
+    fake_docker.update({"worker": [("running", 0, None), ("exited", 1, None)]})
+    record = _run({"services": {"worker": {}}}, tmp_path)
+    assert record["nodes"]["s/worker"]["error"] == "exited with status 1"
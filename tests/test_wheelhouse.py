@@ -0,0 +1,82 @@
+from bank.compose import overlay_path
+from bank.deploy import prepare_workdir
+from bank.wheelhouse import OVERLAY_NAME, Wheelhouse, apply_to_workdir, scan_service
+
+DOCKERFILE = """\
+FROM python:3.11-slim
+WORKDIR /app
+COPY requirements.txt .
+RUN pip install --no-cache-dir -r requirements.txt
+COPY . .
+RUN pip install -e .
+CMD ["python", "app.py"]
+"""
+COMPOSE = """\
+services:
+  web:
+    build: .
+    ports:
+      - "8000:8000"
+"""
+
+
+def _mark_built(root, service_dir):
+    wheelhouse = Wheelhouse(root)
+    for install in scan_service(service_dir.name, service_dir):
+        if install.specs:
+            wheelhouse.tag_dir(install.tag).mkdir(parents=True, exist_ok=True)
+            wheelhouse._save_state(install.tag, {**wheelhouse.state(install.tag), install.set_id: "ok"})
+
+
+def test_editable_install_keeps_the_index(bank_root, make_service, tmp_path):
+    service_dir = make_service("a" * 24, files={
+        "Dockerfile": DOCKERFILE, "docker-compose.yaml": COMPOSE, "requirements.txt": "flask==3.0.0\n"})
+    _mark_built(bank_root, service_dir)
+    workdir = tmp_path / "deploy"
+    prepare_workdir(service_dir, workdir)
+
+    assert apply_to_workdir(service_dir, workdir, root=bank_root)
+    lines = (workdir / "Dockerfile").read_text().splitlines()
+    requirements_run = next(line for line in lines if "requirements.txt" in line and line.startswith("RUN"))
+    assert "--no-index" in requirements_run and "--mount=type=bind" in requirements_run
+    assert "RUN pip install -e ." in lines
+    assert overlay_path(workdir, OVERLAY_NAME).exists()
+
+
+def test_unbuilt_sets_leave_the_dockerfile_alone(bank_root, make_service, tmp_path):
+    service_dir = make_service("b" * 24, files={
+        "Dockerfile": DOCKERFILE, "docker-compose.yaml": COMPOSE, "requirements.txt": "flask==3.0.0\n"})
+    workdir = tmp_path / "deploy"
+    prepare_workdir(service_dir, workdir)
+
+    assert not apply_to_workdir(service_dir, workdir, root=bank_root)
+    assert (workdir / "Dockerfile").read_text() == DOCKERFILE
+    assert not overlay_path(workdir, OVERLAY_NAME).exists()
+
+
+def test_no_compose_service_leaves_the_dockerfile_alone(bank_root, make_service, tmp_path):
+    service_dir = make_service("c" * 24, files={"Dockerfile": DOCKERFILE, "requirements.txt": "flask==3.0.0\n"})
+    _mark_built(bank_root, service_dir)
+    workdir = tmp_path / "deploy"
+    prepare_workdir(service_dir, workdir)
+
+    assert not apply_to_workdir(service_dir, workdir, root=bank_root)
+    assert (workdir / "Dockerfile").read_text() == DOCKERFILE
+
+
+def test_index_options_reach_the_wheel_build(make_service):
+    service_dir = make_service("d" * 24, files={
+        "Dockerfile": DOCKERFILE,
+        "requirements.txt": "--extra-index-url https://download.pytorch.org/whl/cu124\ntorch==2.4.0\n"})
+    install = next(i for i in scan_service(service_dir.name, service_dir) if i.specs)
+    assert install.offline
+    assert install.requirements_text().splitlines() == [
+        "--extra-index-url https://download.pytorch.org/whl/cu124", "torch==2.4.0"]
+
+
+def test_unresolved_requirement_file_is_not_ready(bank_root, make_service):
+    service_dir = make_service("e" * 24, files={
+        "Dockerfile": DOCKERFILE.replace("requirements.txt", "missing.txt")})
+    installs = [i for i in scan_service(service_dir.name, service_dir) if i.requirement_files]
+    assert installs and installs[0].unresolved
+    assert not Wheelhouse(bank_root).ready(installs)